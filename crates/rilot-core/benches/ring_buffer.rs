@@ -0,0 +1,97 @@
+//! Producer cost of handing records to a background writer: `RingBuffer` vs. a
+//! `Mutex<VecDeque>`, with one consumer draining concurrently.
+//!
+//! Run with `cargo bench --bench ring_buffer` from `crates/rilot-core`.
+
+use rilot_core::RingBuffer;
+use std::collections::VecDeque;
+use std::hint::black_box;
+use std::sync::atomic::{AtomicBool, Ordering};
+use std::sync::{Arc, Mutex};
+use std::thread;
+use std::time::Instant;
+
+const PUSHES_PER_PRODUCER: usize = 500_000;
+const CAPACITY: usize = 8192;
+
+trait Queue: Send + Sync + 'static {
+    fn push(&self, value: u64) -> bool;
+    fn pop(&self) -> Option<u64>;
+}
+
+impl Queue for RingBuffer<u64> {
+    fn push(&self, value: u64) -> bool {
+        RingBuffer::push(self, value).is_ok()
+    }
+
+    fn pop(&self) -> Option<u64> {
+        RingBuffer::pop(self)
+    }
+}
+
+struct Locked(Mutex<VecDeque<u64>>);
+
+impl Queue for Locked {
+    fn push(&self, value: u64) -> bool {
+        let mut queue = self.0.lock().unwrap();
+        if queue.len() >= CAPACITY {
+            return false;
+        }
+        queue.push_back(value);
+        true
+    }
+
+    fn pop(&self) -> Option<u64> {
+        self.0.lock().unwrap().pop_front()
+    }
+}
+
+/// Nanoseconds per push across all producers.
+fn run<Q: Queue>(queue: Arc<Q>, producers: usize) -> f64 {
+    let stop = Arc::new(AtomicBool::new(false));
+    let consumer = {
+        let queue = queue.clone();
+        let stop = stop.clone();
+        thread::spawn(move || {
+            while !stop.load(Ordering::Relaxed) {
+                while let Some(v) = queue.pop() {
+                    black_box(v);
+                }
+                thread::yield_now();
+            }
+        })
+    };
+    let start = Instant::now();
+    let handles: Vec<_> = (0..producers)
+        .map(|_| {
+            let queue = queue.clone();
+            thread::spawn(move || {
+                for i in 0..PUSHES_PER_PRODUCER {
+                    black_box(queue.push(i as u64));
+                }
+            })
+        })
+        .collect();
+    for handle in handles {
+        handle.join().unwrap();
+    }
+    let elapsed = start.elapsed();
+    stop.store(true, Ordering::Relaxed);
+    consumer.join().unwrap();
+    elapsed.as_nanos() as f64 / (PUSHES_PER_PRODUCER * producers) as f64
+}
+
+fn main() {
+    println!(
+        "{:>9} {:>14} {:>14}",
+        "producers", "ring ns/push", "mutex ns/push"
+    );
+    for producers in [1, 2, 4, 8] {
+        let ring_ns = run(Arc::new(RingBuffer::<u64>::new(CAPACITY)), producers);
+        let mutex_ns = run(
+            Arc::new(Locked(Mutex::new(VecDeque::with_capacity(CAPACITY)))),
+            producers,
+        );
+        println!("{:>9} {:>14.1} {:>14.1}", producers, ring_ns, mutex_ns);
+    }
+}
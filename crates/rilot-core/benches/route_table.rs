@@ -0,0 +1,61 @@
+//! Route lookup cost: compiled `RouteTable` vs. the linear scan it replaced.
+//!
+//! Run with `cargo bench --bench route_table` from `crates/rilot-core`.
+
+use rilot_core::RouteTable;
+use std::hint::black_box;
+use std::time::Instant;
+
+const LOOKUPS: usize = 200_000;
+
+fn build_rules(n: usize) -> Vec<(String, String)> {
+    (0..n)
+        .map(|i| {
+            let rule_type = if i % 4 == 0 { "exact" } else { "contain" };
+            (format!("/svc-{:04}/api/v{}", i, i % 3), rule_type.to_string())
+        })
+        .collect()
+}
+
+fn linear(rules: &[(String, String)], path: &str) -> Option<usize> {
+    rules.iter().position(|(p, t)| match t.as_str() {
+        "exact" => path == p,
+        _ => path.starts_with(p.as_str()),
+    })
+}
+
+fn main() {
+    println!("{:>6} {:>14} {:>14}", "rules", "table ns/op", "linear ns/op");
+    for n in [10, 100, 1000] {
+        let rules = build_rules(n);
+        let table = RouteTable::new(rules.iter().map(|(p, t)| (p.as_str(), t.as_str())));
+        // Mix of hits spread across the table plus misses (worst case for the scan).
+        let paths: Vec<String> = (0..64)
+            .map(|i| {
+                if i % 8 == 7 {
+                    format!("/missing/{}", i)
+                } else {
+                    let r = (i * 7919) % n;
+                    format!("/svc-{:04}/api/v{}/items/{}", r, r % 3, i)
+                }
+            })
+            .collect();
+        for p in &paths {
+            assert_eq!(table.lookup(p), linear(&rules, p));
+        }
+
+        let start = Instant::now();
+        for i in 0..LOOKUPS {
+            black_box(table.lookup(black_box(&paths[i % paths.len()])));
+        }
+        let table_ns = start.elapsed().as_nanos() as f64 / LOOKUPS as f64;
+
+        let start = Instant::now();
+        for i in 0..LOOKUPS {
+            black_box(linear(&rules, black_box(&paths[i % paths.len()])));
+        }
+        let linear_ns = start.elapsed().as_nanos() as f64 / LOOKUPS as f64;
+
+        println!("{:>6} {:>14.1} {:>14.1}", n, table_ns, linear_ns);
+    }
+}
@@ -1,6 +1,14 @@
 use serde::{Deserialize, Serialize};
 use std::collections::HashMap;
 
+pub mod ring_buffer;
+pub mod route_table;
+pub mod ttl_cache;
+
+pub use ring_buffer::RingBuffer;
+pub use route_table::RouteTable;
+pub use ttl_cache::TtlLru;
+
 #[derive(Debug, Clone, Serialize, Deserialize)]
 pub struct PolicyWeights {
     pub w_carbon: f64,
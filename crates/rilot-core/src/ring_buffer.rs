@@ -0,0 +1,198 @@
+use std::cell::UnsafeCell;
+use std::mem::MaybeUninit;
+use std::sync::atomic::{AtomicUsize, Ordering};
+
+/// Bounded lock-free multi-producer multi-consumer queue.
+///
+/// Each slot carries a sequence number that tells producers and consumers whose turn
+/// it is, so `push`/`pop` are a single CAS on the shared position plus one store on
+/// the slot (Vyukov's bounded queue). `push` never blocks: a full queue hands the
+/// value back. Capacity is rounded up to a power of two.
+pub struct RingBuffer<T> {
+    slots: Box<[Slot<T>]>,
+    mask: usize,
+    enqueue_pos: CachePadded<AtomicUsize>,
+    dequeue_pos: CachePadded<AtomicUsize>,
+}
+
+struct Slot<T> {
+    sequence: AtomicUsize,
+    value: UnsafeCell<MaybeUninit<T>>,
+}
+
+/// Keeps the producer and consumer positions on separate cache lines.
+#[repr(align(64))]
+struct CachePadded<T>(T);
+
+// Slots are only accessed by the thread that won the position CAS for them.
+unsafe impl<T: Send> Send for RingBuffer<T> {}
+unsafe impl<T: Send> Sync for RingBuffer<T> {}
+
+impl<T> RingBuffer<T> {
+    /// `capacity` is clamped to at least two slots and rounded up to a power of two.
+    pub fn new(capacity: usize) -> Self {
+        let capacity = capacity.max(2).next_power_of_two();
+        let slots = (0..capacity)
+            .map(|i| Slot {
+                sequence: AtomicUsize::new(i),
+                value: UnsafeCell::new(MaybeUninit::uninit()),
+            })
+            .collect();
+        Self {
+            slots,
+            mask: capacity - 1,
+            enqueue_pos: CachePadded(AtomicUsize::new(0)),
+            dequeue_pos: CachePadded(AtomicUsize::new(0)),
+        }
+    }
+
+    /// Enqueue `value`, or return it when the queue is full.
+    pub fn push(&self, value: T) -> Result<(), T> {
+        let mut pos = self.enqueue_pos.0.load(Ordering::Relaxed);
+        loop {
+            let slot = &self.slots[pos & self.mask];
+            let sequence = slot.sequence.load(Ordering::Acquire);
+            let lag = sequence.wrapping_sub(pos) as isize;
+            if lag == 0 {
+                match self.enqueue_pos.0.compare_exchange_weak(
+                    pos,
+                    pos.wrapping_add(1),
+                    Ordering::Relaxed,
+                    Ordering::Relaxed,
+                ) {
+                    Ok(_) => {
+                        unsafe { (*slot.value.get()).write(value) };
+                        slot.sequence.store(pos.wrapping_add(1), Ordering::Release);
+                        return Ok(());
+                    }
+                    Err(current) => pos = current,
+                }
+            } else if lag < 0 {
+                // The slot still holds the value from one lap ago.
+                return Err(value);
+            } else {
+                pos = self.enqueue_pos.0.load(Ordering::Relaxed);
+            }
+        }
+    }
+
+    /// Dequeue the oldest value, if any.
+    pub fn pop(&self) -> Option<T> {
+        let mut pos = self.dequeue_pos.0.load(Ordering::Relaxed);
+        loop {
+            let slot = &self.slots[pos & self.mask];
+            let sequence = slot.sequence.load(Ordering::Acquire);
+            let lag = sequence.wrapping_sub(pos.wrapping_add(1)) as isize;
+            if lag == 0 {
+                match self.dequeue_pos.0.compare_exchange_weak(
+                    pos,
+                    pos.wrapping_add(1),
+                    Ordering::Relaxed,
+                    Ordering::Relaxed,
+                ) {
+                    Ok(_) => {
+                        let value = unsafe { (*slot.value.get()).assume_init_read() };
+                        slot.sequence
+                            .store(pos.wrapping_add(self.mask + 1), Ordering::Release);
+                        return Some(value);
+                    }
+                    Err(current) => pos = current,
+                }
+            } else if lag < 0 {
+                return None;
+            } else {
+                pos = self.dequeue_pos.0.load(Ordering::Relaxed);
+            }
+        }
+    }
+
+    pub fn capacity(&self) -> usize {
+        self.mask + 1
+    }
+
+    /// Approximate number of queued values; exact when no push/pop is in progress.
+    pub fn len(&self) -> usize {
+        let enqueued = self.enqueue_pos.0.load(Ordering::Relaxed);
+        let dequeued = self.dequeue_pos.0.load(Ordering::Relaxed);
+        enqueued.wrapping_sub(dequeued).min(self.capacity())
+    }
+
+    pub fn is_empty(&self) -> bool {
+        self.len() == 0
+    }
+}
+
+impl<T> Drop for RingBuffer<T> {
+    fn drop(&mut self) {
+        while self.pop().is_some() {}
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use std::sync::Arc;
+    use std::thread;
+
+    #[test]
+    fn rejects_pushes_when_full() {
+        let ring = RingBuffer::new(3);
+        assert_eq!(ring.capacity(), 4);
+        for i in 0..4 {
+            assert_eq!(ring.push(i), Ok(()));
+        }
+        assert_eq!(ring.push(4), Err(4));
+        assert_eq!(ring.len(), 4);
+        assert_eq!(ring.pop(), Some(0));
+        assert_eq!(ring.push(4), Ok(()));
+        let drained: Vec<_> = std::iter::from_fn(|| ring.pop()).collect();
+        assert_eq!(drained, vec![1, 2, 3, 4]);
+        assert!(ring.is_empty());
+    }
+
+    #[test]
+    fn concurrent_producers_lose_nothing_that_was_accepted() {
+        let ring = Arc::new(RingBuffer::new(1024));
+        let producers: Vec<_> = (0..4u64)
+            .map(|p| {
+                let ring = ring.clone();
+                thread::spawn(move || {
+                    let mut accepted = 0u64;
+                    for i in 0..10_000u64 {
+                        if ring.push(p * 1_000_000 + i).is_ok() {
+                            accepted += 1;
+                        }
+                    }
+                    accepted
+                })
+            })
+            .collect();
+        let mut received = 0u64;
+        let mut last_seen = [None::<u64>; 4];
+        let mut done = false;
+        while !done {
+            done = producers.iter().all(|h| h.is_finished());
+            while let Some(v) = ring.pop() {
+                let producer = (v / 1_000_000) as usize;
+                // Values from one producer come out in the order they went in.
+                assert!(last_seen[producer].map_or(true, |last| last < v));
+                last_seen[producer] = Some(v);
+                received += 1;
+            }
+        }
+        let accepted: u64 = producers.into_iter().map(|h| h.join().unwrap()).sum();
+        assert_eq!(received, accepted);
+    }
+
+    #[test]
+    fn drops_queued_values() {
+        let value = Arc::new(());
+        {
+            let ring = RingBuffer::new(4);
+            ring.push(value.clone()).unwrap();
+            ring.push(value.clone()).unwrap();
+            assert_eq!(Arc::strong_count(&value), 3);
+        }
+        assert_eq!(Arc::strong_count(&value), 1);
+    }
+}
@@ -0,0 +1,142 @@
+/// Route rules compiled once at config load.
+///
+/// Matching keeps the proxy's first-match semantics: among all rules that match a
+/// path (`exact` equality, or prefix match for `contain` and any other type), the
+/// one declared first wins. Both kinds live in one byte trie, so a lookup costs
+/// O(path length) regardless of how many rules exist.
+#[derive(Debug, Clone)]
+pub struct RouteTable {
+    nodes: Vec<TrieNode>,
+    len: usize,
+}
+
+#[derive(Debug, Clone, Default)]
+struct TrieNode {
+    // Sorted by byte for binary search; route paths have a small alphabet.
+    children: Vec<(u8, u32)>,
+    prefix_rule: Option<usize>,
+    exact_rule: Option<usize>,
+}
+
+impl RouteTable {
+    /// Build from `(rule.path, rule.type)` pairs in config order.
+    pub fn new<'a>(rules: impl IntoIterator<Item = (&'a str, &'a str)>) -> Self {
+        let mut table = RouteTable {
+            nodes: vec![TrieNode::default()],
+            len: 0,
+        };
+        for (idx, (path, rule_type)) in rules.into_iter().enumerate() {
+            table.len += 1;
+            let node = table.insert_path(path);
+            // Earlier rules keep precedence over later duplicates.
+            if rule_type == "exact" {
+                table.nodes[node].exact_rule.get_or_insert(idx);
+            } else {
+                table.nodes[node].prefix_rule.get_or_insert(idx);
+            }
+        }
+        table
+    }
+
+    fn insert_path(&mut self, path: &str) -> usize {
+        let mut node = 0usize;
+        for &b in path.as_bytes() {
+            node = match self.nodes[node].children.binary_search_by_key(&b, |(k, _)| *k) {
+                Ok(pos) => self.nodes[node].children[pos].1 as usize,
+                Err(pos) => {
+                    let next = self.nodes.len();
+                    self.nodes.push(TrieNode::default());
+                    self.nodes[node].children.insert(pos, (b, next as u32));
+                    next
+                }
+            };
+        }
+        node
+    }
+
+    /// Index of the first rule (in config order) matching `path`.
+    pub fn lookup(&self, path: &str) -> Option<usize> {
+        let mut best = self.nodes[0].prefix_rule;
+        let mut node = 0usize;
+        for &b in path.as_bytes() {
+            let children = &self.nodes[node].children;
+            match children.binary_search_by_key(&b, |(k, _)| *k) {
+                Ok(pos) => node = children[pos].1 as usize,
+                Err(_) => return best,
+            }
+            best = min_rule(best, self.nodes[node].prefix_rule);
+        }
+        min_rule(best, self.nodes[node].exact_rule)
+    }
+
+    pub fn len(&self) -> usize {
+        self.len
+    }
+
+    pub fn is_empty(&self) -> bool {
+        self.len == 0
+    }
+}
+
+impl Default for RouteTable {
+    fn default() -> Self {
+        Self::new(std::iter::empty())
+    }
+}
+
+fn min_rule(a: Option<usize>, b: Option<usize>) -> Option<usize> {
+    match (a, b) {
+        (Some(x), Some(y)) => Some(x.min(y)),
+        (x, None) => x,
+        (None, y) => y,
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn linear(rules: &[(&str, &str)], path: &str) -> Option<usize> {
+        rules.iter().position(|(p, t)| match *t {
+            "exact" => path == *p,
+            _ => path.starts_with(p),
+        })
+    }
+
+    #[test]
+    fn matches_linear_first_match_semantics() {
+        let rules = [
+            ("/api/v1/users", "exact"),
+            ("/api/v1", "contain"),
+            ("/api", "contain"),
+            ("/api/v1/users", "contain"),
+            ("/health", "exact"),
+            ("/", "contain"),
+            ("/api", "contain"),
+        ];
+        let table = RouteTable::new(rules.iter().copied());
+        for path in [
+            "/api/v1/users",
+            "/api/v1/users/7",
+            "/api/v1",
+            "/api/v2",
+            "/apix",
+            "/health",
+            "/healthz",
+            "/",
+            "",
+            "/other",
+        ] {
+            assert_eq!(table.lookup(path), linear(&rules, path), "path {}", path);
+        }
+    }
+
+    #[test]
+    fn no_match_without_catch_all() {
+        let table = RouteTable::new([("/a", "exact"), ("/b", "contain")]);
+        assert_eq!(table.lookup("/a/x"), None);
+        assert_eq!(table.lookup("/c"), None);
+        assert_eq!(table.lookup("/bb"), Some(1));
+        assert_eq!(table.len(), 2);
+    }
+}
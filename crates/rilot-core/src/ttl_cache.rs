@@ -0,0 +1,156 @@
+use std::borrow::Borrow;
+use std::collections::{BTreeMap, HashMap};
+use std::hash::Hash;
+use std::time::{Duration, Instant};
+
+/// Bounded map with a per-entry TTL and least-recently-used eviction.
+///
+/// Recency is tracked with a monotonically increasing tick per access, kept in a
+/// `BTreeMap` so the eviction victim is always the first entry. `get`/`insert` are
+/// O(log n). Callers pass `now` so time can be controlled in tests.
+#[derive(Debug)]
+pub struct TtlLru<K, V> {
+    capacity: usize,
+    ttl: Duration,
+    entries: HashMap<K, CacheEntry<V>>,
+    recency: BTreeMap<u64, K>,
+    tick: u64,
+    evictions: u64,
+}
+
+#[derive(Debug)]
+struct CacheEntry<V> {
+    value: V,
+    expires_at: Instant,
+    tick: u64,
+}
+
+impl<K: Hash + Eq + Clone, V> TtlLru<K, V> {
+    /// `capacity` is clamped to at least one entry.
+    pub fn new(capacity: usize, ttl: Duration) -> Self {
+        Self {
+            capacity: capacity.max(1),
+            ttl,
+            entries: HashMap::new(),
+            recency: BTreeMap::new(),
+            tick: 0,
+            evictions: 0,
+        }
+    }
+
+    /// Live value for `key`, marking it most recently used. Expired entries are dropped.
+    pub fn get<Q>(&mut self, key: &Q, now: Instant) -> Option<&V>
+    where
+        K: Borrow<Q>,
+        Q: Hash + Eq + ?Sized,
+    {
+        let (owned_key, expired) = match self.entries.get_key_value(key) {
+            None => return None,
+            Some((k, entry)) => (k.clone(), now >= entry.expires_at),
+        };
+        if expired {
+            self.remove(key);
+            return None;
+        }
+        self.tick += 1;
+        let tick = self.tick;
+        let entry = self.entries.get_mut(key)?;
+        self.recency.remove(&entry.tick);
+        self.recency.insert(tick, owned_key);
+        entry.tick = tick;
+        Some(&entry.value)
+    }
+
+    /// Insert or replace `key`, evicting the least recently used entry when full.
+    pub fn insert(&mut self, key: K, value: V, now: Instant) {
+        self.remove(&key);
+        while self.entries.len() >= self.capacity {
+            let Some((_, victim)) = self.recency.pop_first() else {
+                break;
+            };
+            self.entries.remove(&victim);
+            self.evictions += 1;
+        }
+        self.tick += 1;
+        self.recency.insert(self.tick, key.clone());
+        self.entries.insert(
+            key,
+            CacheEntry {
+                value,
+                expires_at: now + self.ttl,
+                tick: self.tick,
+            },
+        );
+    }
+
+    pub fn remove<Q>(&mut self, key: &Q) -> Option<V>
+    where
+        K: Borrow<Q>,
+        Q: Hash + Eq + ?Sized,
+    {
+        let entry = self.entries.remove(key)?;
+        self.recency.remove(&entry.tick);
+        Some(entry.value)
+    }
+
+    pub fn clear(&mut self) {
+        self.entries.clear();
+        self.recency.clear();
+    }
+
+    pub fn len(&self) -> usize {
+        self.entries.len()
+    }
+
+    pub fn is_empty(&self) -> bool {
+        self.entries.is_empty()
+    }
+
+    /// Entries dropped to make room, since creation.
+    pub fn evictions(&self) -> u64 {
+        self.evictions
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn expires_after_ttl() {
+        let start = Instant::now();
+        let mut cache = TtlLru::new(4, Duration::from_secs(10));
+        cache.insert("a", 1, start);
+        assert_eq!(cache.get(&"a", start + Duration::from_secs(9)), Some(&1));
+        assert_eq!(cache.get(&"a", start + Duration::from_secs(10)), None);
+        assert!(cache.is_empty());
+    }
+
+    #[test]
+    fn evicts_least_recently_used() {
+        let now = Instant::now();
+        let mut cache = TtlLru::new(2, Duration::from_secs(60));
+        cache.insert("a", 1, now);
+        cache.insert("b", 2, now);
+        // Touch `a` so `b` becomes the eviction victim.
+        assert_eq!(cache.get(&"a", now), Some(&1));
+        cache.insert("c", 3, now);
+        assert_eq!(cache.get(&"b", now), None);
+        assert_eq!(cache.get(&"a", now), Some(&1));
+        assert_eq!(cache.get(&"c", now), Some(&3));
+        assert_eq!(cache.len(), 2);
+        assert_eq!(cache.evictions(), 1);
+    }
+
+    #[test]
+    fn replacing_a_key_does_not_evict() {
+        let now = Instant::now();
+        let mut cache = TtlLru::new(2, Duration::from_secs(60));
+        cache.insert("a", 1, now);
+        cache.insert("b", 2, now);
+        cache.insert("a", 10, now);
+        assert_eq!(cache.len(), 2);
+        assert_eq!(cache.evictions(), 0);
+        assert_eq!(cache.get(&"a", now), Some(&10));
+    }
+}
@@ -273,6 +273,51 @@ def parse_prom_sum(text: str, metric_name: str, route_filter: str):
     return total, by_zone
 
 
+def parse_prom_histogram(text: str, metric_name: str, route_filter: str) -> dict:
+    """Cumulative `le` -> count for one histogram, summed over zones."""
+    buckets = {}
+    prefix = f"{metric_name}_bucket{{"
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line.startswith(prefix):
+            continue
+        if f'route="{route_filter}"' not in line:
+            continue
+        try:
+            val = float(line.rsplit(" ", 1)[1])
+        except Exception:
+            continue
+        labels = line.split("{", 1)[1].split("}", 1)[0]
+        for pair in labels.split(","):
+            if pair.startswith('le="'):
+                le = float(pair.split("=", 1)[1].strip('"'))
+                buckets[le] = buckets.get(le, 0.0) + val
+                break
+    return buckets
+
+
+def histogram_quantile(q: float, after: dict, before: Optional[dict] = None) -> Optional[float]:
+    """Quantile of the samples recorded between two cumulative bucket snapshots,
+    interpolated within the bucket like Prometheus `histogram_quantile`."""
+    before = before or {}
+    bounds = sorted(after)
+    counts = [max(after[le] - before.get(le, 0.0), 0.0) for le in bounds]
+    if not counts or counts[-1] <= 0:
+        return None
+    rank = q * counts[-1]
+    prev_bound, prev_count = 0.0, 0.0
+    for le, count in zip(bounds, counts):
+        if count >= rank:
+            if math.isinf(le):
+                return prev_bound
+            in_bucket = count - prev_count
+            if in_bucket <= 0:
+                return le
+            return prev_bound + (le - prev_bound) * (rank - prev_count) / in_bucket
+        prev_bound, prev_count = le, count
+    return prev_bound
+
+
 def percentile(values, p):
     if not values:
         return 0.0
@@ -718,7 +763,8 @@ def collect_rilot_metrics(route: str):
     req_total, req_by_zone = parse_prom_sum(metrics_text, "requests_total", route)
     co2e_total, _ = parse_prom_sum(metrics_text, "co2e_estimated_total", route)
     exposure_total, _ = parse_prom_sum(metrics_text, "carbon_intensity_exposure_total", route)
-    return metrics_text, req_total, req_by_zone, co2e_total, exposure_total
+    latency_buckets = parse_prom_histogram(metrics_text, "latency_ms", route)
+    return metrics_text, req_total, req_by_zone, co2e_total, exposure_total, latency_buckets
 
 
 def main():
@@ -806,9 +852,14 @@ def main():
             if not wait_http_ok(f"{RILOT_URL}/metrics"):
                 raise RuntimeError(f"rilot metrics not ready for mode={mode_name}")
 
-            _, req_total_before, req_by_zone_before, co2e_before, exposure_before = collect_rilot_metrics(
-                ROUTE_METRIC_FILTER
-            )
+            (
+                _,
+                req_total_before,
+                req_by_zone_before,
+                co2e_before,
+                exposure_before,
+                latency_buckets_before,
+            ) = collect_rilot_metrics(ROUTE_METRIC_FILTER)
             cpu_start_usec = read_cgroup_cpu_usage_usec()
             mem_peak_start = read_cgroup_memory_peak_bytes()
             start_wall = time.perf_counter()
@@ -823,9 +874,14 @@ def main():
             cpu_end_usec = read_cgroup_cpu_usage_usec()
             mem_peak_end = read_cgroup_memory_peak_bytes()
             mem_current_end = read_cgroup_memory_current_bytes()
-            metrics_text, req_total_after, req_by_zone_after, co2e_after, exposure_after = collect_rilot_metrics(
-                ROUTE_METRIC_FILTER
-            )
+            (
+                metrics_text,
+                req_total_after,
+                req_by_zone_after,
+                co2e_after,
+                exposure_after,
+                latency_buckets_after,
+            ) = collect_rilot_metrics(ROUTE_METRIC_FILTER)
             (out_dir / f"metrics-{mode_name}.prom").write_text(metrics_text, encoding="utf-8")
             req_total_delta = max(req_total_after - req_total_before, 0.0)
             co2e_total = max(co2e_after - co2e_before, 0.0)
@@ -861,6 +917,7 @@ def main():
                 "error_rate_percent": (req_stats["error_count"] / max(1, int(scenario_requests))) * 100.0,
                 "latency_avg_ms": (sum(lats) / len(lats)) if lats else 0.0,
                 "latency_p95_ms": percentile(lats, 95),
+                "proxy_latency_p95_ms": histogram_quantile(0.95, latency_buckets_after, latency_buckets_before),
                 "carbon_exposure_mean_g_per_kwh": mean_exposure,
                 "carbon_exposure_mean_source": (
                     "request_headers"
@@ -931,6 +988,7 @@ def main():
         "latency_avg_ms",
         "latency_p95_ms",
         "latency_p95_delta_ms_vs_baseline",
+        "proxy_latency_p95_ms",
         "cpu_percent_sample",
         "cpu_sample_method",
         "cpu_delta_percent_vs_baseline",
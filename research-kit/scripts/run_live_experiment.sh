@@ -59,6 +59,8 @@ cfg = json.loads(src.read_text(encoding="utf-8"))
 carbon = cfg.setdefault("carbon", {})
 carbon["provider"] = "electricitymap"
 carbon["cache_ttl_seconds"] = 0
+# The stand-in API serves every zone from /latest, so refresh them in one request.
+carbon.setdefault("electricitymap_multi_zone_path", "/latest")
 dst.write_text(json.dumps(cfg, indent=2) + "\n", encoding="utf-8")
 PY
 
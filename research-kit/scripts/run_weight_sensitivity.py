@@ -70,14 +70,34 @@ def send_requests():
             pass
 
 
-def collect_metrics():
+def fetch_metrics_text() -> str:
     with urllib.request.urlopen(f"{RILOT_URL}/metrics", timeout=5) as resp:
-        text = resp.read().decode("utf-8")
+        return resp.read().decode("utf-8")
+
+
+def collect_metrics():
+    text = fetch_metrics_text()
     req_total = parse_prom_sum(text, "requests_total", ROUTE)
     exposure_total = parse_prom_sum(text, "carbon_intensity_exposure_total", ROUTE)
     co2e_total = parse_prom_sum(text, "co2e_estimated_total", ROUTE)
-    mean_exposure = (exposure_total / req_total) if req_total > 0 else 0.0
-    return req_total, mean_exposure, co2e_total
+    return req_total, exposure_total, co2e_total
+
+
+def config_generation() -> int:
+    for line in fetch_metrics_text().splitlines():
+        if line.startswith("config_generation "):
+            return int(float(line.rsplit(" ", 1)[1]))
+    return 0
+
+
+def reload_config(attempts: int = 60, sleep_s: float = 0.5):
+    generation = config_generation()
+    run(COMPOSE + ["kill", "-s", "SIGHUP", "rilot"])
+    for _ in range(attempts):
+        if config_generation() > generation:
+            return True
+        time.sleep(sleep_s)
+    return False
 
 
 def main():
@@ -90,6 +110,7 @@ def main():
     original_config = CONFIG_PATH.read_text(encoding="utf-8")
     base_cfg = json.loads(original_config)
     rows = []
+    started = False
     try:
         run(COMPOSE + ["up", "-d", "us-east", "us-west"])
         for label, weights in WEIGHT_SETS:
@@ -102,11 +123,20 @@ def main():
                 policy["plugin_enabled"] = False
                 proxy["policy"] = policy
             CONFIG_PATH.write_text(json.dumps(cfg, indent=2) + "\n", encoding="utf-8")
-            run(COMPOSE + ["up", "-d", "--build", "rilot"])
-            if not wait_http_ok(f"{RILOT_URL}/metrics"):
-                raise RuntimeError(f"Rilot not ready for {label}")
+            # Build and start once; later weight sets are applied by config reload.
+            if not started:
+                run(COMPOSE + ["up", "-d", "--build", "rilot"])
+                if not wait_http_ok(f"{RILOT_URL}/metrics"):
+                    raise RuntimeError(f"Rilot not ready for {label}")
+                started = True
+            elif not reload_config():
+                raise RuntimeError(f"Rilot did not reload config for {label}")
+            # Counters survive reloads, so each profile is the difference.
+            before = collect_metrics()
             send_requests()
-            req_total, mean_exposure, co2e_total = collect_metrics()
+            after = collect_metrics()
+            req_total, exposure_total, co2e_total = (a - b for a, b in zip(after, before))
+            mean_exposure = (exposure_total / req_total) if req_total > 0 else 0.0
             rows.append(
                 {
                     "weight_profile": label,
@@ -0,0 +1,952 @@
+use once_cell::sync::Lazy;
+use reqwest::header::{HeaderName as ReqHeaderName, HeaderValue as ReqHeaderValue};
+use std::cell::Cell;
+use std::cmp::Reverse;
+use std::collections::HashMap;
+use std::path::{Path, PathBuf};
+use std::sync::atomic::{AtomicBool, AtomicU64, Ordering};
+use std::sync::{Arc, Mutex, RwLock};
+use std::time::{Duration, Instant, SystemTime, UNIX_EPOCH};
+use tokio::sync::Semaphore;
+use tokio::task::JoinHandle;
+
+use crate::config;
+use crate::metrics::{self, AtomicF64};
+
+static HTTP_CLIENT: Lazy<reqwest::Client> = Lazy::new(reqwest::Client::new);
+/// Retry delay after a refresh failed; the stale value keeps being served meanwhile.
+const REFRESH_RETRY_SECS: u64 = 1;
+/// Longest the scheduler sleeps before re-checking which targets are due.
+const SCHEDULER_IDLE_SECS: u64 = 1;
+/// Longest `prime` holds up startup or a reload before leaving the rest to the
+/// refresher.
+const PRIME_TIMEOUT_MS: u64 = 1000;
+/// How often `electricitymap-local` checks the fixture file for changes.
+const LOCAL_FIXTURE_CHECK_MS: u64 = 100;
+/// One signal read in this many is counted towards its target's demand, weighted by
+/// it, so the hot path rarely touches the shared counter.
+const DEMAND_SAMPLE_EVERY: u32 = 16;
+
+thread_local! {
+    /// Per-thread xorshift32 state picking which signal reads count as demand.
+    static DEMAND_SAMPLER: Cell<u32> = const { Cell::new(0x9E37_79B9) };
+}
+
+#[derive(Clone, Copy, PartialEq)]
+pub struct CarbonSignal {
+    pub current: Option<f64>,
+    pub forecast_next: Option<f64>,
+}
+
+#[derive(Clone, Copy)]
+struct CachedCarbon {
+    signal: CarbonSignal,
+    fetched_at: Instant,
+    expires_at: Instant,
+}
+
+/// Refresh bookkeeping for one zone, exported on `/metrics`.
+#[derive(Default)]
+pub struct RefreshStats {
+    pub refreshes_total: AtomicU64,
+    pub failures_total: AtomicU64,
+    pub last_duration_ms: AtomicF64,
+    /// How long the zone was served past `expires_at` before the last refresh landed.
+    pub last_lag_secs: AtomicF64,
+}
+
+/// Provider-wide counters, exported on `/metrics`.
+#[derive(Default)]
+pub struct ProviderStats {
+    /// Provider calls issued (one per target, or one per multi-zone batch).
+    pub fetches_total: AtomicU64,
+    /// Per-zone fetches avoided by shared zone-map targets or multi-zone responses.
+    pub coalesced_total: AtomicU64,
+    /// Fetches that had to wait for the request budget.
+    pub budget_waits_total: AtomicU64,
+}
+
+/// One provider fetch unit. For the ElectricityMap providers, local zones mapped to
+/// the same `electricitymap_zone_map` target share one, so they are fetched once.
+struct Target {
+    name: String,
+    /// Single-zone request URL, built once (`electricitymap` only).
+    url: String,
+    zones: Vec<usize>,
+    /// Sampled signal reads since the last refresh (see `DEMAND_SAMPLE_EVERY`); due
+    /// targets with more demand go first.
+    demand: AtomicU64,
+    in_flight: AtomicBool,
+    next_due: Mutex<Instant>,
+}
+
+/// Global provider request budget shared by every refresh.
+struct TokenBucket {
+    rate: f64,
+    burst: f64,
+    state: Mutex<(f64, Instant)>,
+}
+
+impl TokenBucket {
+    fn new(rate: f64, burst: u32) -> Self {
+        let burst = f64::from(burst.max(1));
+        Self {
+            rate,
+            burst,
+            state: Mutex::new((burst, Instant::now())),
+        }
+    }
+
+    /// Takes one token, waiting for the bucket to refill if needed. Returns whether it
+    /// had to wait. A non-positive rate disables the budget.
+    async fn acquire(&self) -> bool {
+        if self.rate <= 0.0 {
+            return false;
+        }
+        let mut waited = false;
+        loop {
+            let wait_secs = {
+                let mut state = self.state.lock().expect("token bucket lock poisoned");
+                let now = Instant::now();
+                let refill = now.duration_since(state.1).as_secs_f64() * self.rate;
+                state.0 = (state.0 + refill).min(self.burst);
+                state.1 = now;
+                if state.0 >= 1.0 {
+                    state.0 -= 1.0;
+                    return waited;
+                }
+                (1.0 - state.0) / self.rate
+            };
+            waited = true;
+            tokio::time::sleep(Duration::from_secs_f64(wait_secs)).await;
+        }
+    }
+}
+
+/// Per-zone carbon signal cache, indexed by the zone index assigned in
+/// `build_static_state`. Every slot is seeded at startup and refreshed ahead of
+/// expiry by a background scheduler, so the request path only ever reads a slot: a
+/// refresh that is late or fails leaves the previous (stale) value in place.
+///
+/// Refreshes go through one provider layer: a token bucket caps the provider request
+/// rate, a semaphore caps concurrent fetches, and when several targets are due at once
+/// the most-read ones are fetched first.
+pub struct CarbonSignals {
+    cfg: Arc<config::CarbonProviderConfig>,
+    pub zones: Vec<String>,
+    fallback: Vec<CarbonSignal>,
+    zone_target: Vec<usize>,
+    targets: Vec<Target>,
+    slots: Vec<RwLock<CachedCarbon>>,
+    pub stats: Vec<RefreshStats>,
+    pub provider_stats: ProviderStats,
+    budget: TokenBucket,
+    fan_out: Arc<Semaphore>,
+    auth: Option<(ReqHeaderName, ReqHeaderValue)>,
+    multi_zone_url: Option<String>,
+    local_fixture: Option<LocalFixture>,
+    /// Bumped whenever a zone's cached signal changes value.
+    version: AtomicU64,
+    jitter: Mutex<Jitter>,
+}
+
+impl CarbonSignals {
+    pub fn new(cfg: Arc<config::CarbonProviderConfig>, zones: Vec<String>) -> Self {
+        let now = Instant::now();
+        let electricitymap = cfg.provider.starts_with("electricitymap");
+
+        let mut targets: Vec<Target> = Vec::new();
+        let mut target_by_name: HashMap<String, usize> = HashMap::new();
+        let mut zone_target = Vec::with_capacity(zones.len());
+        for (zone_idx, zone) in zones.iter().enumerate() {
+            let name = if electricitymap {
+                cfg.electricitymap_zone_map
+                    .get(zone)
+                    .cloned()
+                    .unwrap_or_else(|| zone.clone())
+            } else {
+                zone.clone()
+            };
+            let target_idx = *target_by_name.entry(name.clone()).or_insert_with(|| {
+                targets.push(Target {
+                    url: electricitymap_latest_url(&cfg, &name),
+                    name,
+                    zones: Vec::new(),
+                    demand: AtomicU64::new(0),
+                    in_flight: AtomicBool::new(false),
+                    // Due immediately; `prime` replaces the seed before traffic arrives.
+                    next_due: Mutex::new(now),
+                });
+                targets.len() - 1
+            });
+            targets[target_idx].zones.push(zone_idx);
+            zone_target.push(target_idx);
+        }
+
+        let auth = cfg.electricitymap_api_key.as_ref().and_then(|api_key| {
+            match (
+                ReqHeaderName::from_bytes(cfg.electricitymap_api_token_header.as_bytes()),
+                ReqHeaderValue::from_str(api_key),
+            ) {
+                (Ok(name), Ok(value)) => Some((name, value)),
+                _ => {
+                    log::warn!(
+                        "electricitymap_auth_header_invalid=true header={}",
+                        cfg.electricitymap_api_token_header
+                    );
+                    None
+                }
+            }
+        });
+        let multi_zone_url = cfg
+            .electricitymap_multi_zone_path
+            .as_ref()
+            .filter(|_| cfg.provider == "electricitymap")
+            .map(|path| {
+                format!(
+                    "{}/{}",
+                    cfg.electricitymap_base_url.trim_end_matches('/'),
+                    path.trim_start_matches('/')
+                )
+            });
+
+        let local_fixture = if cfg.provider == "electricitymap-local" {
+            match cfg.electricitymap_local_fixture.as_ref() {
+                Some(path) => Some(LocalFixture::new(
+                    path,
+                    targets.iter().map(|t| t.name.clone()).collect(),
+                )),
+                None => {
+                    log::warn!("electricitymap_local_fixture_missing=true");
+                    None
+                }
+            }
+        } else {
+            None
+        };
+
+        let fallback: Vec<CarbonSignal> = zones
+            .iter()
+            .map(|zone| fallback_signal(zone, &cfg))
+            .collect();
+        let slots = fallback
+            .iter()
+            .map(|signal| {
+                RwLock::new(CachedCarbon {
+                    signal: *signal,
+                    fetched_at: now,
+                    expires_at: now,
+                })
+            })
+            .collect();
+        let stats = zones.iter().map(|_| RefreshStats::default()).collect();
+        Self {
+            budget: TokenBucket::new(cfg.provider_requests_per_second, cfg.provider_burst),
+            fan_out: Arc::new(Semaphore::new(cfg.provider_max_concurrency.max(1))),
+            jitter: Mutex::new(Jitter::new(zones.len() as u64)),
+            cfg,
+            zones,
+            fallback,
+            zone_target,
+            targets,
+            slots,
+            stats,
+            provider_stats: ProviderStats::default(),
+            version: AtomicU64::new(0),
+            auth,
+            multi_zone_url,
+            local_fixture,
+        }
+    }
+
+    fn live_reload(&self) -> bool {
+        self.cfg.provider == "electricitymap-local" && self.cfg.electricitymap_local_live_reload
+    }
+
+    fn ttl(&self) -> Duration {
+        Duration::from_secs(self.cfg.cache_ttl_seconds.max(1))
+    }
+
+    pub fn zone_idx(&self, name: &str) -> Option<usize> {
+        self.zones.iter().position(|zone| zone == name)
+    }
+
+    /// Latest signal for `zone_idx`, possibly stale. Never blocks on the provider.
+    pub fn get(&self, zone_idx: usize) -> CarbonSignal {
+        let target_idx = self.zone_target[zone_idx];
+        if self.live_reload() {
+            let signal = self.local_signal(target_idx);
+            return self.with_fallback(zone_idx, signal);
+        }
+        if sample_demand() {
+            self.targets[target_idx]
+                .demand
+                .fetch_add(DEMAND_SAMPLE_EVERY as u64, Ordering::Relaxed);
+        }
+        self.slot(zone_idx).signal
+    }
+
+    /// Changes whenever any zone's signal may have changed; lets callers cache work
+    /// derived from signals. With live reload this also picks up fixture edits.
+    pub fn version(&self) -> u64 {
+        let fixture_generation = match self.local_fixture.as_ref() {
+            Some(fixture) if self.live_reload() => {
+                fixture.reload_if_changed();
+                fixture.generation.load(Ordering::Acquire)
+            }
+            _ => 0,
+        };
+        self.version
+            .load(Ordering::Acquire)
+            .wrapping_add(fixture_generation)
+    }
+
+    fn local_signal(&self, target_idx: usize) -> Option<CarbonSignal> {
+        self.local_fixture.as_ref()?.signal(target_idx)
+    }
+
+    fn slot(&self, zone_idx: usize) -> CachedCarbon {
+        *self.slots[zone_idx]
+            .read()
+            .expect("carbon slot lock poisoned")
+    }
+
+    /// Fills fields the provider did not return from the zone's configured seed values.
+    fn with_fallback(&self, zone_idx: usize, signal: Option<CarbonSignal>) -> CarbonSignal {
+        let fallback = self.fallback[zone_idx];
+        match signal {
+            Some(signal) => CarbonSignal {
+                current: signal.current.or(fallback.current),
+                forecast_next: signal.forecast_next.or(fallback.forecast_next),
+            },
+            None => fallback,
+        }
+    }
+
+    pub fn ttl_left_secs(&self, zone_idx: usize) -> u64 {
+        if self.live_reload() {
+            return 0;
+        }
+        self.slot(zone_idx)
+            .expires_at
+            .checked_duration_since(Instant::now())
+            .map(|d| d.as_secs())
+            .unwrap_or(0)
+    }
+
+    /// `(age, staleness)` in seconds: time since the last successful fetch, and time
+    /// spent past `expires_at` (zero while fresh).
+    pub fn freshness_secs(&self, zone_idx: usize) -> (f64, f64) {
+        let entry = self.slot(zone_idx);
+        let now = Instant::now();
+        let age = now.saturating_duration_since(entry.fetched_at);
+        let staleness = now.saturating_duration_since(entry.expires_at);
+        (age.as_secs_f64(), staleness.as_secs_f64())
+    }
+
+    /// Refresh every target once through the provider budget, each fetch bounded by
+    /// `provider_timeout_ms`. Waits at most `PRIME_TIMEOUT_MS` (or one fetch, if
+    /// longer): targets not refreshed by then serve their seed values until the
+    /// refresher gets to them, so a tight budget cannot hold up startup or a reload.
+    pub async fn prime(self: &Arc<Self>) {
+        if self.live_reload() {
+            return;
+        }
+        let all = (0..self.targets.len()).collect();
+        let refresh_all = async {
+            for task in self.dispatch(all).await {
+                let _ = task.await;
+            }
+        };
+        let deadline = self.cfg.provider_timeout_ms.max(PRIME_TIMEOUT_MS);
+        if tokio::time::timeout(Duration::from_millis(deadline), refresh_all)
+            .await
+            .is_err()
+        {
+            log::warn!("carbon_prime_timeout=true timeout_ms={}", deadline);
+        }
+    }
+
+    /// Background scheduler: each target is refetched `refresh_ahead_ratio` of the way
+    /// through its TTL, minus up to `refresh_jitter_ratio` of it so targets do not
+    /// refresh in lockstep. It stops once nothing else holds the signals, i.e. after a
+    /// config reload replaced them and the last request using them finished.
+    pub fn spawn_refresher(self: &Arc<Self>) {
+        if self.live_reload() {
+            return;
+        }
+        let signals = self.clone();
+        tokio::spawn(async move {
+            loop {
+                if Arc::strong_count(&signals) == 1 {
+                    return;
+                }
+                let now = Instant::now();
+                let mut wake_at = now + Duration::from_secs(SCHEDULER_IDLE_SECS);
+                let mut idle = Vec::new();
+                let mut due = Vec::new();
+                for (target_idx, target) in signals.targets.iter().enumerate() {
+                    if target.in_flight.load(Ordering::Acquire) {
+                        continue;
+                    }
+                    idle.push(target_idx);
+                    let next_due = *target.next_due.lock().expect("carbon target lock poisoned");
+                    if next_due <= now {
+                        due.push(target_idx);
+                    } else {
+                        wake_at = wake_at.min(next_due);
+                    }
+                }
+                if due.is_empty() {
+                    tokio::time::sleep_until(tokio::time::Instant::from_std(wake_at)).await;
+                    continue;
+                }
+                // One multi-zone response covers every idle target for the same cost.
+                let batch = if signals.multi_zone_url.is_some() {
+                    idle
+                } else {
+                    due
+                };
+                signals.dispatch(batch).await;
+            }
+        });
+    }
+
+    /// Starts fetches for `target_idxs`, highest demand first, each taking a budget
+    /// token and a fan-out permit before it is spawned.
+    async fn dispatch(self: &Arc<Self>, target_idxs: Vec<usize>) -> Vec<JoinHandle<()>> {
+        let target_idxs = self.by_demand(target_idxs);
+        let batches: Vec<Vec<usize>> = if self.multi_zone_url.is_some() {
+            vec![target_idxs]
+        } else {
+            target_idxs.into_iter().map(|t| vec![t]).collect()
+        };
+
+        let mut tasks = Vec::with_capacity(batches.len());
+        for batch in batches {
+            if self.budget.acquire().await {
+                self.provider_stats
+                    .budget_waits_total
+                    .fetch_add(1, Ordering::Relaxed);
+            }
+            let permit = self
+                .fan_out
+                .clone()
+                .acquire_owned()
+                .await
+                .expect("carbon provider semaphore closed");
+            for &target_idx in &batch {
+                self.targets[target_idx]
+                    .in_flight
+                    .store(true, Ordering::Release);
+            }
+            let signals = self.clone();
+            tasks.push(tokio::spawn(async move {
+                signals.refresh_batch(&batch).await;
+                drop(permit);
+            }));
+        }
+        tasks
+    }
+
+    fn by_demand(&self, mut target_idxs: Vec<usize>) -> Vec<usize> {
+        target_idxs.sort_by_key(|&t| Reverse(self.targets[t].demand.load(Ordering::Relaxed)));
+        target_idxs
+    }
+
+    /// Fetch a batch of targets with one provider call and swap the slots of every zone
+    /// they feed. On timeout or provider failure the previous values stay in place.
+    async fn refresh_batch(&self, batch: &[usize]) {
+        let started = Instant::now();
+        let fetch = tokio::time::timeout(
+            Duration::from_millis(self.cfg.provider_timeout_ms),
+            self.fetch_batch(batch),
+        )
+        .await;
+        let finished = Instant::now();
+        let duration_ms = finished.duration_since(started).as_secs_f64() * 1000.0;
+
+        let results = fetch.unwrap_or_else(|_| {
+            for &target_idx in batch {
+                log::warn!(
+                    "carbon_provider_timeout=true zone={}",
+                    self.targets[target_idx].name
+                );
+            }
+            vec![None; batch.len()]
+        });
+        let zones_fed: usize = batch.iter().map(|&t| self.targets[t].zones.len()).sum();
+        self.provider_stats
+            .fetches_total
+            .fetch_add(1, Ordering::Relaxed);
+        self.provider_stats
+            .coalesced_total
+            .fetch_add(zones_fed.saturating_sub(1) as u64, Ordering::Relaxed);
+
+        for (&target_idx, signal) in batch.iter().zip(results) {
+            let target = &self.targets[target_idx];
+            for &zone_idx in &target.zones {
+                self.store(zone_idx, signal, duration_ms, finished);
+            }
+            let next_due = if signal.is_some() {
+                self.next_refresh_at(finished)
+            } else {
+                finished + Duration::from_secs(REFRESH_RETRY_SECS)
+            };
+            *target.next_due.lock().expect("carbon target lock poisoned") = next_due;
+            target.demand.store(0, Ordering::Relaxed);
+            target.in_flight.store(false, Ordering::Release);
+        }
+    }
+
+    fn store(
+        &self,
+        zone_idx: usize,
+        signal: Option<CarbonSignal>,
+        duration_ms: f64,
+        finished: Instant,
+    ) {
+        let stats = &self.stats[zone_idx];
+        stats.refreshes_total.fetch_add(1, Ordering::Relaxed);
+        stats.last_duration_ms.store(duration_ms);
+        if signal.is_none() {
+            stats.failures_total.fetch_add(1, Ordering::Relaxed);
+            return;
+        }
+        let signal = self.with_fallback(zone_idx, signal);
+        let mut slot = self.slots[zone_idx]
+            .write()
+            .expect("carbon slot lock poisoned");
+        let lag = finished.saturating_duration_since(slot.expires_at);
+        stats.last_lag_secs.store(lag.as_secs_f64());
+        if slot.signal != signal {
+            self.version.fetch_add(1, Ordering::Release);
+        }
+        *slot = CachedCarbon {
+            signal,
+            fetched_at: finished,
+            expires_at: finished + self.ttl(),
+        };
+    }
+
+    fn next_refresh_at(&self, fetched_at: Instant) -> Instant {
+        let ttl = self.ttl().as_secs_f64();
+        let ahead = self.cfg.refresh_ahead_ratio.clamp(0.05, 1.0);
+        let spread = self.cfg.refresh_jitter_ratio.clamp(0.0, ahead);
+        let unit = self
+            .jitter
+            .lock()
+            .expect("carbon jitter lock poisoned")
+            .next_unit();
+        let delay = ttl * ahead - ttl * spread * unit;
+        fetched_at + Duration::from_secs_f64(delay.max(0.0))
+    }
+
+    async fn fetch_batch(&self, batch: &[usize]) -> Vec<Option<CarbonSignal>> {
+        if let Some(url) = self.multi_zone_url.as_ref() {
+            return self.fetch_electricitymap_multi_zone(url, batch).await;
+        }
+        let mut results = Vec::with_capacity(batch.len());
+        for &target_idx in batch {
+            results.push(self.fetch_target(target_idx).await);
+        }
+        results
+    }
+
+    async fn fetch_target(&self, target_idx: usize) -> Option<CarbonSignal> {
+        let target = &self.targets[target_idx];
+        // Keep this async so providers can be swapped without changing the hot path.
+        match self.cfg.provider.as_str() {
+            "electricitymap" => self.fetch_electricitymap_signal(target).await,
+            "electricitymap-local" => self.local_signal(target_idx),
+            _ => Some(fetch_config_signal(&target.name, &self.cfg).await),
+        }
+    }
+
+    async fn fetch_electricitymap_signal(&self, target: &Target) -> Option<CarbonSignal> {
+        let data = self.electricitymap_get(&target.url, &target.name).await?;
+        Some(parse_intensity(&data))
+    }
+
+    /// One request for the whole batch. The response is a zone document in the
+    /// fixture layout: `{"zones": {"<zone>": {"carbonIntensity": ..., ...}}}`.
+    async fn fetch_electricitymap_multi_zone(
+        &self,
+        url: &str,
+        batch: &[usize],
+    ) -> Vec<Option<CarbonSignal>> {
+        let Some(doc) = self.electricitymap_get(url, "*").await else {
+            return vec![None; batch.len()];
+        };
+        let zones = doc.get("zones");
+        batch
+            .iter()
+            .map(|&target_idx| {
+                let name = &self.targets[target_idx].name;
+                let signal = zones.and_then(|z| z.get(name)).map(parse_intensity);
+                if signal.is_none() {
+                    log::warn!("electricitymap_zone_missing=true zone={}", name);
+                }
+                signal
+            })
+            .collect()
+    }
+
+    async fn electricitymap_get(&self, url: &str, zone: &str) -> Option<serde_json::Value> {
+        if self.cfg.electricitymap_api_key.is_none() {
+            log::warn!("electricitymap_api_key_missing=true zone={}", zone);
+            return None;
+        }
+        let mut request = HTTP_CLIENT.get(url);
+        if let Some((name, value)) = self.auth.as_ref() {
+            request = request.header(name.clone(), value.clone());
+        }
+
+        let Ok(resp) = request.send().await else {
+            log::warn!("electricitymap_request_failed=true zone={}", zone);
+            return None;
+        };
+        let status = resp.status();
+        if !status.is_success() {
+            log::warn!(
+                "electricitymap_status_failed=true zone={} status={}",
+                zone,
+                status.as_u16()
+            );
+            return None;
+        }
+        let Ok(data) = resp.json::<serde_json::Value>().await else {
+            log::warn!("electricitymap_parse_failed=true zone={}", zone);
+            return None;
+        };
+        Some(data)
+    }
+}
+
+fn fallback_signal(zone: &str, cfg: &config::CarbonProviderConfig) -> CarbonSignal {
+    CarbonSignal {
+        current: cfg
+            .zone_current
+            .get(zone)
+            .copied()
+            .or(Some(cfg.default_carbon_intensity)),
+        forecast_next: cfg.zone_forecast_next.get(zone).copied(),
+    }
+}
+
+// ElectricityMap API:
+// GET /v3/carbon-intensity/latest?zone=<ZONE>&disableEstimations=<bool>
+// Expected fields read from response JSON:
+// - carbonIntensity
+// - carbonIntensityForecast (optional)
+fn electricitymap_latest_url(cfg: &config::CarbonProviderConfig, external_zone: &str) -> String {
+    let base = cfg.electricitymap_base_url.trim_end_matches('/');
+    let disable_estimations = if cfg.electricitymap_disable_estimations {
+        "true"
+    } else {
+        "false"
+    };
+    format!(
+        "{}/v3/carbon-intensity/latest?zone={}&disableEstimations={}",
+        base, external_zone, disable_estimations
+    )
+}
+
+fn parse_intensity(zone_obj: &serde_json::Value) -> CarbonSignal {
+    let number = |key: &str| {
+        zone_obj
+            .get(key)
+            .and_then(|v| v.as_f64().or_else(|| v.as_i64().map(|i| i as f64)))
+    };
+    CarbonSignal {
+        current: number("carbonIntensity"),
+        forecast_next: number("carbonIntensityForecast"),
+    }
+}
+
+/// `mock`, `slow-mock` and static providers, all driven by the configured zone values.
+async fn fetch_config_signal(zone: &str, cfg: &config::CarbonProviderConfig) -> CarbonSignal {
+    if cfg.provider == "slow-mock" {
+        tokio::time::sleep(Duration::from_millis(cfg.provider_timeout_ms + 10)).await;
+    }
+    let seed = fallback_signal(zone, cfg);
+
+    if cfg.provider == "mock" || cfg.provider == "slow-mock" {
+        let epoch_secs = SystemTime::now()
+            .duration_since(UNIX_EPOCH)
+            .map(|d| d.as_secs_f64())
+            .unwrap_or(0.0);
+        let wave = (epoch_secs / 300.0).sin() * 0.08;
+        let current = seed.current.map(|v| (v * (1.0 + wave)).max(0.0));
+        let forecast_next = seed
+            .forecast_next
+            .or_else(|| current.map(|c| (c * 0.92).max(0.0)));
+        CarbonSignal {
+            current,
+            forecast_next,
+        }
+    } else {
+        seed
+    }
+}
+
+/// `electricitymap_local_fixture` parsed into one signal per fetch target. The file is
+/// re-read only when its mtime or size changes (checked at most every
+/// `LOCAL_FIXTURE_CHECK_MS`), and a reload swaps the whole table at once, so readers
+/// never see a half-applied fixture.
+struct LocalFixture {
+    path: PathBuf,
+    target_names: Vec<String>,
+    table: RwLock<Arc<LocalTable>>,
+    last_checked_ms: AtomicU64,
+    /// Number of reloads so far.
+    generation: AtomicU64,
+}
+
+struct LocalTable {
+    stamp: Option<(SystemTime, u64)>,
+    /// Indexed by target; `None` while the fixture is unreadable.
+    signals: Option<Vec<CarbonSignal>>,
+}
+
+impl LocalFixture {
+    fn new(path: &str, target_names: Vec<String>) -> Self {
+        let path = PathBuf::from(path);
+        let table = load_local_table(&path, &target_names);
+        Self {
+            path,
+            target_names,
+            table: RwLock::new(Arc::new(table)),
+            last_checked_ms: AtomicU64::new(metrics::monotonic_ms()),
+            generation: AtomicU64::new(0),
+        }
+    }
+
+    fn signal(&self, target_idx: usize) -> Option<CarbonSignal> {
+        self.reload_if_changed();
+        let table = self.table.read().expect("local fixture lock poisoned");
+        table.signals.as_ref().map(|signals| signals[target_idx])
+    }
+
+    fn reload_if_changed(&self) {
+        let now = metrics::monotonic_ms();
+        let last = self.last_checked_ms.load(Ordering::Relaxed);
+        if now.saturating_sub(last) < LOCAL_FIXTURE_CHECK_MS {
+            return;
+        }
+        // One caller per interval does the stat; everyone else keeps reading.
+        if self
+            .last_checked_ms
+            .compare_exchange(last, now, Ordering::AcqRel, Ordering::Relaxed)
+            .is_err()
+        {
+            return;
+        }
+        let stamp = file_stamp(&self.path);
+        let current = self
+            .table
+            .read()
+            .expect("local fixture lock poisoned")
+            .stamp;
+        if stamp == current {
+            return;
+        }
+        let table = Arc::new(load_local_table(&self.path, &self.target_names));
+        *self.table.write().expect("local fixture lock poisoned") = table;
+        self.generation.fetch_add(1, Ordering::Release);
+    }
+}
+
+fn file_stamp(path: &Path) -> Option<(SystemTime, u64)> {
+    let meta = std::fs::metadata(path).ok()?;
+    Some((meta.modified().ok()?, meta.len()))
+}
+
+fn load_local_table(path: &Path, target_names: &[String]) -> LocalTable {
+    let stamp = file_stamp(path);
+    let parsed = std::fs::read_to_string(path)
+        .ok()
+        .and_then(|txt| serde_json::from_str::<serde_json::Value>(&txt).ok());
+    let Some(doc) = parsed else {
+        log::warn!(
+            "electricitymap_local_fixture_parse_failed=true path={}",
+            path.display()
+        );
+        return LocalTable {
+            stamp,
+            signals: None,
+        };
+    };
+
+    // Fixture can be either:
+    // 1) {"carbonIntensity": ..., "carbonIntensityForecast": ...}
+    // 2) {"zones": {"<zone>": {"carbonIntensity": ..., "carbonIntensityForecast": ...}}}
+    let signals = target_names
+        .iter()
+        .map(|name| {
+            let zone_obj = doc
+                .get("zones")
+                .and_then(|zones| zones.get(name))
+                .unwrap_or(&doc);
+            parse_intensity(zone_obj)
+        })
+        .collect();
+    LocalTable {
+        stamp,
+        signals: Some(signals),
+    }
+}
+
+/// Whether this signal read counts towards demand; true for about one read in
+/// `DEMAND_SAMPLE_EVERY`. Random rather than every Nth read so a fixed candidate order
+/// doesn't always land the count on the same zone.
+fn sample_demand() -> bool {
+    DEMAND_SAMPLER.with(|state| {
+        let mut x = state.get();
+        x ^= x << 13;
+        x ^= x >> 17;
+        x ^= x << 5;
+        state.set(x);
+        x % DEMAND_SAMPLE_EVERY == 0
+    })
+}
+
+/// xorshift64 seeded from the clock; only used to spread refresh times.
+struct Jitter(u64);
+
+impl Jitter {
+    fn new(salt: u64) -> Self {
+        let nanos = SystemTime::now()
+            .duration_since(UNIX_EPOCH)
+            .map(|d| d.subsec_nanos() as u64)
+            .unwrap_or(0);
+        Self((nanos ^ salt.wrapping_mul(0x9E37_79B9_7F4A_7C15)) | 1)
+    }
+
+    /// Uniform-ish value in `[0, 1)`.
+    fn next_unit(&mut self) -> f64 {
+        self.0 ^= self.0 << 13;
+        self.0 ^= self.0 >> 7;
+        self.0 ^= self.0 << 17;
+        (self.0 >> 11) as f64 / (1u64 << 53) as f64
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn signals(cfg: config::CarbonProviderConfig, zones: &[&str]) -> Arc<CarbonSignals> {
+        let zones = zones.iter().map(|z| z.to_string()).collect();
+        Arc::new(CarbonSignals::new(Arc::new(cfg), zones))
+    }
+
+    #[tokio::test]
+    async fn token_bucket_spends_its_burst_then_waits_for_refill() {
+        let bucket = TokenBucket::new(50.0, 2);
+        assert!(!bucket.acquire().await);
+        assert!(!bucket.acquire().await);
+        let started = Instant::now();
+        assert!(bucket.acquire().await);
+        assert!(started.elapsed() >= Duration::from_millis(15));
+        assert!(!TokenBucket::new(0.0, 1).acquire().await);
+    }
+
+    #[tokio::test]
+    async fn dispatch_counts_budget_waits_and_serves_the_most_read_first() {
+        let cfg = config::CarbonProviderConfig {
+            provider_requests_per_second: 100.0,
+            provider_burst: 1,
+            ..config::CarbonProviderConfig::default()
+        };
+        let signals = signals(cfg, &["east", "west", "north"]);
+        // Demand is sampled, so read often enough for the order to be certain.
+        for _ in 0..200 {
+            signals.get(1);
+        }
+        for _ in 0..2000 {
+            signals.get(2);
+        }
+        let demand = signals.targets[2].demand.load(Ordering::Relaxed);
+        assert!((1000..3000).contains(&demand), "demand {demand}");
+        assert_eq!(signals.by_demand(vec![0, 1, 2]), vec![2, 1, 0]);
+
+        for task in signals.dispatch(vec![0, 1, 2]).await {
+            task.await.unwrap();
+        }
+        let stats = &signals.provider_stats;
+        assert_eq!(stats.fetches_total.load(Ordering::Relaxed), 3);
+        assert_eq!(stats.budget_waits_total.load(Ordering::Relaxed), 2);
+        // A refresh resets the demand it was ordered by.
+        assert!(signals
+            .targets
+            .iter()
+            .all(|t| t.demand.load(Ordering::Relaxed) == 0));
+    }
+
+    #[tokio::test]
+    async fn priming_gives_up_on_a_budget_too_slow_for_every_target() {
+        let cfg = config::CarbonProviderConfig {
+            provider_requests_per_second: 0.5,
+            provider_burst: 1,
+            ..config::CarbonProviderConfig::default()
+        };
+        let signals = signals(cfg, &["east", "west", "north"]);
+        let started = Instant::now();
+        signals.prime().await;
+        // All three would need 4s of budget.
+        let elapsed = started.elapsed();
+        assert!(elapsed >= Duration::from_millis(PRIME_TIMEOUT_MS));
+        assert!(elapsed < Duration::from_millis(PRIME_TIMEOUT_MS + 500));
+        assert_eq!(
+            signals.provider_stats.fetches_total.load(Ordering::Relaxed),
+            1
+        );
+    }
+
+    #[test]
+    fn refreshes_are_scheduled_ahead_of_expiry_within_the_jitter() {
+        let cfg = config::CarbonProviderConfig {
+            cache_ttl_seconds: 100,
+            refresh_ahead_ratio: 0.8,
+            refresh_jitter_ratio: 0.2,
+            ..config::CarbonProviderConfig::default()
+        };
+        let signals = signals(cfg, &["east"]);
+        let fetched_at = Instant::now();
+        let delays: Vec<_> = (0..1000)
+            .map(|_| signals.next_refresh_at(fetched_at) - fetched_at)
+            .collect();
+        let (earliest, latest) = (Duration::from_secs(60), Duration::from_secs(80));
+        assert!(delays.iter().all(|d| *d >= earliest && *d <= latest));
+        // Jittered, not in lockstep.
+        assert!(delays.iter().any(|d| *d != delays[0]));
+    }
+
+    #[test]
+    fn rewriting_the_local_fixture_bumps_the_version() {
+        let dir = std::env::temp_dir().join(format!("rilot-carbon-fixture-{}", std::process::id()));
+        std::fs::create_dir_all(&dir).unwrap();
+        let path = dir.join("fixture.json");
+        std::fs::write(&path, r#"{"zones": {"east": {"carbonIntensity": 100}}}"#).unwrap();
+        let cfg = config::CarbonProviderConfig {
+            provider: "electricitymap-local".to_string(),
+            electricitymap_local_fixture: Some(path.display().to_string()),
+            electricitymap_local_live_reload: true,
+            ..config::CarbonProviderConfig::default()
+        };
+        let signals = signals(cfg, &["east"]);
+        let version = signals.version();
+        assert_eq!(signals.get(0).current, Some(100.0));
+
+        std::fs::write(&path, r#"{"zones": {"east": {"carbonIntensity": 250.5}}}"#).unwrap();
+        std::thread::sleep(Duration::from_millis(LOCAL_FIXTURE_CHECK_MS + 10));
+        assert_ne!(signals.version(), version);
+        assert_eq!(signals.get(0).current, Some(250.5));
+        // Unchanged file: no reload on the next check.
+        let version = signals.version();
+        std::thread::sleep(Duration::from_millis(LOCAL_FIXTURE_CHECK_MS + 10));
+        assert_eq!(signals.version(), version);
+        std::fs::remove_dir_all(&dir).unwrap();
+    }
+}
@@ -0,0 +1,488 @@
+use std::sync::atomic::{AtomicBool, AtomicU64, AtomicUsize, Ordering};
+use std::sync::Arc;
+use std::time::Duration;
+use tokio::sync::Notify;
+
+use crate::config::ConcurrencyConfig;
+use crate::metrics::{monotonic_ms, AtomicF64};
+
+/// Weight of each new sample in a zone's baseline latency.
+const BASELINE_ALPHA: f64 = 0.05;
+/// How often the scheduler lag is sampled, and the weight of each sample.
+const LAG_SAMPLE_MS: u64 = 10;
+const LAG_ALPHA: f64 = 0.3;
+
+/// Route classes in priority order, as the `class` label of the per-class metrics.
+pub const CLASSES: [&str; 3] = ["strict-local", "flexible", "background"];
+
+/// Index into [`CLASSES`]; an unknown class counts as `flexible`, the class
+/// `rilot_core::classify_route` falls back to.
+pub fn class_index(route_class: &str) -> usize {
+    CLASSES.iter().position(|c| *c == route_class).unwrap_or(1)
+}
+
+/// Admission counters for one route class, across zones.
+#[derive(Default)]
+pub struct ClassStats {
+    pub waiting: AtomicUsize,
+    pub queued_total: AtomicU64,
+    /// Shed at a zone's limit: no room in the class's share of the queue, or no
+    /// slot within `max_wait_ms`.
+    pub shed_total: AtomicU64,
+    /// Shed on arrival because the scheduler lag passed the class's threshold.
+    pub lag_shed_total: AtomicU64,
+}
+
+/// One zone's limit and wait queue. Read lock-free by routing and `/metrics`.
+pub struct ZoneLimit {
+    limit: AtomicF64,
+    ceiling: usize,
+    /// Moving average of response latency; `0` until the first sample.
+    baseline_ms: AtomicF64,
+    last_backoff_ms: AtomicU64,
+    /// Whether routing should treat the zone as full: at its limit with no queue room.
+    saturated: AtomicBool,
+    /// One wake-up channel per class, so a freed slot goes to the highest class
+    /// waiting for it.
+    released: [Notify; 3],
+    class_waiting: [AtomicUsize; 3],
+    pub waiting: AtomicUsize,
+    pub queued_total: AtomicU64,
+    pub shed_total: AtomicU64,
+    pub backoffs_total: AtomicU64,
+}
+
+impl ZoneLimit {
+    fn new(ceiling: usize) -> Self {
+        Self {
+            limit: AtomicF64::new(ceiling as f64),
+            ceiling,
+            baseline_ms: AtomicF64::default(),
+            last_backoff_ms: AtomicU64::new(0),
+            saturated: AtomicBool::new(false),
+            released: Default::default(),
+            class_waiting: Default::default(),
+            waiting: AtomicUsize::new(0),
+            queued_total: AtomicU64::new(0),
+            shed_total: AtomicU64::new(0),
+            backoffs_total: AtomicU64::new(0),
+        }
+    }
+
+    pub fn limit(&self) -> usize {
+        (self.limit.load() as usize).clamp(1, self.ceiling.max(1))
+    }
+
+    /// Wakes a waiter of the highest class in the queue. With none seen, every
+    /// class keeps a permit for a waiter about to sleep.
+    fn wake(&self) {
+        match (0..CLASSES.len()).find(|c| self.class_waiting[*c].load(Ordering::Acquire) > 0) {
+            Some(class) => self.released[class].notify_one(),
+            None => self.released.iter().for_each(Notify::notify_one),
+        }
+    }
+}
+
+/// Per-zone adaptive concurrency limits, indexed like the metrics matrix zones.
+///
+/// Every zone gets a limit that starts at its `max_in_flight` (or
+/// `default_max_in_flight`) and moves by AIMD: each
+/// request that answers within `latency_tolerance` times the zone's baseline latency
+/// raises it by `1 / limit` (about one per limit's worth of requests), while a
+/// failure or a slower answer multiplies it by `backoff_ratio`, at most once per
+/// baseline latency so one burst counts once. A request finding the zone at its
+/// limit waits up to `max_wait_ms` for a slot in a queue of `max_queue_per_zone`.
+///
+/// While a higher route class is queued for a zone, lower classes may only fill
+/// their `class_weights` share of its limit; alone, a class can use all of it. Each
+/// class may only take its share of the queue, so under load background requests
+/// queue and shed first, then flexible ones, while strict-local requests keep the
+/// whole zone. With
+/// `max_scheduler_lag_ms` set, lower classes are also shed on arrival when the
+/// runtime falls behind.
+///
+/// Slots are the zone's in-flight counter in the metrics matrix, passed in by the
+/// caller, so the limit and the `in_flight` routing signal never disagree.
+pub struct ConcurrencyLimits {
+    zones: Vec<Option<ZoneLimit>>,
+    ceilings: Vec<Option<usize>>,
+    weights: [f64; 3],
+    pub classes: [ClassStats; 3],
+    /// Moving average of how late the lag sampler wakes up.
+    lag_ms: AtomicF64,
+    config: ConcurrencyConfig,
+}
+
+impl ConcurrencyLimits {
+    /// `ceilings[zone]` is the zone's `max_in_flight`; `None` falls back to
+    /// `default_max_in_flight`, and leaves the zone unlimited when that is `0`.
+    pub fn new(ceilings: &[Option<usize>], config: &ConcurrencyConfig) -> Self {
+        let default_ceiling =
+            (config.default_max_in_flight > 0).then_some(config.default_max_in_flight);
+        Self {
+            zones: ceilings
+                .iter()
+                .map(|c| c.or(default_ceiling).map(ZoneLimit::new))
+                .collect(),
+            ceilings: ceilings.to_vec(),
+            weights: [
+                config.class_weights.strict_local,
+                config.class_weights.flexible,
+                config.class_weights.background,
+            ],
+            classes: Default::default(),
+            lag_ms: AtomicF64::default(),
+            config: config.clone(),
+        }
+    }
+
+    pub fn ceilings(&self) -> &[Option<usize>] {
+        &self.ceilings
+    }
+
+    pub fn zone(&self, zone_idx: usize) -> Option<&ZoneLimit> {
+        self.zones.get(zone_idx).and_then(Option::as_ref)
+    }
+
+    /// Whether routing should skip the zone: it is at its limit and nobody else may
+    /// queue for it.
+    pub fn is_saturated(&self, zone_idx: usize) -> bool {
+        self.zone(zone_idx)
+            .map_or(false, |z| z.saturated.load(Ordering::Relaxed))
+    }
+
+    pub fn scheduler_lag_ms(&self) -> f64 {
+        self.lag_ms.load()
+    }
+
+    /// The part of `n` (slots or queue places) that `class` may use.
+    fn share(&self, n: usize, class: usize) -> usize {
+        (n as f64 * self.weights[class]).ceil() as usize
+    }
+
+    /// Whether a request of `class` may start under the current scheduler lag.
+    /// Classes weighted below `1` are shed once the lag passes their weight times
+    /// `max_scheduler_lag_ms`; strict-local traffic is never shed for lag alone.
+    pub fn admits_class(&self, class: usize) -> bool {
+        let Some(max_lag_ms) = self.config.max_scheduler_lag_ms else {
+            return true;
+        };
+        let weight = self.weights[class];
+        if weight >= 1.0 || self.lag_ms.load() <= weight * max_lag_ms as f64 {
+            return true;
+        }
+        self.classes[class]
+            .lag_shed_total
+            .fetch_add(1, Ordering::Relaxed);
+        false
+    }
+
+    /// Takes a slot on `in_flight` if the zone is below its limit, or below the
+    /// class's share of it while a higher class is queued.
+    pub fn try_acquire(&self, zone_idx: usize, class: usize, in_flight: &AtomicUsize) -> bool {
+        let Some(zone) = self.zone(zone_idx) else {
+            in_flight.fetch_add(1, Ordering::Relaxed);
+            return true;
+        };
+        let higher_waiting = zone.class_waiting[..class]
+            .iter()
+            .any(|w| w.load(Ordering::Acquire) > 0);
+        let limit = if higher_waiting {
+            self.share(zone.limit(), class).max(1)
+        } else {
+            zone.limit()
+        };
+        in_flight
+            .fetch_update(Ordering::AcqRel, Ordering::Relaxed, |v| {
+                (v < limit).then_some(v + 1)
+            })
+            .is_ok()
+    }
+
+    /// Like [`ConcurrencyLimits::try_acquire`], but a zone without a slot for the
+    /// class is waited on for up to `max_wait_ms` while the class's share of the
+    /// queue has room. `false` means the request was shed. Returns whether the
+    /// zone's saturation changed too, so the caller can invalidate routing decisions.
+    pub async fn acquire(
+        &self,
+        zone_idx: usize,
+        class: usize,
+        in_flight: &AtomicUsize,
+    ) -> (bool, bool) {
+        if self.try_acquire(zone_idx, class, in_flight) {
+            return (true, false);
+        }
+        let Some(zone) = self.zone(zone_idx) else {
+            return (true, false);
+        };
+        let stats = &self.classes[class];
+        let queue_share = self.share(self.config.max_queue_per_zone, class);
+        if zone.waiting.fetch_add(1, Ordering::AcqRel) >= queue_share {
+            zone.waiting.fetch_sub(1, Ordering::AcqRel);
+            zone.shed_total.fetch_add(1, Ordering::Relaxed);
+            stats.shed_total.fetch_add(1, Ordering::Relaxed);
+            return (false, self.refresh_saturated(zone, in_flight));
+        }
+        zone.class_waiting[class].fetch_add(1, Ordering::AcqRel);
+        stats.waiting.fetch_add(1, Ordering::Relaxed);
+        zone.queued_total.fetch_add(1, Ordering::Relaxed);
+        stats.queued_total.fetch_add(1, Ordering::Relaxed);
+        let mut changed = self.refresh_saturated(zone, in_flight);
+        let deadline = tokio::time::Instant::now() + Duration::from_millis(self.config.max_wait_ms);
+        // `notify_one` keeps a permit when nobody is waiting yet, so a slot released
+        // between the check and the wait is not missed.
+        let admitted = loop {
+            if self.try_acquire(zone_idx, class, in_flight) {
+                break true;
+            }
+            let released = zone.released[class].notified();
+            if tokio::time::timeout_at(deadline, released).await.is_err() {
+                break self.try_acquire(zone_idx, class, in_flight);
+            }
+        };
+        zone.class_waiting[class].fetch_sub(1, Ordering::AcqRel);
+        stats.waiting.fetch_sub(1, Ordering::Relaxed);
+        zone.waiting.fetch_sub(1, Ordering::AcqRel);
+        if !admitted {
+            zone.shed_total.fetch_add(1, Ordering::Relaxed);
+            stats.shed_total.fetch_add(1, Ordering::Relaxed);
+        }
+        changed |= self.refresh_saturated(zone, in_flight);
+        (admitted, changed)
+    }
+
+    /// Gives back a slot taken from `in_flight`; returns whether the zone's
+    /// saturation changed.
+    pub fn release(&self, zone_idx: usize, in_flight: &AtomicUsize) -> bool {
+        let Some(zone) = self.zone(zone_idx) else {
+            return false;
+        };
+        zone.wake();
+        self.refresh_saturated(zone, in_flight)
+    }
+
+    /// Feeds one finished request into the zone's limit.
+    pub fn record(&self, zone_idx: usize, latency_ms: f64, success: bool) {
+        self.record_at(zone_idx, latency_ms, success, monotonic_ms());
+    }
+
+    fn record_at(&self, zone_idx: usize, latency_ms: f64, success: bool, now_ms: u64) {
+        let Some(zone) = self.zone(zone_idx) else {
+            return;
+        };
+        if !self.config.adaptive {
+            return;
+        }
+        let baseline = zone.baseline_ms.load();
+        let slow = baseline > 0.0 && latency_ms > baseline * self.config.latency_tolerance;
+        if success {
+            zone.baseline_ms.store(if baseline > 0.0 {
+                baseline + (latency_ms - baseline) * BASELINE_ALPHA
+            } else {
+                latency_ms
+            });
+        }
+        let floor = self.config.min_limit.clamp(1, zone.ceiling.max(1)) as f64;
+        // Concurrent updates may overwrite each other; that only loses a step.
+        if success && !slow {
+            let before = zone.limit.load();
+            let after = (before + 1.0 / before.max(1.0)).min(zone.ceiling as f64);
+            zone.limit.store(after);
+            if after as usize > before as usize {
+                zone.wake();
+            }
+            return;
+        }
+        let last = zone.last_backoff_ms.load(Ordering::Acquire);
+        if (last > 0 && now_ms.saturating_sub(last) < baseline.max(1.0) as u64)
+            || zone
+                .last_backoff_ms
+                .compare_exchange(last, now_ms, Ordering::AcqRel, Ordering::Acquire)
+                .is_err()
+        {
+            return;
+        }
+        let after = (zone.limit.load() * self.config.backoff_ratio).max(floor);
+        zone.limit.store(after);
+        zone.backoffs_total.fetch_add(1, Ordering::Relaxed);
+    }
+
+    /// Samples how late a short sleep wakes up, a sign that the runtime's workers
+    /// are out of CPU, while `max_scheduler_lag_ms` is set. Stops once these limits
+    /// have been replaced by a config reload.
+    pub fn spawn_lag_sampler(self: &Arc<Self>) {
+        if self.config.max_scheduler_lag_ms.is_none() {
+            return;
+        }
+        let limits = self.clone();
+        tokio::spawn(async move {
+            let period = Duration::from_millis(LAG_SAMPLE_MS);
+            loop {
+                let start = tokio::time::Instant::now();
+                tokio::time::sleep(period).await;
+                if Arc::strong_count(&limits) == 1 {
+                    return;
+                }
+                let lag = start.elapsed().saturating_sub(period);
+                limits.observe_lag(lag.as_secs_f64() * 1000.0);
+            }
+        });
+    }
+
+    fn observe_lag(&self, lag_ms: f64) {
+        let before = self.lag_ms.load();
+        self.lag_ms.store(before + (lag_ms - before) * LAG_ALPHA);
+    }
+
+    fn refresh_saturated(&self, zone: &ZoneLimit, in_flight: &AtomicUsize) -> bool {
+        let saturated = in_flight.load(Ordering::Relaxed) >= zone.limit()
+            && zone.waiting.load(Ordering::Relaxed) >= self.config.max_queue_per_zone;
+        zone.saturated.swap(saturated, Ordering::Relaxed) != saturated
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn limits(max_queue_per_zone: usize) -> ConcurrencyLimits {
+        let config = ConcurrencyConfig {
+            min_limit: 2,
+            backoff_ratio: 0.5,
+            max_queue_per_zone,
+            max_wait_ms: 50,
+            ..ConcurrencyConfig::default()
+        };
+        ConcurrencyLimits::new(&[Some(8), None], &config)
+    }
+
+    #[test]
+    fn backs_off_on_failure_and_slowness_then_grows_additively() {
+        let limits = limits(0);
+        let zone = limits.zone(0).unwrap();
+        limits.record_at(0, 10.0, true, 0);
+        assert_eq!(zone.limit(), 8);
+        limits.record_at(0, 10.0, false, 100);
+        assert_eq!(zone.limit(), 4);
+        // Within one baseline latency of the last backoff: same burst.
+        limits.record_at(0, 10.0, false, 105);
+        assert_eq!(zone.limit(), 4);
+        // Slow for the baseline, then failing at the floor.
+        limits.record_at(0, 50.0, true, 200);
+        assert_eq!(zone.limit(), 2);
+        limits.record_at(0, 10.0, false, 300);
+        assert_eq!(zone.limit(), 2);
+        assert_eq!(zone.backoffs_total.load(Ordering::Relaxed), 3);
+        for _ in 0..6 {
+            limits.record_at(0, 10.0, true, 400);
+        }
+        assert_eq!(zone.limit(), 4);
+    }
+
+    #[test]
+    fn zones_without_max_in_flight_get_the_default_ceiling() {
+        let limits = limits(0);
+        let zone = limits.zone(1).unwrap();
+        assert_eq!(zone.limit(), 1024);
+        limits.record_at(1, 10.0, false, 100);
+        assert_eq!(zone.limit(), 512);
+
+        let config = ConcurrencyConfig {
+            default_max_in_flight: 0,
+            ..ConcurrencyConfig::default()
+        };
+        let limits = ConcurrencyLimits::new(&[Some(8), None], &config);
+        assert!(limits.zone(1).is_none());
+        assert!(limits.try_acquire(1, 0, &AtomicUsize::new(5000)));
+    }
+
+    #[tokio::test]
+    async fn queued_requests_take_released_slots_or_are_shed() {
+        let limits = limits(1);
+        let in_flight = AtomicUsize::new(0);
+        for _ in 0..8 {
+            assert!(limits.try_acquire(0, 0, &in_flight));
+        }
+        assert!(!limits.try_acquire(0, 0, &in_flight));
+        assert!(limits.try_acquire(1, 0, &in_flight));
+        in_flight.fetch_sub(1, Ordering::Relaxed);
+
+        let (admitted, changed) = tokio::join!(limits.acquire(0, 0, &in_flight), async {
+            tokio::time::sleep(Duration::from_millis(5)).await;
+            assert!(limits.is_saturated(0));
+            // The queue is full: a second waiter is shed at once.
+            assert!(!limits.acquire(0, 0, &in_flight).await.0);
+            in_flight.fetch_sub(1, Ordering::Relaxed);
+            limits.release(0, &in_flight)
+        })
+        .0;
+        assert!(admitted && changed);
+        assert_eq!(in_flight.load(Ordering::Relaxed), 8);
+        assert!(!limits.is_saturated(0));
+
+        // Nothing released within `max_wait_ms`.
+        assert!(!limits.acquire(0, 0, &in_flight).await.0);
+        let zone = limits.zone(0).unwrap();
+        assert_eq!(zone.queued_total.load(Ordering::Relaxed), 2);
+        assert_eq!(zone.shed_total.load(Ordering::Relaxed), 2);
+    }
+
+    #[tokio::test]
+    async fn a_class_alone_uses_the_whole_limit_but_gives_way_to_higher_ones() {
+        let limits = limits(4);
+        let in_flight = AtomicUsize::new(0);
+        let (strict, background) = (class_index("strict-local"), class_index("background"));
+        assert_eq!(class_index("unknown"), class_index("flexible"));
+        // Nothing of a higher class is queued: background fills the zone.
+        for _ in 0..8 {
+            assert!(limits.try_acquire(0, background, &in_flight));
+        }
+        assert!(!limits.try_acquire(0, background, &in_flight));
+
+        let (strict_admitted, bg_admitted) =
+            tokio::join!(limits.acquire(0, strict, &in_flight), async {
+                tokio::time::sleep(Duration::from_millis(5)).await;
+                // With strict-local queued, background is held to half the limit...
+                in_flight.fetch_sub(1, Ordering::Relaxed);
+                assert!(!limits.try_acquire(0, background, &in_flight));
+                let queued = limits.acquire(0, background, &in_flight);
+                let release = async {
+                    tokio::time::sleep(Duration::from_millis(1)).await;
+                    // ...and to half the queue.
+                    assert!(!limits.acquire(0, background, &in_flight).await.0);
+                    // The freed slot goes to strict-local.
+                    limits.release(0, &in_flight);
+                };
+                let ((admitted, _), ()) = tokio::join!(queued, release);
+                admitted
+            });
+        assert!(strict_admitted.0 && !bg_admitted);
+        let stats = &limits.classes[background];
+        assert_eq!(stats.queued_total.load(Ordering::Relaxed), 1);
+        assert_eq!(stats.shed_total.load(Ordering::Relaxed), 2);
+        assert_eq!(limits.classes[strict].shed_total.load(Ordering::Relaxed), 0);
+
+        // Nobody queued any more: background may take the whole limit again.
+        in_flight.fetch_sub(1, Ordering::Relaxed);
+        assert!(limits.try_acquire(0, background, &in_flight));
+    }
+
+    #[test]
+    fn scheduler_lag_sheds_lower_classes_first() {
+        let config = ConcurrencyConfig {
+            max_scheduler_lag_ms: Some(100),
+            ..ConcurrencyConfig::default()
+        };
+        let limits = ConcurrencyLimits::new(&[], &config);
+        limits.observe_lag(200.0);
+        assert!(limits.scheduler_lag_ms() > 50.0 && limits.scheduler_lag_ms() < 80.0);
+        assert!(!limits.admits_class(class_index("background")));
+        assert!(limits.admits_class(class_index("flexible")));
+        for _ in 0..10 {
+            limits.observe_lag(200.0);
+        }
+        assert!(!limits.admits_class(class_index("flexible")));
+        assert!(limits.admits_class(class_index("strict-local")));
+        assert_eq!(limits.classes[2].lag_shed_total.load(Ordering::Relaxed), 1);
+    }
+}
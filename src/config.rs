@@ -18,6 +18,7 @@ pub struct ZoneConfig {
     pub base_rtt_ms: Option<f64>,
     #[serde(default)]
     pub cost_weight: Option<f64>,
+    /// Ceiling of the zone's adaptive concurrency limit (see [`ConcurrencyConfig`]).
     #[serde(default)]
     pub max_in_flight: Option<usize>,
     #[serde(default)]
@@ -50,8 +51,40 @@ pub struct PolicyConstraints {
     pub max_error_rate: Option<f64>,
     #[serde(default)]
     pub max_request_share_percent: Option<f64>,
+    #[serde(default = "default_share_window_secs")]
+    pub share_window_secs: u64,
+    #[serde(default = "default_share_window_buckets")]
+    pub share_window_buckets: usize,
     #[serde(default)]
     pub cross_region_rtt_penalty_ms: Option<f64>,
+    #[serde(default = "default_latency_source")]
+    pub latency_source: String,
+}
+
+#[derive(Debug, Deserialize, Clone)]
+pub struct PluginCacheConfig {
+    #[serde(default)]
+    pub key_headers: Vec<String>,
+    #[serde(default = "default_true")]
+    pub key_method: bool,
+    #[serde(default = "default_true")]
+    pub key_path: bool,
+    #[serde(default = "default_plugin_cache_ttl_secs")]
+    pub ttl_secs: u64,
+    #[serde(default = "default_plugin_cache_max_entries")]
+    pub max_entries: usize,
+}
+
+/// Opt-in hedging for `strict-local` and `latency-first` routes: an idempotent request
+/// still unanswered after the selected zone's recent p95, clamped to
+/// `min_delay_ms..=max_delay_ms`, is duplicated to the runner-up zone.
+#[derive(Debug, Deserialize, Clone)]
+pub struct HedgingConfig {
+    #[serde(default = "default_hedge_min_delay_ms")]
+    pub min_delay_ms: u64,
+    /// Also the delay while the zone has too few samples for a p95.
+    #[serde(default = "default_hedge_max_delay_ms")]
+    pub max_delay_ms: u64,
 }
 
 #[derive(Debug, Deserialize, Clone)]
@@ -76,6 +109,9 @@ pub struct RoutePolicy {
     pub forecast_min_improvement_ratio: f64,
     #[serde(default = "default_defer_seconds")]
     pub max_defer_seconds: u64,
+    /// `hold` (keep the client waiting) or `accept` (answer `202` and forward later).
+    #[serde(default = "default_defer_mode")]
+    pub defer_mode: String,
     #[serde(default = "default_true")]
     pub fail_safe_lowest_latency: bool,
     #[serde(default = "default_hysteresis_delta")]
@@ -86,9 +122,18 @@ pub struct RoutePolicy {
     pub plugin_enabled: bool,
     #[serde(default = "default_plugin_timeout_ms")]
     pub plugin_timeout_ms: u64,
+    #[serde(default = "default_plugin_max_body_bytes")]
+    pub plugin_max_body_bytes: usize,
+    #[serde(default)]
+    pub plugin_cache: Option<PluginCacheConfig>,
+    #[serde(default)]
+    pub hedging: Option<HedgingConfig>,
+    /// Extra attempts, each on the next-best zone, after a connect error.
+    #[serde(default)]
+    pub connect_retries: u32,
 }
 
-#[derive(Debug, Deserialize, Clone)]
+#[derive(Debug, Deserialize, Clone, PartialEq)]
 pub struct CarbonProviderConfig {
     #[serde(default = "default_carbon_provider")]
     pub provider: String,
@@ -118,6 +163,18 @@ pub struct CarbonProviderConfig {
     pub electricitymap_local_fixture: Option<String>,
     #[serde(default = "default_false")]
     pub electricitymap_local_live_reload: bool,
+    #[serde(default = "default_refresh_ahead_ratio")]
+    pub refresh_ahead_ratio: f64,
+    #[serde(default = "default_refresh_jitter_ratio")]
+    pub refresh_jitter_ratio: f64,
+    #[serde(default = "default_provider_requests_per_second")]
+    pub provider_requests_per_second: f64,
+    #[serde(default = "default_provider_burst")]
+    pub provider_burst: u32,
+    #[serde(default = "default_provider_max_concurrency")]
+    pub provider_max_concurrency: usize,
+    #[serde(default)]
+    pub electricitymap_multi_zone_path: Option<String>,
 }
 
 #[derive(Debug, Deserialize, Clone)]
@@ -130,6 +187,277 @@ pub struct MetricsConfig {
     pub decision_log_sample_rate: f64,
     #[serde(default = "default_rollup_interval_secs")]
     pub rollup_interval_secs: u64,
+    #[serde(default = "default_latency_histogram_min_ms")]
+    pub latency_histogram_min_ms: f64,
+    #[serde(default = "default_latency_histogram_max_ms")]
+    pub latency_histogram_max_ms: f64,
+    #[serde(default = "default_latency_histogram_sub_buckets")]
+    pub latency_histogram_sub_buckets: usize,
+}
+
+#[derive(Debug, Deserialize, Clone, PartialEq)]
+pub struct UpstreamConfig {
+    #[serde(default = "default_pool_idle_timeout_secs")]
+    pub pool_idle_timeout_secs: u64,
+    #[serde(default = "default_pool_max_idle_per_zone")]
+    pub pool_max_idle_per_zone: usize,
+    #[serde(default)]
+    pub max_connections_per_zone: Option<usize>,
+    #[serde(default)]
+    pub prewarm_connections: usize,
+    #[serde(default = "default_upstream_connect_timeout_ms")]
+    pub connect_timeout_ms: u64,
+    #[serde(default = "default_true")]
+    pub tcp_nodelay: bool,
+    #[serde(default = "default_upstream_tcp_keepalive_secs")]
+    pub tcp_keepalive_secs: u64,
+    /// Time allowed for response headers; a request past it gets `504`.
+    #[serde(default)]
+    pub request_timeout_ms: Option<u64>,
+}
+
+#[derive(Debug, Deserialize, Clone, Default, PartialEq)]
+pub struct PluginComponentConfig {
+    #[serde(default)]
+    pub pool_size: Option<usize>,
+    #[serde(default)]
+    pub max_concurrent_instances: Option<usize>,
+    #[serde(default)]
+    pub abi: Option<String>,
+}
+
+#[derive(Debug, Deserialize, Clone, PartialEq)]
+pub struct PluginsConfig {
+    #[serde(default = "default_plugin_pool_size")]
+    pub pool_size: usize,
+    #[serde(default)]
+    pub max_concurrent_instances: Option<usize>,
+    #[serde(default)]
+    pub components: HashMap<String, PluginComponentConfig>,
+    #[serde(default = "default_plugin_compiled_cache_dir")]
+    pub compiled_cache_dir: String,
+    /// Largest linear memory one plugin instance may grow to.
+    #[serde(default = "default_plugin_max_memory_bytes")]
+    pub max_memory_bytes: usize,
+}
+
+impl PluginsConfig {
+    /// `(pool_size, max_concurrent_instances)` for one `override_file`. Concurrency never
+    /// exceeds the pooling-allocator slots reserved for the component.
+    pub fn limits_for(&self, component_path: &str) -> (usize, usize) {
+        let per_component = self.components.get(component_path);
+        let pool_size = per_component
+            .and_then(|c| c.pool_size)
+            .unwrap_or(self.pool_size)
+            .max(1);
+        let max_concurrent = per_component
+            .and_then(|c| c.max_concurrent_instances)
+            .or(self.max_concurrent_instances)
+            .unwrap_or(pool_size)
+            .clamp(1, pool_size);
+        (pool_size, max_concurrent)
+    }
+
+    /// Plugin ABI for one `override_file`: `json` (stdio, default) or `typed`.
+    pub fn abi_for(&self, component_path: &str) -> &str {
+        self.components
+            .get(component_path)
+            .and_then(|c| c.abi.as_deref())
+            .unwrap_or("json")
+    }
+}
+
+#[derive(Debug, Deserialize, Clone)]
+pub struct DecisionCacheConfig {
+    #[serde(default = "default_true")]
+    pub enabled: bool,
+    #[serde(default = "default_decision_cache_error_rate_step")]
+    pub error_rate_step: f64,
+    #[serde(default = "default_decision_cache_max_entries_per_route")]
+    pub max_entries_per_route: usize,
+    #[serde(default = "default_decision_cache_max_age_ms")]
+    pub max_age_ms: u64,
+}
+
+#[derive(Debug, Deserialize, Clone, PartialEq)]
+pub struct DecisionLogConfig {
+    /// `log` (through the process logger) or `file` (NDJSON written to `path`).
+    #[serde(default = "default_decision_log_sink")]
+    pub sink: String,
+    #[serde(default = "default_decision_log_path")]
+    pub path: String,
+    #[serde(default = "default_decision_log_queue_capacity")]
+    pub queue_capacity: usize,
+    #[serde(default = "default_decision_log_batch_size")]
+    pub batch_size: usize,
+    #[serde(default = "default_decision_log_flush_interval_ms")]
+    pub flush_interval_ms: u64,
+    #[serde(default = "default_decision_log_max_file_bytes")]
+    pub max_file_bytes: u64,
+    #[serde(default = "default_decision_log_max_files")]
+    pub max_files: usize,
+    #[serde(default = "default_true")]
+    pub keep_errors: bool,
+    #[serde(default)]
+    pub keep_slow_ms: Option<f64>,
+}
+
+#[derive(Debug, Deserialize, Clone)]
+pub struct DeferralConfig {
+    #[serde(default = "default_deferral_max_queued")]
+    pub max_queued: usize,
+    #[serde(default = "default_deferral_check_interval_ms")]
+    pub check_interval_ms: u64,
+    #[serde(default = "default_deferral_max_body_bytes")]
+    pub max_body_bytes: usize,
+    #[serde(default = "default_deferral_max_body_bytes")]
+    pub max_result_bytes: usize,
+    #[serde(default = "default_deferral_result_ttl_secs")]
+    pub result_ttl_secs: u64,
+    #[serde(default = "default_deferral_max_results")]
+    pub max_results: usize,
+    #[serde(default = "default_deferral_poll_path")]
+    pub poll_path: String,
+    #[serde(default = "default_false")]
+    pub allow_callbacks: bool,
+}
+
+#[derive(Debug, Deserialize, Clone)]
+pub struct ReloadConfig {
+    /// Also reload when the config file's mtime or size changes, not only on `SIGHUP`.
+    #[serde(default = "default_false")]
+    pub watch: bool,
+    #[serde(default = "default_reload_watch_interval_ms")]
+    pub watch_interval_ms: u64,
+}
+
+#[derive(Debug, Deserialize, Clone, PartialEq)]
+pub struct CircuitBreakerConfig {
+    #[serde(default = "default_true")]
+    pub enabled: bool,
+    /// Consecutive failed requests (connect errors, timeouts, `5xx`) that open a zone.
+    #[serde(default = "default_breaker_failure_threshold")]
+    pub failure_threshold: u32,
+    /// How long an open zone is skipped before trial requests are let through.
+    #[serde(default = "default_breaker_open_ms")]
+    pub open_ms: u64,
+    #[serde(default = "default_breaker_half_open_max_requests")]
+    pub half_open_max_requests: u32,
+    /// Successful trials that close a half-open zone.
+    #[serde(default = "default_breaker_success_threshold")]
+    pub success_threshold: u32,
+}
+
+#[derive(Debug, Deserialize, Clone, PartialEq)]
+pub struct HealthCheckConfig {
+    #[serde(default = "default_false")]
+    pub enabled: bool,
+    /// Requested with `GET` on each zone's `app_uri`; any status below `500` is healthy.
+    #[serde(default = "default_health_check_path")]
+    pub path: String,
+    #[serde(default = "default_health_check_interval_ms")]
+    pub interval_ms: u64,
+    #[serde(default = "default_health_check_timeout_ms")]
+    pub timeout_ms: u64,
+}
+
+/// Adaptive in-flight limit for zones with `max_in_flight`, plus a short wait queue
+/// in front of it.
+#[derive(Debug, Deserialize, Clone, PartialEq)]
+pub struct ConcurrencyConfig {
+    /// AIMD between `min_limit` and `max_in_flight`; `false` pins the limit at
+    /// `max_in_flight`.
+    #[serde(default = "default_true")]
+    pub adaptive: bool,
+    #[serde(default = "default_concurrency_min_limit")]
+    pub min_limit: usize,
+    /// Multiplied into the limit when a zone looks overloaded.
+    #[serde(default = "default_concurrency_backoff_ratio")]
+    pub backoff_ratio: f64,
+    /// A response slower than this many times the zone's baseline latency counts
+    /// as overload, like a failure.
+    #[serde(default = "default_concurrency_latency_tolerance")]
+    pub latency_tolerance: f64,
+    /// Requests that may wait for a slot on a zone at its limit; routing only moves
+    /// traffic elsewhere once the queue is full.
+    #[serde(default = "default_concurrency_max_queue_per_zone")]
+    pub max_queue_per_zone: usize,
+    /// Longest a queued request waits before it is answered `503`.
+    #[serde(default = "default_concurrency_max_wait_ms")]
+    pub max_wait_ms: u64,
+    #[serde(default)]
+    pub class_weights: ClassWeights,
+    /// Scheduler lag at which CPU pressure sheds lower route classes; unset leaves
+    /// CPU pressure out of admission.
+    #[serde(default)]
+    pub max_scheduler_lag_ms: Option<u64>,
+    /// Ceiling for zones that do not set `max_in_flight`; `0` leaves them unlimited.
+    #[serde(default = "default_concurrency_max_in_flight")]
+    pub default_max_in_flight: usize,
+}
+
+/// Share of a zone's concurrency limit each route class may use while a higher class
+/// is queued for it, its share of the wait queue, and the fraction of
+/// `max_scheduler_lag_ms` it is still admitted at. Lower weights are queued and shed
+/// first.
+#[derive(Debug, Deserialize, Clone, PartialEq)]
+pub struct ClassWeights {
+    #[serde(rename = "strict-local", default = "default_class_weight_strict_local")]
+    pub strict_local: f64,
+    #[serde(default = "default_class_weight_flexible")]
+    pub flexible: f64,
+    #[serde(default = "default_class_weight_background")]
+    pub background: f64,
+}
+
+#[derive(Debug, Deserialize, Clone, PartialEq)]
+pub struct ServerConfig {
+    /// Accept sockets bound to the listen address, with `SO_REUSEPORT` when above one.
+    #[serde(default = "default_server_listeners")]
+    pub listeners: usize,
+    /// Tokio worker threads; defaults to one per core.
+    #[serde(default)]
+    pub worker_threads: Option<usize>,
+    /// Run each listener and its connections on its own core-pinned single-threaded
+    /// runtime instead of the shared worker pool.
+    #[serde(default = "default_false")]
+    pub pin_listeners: bool,
+    #[serde(default = "default_server_accept_backlog")]
+    pub accept_backlog: u32,
+    /// Accepted connections open at once, across all listeners; further accepts wait.
+    #[serde(default)]
+    pub max_connections: Option<usize>,
+    #[serde(default = "default_true")]
+    pub tcp_nodelay: bool,
+    /// `0` turns TCP keep-alive off.
+    #[serde(default = "default_server_tcp_keepalive_secs")]
+    pub tcp_keepalive_secs: u64,
+    #[serde(default = "default_true")]
+    pub http1_keep_alive: bool,
+    #[serde(default)]
+    pub http1_header_read_timeout_ms: Option<u64>,
+    #[serde(default)]
+    pub http2_max_concurrent_streams: Option<u32>,
+    #[serde(default)]
+    pub http2_initial_stream_window_size: Option<u32>,
+    #[serde(default)]
+    pub http2_initial_connection_window_size: Option<u32>,
+    #[serde(default = "default_false")]
+    pub http2_adaptive_window: bool,
+    #[serde(default)]
+    pub http2_keep_alive_interval_secs: Option<u64>,
+    #[serde(default = "default_server_http2_keep_alive_timeout_secs")]
+    pub http2_keep_alive_timeout_secs: u64,
+}
+
+#[derive(Debug, Deserialize, Clone)]
+pub struct RoutingSignalsConfig {
+    #[serde(default = "default_signals_window_secs")]
+    pub window_secs: u64,
+    #[serde(default = "default_signals_window_buckets")]
+    pub window_buckets: usize,
+    #[serde(default = "default_signals_min_samples")]
+    pub min_samples: u64,
 }
 
 #[derive(Debug, Deserialize, Clone)]
@@ -154,6 +482,28 @@ pub struct Config {
     pub carbon: CarbonProviderConfig,
     #[serde(default)]
     pub metrics: MetricsConfig,
+    #[serde(default)]
+    pub upstream: UpstreamConfig,
+    #[serde(default)]
+    pub plugins: PluginsConfig,
+    #[serde(default)]
+    pub decision_cache: DecisionCacheConfig,
+    #[serde(default)]
+    pub signals: RoutingSignalsConfig,
+    #[serde(default)]
+    pub decision_log: DecisionLogConfig,
+    #[serde(default)]
+    pub deferral: DeferralConfig,
+    #[serde(default)]
+    pub reload: ReloadConfig,
+    #[serde(default)]
+    pub server: ServerConfig,
+    #[serde(default)]
+    pub circuit_breaker: CircuitBreakerConfig,
+    #[serde(default)]
+    pub health_check: HealthCheckConfig,
+    #[serde(default)]
+    pub concurrency: ConcurrencyConfig,
 }
 
 fn default_rule_type() -> String {
@@ -163,8 +513,102 @@ fn default_rule_type() -> String {
 use std::fs;
 
 pub fn load_config(path: &str) -> Config {
-    let data = fs::read_to_string(path).expect("Failed to read config.json");
-    serde_json::from_str(&data).expect("Failed to parse config.json")
+    try_load_config(path).unwrap_or_else(|e| panic!("{}", e))
+}
+
+/// Read, parse and validate `path` without panicking; used for reloads.
+pub fn try_load_config(path: &str) -> Result<Config, String> {
+    let data = fs::read_to_string(path).map_err(|e| format!("Failed to read {}: {}", path, e))?;
+    let config: Config =
+        serde_json::from_str(&data).map_err(|e| format!("Failed to parse {}: {}", path, e))?;
+    config.validate()?;
+    Ok(config)
+}
+
+impl Config {
+    /// Rejects values that would otherwise only fail, or silently fall back, once
+    /// requests arrive.
+    pub fn validate(&self) -> Result<(), String> {
+        for proxy in &self.proxies {
+            let route = &proxy.rule.path;
+            if !matches!(proxy.rule.r#type.as_str(), "exact" | "contain") {
+                log::warn!(
+                    "route {}: unknown rule type {}, matching it as a prefix like contain",
+                    route,
+                    proxy.rule.r#type
+                );
+            }
+            let uris =
+                std::iter::once(&proxy.app_uri).chain(proxy.zones.iter().map(|z| &z.app_uri));
+            for uri in uris {
+                uri.parse::<hyper::Uri>()
+                    .map_err(|e| format!("route {}: invalid app_uri {}: {}", route, uri, e))?;
+            }
+            if !matches!(proxy.policy.defer_mode.as_str(), "hold" | "accept") {
+                return Err(format!(
+                    "route {}: defer_mode must be hold or accept, got {}",
+                    route, proxy.policy.defer_mode
+                ));
+            }
+            if let Some(hedging) = &proxy.policy.hedging {
+                if hedging.min_delay_ms > hedging.max_delay_ms {
+                    return Err(format!(
+                        "route {}: hedging.min_delay_ms must not exceed max_delay_ms",
+                        route
+                    ));
+                }
+            }
+        }
+        if !matches!(self.decision_log.sink.as_str(), "log" | "file") {
+            return Err(format!(
+                "decision_log.sink must be log or file, got {}",
+                self.decision_log.sink
+            ));
+        }
+        if !(0.0..=1.0).contains(&self.metrics.decision_log_sample_rate) {
+            return Err("metrics.decision_log_sample_rate must be within 0..=1".to_string());
+        }
+        if !(self.metrics.latency_histogram_min_ms > 0.0
+            && self.metrics.latency_histogram_max_ms > self.metrics.latency_histogram_min_ms)
+        {
+            return Err(
+                "metrics.latency_histogram_max_ms must exceed latency_histogram_min_ms > 0"
+                    .to_string(),
+            );
+        }
+        if !self.health_check.path.starts_with('/') {
+            return Err(format!(
+                "health_check.path must start with /, got {}",
+                self.health_check.path
+            ));
+        }
+        if !(self.concurrency.backoff_ratio > 0.0 && self.concurrency.backoff_ratio < 1.0) {
+            return Err("concurrency.backoff_ratio must be within (0, 1)".to_string());
+        }
+        if self.concurrency.latency_tolerance < 1.0 {
+            return Err("concurrency.latency_tolerance must be at least 1".to_string());
+        }
+        if self.concurrency.max_scheduler_lag_ms == Some(0) {
+            return Err("concurrency.max_scheduler_lag_ms must be at least 1".to_string());
+        }
+        let weights = &self.concurrency.class_weights;
+        for (class, weight) in [
+            ("strict-local", weights.strict_local),
+            ("flexible", weights.flexible),
+            ("background", weights.background),
+        ] {
+            if !(weight > 0.0 && weight <= 1.0) {
+                return Err(format!(
+                    "concurrency.class_weights.{} must be within (0, 1]",
+                    class
+                ));
+            }
+        }
+        if self.server.listeners == 0 || self.server.worker_threads == Some(0) {
+            return Err("server.listeners and worker_threads must be at least 1".to_string());
+        }
+        Ok(())
+    }
 }
 
 
@@ -192,7 +636,10 @@ impl Default for PolicyConstraints {
             p95_latency_budget_ms: None,
             max_error_rate: None,
             max_request_share_percent: None,
+            share_window_secs: default_share_window_secs(),
+            share_window_buckets: default_share_window_buckets(),
             cross_region_rtt_penalty_ms: None,
+            latency_source: default_latency_source(),
         }
     }
 }
@@ -210,11 +657,16 @@ impl Default for RoutePolicy {
             forecast_window_minutes: default_forecast_minutes(),
             forecast_min_improvement_ratio: default_forecast_threshold(),
             max_defer_seconds: default_defer_seconds(),
+            defer_mode: default_defer_mode(),
             fail_safe_lowest_latency: default_true(),
             hysteresis_delta: default_hysteresis_delta(),
             min_switch_interval_secs: default_min_switch_interval_secs(),
             plugin_enabled: default_true(),
             plugin_timeout_ms: default_plugin_timeout_ms(),
+            plugin_max_body_bytes: default_plugin_max_body_bytes(),
+            plugin_cache: None,
+            hedging: None,
+            connect_retries: 0,
         }
     }
 }
@@ -236,6 +688,12 @@ impl Default for CarbonProviderConfig {
             electricitymap_disable_estimations: false,
             electricitymap_local_fixture: None,
             electricitymap_local_live_reload: default_false(),
+            refresh_ahead_ratio: default_refresh_ahead_ratio(),
+            refresh_jitter_ratio: default_refresh_jitter_ratio(),
+            provider_requests_per_second: default_provider_requests_per_second(),
+            provider_burst: default_provider_burst(),
+            provider_max_concurrency: default_provider_max_concurrency(),
+            electricitymap_multi_zone_path: None,
         }
     }
 }
@@ -247,6 +705,168 @@ impl Default for MetricsConfig {
             path: default_metrics_path(),
             decision_log_sample_rate: default_decision_log_sample_rate(),
             rollup_interval_secs: default_rollup_interval_secs(),
+            latency_histogram_min_ms: default_latency_histogram_min_ms(),
+            latency_histogram_max_ms: default_latency_histogram_max_ms(),
+            latency_histogram_sub_buckets: default_latency_histogram_sub_buckets(),
+        }
+    }
+}
+
+impl Default for UpstreamConfig {
+    fn default() -> Self {
+        Self {
+            pool_idle_timeout_secs: default_pool_idle_timeout_secs(),
+            pool_max_idle_per_zone: default_pool_max_idle_per_zone(),
+            max_connections_per_zone: None,
+            prewarm_connections: 0,
+            connect_timeout_ms: default_upstream_connect_timeout_ms(),
+            tcp_nodelay: default_true(),
+            tcp_keepalive_secs: default_upstream_tcp_keepalive_secs(),
+            request_timeout_ms: None,
+        }
+    }
+}
+
+impl Default for PluginsConfig {
+    fn default() -> Self {
+        Self {
+            pool_size: default_plugin_pool_size(),
+            max_concurrent_instances: None,
+            components: HashMap::new(),
+            compiled_cache_dir: default_plugin_compiled_cache_dir(),
+            max_memory_bytes: default_plugin_max_memory_bytes(),
+        }
+    }
+}
+
+impl Default for DecisionCacheConfig {
+    fn default() -> Self {
+        Self {
+            enabled: default_true(),
+            error_rate_step: default_decision_cache_error_rate_step(),
+            max_entries_per_route: default_decision_cache_max_entries_per_route(),
+            max_age_ms: default_decision_cache_max_age_ms(),
+        }
+    }
+}
+
+impl Default for DecisionLogConfig {
+    fn default() -> Self {
+        Self {
+            sink: default_decision_log_sink(),
+            path: default_decision_log_path(),
+            queue_capacity: default_decision_log_queue_capacity(),
+            batch_size: default_decision_log_batch_size(),
+            flush_interval_ms: default_decision_log_flush_interval_ms(),
+            max_file_bytes: default_decision_log_max_file_bytes(),
+            max_files: default_decision_log_max_files(),
+            keep_errors: default_true(),
+            keep_slow_ms: None,
+        }
+    }
+}
+
+impl Default for DeferralConfig {
+    fn default() -> Self {
+        Self {
+            max_queued: default_deferral_max_queued(),
+            check_interval_ms: default_deferral_check_interval_ms(),
+            max_body_bytes: default_deferral_max_body_bytes(),
+            max_result_bytes: default_deferral_max_body_bytes(),
+            result_ttl_secs: default_deferral_result_ttl_secs(),
+            max_results: default_deferral_max_results(),
+            poll_path: default_deferral_poll_path(),
+            allow_callbacks: default_false(),
+        }
+    }
+}
+
+impl Default for ReloadConfig {
+    fn default() -> Self {
+        Self {
+            watch: default_false(),
+            watch_interval_ms: default_reload_watch_interval_ms(),
+        }
+    }
+}
+
+impl Default for CircuitBreakerConfig {
+    fn default() -> Self {
+        Self {
+            enabled: default_true(),
+            failure_threshold: default_breaker_failure_threshold(),
+            open_ms: default_breaker_open_ms(),
+            half_open_max_requests: default_breaker_half_open_max_requests(),
+            success_threshold: default_breaker_success_threshold(),
+        }
+    }
+}
+
+impl Default for HealthCheckConfig {
+    fn default() -> Self {
+        Self {
+            enabled: default_false(),
+            path: default_health_check_path(),
+            interval_ms: default_health_check_interval_ms(),
+            timeout_ms: default_health_check_timeout_ms(),
+        }
+    }
+}
+
+impl Default for ConcurrencyConfig {
+    fn default() -> Self {
+        Self {
+            adaptive: default_true(),
+            min_limit: default_concurrency_min_limit(),
+            backoff_ratio: default_concurrency_backoff_ratio(),
+            latency_tolerance: default_concurrency_latency_tolerance(),
+            max_queue_per_zone: default_concurrency_max_queue_per_zone(),
+            max_wait_ms: default_concurrency_max_wait_ms(),
+            class_weights: ClassWeights::default(),
+            max_scheduler_lag_ms: None,
+            default_max_in_flight: default_concurrency_max_in_flight(),
+        }
+    }
+}
+
+impl Default for ClassWeights {
+    fn default() -> Self {
+        Self {
+            strict_local: default_class_weight_strict_local(),
+            flexible: default_class_weight_flexible(),
+            background: default_class_weight_background(),
+        }
+    }
+}
+
+impl Default for ServerConfig {
+    fn default() -> Self {
+        Self {
+            listeners: default_server_listeners(),
+            worker_threads: None,
+            pin_listeners: default_false(),
+            accept_backlog: default_server_accept_backlog(),
+            max_connections: None,
+            tcp_nodelay: default_true(),
+            tcp_keepalive_secs: default_server_tcp_keepalive_secs(),
+            http1_keep_alive: default_true(),
+            http1_header_read_timeout_ms: None,
+            http2_max_concurrent_streams: None,
+            http2_initial_stream_window_size: None,
+            http2_initial_connection_window_size: None,
+            http2_adaptive_window: default_false(),
+            http2_keep_alive_interval_secs: None,
+            http2_keep_alive_timeout_secs: default_server_http2_keep_alive_timeout_secs(),
+        }
+    }
+}
+
+impl Default for RoutingSignalsConfig {
+    fn default() -> Self {
+        Self {
+            window_secs: default_signals_window_secs(),
+            window_buckets: default_signals_window_buckets(),
+            min_samples: default_signals_min_samples(),
         }
     }
 }
@@ -291,6 +911,10 @@ fn default_defer_seconds() -> u64 {
     0
 }
 
+fn default_defer_mode() -> String {
+    "hold".to_string()
+}
+
 fn default_hysteresis_delta() -> f64 {
     0.05
 }
@@ -311,6 +935,14 @@ fn default_default_carbon_intensity() -> f64 {
     450.0
 }
 
+fn default_refresh_ahead_ratio() -> f64 {
+    0.8
+}
+
+fn default_refresh_jitter_ratio() -> f64 {
+    0.1
+}
+
 fn default_carbon_safe_threshold_g_per_kwh() -> f64 {
     300.0
 }
@@ -323,10 +955,54 @@ fn default_plugin_timeout_ms() -> u64 {
     800
 }
 
+fn default_plugin_max_body_bytes() -> usize {
+    1024 * 1024
+}
+
+fn default_plugin_cache_ttl_secs() -> u64 {
+    60
+}
+
+fn default_plugin_cache_max_entries() -> usize {
+    1024
+}
+
+fn default_hedge_min_delay_ms() -> u64 {
+    10
+}
+
+fn default_hedge_max_delay_ms() -> u64 {
+    250
+}
+
+fn default_provider_requests_per_second() -> f64 {
+    5.0
+}
+
+fn default_provider_burst() -> u32 {
+    10
+}
+
+fn default_provider_max_concurrency() -> usize {
+    4
+}
+
 fn default_provider_timeout_ms() -> u64 {
     75
 }
 
+fn default_share_window_secs() -> u64 {
+    60
+}
+
+fn default_share_window_buckets() -> usize {
+    12
+}
+
+fn default_latency_source() -> String {
+    "static".to_string()
+}
+
 fn default_decision_log_sample_rate() -> f64 {
     0.01
 }
@@ -335,6 +1011,18 @@ fn default_rollup_interval_secs() -> u64 {
     60
 }
 
+fn default_latency_histogram_min_ms() -> f64 {
+    0.5
+}
+
+fn default_latency_histogram_max_ms() -> f64 {
+    30_000.0
+}
+
+fn default_latency_histogram_sub_buckets() -> usize {
+    4
+}
+
 fn default_max_candidates() -> usize {
     8
 }
@@ -346,3 +1034,221 @@ fn default_electricitymap_base_url() -> String {
 fn default_electricitymap_api_token_header() -> String {
     "auth-token".to_string()
 }
+
+fn default_pool_idle_timeout_secs() -> u64 {
+    90
+}
+
+fn default_pool_max_idle_per_zone() -> usize {
+    64
+}
+
+fn default_upstream_connect_timeout_ms() -> u64 {
+    1000
+}
+
+fn default_upstream_tcp_keepalive_secs() -> u64 {
+    60
+}
+
+fn default_plugin_pool_size() -> usize {
+    16
+}
+
+fn default_plugin_compiled_cache_dir() -> String {
+    ".rilot-cache/wasm".to_string()
+}
+
+fn default_plugin_max_memory_bytes() -> usize {
+    256 * 1024 * 1024
+}
+
+fn default_decision_cache_error_rate_step() -> f64 {
+    0.01
+}
+
+fn default_decision_cache_max_entries_per_route() -> usize {
+    256
+}
+
+fn default_decision_cache_max_age_ms() -> u64 {
+    1000
+}
+
+fn default_decision_log_sink() -> String {
+    "log".to_string()
+}
+
+fn default_decision_log_path() -> String {
+    "rilot-decisions.ndjson".to_string()
+}
+
+fn default_decision_log_queue_capacity() -> usize {
+    8192
+}
+
+fn default_decision_log_batch_size() -> usize {
+    256
+}
+
+fn default_decision_log_flush_interval_ms() -> u64 {
+    100
+}
+
+fn default_decision_log_max_file_bytes() -> u64 {
+    64 * 1024 * 1024
+}
+
+fn default_decision_log_max_files() -> usize {
+    5
+}
+
+fn default_deferral_max_queued() -> usize {
+    10_000
+}
+
+fn default_deferral_check_interval_ms() -> u64 {
+    1000
+}
+
+fn default_deferral_max_body_bytes() -> usize {
+    1024 * 1024
+}
+
+fn default_deferral_result_ttl_secs() -> u64 {
+    3600
+}
+
+fn default_deferral_max_results() -> usize {
+    10_000
+}
+
+fn default_deferral_poll_path() -> String {
+    "/_rilot/deferred".to_string()
+}
+
+fn default_reload_watch_interval_ms() -> u64 {
+    1000
+}
+
+fn default_breaker_failure_threshold() -> u32 {
+    5
+}
+
+fn default_breaker_open_ms() -> u64 {
+    5000
+}
+
+fn default_breaker_half_open_max_requests() -> u32 {
+    1
+}
+
+fn default_breaker_success_threshold() -> u32 {
+    2
+}
+
+fn default_health_check_path() -> String {
+    "/".to_string()
+}
+
+fn default_health_check_interval_ms() -> u64 {
+    1000
+}
+
+fn default_health_check_timeout_ms() -> u64 {
+    500
+}
+
+fn default_concurrency_min_limit() -> usize {
+    1
+}
+
+fn default_concurrency_backoff_ratio() -> f64 {
+    0.9
+}
+
+fn default_concurrency_latency_tolerance() -> f64 {
+    2.0
+}
+
+fn default_concurrency_max_queue_per_zone() -> usize {
+    32
+}
+
+fn default_concurrency_max_in_flight() -> usize {
+    1024
+}
+
+fn default_concurrency_max_wait_ms() -> u64 {
+    25
+}
+
+fn default_class_weight_strict_local() -> f64 {
+    1.0
+}
+
+fn default_class_weight_flexible() -> f64 {
+    0.8
+}
+
+fn default_class_weight_background() -> f64 {
+    0.5
+}
+
+fn default_server_listeners() -> usize {
+    1
+}
+
+fn default_server_accept_backlog() -> u32 {
+    1024
+}
+
+fn default_server_tcp_keepalive_secs() -> u64 {
+    60
+}
+
+fn default_server_http2_keep_alive_timeout_secs() -> u64 {
+    20
+}
+
+fn default_signals_window_secs() -> u64 {
+    30
+}
+
+fn default_signals_window_buckets() -> usize {
+    6
+}
+
+fn default_signals_min_samples() -> u64 {
+    20
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn unknown_rule_types_still_load_as_prefix_rules() {
+        let path = std::env::temp_dir().join(format!("rilot-config-{}.json", std::process::id()));
+        fs::write(
+            &path,
+            r#"{
+                "proxies": [{
+                    "app_name": "app",
+                    "app_uri": "http://127.0.0.1:3000",
+                    "rule": { "path": "/api", "type": "prefix" }
+                }]
+            }"#,
+        )
+        .unwrap();
+        let config = try_load_config(path.to_str().unwrap());
+        let _ = fs::remove_file(&path);
+        let config = config.unwrap();
+        let rules = config
+            .proxies
+            .iter()
+            .map(|p| (p.rule.path.as_str(), p.rule.r#type.as_str()));
+        let table = rilot_core::RouteTable::new(rules);
+        assert_eq!(table.lookup("/api/users"), Some(0));
+    }
+}
@@ -0,0 +1,446 @@
+use std::collections::hash_map::DefaultHasher;
+use std::collections::HashMap;
+use std::hash::{Hash, Hasher};
+use std::sync::atomic::{AtomicU64, Ordering};
+use std::sync::{Arc, RwLock};
+
+use crate::config;
+use crate::metrics::monotonic_ms;
+
+pub const INVALIDATION_REASONS: [&str; 6] = [
+    "carbon",
+    "error-rate",
+    "capacity",
+    "hysteresis",
+    "expired",
+    "circuit",
+];
+const REASON_CARBON: usize = 0;
+const REASON_ERROR_RATE: usize = 1;
+const REASON_CAPACITY: usize = 2;
+const REASON_HYSTERESIS: usize = 3;
+const REASON_EXPIRED: usize = 4;
+const REASON_CIRCUIT: usize = 5;
+/// Lock shards per route. A lookup takes a shared lock on the shard its key hashes
+/// to, so requests for different keys do not bounce one lock word between cores.
+const SHARDS: usize = 16;
+
+/// Request attributes `choose_zone` depends on besides the route: the user region and
+/// the route policy after per-request header overrides.
+#[derive(Hash)]
+pub struct DecisionKey<'a> {
+    pub region: &'a str,
+    pub route_class: &'a str,
+    pub carbon_cursor_enabled: bool,
+    pub forecasting_enabled: bool,
+    pub time_shift_enabled: bool,
+}
+
+impl DecisionKey<'_> {
+    fn hash64(&self) -> u64 {
+        let mut hasher = DefaultHasher::new();
+        self.hash(&mut hasher);
+        hasher.finish()
+    }
+
+    fn matches(&self, entry: &OwnedKey) -> bool {
+        self.region == entry.region
+            && self.route_class == entry.route_class
+            && self.carbon_cursor_enabled == entry.carbon_cursor_enabled
+            && self.forecasting_enabled == entry.forecasting_enabled
+            && self.time_shift_enabled == entry.time_shift_enabled
+    }
+}
+
+struct OwnedKey {
+    region: String,
+    route_class: String,
+    carbon_cursor_enabled: bool,
+    forecasting_enabled: bool,
+    time_shift_enabled: bool,
+}
+
+/// Versions of every input a cached decision was computed from. A decision is reused
+/// only while all of them are unchanged.
+#[derive(Clone, Copy, PartialEq, Eq)]
+pub struct DecisionStamp {
+    carbon: u64,
+    circuit: u64,
+    error_rate: u64,
+    capacity: u64,
+}
+
+/// Entries whose keys hash to the same 64 bits share a bucket and are told apart by
+/// their full key.
+type Buckets<T> = HashMap<u64, Vec<CachedDecision<T>>>;
+
+/// One lock shard, on its own cache line.
+#[repr(align(64))]
+struct Shard<T>(RwLock<Buckets<T>>);
+
+struct CachedDecision<T> {
+    key: OwnedKey,
+    stamp: DecisionStamp,
+    created_ms: u64,
+    zone_idx: usize,
+    decision: Arc<T>,
+}
+
+/// Per-route memo of routing decisions, keyed by [`DecisionKey`].
+///
+/// Rather than tracking every input, entries carry a [`DecisionStamp`]: the carbon
+/// signal and circuit breaker versions plus two epochs bumped here when a zone's error rate moves by
+/// `error_rate_step` or crosses a route's `max_error_rate`, and when a zone fills up
+/// (or stops being full) under its concurrency limit. A lookup is one hash, a shared
+/// lock on one of the route's shards, and a compare of the full key.
+///
+/// Error rate and observed latency come from sliding windows that also move when no
+/// request is recorded (a failing zone stops getting traffic while its errors age
+/// out), so entries additionally expire after `max_age_ms`.
+pub struct DecisionCache<T> {
+    /// `None` for routes that are not cached (cache disabled, or share caps whose
+    /// input moves with every request).
+    routes: Vec<Option<[Shard<T>; SHARDS]>>,
+    max_entries_per_shard: usize,
+    max_age_ms: u64,
+    error_rate_step: f64,
+    error_epoch: AtomicU64,
+    capacity_epoch: AtomicU64,
+    /// Per zone: `max_error_rate` thresholds, sorted.
+    error_thresholds: Vec<Vec<f64>>,
+    error_levels: Vec<AtomicU64>,
+    pub hits: AtomicU64,
+    pub misses: AtomicU64,
+    pub invalidations: [AtomicU64; INVALIDATION_REASONS.len()],
+}
+
+impl<T> DecisionCache<T> {
+    /// `cacheable[route]` enables the route; `zone_error_thresholds` is indexed by
+    /// zone.
+    pub fn new(
+        cfg: &config::DecisionCacheConfig,
+        cacheable: Vec<bool>,
+        mut zone_error_thresholds: Vec<Vec<f64>>,
+    ) -> Self {
+        for thresholds in &mut zone_error_thresholds {
+            thresholds.sort_by(f64::total_cmp);
+        }
+        let zones = zone_error_thresholds.len();
+        Self {
+            routes: cacheable
+                .into_iter()
+                .map(|enabled| {
+                    (cfg.enabled && enabled)
+                        .then(|| std::array::from_fn(|_| Shard(RwLock::new(HashMap::new()))))
+                })
+                .collect(),
+            max_entries_per_shard: cfg.max_entries_per_route.div_ceil(SHARDS).max(1),
+            max_age_ms: cfg.max_age_ms,
+            error_rate_step: cfg.error_rate_step,
+            error_epoch: AtomicU64::new(0),
+            capacity_epoch: AtomicU64::new(0),
+            error_thresholds: zone_error_thresholds,
+            error_levels: (0..zones).map(|_| AtomicU64::new(0)).collect(),
+            hits: AtomicU64::new(0),
+            misses: AtomicU64::new(0),
+            invalidations: Default::default(),
+        }
+    }
+
+    pub fn is_enabled(&self, route_idx: usize) -> bool {
+        self.routes[route_idx].is_some()
+    }
+
+    /// Current input versions; take this before computing a decision to insert.
+    pub fn stamp(&self, carbon_version: u64, circuit_version: u64) -> DecisionStamp {
+        DecisionStamp {
+            carbon: carbon_version,
+            circuit: circuit_version,
+            error_rate: self.error_epoch.load(Ordering::Acquire),
+            capacity: self.capacity_epoch.load(Ordering::Acquire),
+        }
+    }
+
+    /// Cached decision for `key`, if its inputs are unchanged. `last_zone` is the
+    /// route's current hysteresis zone when hysteresis is active: a decision made
+    /// before another key moved the route elsewhere would skip the sticky check.
+    pub fn get(
+        &self,
+        route_idx: usize,
+        key: &DecisionKey<'_>,
+        stamp: DecisionStamp,
+        last_zone: Option<usize>,
+    ) -> Option<Arc<T>> {
+        self.get_hashed(route_idx, key.hash64(), key, stamp, last_zone)
+    }
+
+    fn get_hashed(
+        &self,
+        route_idx: usize,
+        hash: u64,
+        key: &DecisionKey<'_>,
+        stamp: DecisionStamp,
+        last_zone: Option<usize>,
+    ) -> Option<Arc<T>> {
+        let shards = self.routes[route_idx].as_ref()?;
+        let hit = {
+            let buckets = shards[shard_of(hash)]
+                .0
+                .read()
+                .expect("decision cache lock poisoned");
+            let entry = buckets
+                .get(&hash)
+                .and_then(|bucket| bucket.iter().find(|e| key.matches(&e.key)));
+            match entry {
+                None => None,
+                Some(entry) => match self.stale_reason(entry, stamp, last_zone) {
+                    None => Some(entry.decision.clone()),
+                    Some(reason) => {
+                        self.invalidations[reason].fetch_add(1, Ordering::Relaxed);
+                        None
+                    }
+                },
+            }
+        };
+        let counter = if hit.is_some() {
+            &self.hits
+        } else {
+            &self.misses
+        };
+        counter.fetch_add(1, Ordering::Relaxed);
+        hit
+    }
+
+    pub fn insert(
+        &self,
+        route_idx: usize,
+        key: &DecisionKey<'_>,
+        stamp: DecisionStamp,
+        zone_idx: usize,
+        decision: Arc<T>,
+    ) {
+        self.insert_hashed(route_idx, key.hash64(), key, stamp, zone_idx, decision);
+    }
+
+    fn insert_hashed(
+        &self,
+        route_idx: usize,
+        hash: u64,
+        key: &DecisionKey<'_>,
+        stamp: DecisionStamp,
+        zone_idx: usize,
+        decision: Arc<T>,
+    ) {
+        let Some(shards) = self.routes[route_idx].as_ref() else {
+            return;
+        };
+        let mut buckets = shards[shard_of(hash)]
+            .0
+            .write()
+            .expect("decision cache lock poisoned");
+        // Keys are (region, class, overrides), so a full shard means unexpected
+        // cardinality; start over rather than track recency.
+        if buckets.len() >= self.max_entries_per_shard && !buckets.contains_key(&hash) {
+            buckets.clear();
+        }
+        let bucket = buckets.entry(hash).or_default();
+        bucket.retain(|e| !key.matches(&e.key));
+        bucket.push(CachedDecision {
+            key: OwnedKey {
+                region: key.region.to_string(),
+                route_class: key.route_class.to_string(),
+                carbon_cursor_enabled: key.carbon_cursor_enabled,
+                forecasting_enabled: key.forecasting_enabled,
+                time_shift_enabled: key.time_shift_enabled,
+            },
+            stamp,
+            created_ms: monotonic_ms(),
+            zone_idx,
+            decision,
+        });
+    }
+
+    /// Called after each recorded request with the zone's current error rate.
+    pub fn observe_error_rate(&self, zone_idx: usize, error_rate: f64) {
+        let Some(level_slot) = self.error_levels.get(zone_idx) else {
+            return;
+        };
+        let step_level = if self.error_rate_step > 0.0 {
+            (error_rate / self.error_rate_step).floor() as u64
+        } else {
+            0
+        };
+        let crossed = self.error_thresholds[zone_idx]
+            .iter()
+            .take_while(|&&t| error_rate > t)
+            .count() as u64;
+        let level = (step_level << 8) | crossed.min(0xff);
+        if level_slot.swap(level, Ordering::Relaxed) != level {
+            self.error_epoch.fetch_add(1, Ordering::Release);
+        }
+    }
+
+    /// Called when a zone becomes saturated under its concurrency limit, or stops
+    /// being so.
+    pub fn observe_saturation_change(&self) {
+        self.capacity_epoch.fetch_add(1, Ordering::Release);
+    }
+
+    fn stale_reason(
+        &self,
+        entry: &CachedDecision<T>,
+        stamp: DecisionStamp,
+        last_zone: Option<usize>,
+    ) -> Option<usize> {
+        if entry.stamp.carbon != stamp.carbon {
+            return Some(REASON_CARBON);
+        }
+        if entry.stamp.circuit != stamp.circuit {
+            return Some(REASON_CIRCUIT);
+        }
+        if entry.stamp.error_rate != stamp.error_rate {
+            return Some(REASON_ERROR_RATE);
+        }
+        if entry.stamp.capacity != stamp.capacity {
+            return Some(REASON_CAPACITY);
+        }
+        if last_zone.is_some_and(|zone| zone != entry.zone_idx) {
+            return Some(REASON_HYSTERESIS);
+        }
+        let age_ms = monotonic_ms().saturating_sub(entry.created_ms);
+        if self.max_age_ms > 0 && age_ms >= self.max_age_ms {
+            return Some(REASON_EXPIRED);
+        }
+        None
+    }
+
+    /// Cached decisions across all routes, for `/metrics`.
+    pub fn len(&self) -> usize {
+        self.routes
+            .iter()
+            .flatten()
+            .flatten()
+            .map(|shard| {
+                let buckets = shard.0.read().expect("decision cache lock poisoned");
+                buckets.values().map(Vec::len).sum::<usize>()
+            })
+            .sum()
+    }
+}
+
+fn shard_of(hash: u64) -> usize {
+    // The maps inside rehash the key, so the low bits are free to pick the shard.
+    (hash % SHARDS as u64) as usize
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn key(region: &str) -> DecisionKey<'_> {
+        DecisionKey {
+            region,
+            route_class: "flexible",
+            carbon_cursor_enabled: true,
+            forecasting_enabled: false,
+            time_shift_enabled: false,
+        }
+    }
+
+    #[test]
+    fn reuses_decision_until_an_input_moves() {
+        let cache: DecisionCache<&str> = DecisionCache::new(
+            &config::DecisionCacheConfig::default(),
+            vec![true],
+            vec![vec![0.05]],
+        );
+        let stamp = cache.stamp(7, 0);
+        cache.insert(0, &key("eu"), stamp, 0, Arc::new("zone-a"));
+        assert_eq!(
+            cache.get(0, &key("eu"), cache.stamp(7, 0), None).as_deref(),
+            Some(&"zone-a")
+        );
+        assert!(cache.get(0, &key("us"), cache.stamp(7, 0), None).is_none());
+
+        // Below the next error-rate step: still cached.
+        cache.observe_error_rate(0, 0.004);
+        assert!(cache.get(0, &key("eu"), cache.stamp(7, 0), None).is_some());
+        // A zone filling up invalidates.
+        cache.observe_saturation_change();
+        assert!(cache.get(0, &key("eu"), cache.stamp(7, 0), None).is_none());
+        assert_eq!(
+            cache.invalidations[REASON_CAPACITY].load(Ordering::Relaxed),
+            1
+        );
+    }
+
+    #[test]
+    fn carbon_circuit_and_hysteresis_changes_invalidate() {
+        let cache: DecisionCache<&str> = DecisionCache::new(
+            &config::DecisionCacheConfig::default(),
+            vec![true],
+            vec![Vec::new()],
+        );
+        cache.insert(0, &key("eu"), cache.stamp(1, 0), 0, Arc::new("zone-a"));
+        assert!(cache.get(0, &key("eu"), cache.stamp(2, 0), None).is_none());
+        assert_eq!(
+            cache.invalidations[REASON_CARBON].load(Ordering::Relaxed),
+            1
+        );
+        assert!(cache
+            .get(0, &key("eu"), cache.stamp(1, 0), Some(1))
+            .is_none());
+        assert_eq!(
+            cache.invalidations[REASON_HYSTERESIS].load(Ordering::Relaxed),
+            1
+        );
+        assert!(cache
+            .get(0, &key("eu"), cache.stamp(1, 0), Some(0))
+            .is_some());
+        assert!(cache
+            .get(0, &key("eu"), cache.stamp(1, 1), Some(0))
+            .is_none());
+        assert_eq!(
+            cache.invalidations[REASON_CIRCUIT].load(Ordering::Relaxed),
+            1
+        );
+    }
+
+    #[test]
+    fn colliding_keys_never_share_a_decision() {
+        let cache: DecisionCache<&str> = DecisionCache::new(
+            &config::DecisionCacheConfig::default(),
+            vec![true],
+            vec![Vec::new()],
+        );
+        let stamp = cache.stamp(1, 0);
+        cache.insert_hashed(0, 42, &key("eu"), stamp, 0, Arc::new("zone-a"));
+        assert!(cache.get_hashed(0, 42, &key("us"), stamp, None).is_none());
+        cache.insert_hashed(0, 42, &key("us"), stamp, 1, Arc::new("zone-b"));
+        assert_eq!(
+            cache.get_hashed(0, 42, &key("eu"), stamp, None).as_deref(),
+            Some(&"zone-a")
+        );
+        assert_eq!(
+            cache.get_hashed(0, 42, &key("us"), stamp, None).as_deref(),
+            Some(&"zone-b")
+        );
+        assert_eq!(cache.len(), 2);
+    }
+
+    #[test]
+    fn entries_expire_after_max_age() {
+        let cfg = config::DecisionCacheConfig {
+            max_age_ms: 5,
+            ..Default::default()
+        };
+        let cache: DecisionCache<&str> = DecisionCache::new(&cfg, vec![true], vec![Vec::new()]);
+        cache.insert(0, &key("eu"), cache.stamp(1, 0), 0, Arc::new("zone-a"));
+        std::thread::sleep(std::time::Duration::from_millis(10));
+        assert!(cache.get(0, &key("eu"), cache.stamp(1, 0), None).is_none());
+        assert_eq!(
+            cache.invalidations[REASON_EXPIRED].load(Ordering::Relaxed),
+            1
+        );
+    }
+}
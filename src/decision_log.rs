@@ -0,0 +1,435 @@
+use std::borrow::Cow;
+use std::fs::{self, File, OpenOptions};
+use std::io::{self, Write};
+use std::path::{Path, PathBuf};
+use std::sync::atomic::{AtomicU64, Ordering};
+use std::sync::Arc;
+use std::thread::{self, Thread};
+use std::time::Duration;
+
+use once_cell::sync::OnceCell;
+use rilot_core::RingBuffer;
+use serde::Serialize;
+
+use crate::config::DecisionLogConfig;
+use crate::metrics::DEFAULT_ZONE;
+
+/// One routing decision, captured on the request task with owned fields only. Route
+/// and zone are indices; the writer resolves their names when it encodes the line.
+pub struct DecisionRecord {
+    pub route_idx: usize,
+    pub zone_idx: Option<usize>,
+    pub class: String,
+    pub method: String,
+    pub status: u16,
+    pub score: Option<f64>,
+    pub reason: Option<Cow<'static, str>>,
+    pub carbon_g_per_kwh: Option<f64>,
+    pub latency_ms_estimate: Option<f64>,
+    pub latency_ms_observed: f64,
+    pub co2e_g: f64,
+    pub is_error: bool,
+    pub energy_source: Option<String>,
+}
+
+#[derive(Serialize)]
+struct DecisionLine<'a> {
+    route: &'a str,
+    class: &'a str,
+    method: &'a str,
+    status: u16,
+    selected_zone: &'a str,
+    score: Option<f64>,
+    reason: Option<&'a str>,
+    carbon_g_per_kwh: Option<f64>,
+    latency_ms_estimate: Option<f64>,
+    latency_ms_observed: f64,
+    co2e_g: f64,
+    is_error: bool,
+    energy_source: Option<&'a str>,
+}
+
+#[derive(Default)]
+pub struct DecisionLogStats {
+    pub enqueued_total: AtomicU64,
+    /// Records lost because the queue was full.
+    pub dropped_total: AtomicU64,
+    pub written_total: AtomicU64,
+    pub write_errors_total: AtomicU64,
+    pub rotations_total: AtomicU64,
+}
+
+/// Decision log pipeline: request tasks push records into a bounded lock-free ring
+/// and a dedicated writer thread drains it in batches, so formatting and I/O never
+/// run on the request path. A full ring drops the record and counts it.
+pub struct DecisionLog {
+    config: DecisionLogConfig,
+    ring: RingBuffer<DecisionRecord>,
+    /// Keep one in every `sample_every` decisions; `0` disables sampling.
+    sample_every: u64,
+    sequence: AtomicU64,
+    routes: Vec<String>,
+    zones: Vec<String>,
+    writer: OnceCell<Thread>,
+    pub stats: DecisionLogStats,
+}
+
+impl DecisionLog {
+    pub fn new(
+        config: &DecisionLogConfig,
+        sample_rate: f64,
+        routes: Vec<String>,
+        zones: Vec<String>,
+    ) -> Self {
+        let sample_every = if sample_rate <= 0.0 {
+            0
+        } else if sample_rate >= 1.0 {
+            1
+        } else {
+            ((1.0 / sample_rate).round() as u64).max(1)
+        };
+        Self {
+            config: config.clone(),
+            ring: RingBuffer::new(config.queue_capacity),
+            sample_every,
+            sequence: AtomicU64::new(0),
+            routes,
+            zones,
+            writer: OnceCell::new(),
+            stats: DecisionLogStats::default(),
+        }
+    }
+
+    /// Whether a finished request is logged: errors and slow requests are always kept
+    /// (tail rules), everything else is sampled.
+    pub fn should_keep(&self, is_error: bool, latency_ms: f64) -> bool {
+        if is_error && self.config.keep_errors {
+            return true;
+        }
+        if self
+            .config
+            .keep_slow_ms
+            .is_some_and(|slow_ms| latency_ms >= slow_ms)
+        {
+            return true;
+        }
+        match self.sample_every {
+            0 => false,
+            1 => true,
+            n => self.sequence.fetch_add(1, Ordering::Relaxed) % n == 0,
+        }
+    }
+
+    /// Queue `record` for the writer without blocking.
+    pub fn submit(&self, record: DecisionRecord) {
+        if self.ring.push(record).is_err() {
+            self.stats.dropped_total.fetch_add(1, Ordering::Relaxed);
+            return;
+        }
+        self.stats.enqueued_total.fetch_add(1, Ordering::Relaxed);
+        // Wake the writer early once a full batch is waiting.
+        if self.ring.len() >= self.config.batch_size {
+            if let Some(writer) = self.writer.get() {
+                writer.unpark();
+            }
+        }
+    }
+
+    pub fn queue_depth(&self) -> usize {
+        self.ring.len()
+    }
+
+    /// Start the writer thread. It drains up to `batch_size` records per write and
+    /// otherwise wakes every `flush_interval_ms`. Once nothing else holds the log
+    /// (a config reload replaced it) the writer drains what is left and exits.
+    pub fn spawn_writer(self: &Arc<Self>) {
+        let log = self.clone();
+        let spawned = thread::Builder::new()
+            .name("rilot-decision-log".to_string())
+            .spawn(move || log.run_writer());
+        match spawned {
+            Ok(handle) => {
+                let _ = self.writer.set(handle.thread().clone());
+            }
+            Err(e) => log::warn!("decision_log_writer_spawn_failed error={}", e),
+        }
+    }
+
+    fn run_writer(self: Arc<Self>) {
+        let mut sink = Sink::open(&self.config);
+        let batch_size = self.config.batch_size.max(1);
+        let flush_interval = Duration::from_millis(self.config.flush_interval_ms.max(1));
+        let mut batch = Vec::with_capacity(batch_size * 256);
+        loop {
+            let mut records = 0;
+            while records < batch_size {
+                let Some(record) = self.ring.pop() else {
+                    break;
+                };
+                self.encode(&record, &mut batch);
+                records += 1;
+            }
+            if records > 0 {
+                match sink.write_batch(&batch, &self.stats) {
+                    Ok(()) => {
+                        self.stats
+                            .written_total
+                            .fetch_add(records as u64, Ordering::Relaxed);
+                    }
+                    Err(e) => {
+                        self.stats
+                            .write_errors_total
+                            .fetch_add(1, Ordering::Relaxed);
+                        log::warn!("decision_log_write_failed records={} error={}", records, e);
+                    }
+                }
+                batch.clear();
+            } else if Arc::strong_count(&self) == 1 {
+                return;
+            }
+            if records < batch_size {
+                thread::park_timeout(flush_interval);
+            }
+        }
+    }
+
+    /// Appends `record` to `out` as one NDJSON line.
+    fn encode(&self, record: &DecisionRecord, out: &mut Vec<u8>) {
+        let line = DecisionLine {
+            route: self.routes.get(record.route_idx).map_or("", String::as_str),
+            class: &record.class,
+            method: &record.method,
+            status: record.status,
+            selected_zone: record
+                .zone_idx
+                .and_then(|idx| self.zones.get(idx))
+                .map_or(DEFAULT_ZONE, String::as_str),
+            score: record.score,
+            reason: record.reason.as_deref(),
+            carbon_g_per_kwh: record.carbon_g_per_kwh,
+            latency_ms_estimate: record.latency_ms_estimate,
+            latency_ms_observed: record.latency_ms_observed,
+            co2e_g: record.co2e_g,
+            is_error: record.is_error,
+            energy_source: record.energy_source.as_deref(),
+        };
+        if serde_json::to_writer(&mut *out, &line).is_ok() {
+            out.push(b'\n');
+        }
+    }
+}
+
+enum Sink {
+    Log,
+    File(RotatingFile),
+}
+
+impl Sink {
+    fn open(config: &DecisionLogConfig) -> Self {
+        if config.sink != "file" {
+            return Sink::Log;
+        }
+        match RotatingFile::open(PathBuf::from(&config.path), config) {
+            Ok(file) => Sink::File(file),
+            Err(e) => {
+                log::warn!(
+                    "decision_log_open_failed path={} error={} fallback=log",
+                    config.path,
+                    e
+                );
+                Sink::Log
+            }
+        }
+    }
+
+    fn write_batch(&mut self, batch: &[u8], stats: &DecisionLogStats) -> io::Result<()> {
+        match self {
+            Sink::Log => {
+                for line in String::from_utf8_lossy(batch).lines() {
+                    log::info!("decision={}", line);
+                }
+                Ok(())
+            }
+            Sink::File(file) => file.write_batch(batch, stats),
+        }
+    }
+}
+
+/// Append-only NDJSON file rotated by size: `path` -> `path.1` -> ... -> `path.<max_files>`.
+struct RotatingFile {
+    path: PathBuf,
+    file: File,
+    written: u64,
+    max_bytes: u64,
+    max_files: usize,
+}
+
+impl RotatingFile {
+    fn open(path: PathBuf, config: &DecisionLogConfig) -> io::Result<Self> {
+        let file = OpenOptions::new().create(true).append(true).open(&path)?;
+        let written = file.metadata()?.len();
+        Ok(Self {
+            path,
+            file,
+            written,
+            max_bytes: config.max_file_bytes,
+            max_files: config.max_files,
+        })
+    }
+
+    /// Writes a whole batch with one call, rotating first when it would overflow.
+    fn write_batch(&mut self, batch: &[u8], stats: &DecisionLogStats) -> io::Result<()> {
+        if self.max_bytes > 0
+            && self.written > 0
+            && self.written + batch.len() as u64 > self.max_bytes
+        {
+            self.rotate()?;
+            stats.rotations_total.fetch_add(1, Ordering::Relaxed);
+        }
+        self.file.write_all(batch)?;
+        self.written += batch.len() as u64;
+        Ok(())
+    }
+
+    fn rotate(&mut self) -> io::Result<()> {
+        self.file.flush()?;
+        if self.max_files > 0 {
+            for idx in (1..self.max_files).rev() {
+                let from = rotated_path(&self.path, idx);
+                if from.exists() {
+                    fs::rename(&from, rotated_path(&self.path, idx + 1))?;
+                }
+            }
+            fs::rename(&self.path, rotated_path(&self.path, 1))?;
+        }
+        self.file = OpenOptions::new()
+            .create(true)
+            .write(true)
+            .truncate(true)
+            .open(&self.path)?;
+        self.written = 0;
+        Ok(())
+    }
+}
+
+fn rotated_path(path: &Path, idx: usize) -> PathBuf {
+    let mut name = path.as_os_str().to_owned();
+    name.push(format!(".{}", idx));
+    PathBuf::from(name)
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn record(route_idx: usize, is_error: bool) -> DecisionRecord {
+        DecisionRecord {
+            route_idx,
+            zone_idx: Some(0),
+            class: "flexible".to_string(),
+            method: "GET".to_string(),
+            status: if is_error { 502 } else { 200 },
+            score: Some(0.5),
+            reason: None,
+            carbon_g_per_kwh: Some(120.0),
+            latency_ms_estimate: Some(12.0),
+            latency_ms_observed: 10.0,
+            co2e_g: 0.001,
+            is_error,
+            energy_source: None,
+        }
+    }
+
+    fn decision_log(config: DecisionLogConfig, sample_rate: f64) -> DecisionLog {
+        DecisionLog::new(
+            &config,
+            sample_rate,
+            vec!["/api".to_string()],
+            vec!["eu-west".to_string(), DEFAULT_ZONE.to_string()],
+        )
+    }
+
+    #[test]
+    fn samples_and_keeps_tail_requests() {
+        let config = DecisionLogConfig {
+            keep_slow_ms: Some(500.0),
+            ..DecisionLogConfig::default()
+        };
+        let log = decision_log(config, 0.25);
+        let kept = (0..100).filter(|_| log.should_keep(false, 10.0)).count();
+        assert_eq!(kept, 25);
+        let log = decision_log(DecisionLogConfig::default(), 0.0);
+        assert!(!log.should_keep(false, 10.0));
+        assert!(log.should_keep(true, 10.0));
+        let config = DecisionLogConfig {
+            keep_slow_ms: Some(500.0),
+            ..DecisionLogConfig::default()
+        };
+        let log = decision_log(config, 0.0);
+        assert!(log.should_keep(false, 800.0));
+    }
+
+    #[test]
+    fn full_queue_drops_and_counts() {
+        let config = DecisionLogConfig {
+            queue_capacity: 2,
+            ..DecisionLogConfig::default()
+        };
+        let log = decision_log(config, 1.0);
+        for _ in 0..5 {
+            log.submit(record(0, false));
+        }
+        assert_eq!(log.stats.enqueued_total.load(Ordering::Relaxed), 2);
+        assert_eq!(log.stats.dropped_total.load(Ordering::Relaxed), 3);
+        assert_eq!(log.queue_depth(), 2);
+    }
+
+    #[test]
+    fn encodes_ndjson_with_resolved_names() {
+        let log = decision_log(DecisionLogConfig::default(), 1.0);
+        let mut out = Vec::new();
+        log.encode(&record(0, false), &mut out);
+        let mut unrouted = record(0, true);
+        unrouted.zone_idx = None;
+        log.encode(&unrouted, &mut out);
+        let text = String::from_utf8(out).unwrap();
+        let lines: Vec<serde_json::Value> = text
+            .lines()
+            .map(|l| serde_json::from_str(l).unwrap())
+            .collect();
+        assert_eq!(lines.len(), 2);
+        assert_eq!(lines[0]["route"], "/api");
+        assert_eq!(lines[0]["selected_zone"], "eu-west");
+        assert_eq!(lines[1]["selected_zone"], DEFAULT_ZONE);
+        assert_eq!(lines[1]["status"], 502);
+    }
+
+    #[test]
+    fn rotates_files_by_size() {
+        let dir = std::env::temp_dir().join(format!("rilot-decision-log-{}", std::process::id()));
+        fs::create_dir_all(&dir).unwrap();
+        let path = dir.join("decisions.ndjson");
+        let config = DecisionLogConfig {
+            max_file_bytes: 10,
+            max_files: 2,
+            ..DecisionLogConfig::default()
+        };
+        let stats = DecisionLogStats::default();
+        let mut file = RotatingFile::open(path.clone(), &config).unwrap();
+        for batch in ["aaaaaaaa\n", "bbbbbbbb\n", "cccccccc\n", "dddddddd\n"] {
+            file.write_batch(batch.as_bytes(), &stats).unwrap();
+        }
+        assert_eq!(stats.rotations_total.load(Ordering::Relaxed), 3);
+        assert_eq!(fs::read_to_string(&path).unwrap(), "dddddddd\n");
+        assert_eq!(
+            fs::read_to_string(rotated_path(&path, 1)).unwrap(),
+            "cccccccc\n"
+        );
+        assert_eq!(
+            fs::read_to_string(rotated_path(&path, 2)).unwrap(),
+            "bbbbbbbb\n"
+        );
+        assert!(!rotated_path(&path, 3).exists());
+        fs::remove_dir_all(&dir).unwrap();
+    }
+}
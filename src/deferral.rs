@@ -0,0 +1,388 @@
+use hyper::body::Bytes;
+use rilot_core::TtlLru;
+use std::collections::HashMap;
+use std::sync::atomic::{AtomicU64, AtomicUsize, Ordering};
+use std::sync::{Arc, Mutex, RwLock};
+use std::time::{Duration, Instant};
+use tokio::sync::oneshot;
+
+use crate::carbon::{CarbonSignal, CarbonSignals};
+use crate::config::DeferralConfig;
+use crate::metrics::{AtomicF64, LatencyHistogram, LatencyLayout};
+
+/// Why a deferred request was let go, in `released` counter order.
+pub const RELEASE_REASONS: [&str; 4] = ["improved", "forecast-withdrawn", "deadline", "cancelled"];
+const REASON_IMPROVED: usize = 0;
+const REASON_FORECAST_WITHDRAWN: usize = 1;
+const REASON_DEADLINE: usize = 2;
+const REASON_CANCELLED: usize = 3;
+
+/// Wait-time histogram range: 100 ms to 24 h, two buckets per doubling.
+const WAIT_HISTOGRAM_MIN_MS: f64 = 100.0;
+const WAIT_HISTOGRAM_MAX_MS: f64 = 86_400_000.0;
+const WAIT_HISTOGRAM_SUB_BUCKETS: usize = 2;
+
+/// A request waiting for its zone's greener window.
+struct Waiter {
+    /// Zone name rather than index, so waiters survive a config reload.
+    zone: String,
+    /// Zone's current intensity when the request was deferred.
+    deferred_g_per_kwh: Option<f64>,
+    min_improvement_ratio: f64,
+    enqueued_at: Instant,
+    deadline: Instant,
+    release: oneshot::Sender<&'static str>,
+}
+
+impl Waiter {
+    /// Index into [`RELEASE_REASONS`] once the waiter should go, given the zone's
+    /// latest signal; `None` for a zone the config no longer has.
+    fn release_reason(&self, signal: Option<CarbonSignal>, now: Instant) -> Option<usize> {
+        if self.release.is_closed() {
+            return Some(REASON_CANCELLED);
+        }
+        let Some(signal) = signal else {
+            return Some(REASON_FORECAST_WITHDRAWN);
+        };
+        if let (Some(then), Some(current)) = (self.deferred_g_per_kwh, signal.current) {
+            if then > 0.0 && (then - current) / then >= self.min_improvement_ratio {
+                return Some(REASON_IMPROVED);
+            }
+        }
+        // The window only stays worth waiting for while the forecast still predicts it.
+        // An unknown signal (provider hiccup, nothing fetched yet) withdraws nothing;
+        // the waiter keeps waiting until its deadline.
+        if let (Some(current), Some(next)) = (signal.current, signal.forecast_next) {
+            if current > 0.0 && (current - next) / current < self.min_improvement_ratio {
+                return Some(REASON_FORECAST_WITHDRAWN);
+            }
+        }
+        if now >= self.deadline {
+            return Some(REASON_DEADLINE);
+        }
+        None
+    }
+}
+
+/// Outcome of a request accepted with `202`, kept for polling.
+#[derive(Clone)]
+pub enum DeferredResult {
+    Pending,
+    Done {
+        status: u16,
+        content_type: Option<String>,
+        body: Bytes,
+    },
+}
+
+pub struct DeferralStats {
+    pub enqueued_total: AtomicU64,
+    /// Requests forwarded immediately because the queue was full.
+    pub rejected_total: AtomicU64,
+    pub released: [AtomicU64; RELEASE_REASONS.len()],
+    pub callbacks_failed_total: AtomicU64,
+    pub wait_ms: LatencyHistogram,
+    pub wait_ms_sum: AtomicF64,
+}
+
+/// Bounded queue of time-shifted requests. Instead of sleeping for
+/// `max_defer_seconds`, each deferred request parks on a oneshot and a scheduler
+/// task releases it as soon as its zone's current intensity has improved by the
+/// route's `forecast_min_improvement_ratio`, the forecast stops predicting that
+/// improvement, or the deadline passes.
+pub struct DeferralQueue {
+    capacity: AtomicUsize,
+    check_interval: Duration,
+    carbon: RwLock<Option<Arc<CarbonSignals>>>,
+    waiters: Mutex<Vec<Waiter>>,
+    depth: AtomicUsize,
+    results: Mutex<TtlLru<u64, DeferredResult>>,
+    next_id: AtomicU64,
+    pub stats: DeferralStats,
+}
+
+impl DeferralQueue {
+    pub fn new(config: &DeferralConfig) -> Self {
+        let wait_layout = Arc::new(LatencyLayout::new(
+            WAIT_HISTOGRAM_MIN_MS,
+            WAIT_HISTOGRAM_MAX_MS,
+            WAIT_HISTOGRAM_SUB_BUCKETS,
+        ));
+        Self {
+            capacity: AtomicUsize::new(config.max_queued),
+            check_interval: Duration::from_millis(config.check_interval_ms.max(10)),
+            carbon: RwLock::new(None),
+            waiters: Mutex::new(Vec::new()),
+            depth: AtomicUsize::new(0),
+            results: Mutex::new(TtlLru::new(
+                config.max_results,
+                Duration::from_secs(config.result_ttl_secs),
+            )),
+            next_id: AtomicU64::new(0),
+            stats: DeferralStats {
+                enqueued_total: AtomicU64::new(0),
+                rejected_total: AtomicU64::new(0),
+                released: Default::default(),
+                callbacks_failed_total: AtomicU64::new(0),
+                wait_ms: LatencyHistogram::new(wait_layout),
+                wait_ms_sum: AtomicF64::new(0.0),
+            },
+        }
+    }
+
+    /// Park a request on `zone` for at most `max_wait`. Resolves with the release
+    /// reason; `None` when the queue is full and the caller should forward now.
+    pub fn enqueue(
+        &self,
+        zone: &str,
+        deferred_g_per_kwh: Option<f64>,
+        min_improvement_ratio: f64,
+        max_wait: Duration,
+    ) -> Option<oneshot::Receiver<&'static str>> {
+        let (release, released) = oneshot::channel();
+        let now = Instant::now();
+        let mut waiters = self.waiters.lock().expect("deferral queue lock poisoned");
+        if waiters.len() >= self.capacity.load(Ordering::Relaxed) {
+            self.stats.rejected_total.fetch_add(1, Ordering::Relaxed);
+            return None;
+        }
+        waiters.push(Waiter {
+            zone: zone.to_string(),
+            deferred_g_per_kwh,
+            min_improvement_ratio,
+            enqueued_at: now,
+            deadline: now + max_wait,
+            release,
+        });
+        self.depth.store(waiters.len(), Ordering::Relaxed);
+        self.stats.enqueued_total.fetch_add(1, Ordering::Relaxed);
+        Some(released)
+    }
+
+    pub fn depth(&self) -> usize {
+        self.depth.load(Ordering::Relaxed)
+    }
+
+    /// Re-check every waiter against the latest signals every `check_interval_ms`.
+    /// Stops once the queue is dropped.
+    pub fn spawn_scheduler(self: &Arc<Self>, carbon: Arc<CarbonSignals>) {
+        *self.carbon.write().expect("deferral carbon lock poisoned") = Some(carbon);
+        let queue = self.clone();
+        tokio::spawn(async move {
+            let mut interval = tokio::time::interval(queue.check_interval);
+            interval.set_missed_tick_behavior(tokio::time::MissedTickBehavior::Delay);
+            loop {
+                interval.tick().await;
+                if Arc::strong_count(&queue) == 1 {
+                    return;
+                }
+                queue.release_due(|zone| queue.signal(zone), Instant::now());
+            }
+        });
+    }
+
+    /// Apply a reloaded config: waiters stay queued and are checked against `carbon`
+    /// from now on. `check_interval_ms` and the result store keep their startup sizes.
+    pub fn reconfigure(&self, config: &DeferralConfig, carbon: Arc<CarbonSignals>) {
+        self.capacity.store(config.max_queued, Ordering::Relaxed);
+        *self.carbon.write().expect("deferral carbon lock poisoned") = Some(carbon);
+    }
+
+    /// `None` for a zone the current config no longer has, which releases its waiters.
+    fn signal(&self, zone: &str) -> Option<CarbonSignal> {
+        let carbon = self.carbon.read().expect("deferral carbon lock poisoned");
+        let carbon = carbon.as_ref()?;
+        carbon.zone_idx(zone).map(|idx| carbon.get(idx))
+    }
+
+    /// Releases every waiter that is due; `signal` is read once per zone.
+    fn release_due(&self, signal: impl Fn(&str) -> Option<CarbonSignal>, now: Instant) {
+        let mut due = Vec::new();
+        {
+            let mut waiters = self.waiters.lock().expect("deferral queue lock poisoned");
+            if waiters.is_empty() {
+                return;
+            }
+            let mut signals: HashMap<String, Option<CarbonSignal>> = HashMap::new();
+            let mut idx = 0;
+            while idx < waiters.len() {
+                let zone = &waiters[idx].zone;
+                let zone_signal = match signals.get(zone) {
+                    Some(cached) => *cached,
+                    None => {
+                        let fresh = signal(zone);
+                        signals.insert(zone.clone(), fresh);
+                        fresh
+                    }
+                };
+                match waiters[idx].release_reason(zone_signal, now) {
+                    Some(reason) => due.push((waiters.swap_remove(idx), reason)),
+                    None => idx += 1,
+                }
+            }
+            self.depth.store(waiters.len(), Ordering::Relaxed);
+        }
+        for (waiter, reason) in due {
+            let waited_ms = now.duration_since(waiter.enqueued_at).as_secs_f64() * 1000.0;
+            self.stats.wait_ms.record(waited_ms);
+            self.stats.wait_ms_sum.add(waited_ms);
+            self.stats.released[reason].fetch_add(1, Ordering::Relaxed);
+            let _ = waiter.release.send(RELEASE_REASONS[reason]);
+        }
+    }
+
+    /// Registers a pending `202 Accepted` result and returns its id.
+    pub fn open_result(&self) -> u64 {
+        let id = self.next_id.fetch_add(1, Ordering::Relaxed) + 1;
+        self.store_result(id, DeferredResult::Pending);
+        id
+    }
+
+    pub fn complete_result(&self, id: u64, result: DeferredResult) {
+        self.store_result(id, result);
+    }
+
+    pub fn result(&self, id: u64) -> Option<DeferredResult> {
+        self.results
+            .lock()
+            .expect("deferral results lock poisoned")
+            .get(&id, Instant::now())
+            .cloned()
+    }
+
+    fn store_result(&self, id: u64, result: DeferredResult) {
+        self.results
+            .lock()
+            .expect("deferral results lock poisoned")
+            .insert(id, result, Instant::now());
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn queue(max_queued: usize) -> DeferralQueue {
+        DeferralQueue::new(&DeferralConfig {
+            max_queued,
+            ..DeferralConfig::default()
+        })
+    }
+
+    fn signal(current: f64, forecast_next: f64) -> Option<CarbonSignal> {
+        Some(CarbonSignal {
+            current: Some(current),
+            forecast_next: Some(forecast_next),
+        })
+    }
+
+    #[test]
+    fn releases_when_the_signal_improves_not_before() {
+        let queue = queue(8);
+        let mut released = queue
+            .enqueue("east", Some(400.0), 0.2, Duration::from_secs(600))
+            .unwrap();
+        let now = Instant::now();
+        queue.release_due(|_| signal(380.0, 250.0), now);
+        assert!(released.try_recv().is_err());
+        assert_eq!(queue.depth(), 1);
+
+        queue.release_due(|_| signal(300.0, 250.0), now);
+        assert_eq!(released.try_recv().unwrap(), "improved");
+        assert_eq!(queue.depth(), 0);
+        assert_eq!(
+            queue.stats.released[REASON_IMPROVED].load(Ordering::Relaxed),
+            1
+        );
+    }
+
+    #[test]
+    fn releases_on_withdrawn_forecast_or_deadline() {
+        let queue = queue(8);
+        let mut withdrawn = queue
+            .enqueue("east", Some(400.0), 0.2, Duration::from_secs(600))
+            .unwrap();
+        let mut expired = queue
+            .enqueue("west", Some(400.0), 0.2, Duration::from_secs(1))
+            .unwrap();
+        let later = Instant::now() + Duration::from_secs(2);
+        queue.release_due(
+            |zone| {
+                if zone == "east" {
+                    signal(400.0, 390.0)
+                } else {
+                    signal(400.0, 200.0)
+                }
+            },
+            later,
+        );
+        assert_eq!(withdrawn.try_recv().unwrap(), "forecast-withdrawn");
+        assert_eq!(expired.try_recv().unwrap(), "deadline");
+    }
+
+    #[test]
+    fn full_queue_rejects_and_dropped_waiters_are_cancelled() {
+        let queue = queue(1);
+        let released = queue.enqueue("east", Some(400.0), 0.2, Duration::from_secs(600));
+        assert!(queue
+            .enqueue("east", Some(400.0), 0.2, Duration::from_secs(600))
+            .is_none());
+        assert_eq!(queue.stats.rejected_total.load(Ordering::Relaxed), 1);
+        drop(released);
+        queue.release_due(|_| signal(400.0, 200.0), Instant::now());
+        assert_eq!(queue.depth(), 0);
+        assert_eq!(
+            queue.stats.released[REASON_CANCELLED].load(Ordering::Relaxed),
+            1
+        );
+    }
+
+    #[test]
+    fn unknown_signals_wait_for_the_deadline_and_removed_zones_release() {
+        let queue = queue(8);
+        let mut waiting = queue
+            .enqueue("east", Some(400.0), 0.2, Duration::from_secs(60))
+            .unwrap();
+        let mut removed = queue
+            .enqueue("west", Some(400.0), 0.2, Duration::from_secs(60))
+            .unwrap();
+        let unknown = |zone: &str| {
+            (zone == "east").then_some(CarbonSignal {
+                current: None,
+                forecast_next: None,
+            })
+        };
+        let now = Instant::now();
+        queue.release_due(unknown, now);
+        assert!(waiting.try_recv().is_err());
+        assert_eq!(removed.try_recv().unwrap(), "forecast-withdrawn");
+
+        let current_only = |_: &str| {
+            Some(CarbonSignal {
+                current: Some(400.0),
+                forecast_next: None,
+            })
+        };
+        queue.release_due(current_only, now);
+        assert!(waiting.try_recv().is_err());
+        queue.release_due(unknown, now + Duration::from_secs(61));
+        assert_eq!(waiting.try_recv().unwrap(), "deadline");
+    }
+
+    #[tokio::test]
+    async fn scheduler_stops_once_the_queue_is_dropped() {
+        let queue = Arc::new(DeferralQueue::new(&DeferralConfig {
+            check_interval_ms: 10,
+            ..DeferralConfig::default()
+        }));
+        let carbon = Arc::new(CarbonSignals::new(
+            Arc::new(crate::config::CarbonProviderConfig::default()),
+            vec!["east".to_string()],
+        ));
+        queue.spawn_scheduler(carbon);
+        let weak = Arc::downgrade(&queue);
+        drop(queue);
+        tokio::time::sleep(Duration::from_millis(50)).await;
+        assert!(weak.upgrade().is_none());
+    }
+}
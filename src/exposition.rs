@@ -0,0 +1,400 @@
+use std::fmt::{Display, Write as _};
+use std::io::Write as _;
+use std::sync::atomic::{AtomicUsize, Ordering};
+
+use flate2::write::GzEncoder;
+use flate2::Compression;
+
+use crate::metrics::{LatencyHistogram, MetricsMatrix};
+
+const PROMETHEUS_CONTENT_TYPE: &str = "text/plain; version=0.0.4";
+const OPENMETRICS_CONTENT_TYPE: &str = "application/openmetrics-text; version=1.0.0; charset=utf-8";
+
+/// Size of the previous scrape, so the next buffer is allocated once at full size.
+static LAST_SCRAPE_BYTES: AtomicUsize = AtomicUsize::new(0);
+
+#[derive(Clone, Copy, Debug, PartialEq, Eq)]
+pub enum Format {
+    Prometheus,
+    OpenMetrics,
+}
+
+impl Format {
+    /// OpenMetrics when the scraper's `Accept` header lists it, as Prometheus does.
+    pub fn negotiate(accept: Option<&str>) -> Self {
+        match accept {
+            Some(accept) if accept.contains("application/openmetrics-text") => Self::OpenMetrics,
+            _ => Self::Prometheus,
+        }
+    }
+
+    pub fn content_type(self) -> &'static str {
+        match self {
+            Self::Prometheus => PROMETHEUS_CONTENT_TYPE,
+            Self::OpenMetrics => OPENMETRICS_CONTENT_TYPE,
+        }
+    }
+}
+
+/// Text exposition buffer. Every family is written contiguously after its `# TYPE`
+/// line (required by OpenMetrics), and samples are written straight into the buffer
+/// with pre-encoded label sets instead of one `format!` per line.
+pub struct Exposition {
+    out: String,
+    format: Format,
+}
+
+impl Exposition {
+    pub fn new(format: Format) -> Self {
+        let capacity = LAST_SCRAPE_BYTES.load(Ordering::Relaxed).max(4096);
+        Self {
+            out: String::with_capacity(capacity + capacity / 8),
+            format,
+        }
+    }
+
+    /// Starts a family. OpenMetrics names counter families without the `_total`
+    /// suffix their samples carry.
+    pub fn family(&mut self, name: &str, kind: &str) {
+        let name = match self.format {
+            Format::OpenMetrics if kind == "counter" => name.strip_suffix("_total").unwrap_or(name),
+            _ => name,
+        };
+        let _ = writeln!(self.out, "# TYPE {} {}", name, kind);
+    }
+
+    /// `labels` comes from [`encode_labels`]; empty for an unlabeled sample.
+    pub fn sample(&mut self, name: &str, labels: &str, value: impl Display) {
+        let _ = if labels.is_empty() {
+            writeln!(self.out, "{} {}", name, value)
+        } else {
+            writeln!(self.out, "{}{{{}}} {}", name, labels, value)
+        };
+    }
+
+    /// Like [`Exposition::sample`] with one more label after `labels`, for histogram
+    /// `le` bounds and other per-sample labels whose values need no escaping.
+    pub fn sample_with(
+        &mut self,
+        name: &str,
+        labels: &str,
+        key: &str,
+        key_value: &str,
+        value: impl Display,
+    ) {
+        let sep = if labels.is_empty() { "" } else { "," };
+        let _ = writeln!(
+            self.out,
+            "{}{{{}{}{}=\"{}\"}} {}",
+            name, labels, sep, key, key_value, value
+        );
+    }
+
+    pub fn finish(mut self) -> String {
+        if self.format == Format::OpenMetrics {
+            self.out.push_str("# EOF\n");
+        }
+        LAST_SCRAPE_BYTES.store(self.out.len(), Ordering::Relaxed);
+        self.out
+    }
+}
+
+pub fn escape_label(value: &str) -> String {
+    value
+        .replace('\\', "\\\\")
+        .replace('"', "\\\"")
+        .replace('\n', "\\n")
+}
+
+/// `key="value",...` with values escaped, for use as a series' label set.
+pub fn encode_labels(pairs: &[(&str, &str)]) -> String {
+    let mut out = String::new();
+    for (i, (key, value)) in pairs.iter().enumerate() {
+        if i > 0 {
+            out.push(',');
+        }
+        let _ = write!(out, "{}=\"{}\"", key, escape_label(value));
+    }
+    out
+}
+
+pub fn accepts_gzip(accept_encoding: Option<&str>) -> bool {
+    accept_encoding.is_some_and(|value| {
+        value
+            .split(',')
+            .filter_map(|coding| coding.split(';').next())
+            .any(|coding| coding.trim().eq_ignore_ascii_case("gzip"))
+    })
+}
+
+pub fn gzip(body: &[u8]) -> std::io::Result<Vec<u8>> {
+    let mut encoder = GzEncoder::new(Vec::with_capacity(body.len() / 4), Compression::fast());
+    encoder.write_all(body)?;
+    encoder.finish()
+}
+
+/// Per-series counters read once per scrape, so every family reports the same
+/// request count for a series even while requests keep landing.
+struct SeriesSnapshot<'a> {
+    labels: &'a str,
+    latency_histogram: &'a LatencyHistogram,
+    requests: u64,
+    carbon_safe: u64,
+    errors: u64,
+    exposure: f64,
+    co2e: f64,
+    energy: f64,
+    latency_sum: f64,
+}
+
+/// Route x zone families and the per-zone carbon gauge from the metrics matrix.
+pub fn render_matrix(ex: &mut Exposition, matrix: &MetricsMatrix) {
+    let series: Vec<SeriesSnapshot<'_>> = matrix
+        .active_route_zones()
+        .map(|(route_idx, zone_idx, m)| SeriesSnapshot {
+            labels: matrix.series_labels(route_idx, zone_idx),
+            latency_histogram: &m.latency_histogram,
+            requests: m.requests_total.load(Ordering::Relaxed),
+            carbon_safe: m.carbon_safe_calls_total.load(Ordering::Relaxed),
+            errors: m.errors_total.load(Ordering::Relaxed),
+            exposure: m.carbon_intensity_exposure_total_g_per_kwh.load(),
+            co2e: m.co2e_estimated_total_g.load(),
+            energy: m.energy_estimated_total_j.load(),
+            latency_sum: m.latency_sum_ms.load(),
+        })
+        .collect();
+
+    ex.family("requests_total", "counter");
+    for s in &series {
+        ex.sample("requests_total", s.labels, s.requests);
+    }
+    ex.family("carbon_safe_calls_total", "counter");
+    for s in &series {
+        ex.sample("carbon_safe_calls_total", s.labels, s.carbon_safe);
+    }
+    ex.family("carbon_safe_call_ratio", "gauge");
+    for s in &series {
+        let ratio = if s.requests > 0 {
+            s.carbon_safe as f64 / s.requests as f64
+        } else {
+            0.0
+        };
+        ex.sample(
+            "carbon_safe_call_ratio",
+            s.labels,
+            format_args!("{:.8}", ratio),
+        );
+    }
+    ex.family("errors_total", "counter");
+    for s in &series {
+        ex.sample("errors_total", s.labels, s.errors);
+    }
+
+    ex.family("latency_ms", "histogram");
+    let layout = matrix.latency_layout();
+    for s in &series {
+        let histogram = s.latency_histogram;
+        // Buckets are stored per bucket; `le` series are cumulative.
+        let mut cumulative = 0;
+        for (i, le) in layout.labels().iter().enumerate() {
+            cumulative += histogram.count(i);
+            ex.sample_with("latency_ms_bucket", s.labels, "le", le, cumulative);
+        }
+        cumulative += histogram.count(layout.labels().len());
+        ex.sample_with("latency_ms_bucket", s.labels, "le", "+Inf", cumulative);
+        ex.sample(
+            "latency_ms_sum",
+            s.labels,
+            format_args!("{:.6}", s.latency_sum),
+        );
+        ex.sample("latency_ms_count", s.labels, cumulative);
+    }
+
+    ex.family("carbon_intensity_g_per_kwh", "gauge");
+    for zone_idx in 0..matrix.zones.len() {
+        let stats = matrix.zone(zone_idx);
+        if !stats.carbon_intensity_seen.load(Ordering::Relaxed) {
+            continue;
+        }
+        ex.sample(
+            "carbon_intensity_g_per_kwh",
+            matrix.zone_labels(zone_idx),
+            format_args!("{:.6}", stats.carbon_intensity_g_per_kwh.load()),
+        );
+    }
+
+    ex.family("carbon_intensity_exposure_total", "counter");
+    for s in &series {
+        ex.sample(
+            "carbon_intensity_exposure_total",
+            s.labels,
+            format_args!("{:.8}", s.exposure),
+        );
+    }
+    ex.family("co2e_estimated_total", "counter");
+    for s in &series {
+        ex.sample(
+            "co2e_estimated_total",
+            s.labels,
+            format_args!("{:.8}", s.co2e),
+        );
+    }
+    ex.family("energy_joules_estimated_total", "counter");
+    for s in &series {
+        ex.sample(
+            "energy_joules_estimated_total",
+            s.labels,
+            format_args!("{:.8}", s.energy),
+        );
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use crate::metrics::RequestSample;
+    use std::time::Instant;
+
+    fn matrix(routes: usize, zones: usize) -> MetricsMatrix {
+        let matrix = MetricsMatrix::new(
+            (0..routes).map(|r| format!("/svc-{:03}", r)).collect(),
+            (0..zones).map(|z| format!("zone-\"{:02}\"", z)).collect(),
+        );
+        for route_idx in 0..routes {
+            for zone_idx in 0..zones {
+                let sample = RequestSample {
+                    latency_ms: (route_idx + zone_idx) as f64 + 0.7,
+                    carbon_g_per_kwh: 200.0,
+                    is_carbon_safe: zone_idx % 2 == 0,
+                    energy_j: 1.0,
+                    co2e_g: 0.5,
+                    is_error: false,
+                };
+                matrix.record(route_idx, zone_idx, &sample);
+            }
+        }
+        matrix
+    }
+
+    #[test]
+    fn families_are_contiguous_and_openmetrics_terminated() {
+        let matrix = matrix(2, 2);
+        let mut ex = Exposition::new(Format::OpenMetrics);
+        render_matrix(&mut ex, &matrix);
+        let text = ex.finish();
+
+        assert!(text.ends_with("# EOF\n"));
+        assert!(text.contains("# TYPE requests counter\n"));
+        assert!(text.contains("requests_total{route=\"/svc-001\",zone=\"zone-\\\"00\\\"\"} 1\n"));
+        assert!(text.contains(
+            "latency_ms_bucket{route=\"/svc-000\",zone=\"zone-\\\"00\\\"\",le=\"+Inf\"} 1\n"
+        ));
+        // Each family's samples follow its TYPE line without interleaving.
+        let mut seen = Vec::new();
+        for line in text.lines().filter(|l| !l.starts_with('#')) {
+            let name = line.split(['{', ' ']).next().unwrap();
+            let family = name
+                .trim_end_matches("_bucket")
+                .trim_end_matches("_sum")
+                .trim_end_matches("_count");
+            if seen.last() != Some(&family) {
+                assert!(!seen.contains(&family), "{family} is split");
+                seen.push(family);
+            }
+        }
+    }
+
+    #[test]
+    fn gzip_is_negotiated_from_accept_encoding() {
+        assert!(accepts_gzip(Some("deflate, gzip;q=0.8")));
+        assert!(!accepts_gzip(Some("identity")));
+        assert!(!accepts_gzip(None));
+        assert_eq!(
+            Format::negotiate(Some(
+                "application/openmetrics-text;version=1.0.0,text/plain;q=0.5"
+            )),
+            Format::OpenMetrics
+        );
+    }
+
+    /// The per-line `format!` + `escape_label` renderer this module replaced.
+    fn render_legacy(matrix: &MetricsMatrix) -> String {
+        let mut out = String::new();
+        for (route_idx, zone_idx, m) in matrix.active_route_zones() {
+            let route = &matrix.routes[route_idx];
+            let zone = &matrix.zones[zone_idx];
+            for (name, value) in [
+                (
+                    "requests_total",
+                    m.requests_total.load(Ordering::Relaxed) as f64,
+                ),
+                (
+                    "carbon_safe_calls_total",
+                    m.carbon_safe_calls_total.load(Ordering::Relaxed) as f64,
+                ),
+                (
+                    "errors_total",
+                    m.errors_total.load(Ordering::Relaxed) as f64,
+                ),
+                (
+                    "carbon_intensity_exposure_total",
+                    m.carbon_intensity_exposure_total_g_per_kwh.load(),
+                ),
+                ("co2e_estimated_total", m.co2e_estimated_total_g.load()),
+                (
+                    "energy_joules_estimated_total",
+                    m.energy_estimated_total_j.load(),
+                ),
+            ] {
+                out.push_str(&format!(
+                    "{}{{route=\"{}\",zone=\"{}\"}} {}\n",
+                    name,
+                    escape_label(route),
+                    escape_label(zone),
+                    value
+                ));
+            }
+            for (i, le) in matrix.latency_layout().labels().iter().enumerate() {
+                out.push_str(&format!(
+                    "latency_ms_bucket{{route=\"{}\",zone=\"{}\",le=\"{}\"}} {}\n",
+                    escape_label(route),
+                    escape_label(zone),
+                    le,
+                    m.latency_histogram.count(i)
+                ));
+            }
+        }
+        out
+    }
+
+    /// Scrape cost at 1000 route x zone series.
+    /// Run with `cargo test --release bench_render_1000_series -- --ignored --nocapture`.
+    #[test]
+    #[ignore]
+    fn bench_render_1000_series() {
+        const SCRAPES: u32 = 50;
+        let matrix = matrix(50, 20);
+        let start = Instant::now();
+        let mut bytes = 0;
+        for _ in 0..SCRAPES {
+            let mut ex = Exposition::new(Format::Prometheus);
+            render_matrix(&mut ex, &matrix);
+            bytes = ex.finish().len();
+        }
+        let encoded = start.elapsed() / SCRAPES;
+        let start = Instant::now();
+        for _ in 0..SCRAPES {
+            std::hint::black_box(render_legacy(&matrix));
+        }
+        let legacy = start.elapsed() / SCRAPES;
+        let start = Instant::now();
+        let mut ex = Exposition::new(Format::Prometheus);
+        render_matrix(&mut ex, &matrix);
+        let compressed = gzip(ex.finish().as_bytes()).unwrap().len();
+        let with_gzip = start.elapsed();
+        println!(
+            "1000 series: {:?}/scrape pre-encoded ({} bytes), {:?}/scrape legacy, {:?} with gzip ({} bytes)",
+            encoded, bytes, legacy, with_gzip, compressed
+        );
+    }
+}
@@ -0,0 +1,417 @@
+use std::sync::atomic::{AtomicU32, AtomicU64, AtomicU8, Ordering};
+use std::sync::Arc;
+use std::time::Duration;
+
+use crate::config::{CircuitBreakerConfig, HealthCheckConfig};
+use crate::metrics::monotonic_ms;
+use crate::upstream::UpstreamPools;
+
+/// Breaker states, in `circuit_state` gauge order.
+pub const CIRCUIT_STATES: [&str; 3] = ["closed", "open", "half-open"];
+const CLOSED: u8 = 0;
+const OPEN: u8 = 1;
+const HALF_OPEN: u8 = 2;
+
+/// One zone's breaker plus its probe counters. Read lock-free by routing and
+/// `/metrics`.
+#[derive(Default)]
+pub struct Breaker {
+    state: AtomicU8,
+    consecutive_failures: AtomicU32,
+    half_open_successes: AtomicU32,
+    /// Requests let through while half-open that have not finished yet.
+    trials: AtomicU32,
+    opened_at_ms: AtomicU64,
+    pub opens_total: AtomicU64,
+    pub probes_total: AtomicU64,
+    pub probe_failures_total: AtomicU64,
+}
+
+impl Breaker {
+    pub fn state(&self) -> u8 {
+        self.state.load(Ordering::Acquire)
+    }
+}
+
+/// Per-zone circuit breakers, indexed like the metrics matrix zones.
+///
+/// A closed zone opens after `failure_threshold` consecutive failures and is skipped
+/// by routing for `open_ms`. It then turns half-open and takes up to
+/// `half_open_max_requests` trial requests at once: `success_threshold` successes
+/// close it, any failure opens it again. With health checks on, probes count like
+/// requests, so an idle zone is opened before traffic reaches it, and a successful
+/// probe ends the open period early.
+pub struct ZoneHealth {
+    pub zones: Vec<String>,
+    pub breakers: Vec<Breaker>,
+    config: CircuitBreakerConfig,
+    probes: HealthCheckConfig,
+    /// Bumped on every state change; cached routing decisions compare it.
+    version: AtomicU64,
+}
+
+impl ZoneHealth {
+    pub fn new(
+        zones: Vec<String>,
+        config: &CircuitBreakerConfig,
+        probes: &HealthCheckConfig,
+    ) -> Self {
+        Self {
+            breakers: zones.iter().map(|_| Breaker::default()).collect(),
+            zones,
+            config: config.clone(),
+            probes: probes.clone(),
+            version: AtomicU64::new(0),
+        }
+    }
+
+    pub fn version(&self) -> u64 {
+        self.version.load(Ordering::Acquire)
+    }
+
+    pub fn is_closed(&self, zone_idx: usize) -> bool {
+        self.breakers
+            .get(zone_idx)
+            .map_or(true, |b| b.state() == CLOSED)
+    }
+
+    /// Whether routing may send a request to the zone now. Only a peek: a request
+    /// actually sent there takes its half-open trial slot through [`Self::admit`].
+    pub fn admits(&self, zone_idx: usize) -> bool {
+        self.admits_at(zone_idx, monotonic_ms())
+    }
+
+    fn admits_at(&self, zone_idx: usize, now_ms: u64) -> bool {
+        let Some(breaker) = self.breakers.get(zone_idx) else {
+            return true;
+        };
+        if !self.config.enabled {
+            return true;
+        }
+        if !self.ends_open_period(zone_idx, now_ms) {
+            return false;
+        }
+        breaker.state() != HALF_OPEN
+            || breaker.trials.load(Ordering::Acquire) < self.config.half_open_max_requests
+    }
+
+    /// Starts a request to the zone if its breaker admits one; report the outcome
+    /// through [`Call::finish`]. While half-open the trial slot is reserved here, in
+    /// one step, so concurrent requests cannot all slip through as trials. `None`
+    /// when the zone is open or every trial slot is taken.
+    pub fn admit(&self, zone_idx: usize) -> Option<Call<'_>> {
+        self.admit_at(zone_idx, monotonic_ms())
+    }
+
+    fn admit_at(&self, zone_idx: usize, now_ms: u64) -> Option<Call<'_>> {
+        let Some(breaker) = self.breakers.get(zone_idx) else {
+            return Some(self.call(zone_idx));
+        };
+        if !self.config.enabled {
+            return Some(self.call(zone_idx));
+        }
+        if !self.ends_open_period(zone_idx, now_ms) {
+            return None;
+        }
+        if breaker.state() != HALF_OPEN {
+            return Some(self.call(zone_idx));
+        }
+        let max_trials = self.config.half_open_max_requests;
+        breaker
+            .trials
+            .fetch_update(Ordering::AcqRel, Ordering::Acquire, |t| {
+                (t < max_trials).then_some(t + 1)
+            })
+            .ok()?;
+        Some(Call {
+            health: self,
+            zone_idx,
+            trial: true,
+        })
+    }
+
+    /// Turns an open zone half-open once `open_ms` has passed; false while it is
+    /// still open.
+    fn ends_open_period(&self, zone_idx: usize, now_ms: u64) -> bool {
+        let breaker = &self.breakers[zone_idx];
+        if breaker.state() != OPEN {
+            return true;
+        }
+        let opened_at = breaker.opened_at_ms.load(Ordering::Acquire);
+        if now_ms.saturating_sub(opened_at) < self.config.open_ms {
+            return false;
+        }
+        self.transition(zone_idx, OPEN, HALF_OPEN, now_ms);
+        true
+    }
+
+    /// Starts a request to the zone regardless of its breaker (routing ignores the
+    /// breakers when every candidate is open); the outcome still counts. Takes no
+    /// trial slot.
+    pub fn call(&self, zone_idx: usize) -> Call<'_> {
+        Call {
+            health: self,
+            zone_idx,
+            trial: false,
+        }
+    }
+
+    fn record(&self, zone_idx: usize, success: bool, now_ms: u64) {
+        let Some(breaker) = self.breakers.get(zone_idx) else {
+            return;
+        };
+        if !self.config.enabled {
+            return;
+        }
+        if success {
+            breaker.consecutive_failures.store(0, Ordering::Relaxed);
+            if breaker.state() == HALF_OPEN {
+                let successes = breaker.half_open_successes.fetch_add(1, Ordering::AcqRel) + 1;
+                if successes >= self.config.success_threshold {
+                    self.transition(zone_idx, HALF_OPEN, CLOSED, now_ms);
+                }
+            }
+            return;
+        }
+        match breaker.state() {
+            CLOSED => {
+                let failures = breaker.consecutive_failures.fetch_add(1, Ordering::AcqRel) + 1;
+                if failures >= self.config.failure_threshold.max(1) {
+                    self.transition(zone_idx, CLOSED, OPEN, now_ms);
+                }
+            }
+            HALF_OPEN => {
+                self.transition(zone_idx, HALF_OPEN, OPEN, now_ms);
+            }
+            // Failures while open (late requests, probes) restart the open period.
+            _ => breaker.opened_at_ms.store(now_ms, Ordering::Release),
+        }
+    }
+
+    fn record_probe(&self, zone_idx: usize, healthy: bool, now_ms: u64) {
+        let Some(breaker) = self.breakers.get(zone_idx) else {
+            return;
+        };
+        breaker.probes_total.fetch_add(1, Ordering::Relaxed);
+        if !healthy {
+            breaker.probe_failures_total.fetch_add(1, Ordering::Relaxed);
+        } else if self.config.enabled && breaker.state() == OPEN {
+            self.transition(zone_idx, OPEN, HALF_OPEN, now_ms);
+        }
+        self.record(zone_idx, healthy, now_ms);
+    }
+
+    /// Moves the zone from `from` to `to`; a no-op when another thread got there first.
+    fn transition(&self, zone_idx: usize, from: u8, to: u8, now_ms: u64) {
+        let breaker = &self.breakers[zone_idx];
+        if breaker
+            .state
+            .compare_exchange(from, to, Ordering::AcqRel, Ordering::Acquire)
+            .is_err()
+        {
+            return;
+        }
+        match to {
+            OPEN => {
+                breaker.opened_at_ms.store(now_ms, Ordering::Release);
+                breaker.opens_total.fetch_add(1, Ordering::Relaxed);
+            }
+            HALF_OPEN => breaker.half_open_successes.store(0, Ordering::Relaxed),
+            _ => breaker.consecutive_failures.store(0, Ordering::Relaxed),
+        }
+        self.version.fetch_add(1, Ordering::Release);
+        log::info!(
+            "circuit zone={} from={} to={}",
+            self.zones[zone_idx],
+            CIRCUIT_STATES[from as usize],
+            CIRCUIT_STATES[to as usize]
+        );
+    }
+
+    /// Probes every zone's pool each `interval_ms` while health checks are on. Stops
+    /// once this `ZoneHealth` has been replaced by a config reload.
+    pub fn spawn_probes(self: &Arc<Self>, upstreams: Arc<UpstreamPools>) {
+        if !self.probes.enabled || self.zones.is_empty() {
+            return;
+        }
+        let health = self.clone();
+        tokio::spawn(async move {
+            let timeout = Duration::from_millis(health.probes.timeout_ms.max(1));
+            let every = Duration::from_millis(health.probes.interval_ms.max(10));
+            let mut ticker = tokio::time::interval(every);
+            ticker.set_missed_tick_behavior(tokio::time::MissedTickBehavior::Delay);
+            loop {
+                ticker.tick().await;
+                if Arc::strong_count(&health) == 1 {
+                    return;
+                }
+                let probes = health
+                    .zones
+                    .iter()
+                    .map(|zone| upstreams.for_zone(zone).probe(&health.probes.path, timeout));
+                let results = futures_util::future::join_all(probes).await;
+                let now_ms = monotonic_ms();
+                for (zone_idx, healthy) in results.into_iter().enumerate() {
+                    health.record_probe(zone_idx, healthy, now_ms);
+                }
+            }
+        });
+    }
+}
+
+/// An in-flight request to a zone, holding its half-open trial slot if it took one.
+/// Dropping it without an outcome (the client went away) only gives that slot back.
+pub struct Call<'a> {
+    health: &'a ZoneHealth,
+    zone_idx: usize,
+    trial: bool,
+}
+
+impl Call<'_> {
+    pub fn finish(self, success: bool) {
+        self.health.record(self.zone_idx, success, monotonic_ms());
+    }
+}
+
+impl Drop for Call<'_> {
+    fn drop(&mut self) {
+        if self.trial {
+            self.health.breakers[self.zone_idx]
+                .trials
+                .fetch_sub(1, Ordering::AcqRel);
+        }
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn health() -> ZoneHealth {
+        let config = CircuitBreakerConfig {
+            failure_threshold: 3,
+            open_ms: 1000,
+            half_open_max_requests: 1,
+            success_threshold: 2,
+            ..CircuitBreakerConfig::default()
+        };
+        ZoneHealth::new(
+            vec!["east".to_string(), "west".to_string()],
+            &config,
+            &HealthCheckConfig::default(),
+        )
+    }
+
+    #[test]
+    fn opens_after_consecutive_failures_and_recovers_through_half_open() {
+        let health = health();
+        health.record(0, false, 0);
+        health.record(0, false, 0);
+        health.record(0, true, 0);
+        health.record(0, false, 0);
+        health.record(0, false, 0);
+        assert!(health.admits_at(0, 10));
+        health.record(0, false, 10);
+        assert!(!health.admits_at(0, 10));
+        assert!(health.admits_at(1, 10));
+        assert_eq!(health.breakers[0].opens_total.load(Ordering::Relaxed), 1);
+
+        // Half-open after `open_ms`, one trial at a time.
+        assert!(!health.admits_at(0, 1009));
+        assert!(health.admits_at(0, 1010));
+        let trial = health.admit_at(0, 1010).unwrap();
+        assert!(!health.admits_at(0, 1010));
+        assert!(health.admit_at(0, 1010).is_none());
+        trial.finish(true);
+        assert!(health.admits_at(0, 1010));
+        assert!(!health.is_closed(0));
+        health.admit_at(0, 1010).unwrap().finish(true);
+        assert!(health.is_closed(0));
+    }
+
+    #[test]
+    fn half_open_failure_reopens_and_dropped_calls_free_their_slot() {
+        let health = health();
+        for _ in 0..3 {
+            health.record(0, false, 0);
+        }
+        assert!(health.admits_at(0, 1000));
+        drop(health.admit_at(0, 1000).unwrap());
+        assert!(health.admits_at(0, 1000));
+        let trial = health.admit_at(0, 1000).unwrap();
+        health.record(0, false, 1000);
+        drop(trial);
+        assert!(!health.admits_at(0, 1500));
+        assert!(health.admits_at(0, 2000));
+        assert_eq!(health.breakers[0].opens_total.load(Ordering::Relaxed), 2);
+    }
+
+    #[test]
+    fn concurrent_admissions_take_at_most_the_trial_slots() {
+        let config = CircuitBreakerConfig {
+            failure_threshold: 1,
+            open_ms: 1000,
+            half_open_max_requests: 2,
+            ..CircuitBreakerConfig::default()
+        };
+        let health = ZoneHealth::new(
+            vec!["east".to_string()],
+            &config,
+            &HealthCheckConfig::default(),
+        );
+        health.record(0, false, 0);
+        let start = std::sync::Barrier::new(16);
+        let calls: Vec<_> = std::thread::scope(|scope| {
+            let admissions: Vec<_> = (0..16)
+                .map(|_| {
+                    scope.spawn(|| {
+                        start.wait();
+                        health.admit_at(0, 1000)
+                    })
+                })
+                .collect();
+            admissions.into_iter().map(|a| a.join().unwrap()).collect()
+        });
+        assert_eq!(calls.iter().flatten().count(), 2);
+        assert!(!health.admits_at(0, 1000));
+        drop(calls);
+        assert!(health.admits_at(0, 1000));
+        // Routing that ignores the breaker takes no trial slot.
+        let _forced = health.call(0);
+        assert!(health.admits_at(0, 1000));
+    }
+
+    #[test]
+    fn a_lost_open_transition_keeps_the_open_period() {
+        let health = health();
+        for _ in 0..3 {
+            health.record(0, false, 0);
+        }
+        // A second caller that also saw the zone closed loses the race to open it.
+        health.transition(0, CLOSED, OPEN, 900);
+        assert!(health.admits_at(0, 1000));
+        assert_eq!(health.breakers[0].opens_total.load(Ordering::Relaxed), 1);
+    }
+
+    #[test]
+    fn probes_open_idle_zones_and_end_the_open_period_early() {
+        let health = health();
+        let version = health.version();
+        for _ in 0..3 {
+            health.record_probe(1, false, 0);
+        }
+        assert!(!health.admits_at(1, 10));
+        assert!(health.version() > version);
+        health.record_probe(1, true, 20);
+        assert!(health.admits_at(1, 20));
+        health.record_probe(1, true, 30);
+        assert!(health.is_closed(1));
+        assert_eq!(health.breakers[1].probes_total.load(Ordering::Relaxed), 5);
+        assert_eq!(
+            health.breakers[1]
+                .probe_failures_total
+                .load(Ordering::Relaxed),
+            3
+        );
+    }
+}
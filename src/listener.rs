@@ -0,0 +1,371 @@
+use futures_util::stream::{self, Stream};
+use hyper::server::accept::{self, Accept};
+use hyper::server::Builder;
+use socket2::{Domain, Protocol, SockRef, Socket, TcpKeepalive, Type};
+use std::future::Future;
+use std::io;
+use std::net::SocketAddr;
+use std::pin::Pin;
+use std::sync::atomic::{AtomicU64, Ordering};
+use std::sync::Arc;
+use std::task::{Context, Poll};
+use std::time::Duration;
+use tokio::io::{AsyncRead, AsyncWrite, ReadBuf};
+use tokio::net::{TcpListener, TcpStream};
+use tokio::sync::{OwnedSemaphorePermit, Semaphore};
+
+use crate::config::ServerConfig;
+
+/// Downstream connection bookkeeping, exported on `/metrics`. Carried across reloads.
+pub struct ListenerStats {
+    /// Per listener, so an uneven `SO_REUSEPORT` spread shows up.
+    pub accepted: Vec<AtomicU64>,
+    pub accept_errors: Vec<AtomicU64>,
+    /// Accepts that had to wait for a slot under `max_connections`.
+    pub limit_waits: AtomicU64,
+    pub open: AtomicU64,
+}
+
+impl ListenerStats {
+    pub fn new(listeners: usize) -> Self {
+        Self {
+            accepted: (0..listeners).map(|_| AtomicU64::new(0)).collect(),
+            accept_errors: (0..listeners).map(|_| AtomicU64::new(0)).collect(),
+            limit_waits: AtomicU64::new(0),
+            open: AtomicU64::new(0),
+        }
+    }
+}
+
+/// The worker runtime everything but pinned listeners runs on.
+pub fn build_runtime(config: &ServerConfig) -> io::Result<tokio::runtime::Runtime> {
+    let mut builder = tokio::runtime::Builder::new_multi_thread();
+    builder.enable_all().thread_name("rilot-worker");
+    if let Some(threads) = config.worker_threads {
+        builder.worker_threads(threads);
+    }
+    builder.build()
+}
+
+/// Binds `config.listeners` accept sockets to `addr`. On Unix each gets its own
+/// socket with `SO_REUSEPORT`, so the kernel spreads new connections across them;
+/// elsewhere they share one socket. A zero port is resolved by the first bind.
+pub fn bind(addr: SocketAddr, config: &ServerConfig) -> io::Result<Vec<std::net::TcpListener>> {
+    let count = config.listeners.max(1);
+    let first = bind_one(addr, config, count > 1)?;
+    let addr = first.local_addr()?;
+    let mut listeners = vec![first];
+    while listeners.len() < count {
+        #[cfg(unix)]
+        listeners.push(bind_one(addr, config, true)?);
+        #[cfg(not(unix))]
+        listeners.push(listeners[0].try_clone()?);
+    }
+    Ok(listeners)
+}
+
+fn bind_one(
+    addr: SocketAddr,
+    config: &ServerConfig,
+    reuse_port: bool,
+) -> io::Result<std::net::TcpListener> {
+    let socket = Socket::new(Domain::for_address(addr), Type::STREAM, Some(Protocol::TCP))?;
+    socket.set_reuse_address(true)?;
+    #[cfg(unix)]
+    if reuse_port {
+        socket.set_reuse_port(true)?;
+    }
+    #[cfg(not(unix))]
+    let _ = reuse_port;
+    socket.bind(&addr.into())?;
+    socket.listen(config.accept_backlog.min(i32::MAX as u32) as i32)?;
+    socket.set_nonblocking(true)?;
+    Ok(socket.into())
+}
+
+/// Applies the downstream HTTP/1 and HTTP/2 settings. Unset options keep hyper's
+/// defaults; explicit window sizes turn the adaptive window off.
+pub fn configure<I, E>(builder: Builder<I, E>, config: &ServerConfig) -> Builder<I, E> {
+    let mut builder = builder.http1_keepalive(config.http1_keep_alive);
+    if let Some(ms) = config.http1_header_read_timeout_ms {
+        builder = builder.http1_header_read_timeout(Duration::from_millis(ms));
+    }
+    if let Some(max) = config.http2_max_concurrent_streams {
+        builder = builder.http2_max_concurrent_streams(max);
+    }
+    if config.http2_adaptive_window {
+        builder = builder.http2_adaptive_window(true);
+    }
+    if let Some(size) = config.http2_initial_stream_window_size {
+        builder = builder.http2_initial_stream_window_size(size);
+    }
+    if let Some(size) = config.http2_initial_connection_window_size {
+        builder = builder.http2_initial_connection_window_size(size);
+    }
+    if let Some(secs) = config.http2_keep_alive_interval_secs {
+        builder = builder
+            .http2_keep_alive_interval(Duration::from_secs(secs))
+            .http2_keep_alive_timeout(Duration::from_secs(config.http2_keep_alive_timeout_secs));
+    }
+    builder
+}
+
+/// Connections accepted by listener `index`, for `Server::builder`. Must be called
+/// from inside the runtime that will serve them.
+pub fn incoming(
+    index: usize,
+    listener: std::net::TcpListener,
+    config: &ServerConfig,
+    limit: Option<Arc<Semaphore>>,
+    stats: Arc<ListenerStats>,
+) -> io::Result<impl Accept<Conn = Connection, Error = io::Error>> {
+    Ok(accept::from_stream(connections(
+        index, listener, config, limit, stats,
+    )?))
+}
+
+struct Acceptor {
+    index: usize,
+    listener: TcpListener,
+    nodelay: bool,
+    keepalive: Option<TcpKeepalive>,
+    limit: Option<Arc<Semaphore>>,
+    stats: Arc<ListenerStats>,
+}
+
+fn connections(
+    index: usize,
+    listener: std::net::TcpListener,
+    config: &ServerConfig,
+    limit: Option<Arc<Semaphore>>,
+    stats: Arc<ListenerStats>,
+) -> io::Result<impl Stream<Item = io::Result<Connection>>> {
+    let acceptor = Acceptor {
+        index,
+        listener: TcpListener::from_std(listener)?,
+        nodelay: config.tcp_nodelay,
+        keepalive: (config.tcp_keepalive_secs > 0)
+            .then(|| TcpKeepalive::new().with_time(Duration::from_secs(config.tcp_keepalive_secs))),
+        limit,
+        stats,
+    };
+    Ok(stream::unfold(acceptor, |acceptor| async move {
+        let conn = acceptor.accept().await;
+        Some((Ok(conn), acceptor))
+    }))
+}
+
+impl Acceptor {
+    /// Waits for a connection slot, then for a connection. Accept errors never end
+    /// the stream: hyper would stop serving the listener.
+    async fn accept(&self) -> Connection {
+        loop {
+            let permit = match &self.limit {
+                Some(limit) => Some(match limit.clone().try_acquire_owned() {
+                    Ok(permit) => permit,
+                    Err(_) => {
+                        self.stats.limit_waits.fetch_add(1, Ordering::Relaxed);
+                        limit
+                            .clone()
+                            .acquire_owned()
+                            .await
+                            .expect("connection limit closed")
+                    }
+                }),
+                None => None,
+            };
+            match self.listener.accept().await {
+                Ok((stream, _)) => return self.open(stream, permit),
+                Err(e) => {
+                    self.stats.accept_errors[self.index].fetch_add(1, Ordering::Relaxed);
+                    if !is_connection_error(&e) {
+                        // Usually descriptor exhaustion; retrying at once would spin.
+                        log::warn!("accept_failed listener={} error={}", self.index, e);
+                        tokio::time::sleep(Duration::from_millis(100)).await;
+                    }
+                }
+            }
+        }
+    }
+
+    fn open(&self, stream: TcpStream, permit: Option<OwnedSemaphorePermit>) -> Connection {
+        if self.nodelay {
+            if let Err(e) = stream.set_nodelay(true) {
+                log::debug!("tcp_nodelay_failed error={}", e);
+            }
+        }
+        if let Some(keepalive) = &self.keepalive {
+            if let Err(e) = SockRef::from(&stream).set_tcp_keepalive(keepalive) {
+                log::debug!("tcp_keepalive_failed error={}", e);
+            }
+        }
+        self.stats.accepted[self.index].fetch_add(1, Ordering::Relaxed);
+        self.stats.open.fetch_add(1, Ordering::Relaxed);
+        Connection {
+            stream,
+            stats: self.stats.clone(),
+            _permit: permit,
+        }
+    }
+}
+
+/// Errors about a single connection that went away before it was accepted.
+fn is_connection_error(e: &io::Error) -> bool {
+    matches!(
+        e.kind(),
+        io::ErrorKind::ConnectionRefused
+            | io::ErrorKind::ConnectionAborted
+            | io::ErrorKind::ConnectionReset
+    )
+}
+
+/// An accepted downstream connection; holds its `max_connections` slot until dropped.
+pub struct Connection {
+    stream: TcpStream,
+    stats: Arc<ListenerStats>,
+    _permit: Option<OwnedSemaphorePermit>,
+}
+
+impl Drop for Connection {
+    fn drop(&mut self) {
+        self.stats.open.fetch_sub(1, Ordering::Relaxed);
+    }
+}
+
+impl AsyncRead for Connection {
+    fn poll_read(
+        mut self: Pin<&mut Self>,
+        cx: &mut Context<'_>,
+        buf: &mut ReadBuf<'_>,
+    ) -> Poll<io::Result<()>> {
+        Pin::new(&mut self.stream).poll_read(cx, buf)
+    }
+}
+
+impl AsyncWrite for Connection {
+    fn poll_write(
+        mut self: Pin<&mut Self>,
+        cx: &mut Context<'_>,
+        buf: &[u8],
+    ) -> Poll<io::Result<usize>> {
+        Pin::new(&mut self.stream).poll_write(cx, buf)
+    }
+
+    fn poll_write_vectored(
+        mut self: Pin<&mut Self>,
+        cx: &mut Context<'_>,
+        bufs: &[io::IoSlice<'_>],
+    ) -> Poll<io::Result<usize>> {
+        Pin::new(&mut self.stream).poll_write_vectored(cx, bufs)
+    }
+
+    fn is_write_vectored(&self) -> bool {
+        self.stream.is_write_vectored()
+    }
+
+    fn poll_flush(mut self: Pin<&mut Self>, cx: &mut Context<'_>) -> Poll<io::Result<()>> {
+        Pin::new(&mut self.stream).poll_flush(cx)
+    }
+
+    fn poll_shutdown(mut self: Pin<&mut Self>, cx: &mut Context<'_>) -> Poll<io::Result<()>> {
+        Pin::new(&mut self.stream).poll_shutdown(cx)
+    }
+}
+
+/// Runs `server` on its own thread and single-threaded runtime, pinned to a core
+/// (Linux only): the listener's connections and the tasks they spawn stay on it.
+pub fn spawn_pinned<F>(index: usize, server: F) -> io::Result<std::thread::JoinHandle<()>>
+where
+    F: Future<Output = ()> + Send + 'static,
+{
+    std::thread::Builder::new()
+        .name(format!("rilot-listener-{}", index))
+        .spawn(move || {
+            match pin_to_core(index) {
+                Some(core) => log::info!("listener_pinned listener={} core={}", index, core),
+                None => log::warn!("listener_pin_unavailable listener={}", index),
+            }
+            let runtime = tokio::runtime::Builder::new_current_thread()
+                .enable_all()
+                .build()
+                .expect("failed to build listener runtime");
+            runtime.block_on(server);
+        })
+}
+
+/// Pins the calling thread to the `index`-th core it is allowed to run on, wrapping
+/// around; returns that core.
+#[cfg(target_os = "linux")]
+fn pin_to_core(index: usize) -> Option<usize> {
+    let size = std::mem::size_of::<libc::cpu_set_t>();
+    // SAFETY: `cpu_set_t` is plain data, and both calls get its exact size.
+    unsafe {
+        let mut allowed: libc::cpu_set_t = std::mem::zeroed();
+        if libc::sched_getaffinity(0, size, &mut allowed) != 0 {
+            return None;
+        }
+        let cores: Vec<usize> = (0..libc::CPU_SETSIZE as usize)
+            .filter(|&core| libc::CPU_ISSET(core, &allowed))
+            .collect();
+        let core = *cores.get(index % cores.len().max(1))?;
+        let mut set: libc::cpu_set_t = std::mem::zeroed();
+        libc::CPU_SET(core, &mut set);
+        (libc::sched_setaffinity(0, size, &set) == 0).then_some(core)
+    }
+}
+
+#[cfg(not(target_os = "linux"))]
+fn pin_to_core(_index: usize) -> Option<usize> {
+    None
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use futures_util::StreamExt;
+
+    fn server_config(listeners: usize) -> ServerConfig {
+        ServerConfig {
+            listeners,
+            ..ServerConfig::default()
+        }
+    }
+
+    #[tokio::test]
+    async fn listeners_share_the_resolved_port() {
+        let addr: SocketAddr = "127.0.0.1:0".parse().unwrap();
+        let listeners = bind(addr, &server_config(3)).unwrap();
+        assert_eq!(listeners.len(), 3);
+        let port = listeners[0].local_addr().unwrap().port();
+        assert_ne!(port, 0);
+        assert!(listeners
+            .iter()
+            .all(|l| l.local_addr().unwrap().port() == port));
+    }
+
+    #[tokio::test]
+    async fn connection_limit_holds_accepts_until_a_connection_closes() {
+        let config = server_config(1);
+        let addr: SocketAddr = "127.0.0.1:0".parse().unwrap();
+        let listener = bind(addr, &config).unwrap().remove(0);
+        let addr = listener.local_addr().unwrap();
+        let stats = Arc::new(ListenerStats::new(1));
+        let limit = Some(Arc::new(Semaphore::new(1)));
+        let conns = connections(0, listener, &config, limit, stats.clone()).unwrap();
+        let mut conns = Box::pin(conns);
+
+        let _a = TcpStream::connect(addr).await.unwrap();
+        let _b = TcpStream::connect(addr).await.unwrap();
+        let first = conns.next().await.unwrap().unwrap();
+        assert_eq!(stats.open.load(Ordering::Relaxed), 1);
+
+        let waiting = tokio::time::timeout(Duration::from_millis(50), conns.next()).await;
+        assert!(waiting.is_err());
+        assert_eq!(stats.limit_waits.load(Ordering::Relaxed), 1);
+
+        drop(first);
+        let _second = conns.next().await.unwrap().unwrap();
+        assert_eq!(stats.accepted[0].load(Ordering::Relaxed), 2);
+        assert_eq!(stats.open.load(Ordering::Relaxed), 1);
+    }
+}
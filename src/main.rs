@@ -1,11 +1,22 @@
 use std::sync::Arc;
 use std::env;
+mod carbon;
+mod concurrency;
 mod config;
+mod decision_cache;
+mod decision_log;
+mod deferral;
+mod exposition;
+mod health;
+mod listener;
+mod metrics;
+mod plugin_cache;
 mod proxy;
+mod reload;
+mod upstream;
 mod wasm_engine;
 
-#[tokio::main]
-async fn main() {
+fn main() {
     env_logger::Builder::from_env(env_logger::Env::default().default_filter_or("info")).init();
 
     let args: Vec<String> = env::args().collect();
@@ -20,12 +31,17 @@ async fn main() {
         log::warn!("No proxy rules defined in the configuration.");
     }
 
+    let override_paths: Vec<String> = cfg
+        .proxies
+        .iter()
+        .filter_map(|p| p.override_file.clone())
+        .collect();
+    if let Err(e) = wasm_engine::configure(&cfg.plugins, &override_paths) {
+        log::error!("Failed to initialize the Wasm plugin runtime: {}", e);
+        std::process::exit(1);
+    }
+
     if wasm_engine::is_production_mode() {
-        let override_paths: Vec<String> = cfg
-            .proxies
-            .iter()
-            .filter_map(|p| p.override_file.clone())
-            .collect();
         if !override_paths.is_empty() {
             match wasm_engine::preload_components(&override_paths) {
                 Ok(count) => log::info!("Preloaded {} Wasm component(s) into memory.", count),
@@ -39,8 +55,16 @@ async fn main() {
 
     let config_arc = Arc::new(cfg);
 
+    let runtime = match listener::build_runtime(&config_arc.server) {
+        Ok(runtime) => runtime,
+        Err(e) => {
+            log::error!("Failed to build the async runtime: {}", e);
+            std::process::exit(1);
+        }
+    };
+
     log::info!("Starting proxy server...");
-    proxy::start_proxy(config_arc).await;
+    runtime.block_on(proxy::start_proxy(config_arc, config_path.to_string()));
 
     log::info!("Proxy server shut down.");
 }
@@ -0,0 +1,915 @@
+use once_cell::sync::Lazy;
+use std::collections::HashMap;
+use std::sync::atomic::{AtomicBool, AtomicU64, AtomicUsize, Ordering};
+use std::sync::Arc;
+use std::time::Instant;
+
+use crate::exposition::encode_labels;
+
+pub const DEFAULT_ZONE: &str = "default";
+pub const NO_ZONE: usize = usize::MAX;
+pub const DEFAULT_LATENCY_MIN_MS: f64 = 0.5;
+pub const DEFAULT_LATENCY_MAX_MS: f64 = 30_000.0;
+pub const DEFAULT_LATENCY_SUB_BUCKETS: usize = 4;
+pub const DEFAULT_RECENT_WINDOW_MS: u64 = 30_000;
+pub const DEFAULT_RECENT_WINDOW_BUCKETS: usize = 6;
+pub const DEFAULT_RECENT_MIN_SAMPLES: u64 = 20;
+
+static PROCESS_START: Lazy<Instant> = Lazy::new(Instant::now);
+
+/// Milliseconds since process start; lets timestamps live in an `AtomicU64`.
+pub fn monotonic_ms() -> u64 {
+    PROCESS_START.elapsed().as_millis() as u64
+}
+
+/// `f64` stored as bits in an `AtomicU64`.
+#[derive(Default)]
+pub struct AtomicF64(AtomicU64);
+
+impl AtomicF64 {
+    pub fn new(v: f64) -> Self {
+        Self(AtomicU64::new(v.to_bits()))
+    }
+
+    pub fn load(&self) -> f64 {
+        f64::from_bits(self.0.load(Ordering::Relaxed))
+    }
+
+    pub fn store(&self, v: f64) {
+        self.0.store(v.to_bits(), Ordering::Relaxed);
+    }
+
+    pub fn add(&self, v: f64) {
+        let _ = self.0.fetch_update(Ordering::Relaxed, Ordering::Relaxed, |bits| {
+            Some((f64::from_bits(bits) + v).to_bits())
+        });
+    }
+}
+
+/// Log-linear (HDR-style) latency bucket layout shared by every latency histogram.
+///
+/// Each power-of-two range above `min_ms` is split into `sub_buckets` equal-width
+/// buckets, so the relative error is at most `1 / sub_buckets` at any scale and a
+/// sample's bucket is computed in constant time. Bucket 0 holds everything up to
+/// `min_ms`; the last bucket is open-ended (`+Inf`).
+#[derive(PartialEq)]
+pub struct LatencyLayout {
+    min_ms: f64,
+    sub_buckets: usize,
+    /// Finite upper bounds, ascending; there is one more bucket than bounds.
+    bounds: Vec<f64>,
+    labels: Vec<String>,
+}
+
+impl LatencyLayout {
+    pub fn new(min_ms: f64, max_ms: f64, sub_buckets: usize) -> Self {
+        let min_ms = if min_ms > 0.0 {
+            min_ms
+        } else {
+            DEFAULT_LATENCY_MIN_MS
+        };
+        let sub_buckets = sub_buckets.clamp(1, 64);
+        let octaves = (max_ms / min_ms).log2().ceil().clamp(0.0, 64.0) as usize;
+        let mut bounds = Vec::with_capacity(1 + octaves * sub_buckets);
+        bounds.push(min_ms);
+        for octave in 0..octaves {
+            let base = min_ms * 2f64.powi(octave as i32);
+            for sub in 1..=sub_buckets {
+                bounds.push(base * (1.0 + sub as f64 / sub_buckets as f64));
+            }
+        }
+        let labels = bounds
+            .iter()
+            .map(|bound| format!("{}", (bound * 1000.0).round() / 1000.0))
+            .collect();
+        Self {
+            min_ms,
+            sub_buckets,
+            bounds,
+            labels,
+        }
+    }
+
+    /// Buckets including the open-ended one.
+    pub fn bucket_count(&self) -> usize {
+        self.bounds.len() + 1
+    }
+
+    /// `le` labels of the finite buckets, for exposition.
+    pub fn labels(&self) -> &[String] {
+        &self.labels
+    }
+
+    pub fn index(&self, latency_ms: f64) -> usize {
+        // Also catches NaN.
+        if !(latency_ms > self.min_ms) {
+            return 0;
+        }
+        let scaled = latency_ms / self.min_ms;
+        let octave = scaled.log2().floor();
+        // Upper bounds are inclusive, so an exact power of two closes the octave below.
+        let sub = ((scaled / octave.exp2() - 1.0) * self.sub_buckets as f64).ceil() as usize;
+        (octave as usize * self.sub_buckets + sub).min(self.bounds.len())
+    }
+
+    /// `quantile` of the distribution described by per-bucket `counts`, interpolated
+    /// linearly within its bucket like Prometheus `histogram_quantile`. Samples in the
+    /// open-ended bucket report the highest finite bound.
+    pub fn quantile(&self, quantile: f64, counts: impl Fn(usize) -> u64) -> Option<f64> {
+        let total: u64 = (0..self.bucket_count()).map(&counts).sum();
+        if total == 0 {
+            return None;
+        }
+        let rank = quantile.clamp(0.0, 1.0) * total as f64;
+        let mut seen = 0u64;
+        for (idx, upper) in self.bounds.iter().enumerate() {
+            let count = counts(idx);
+            if count > 0 && (seen + count) as f64 >= rank {
+                let lower = if idx == 0 { 0.0 } else { self.bounds[idx - 1] };
+                let within = ((rank - seen as f64) / count as f64).clamp(0.0, 1.0);
+                return Some(lower + (upper - lower) * within);
+            }
+            seen += count;
+        }
+        self.bounds.last().copied()
+    }
+}
+
+impl Default for LatencyLayout {
+    fn default() -> Self {
+        Self::new(
+            DEFAULT_LATENCY_MIN_MS,
+            DEFAULT_LATENCY_MAX_MS,
+            DEFAULT_LATENCY_SUB_BUCKETS,
+        )
+    }
+}
+
+/// Non-cumulative bucket counts over a [`LatencyLayout`]; recording is one atomic
+/// add, and cumulative `le` counts are summed at exposition time.
+pub struct LatencyHistogram {
+    layout: Arc<LatencyLayout>,
+    counts: Vec<AtomicU64>,
+}
+
+impl LatencyHistogram {
+    pub fn new(layout: Arc<LatencyLayout>) -> Self {
+        Self {
+            counts: (0..layout.bucket_count())
+                .map(|_| AtomicU64::new(0))
+                .collect(),
+            layout,
+        }
+    }
+
+    pub fn record(&self, latency_ms: f64) {
+        self.counts[self.layout.index(latency_ms)].fetch_add(1, Ordering::Relaxed);
+    }
+
+    pub fn layout(&self) -> &LatencyLayout {
+        &self.layout
+    }
+
+    /// Samples in bucket `idx` alone (not cumulative).
+    pub fn count(&self, idx: usize) -> u64 {
+        self.counts[idx].load(Ordering::Relaxed)
+    }
+
+    pub fn quantile(&self, quantile: f64) -> Option<f64> {
+        self.layout.quantile(quantile, |idx| self.count(idx))
+    }
+}
+
+pub struct RouteZoneCounters {
+    pub requests_total: AtomicU64,
+    pub carbon_safe_calls_total: AtomicU64,
+    pub errors_total: AtomicU64,
+    pub carbon_intensity_exposure_total_g_per_kwh: AtomicF64,
+    pub co2e_estimated_total_g: AtomicF64,
+    pub energy_estimated_total_j: AtomicF64,
+    pub latency_sum_ms: AtomicF64,
+    pub latency_count: AtomicU64,
+    pub latency_histogram: LatencyHistogram,
+    /// Duplicates sent to this zone for a request first sent elsewhere, and how many
+    /// answered first.
+    pub hedges_total: AtomicU64,
+    pub hedge_wins_total: AtomicU64,
+    /// Attempts sent to this zone after a connect error elsewhere (or here).
+    pub connect_retries_total: AtomicU64,
+}
+
+impl RouteZoneCounters {
+    fn new(layout: &Arc<LatencyLayout>) -> Self {
+        Self {
+            requests_total: AtomicU64::new(0),
+            carbon_safe_calls_total: AtomicU64::new(0),
+            errors_total: AtomicU64::new(0),
+            carbon_intensity_exposure_total_g_per_kwh: AtomicF64::default(),
+            co2e_estimated_total_g: AtomicF64::default(),
+            energy_estimated_total_j: AtomicF64::default(),
+            latency_sum_ms: AtomicF64::default(),
+            latency_count: AtomicU64::new(0),
+            latency_histogram: LatencyHistogram::new(layout.clone()),
+            hedges_total: AtomicU64::new(0),
+            hedge_wins_total: AtomicU64::new(0),
+            connect_retries_total: AtomicU64::new(0),
+        }
+    }
+}
+
+#[derive(Default)]
+pub struct ZoneCounters {
+    pub requests: AtomicU64,
+    pub errors: AtomicU64,
+    pub in_flight: AtomicUsize,
+    pub carbon_intensity_g_per_kwh: AtomicF64,
+    pub carbon_intensity_seen: AtomicBool,
+}
+
+/// Last hysteresis decision for a route. Fields are updated independently; a torn
+/// read only means one request sees a slightly older decision.
+pub struct RouteDecisionState {
+    pub zone: AtomicUsize,
+    pub score: AtomicF64,
+    pub at_ms: AtomicU64,
+}
+
+impl Default for RouteDecisionState {
+    fn default() -> Self {
+        Self {
+            zone: AtomicUsize::new(NO_ZONE),
+            score: AtomicF64::default(),
+            at_ms: AtomicU64::new(0),
+        }
+    }
+}
+
+impl RouteDecisionState {
+    pub fn last(&self) -> Option<(usize, f64, u64)> {
+        let zone = self.zone.load(Ordering::Acquire);
+        if zone == NO_ZONE {
+            return None;
+        }
+        Some((zone, self.score.load(), self.at_ms.load(Ordering::Relaxed)))
+    }
+
+    pub fn set(&self, zone: usize, score: f64) {
+        self.score.store(score);
+        self.at_ms.store(monotonic_ms(), Ordering::Relaxed);
+        self.zone.store(zone, Ordering::Release);
+    }
+}
+
+/// Counters over a sliding window, kept as a ring of time buckets plus a running
+/// total per column so reading a column is one load.
+///
+/// Expired buckets are subtracted from the totals lazily, by whichever caller first
+/// observes that time moved past them. Totals are bumped before bucket counts, so a
+/// bucket being retired concurrently can only drop an event, never go negative.
+pub struct WindowedCounts {
+    bucket_ms: u64,
+    columns: usize,
+    /// `buckets * columns` counts; bucket `b` owns `[b * columns, (b + 1) * columns)`.
+    counts: Vec<AtomicU64>,
+    totals: Vec<AtomicU64>,
+    /// Absolute index (`now_ms / bucket_ms`) of the newest bucket.
+    head: AtomicU64,
+}
+
+impl WindowedCounts {
+    pub fn new(window_ms: u64, buckets: usize, columns: usize) -> Self {
+        let buckets = buckets.max(1);
+        let bucket_ms = (window_ms / buckets as u64).max(1);
+        Self {
+            bucket_ms,
+            columns,
+            counts: (0..buckets * columns).map(|_| AtomicU64::new(0)).collect(),
+            totals: (0..columns).map(|_| AtomicU64::new(0)).collect(),
+            head: AtomicU64::new(monotonic_ms() / bucket_ms),
+        }
+    }
+
+    fn buckets(&self) -> u64 {
+        (self.counts.len() / self.columns.max(1)) as u64
+    }
+
+    /// Retires buckets that fell out of the window as of `now_ms`; returns the slot of
+    /// the current bucket.
+    pub fn advance(&self, now_ms: u64) -> usize {
+        let now = now_ms / self.bucket_ms;
+        let buckets = self.buckets();
+        let head = self.head.load(Ordering::Acquire);
+        if now > head
+            && self
+                .head
+                .compare_exchange(head, now, Ordering::AcqRel, Ordering::Acquire)
+                .is_ok()
+        {
+            // Every bucket in (head, now] is reused for new time; clear at most one lap.
+            for id in (head + 1..=now).take(buckets as usize) {
+                let base = (id % buckets) as usize * self.columns;
+                for column in 0..self.columns {
+                    let retired = self.counts[base + column].swap(0, Ordering::AcqRel);
+                    if retired > 0 {
+                        self.totals[column].fetch_sub(retired, Ordering::AcqRel);
+                    }
+                }
+            }
+        }
+        (now % buckets) as usize
+    }
+
+    /// Counts one event in each of `columns` at `now_ms`.
+    pub fn record(&self, columns: &[usize], now_ms: u64) {
+        let slot = self.advance(now_ms);
+        for &column in columns {
+            self.totals[column].fetch_add(1, Ordering::AcqRel);
+            self.counts[slot * self.columns + column].fetch_add(1, Ordering::AcqRel);
+        }
+    }
+
+    /// Window total for `column` as of the last `advance`.
+    pub fn total(&self, column: usize) -> u64 {
+        self.totals[column].load(Ordering::Acquire)
+    }
+}
+
+/// Per-zone request counts for one route over a sliding window; the last column is
+/// the route total, so a share lookup is two loads.
+pub struct ShareWindow {
+    zones: usize,
+    counts: WindowedCounts,
+}
+
+impl ShareWindow {
+    pub fn new(window_ms: u64, buckets: usize, zones: usize) -> Self {
+        Self {
+            zones,
+            counts: WindowedCounts::new(window_ms, buckets, zones + 1),
+        }
+    }
+
+    pub fn record(&self, zone_idx: usize, now_ms: u64) {
+        // Route total first, so a zone never reads as more than 100%.
+        self.counts.record(&[self.zones, zone_idx], now_ms);
+    }
+
+    /// `zone_idx`'s share of the route's requests in the window, in percent.
+    pub fn share_percent(&self, zone_idx: usize, now_ms: u64) -> f64 {
+        self.counts.advance(now_ms);
+        let total = self.counts.total(self.zones);
+        if total == 0 {
+            return 0.0;
+        }
+        let zone = self.counts.total(zone_idx);
+        ((zone as f64 / total as f64) * 100.0).min(100.0)
+    }
+}
+
+const RECENT_REQUESTS: usize = 0;
+const RECENT_ERRORS: usize = 1;
+const RECENT_LATENCY_BUCKETS: usize = 2;
+
+/// Requests, errors and an upstream latency histogram for one zone over a sliding
+/// window. Routing reads error rate and p95 from here rather than lifetime counters,
+/// so a zone that failed or slowed down long ago is not penalized forever. Below
+/// `min_samples` requests in the window there is no signal: the error rate reads as
+/// zero and there is no latency quantile.
+pub struct RecentZoneStats {
+    min_samples: u64,
+    layout: Arc<LatencyLayout>,
+    counts: WindowedCounts,
+}
+
+impl RecentZoneStats {
+    pub fn new(
+        layout: Arc<LatencyLayout>,
+        window_ms: u64,
+        buckets: usize,
+        min_samples: u64,
+    ) -> Self {
+        Self {
+            min_samples: min_samples.max(1),
+            counts: WindowedCounts::new(
+                window_ms,
+                buckets,
+                RECENT_LATENCY_BUCKETS + layout.bucket_count(),
+            ),
+            layout,
+        }
+    }
+
+    pub fn record(&self, latency_ms: f64, is_error: bool, now_ms: u64) {
+        let bin = RECENT_LATENCY_BUCKETS + self.layout.index(latency_ms);
+        if is_error {
+            self.counts
+                .record(&[RECENT_REQUESTS, RECENT_ERRORS, bin], now_ms);
+        } else {
+            self.counts.record(&[RECENT_REQUESTS, bin], now_ms);
+        }
+    }
+
+    /// Requests in the window as of `now_ms`.
+    pub fn requests(&self, now_ms: u64) -> u64 {
+        self.counts.advance(now_ms);
+        self.counts.total(RECENT_REQUESTS)
+    }
+
+    /// Error rate over the window.
+    pub fn error_rate(&self, now_ms: u64) -> f64 {
+        let requests = self.requests(now_ms);
+        if requests < self.min_samples {
+            return 0.0;
+        }
+        let errors = self.counts.total(RECENT_ERRORS).min(requests);
+        errors as f64 / requests as f64
+    }
+
+    /// `quantile` latency over the window.
+    pub fn latency_quantile_ms(&self, quantile: f64, now_ms: u64) -> Option<f64> {
+        if self.requests(now_ms) < self.min_samples {
+            return None;
+        }
+        self.layout.quantile(quantile, |idx| {
+            self.counts.total(RECENT_LATENCY_BUCKETS + idx)
+        })
+    }
+}
+
+/// Dense per-(route, zone) and per-zone runtime counters, indexed by the route
+/// position in `config.proxies` and the zone index assigned in `build_static_state`.
+/// Every slot is an independent set of atomics, so request tasks never share a lock.
+pub struct MetricsMatrix {
+    pub routes: Vec<String>,
+    pub zones: Vec<String>,
+    zone_index: HashMap<String, usize>,
+    /// Pre-encoded `/metrics` label sets, built once per series.
+    series_labels: Vec<String>,
+    zone_labels: Vec<String>,
+    route_labels: Vec<String>,
+    route_zone: Vec<Arc<RouteZoneCounters>>,
+    zone: Vec<Arc<ZoneCounters>>,
+    route_decisions: Vec<Arc<RouteDecisionState>>,
+    share_windows: Vec<Option<Arc<ShareWindow>>>,
+    recent_zones: Vec<Arc<RecentZoneStats>>,
+    /// `(window_ms, buckets, min_samples)` of `recent_zones`.
+    recent_window: (u64, usize, u64),
+    latency_layout: Arc<LatencyLayout>,
+}
+
+pub struct RequestSample {
+    pub latency_ms: f64,
+    pub carbon_g_per_kwh: f64,
+    pub is_carbon_safe: bool,
+    pub energy_j: f64,
+    pub co2e_g: f64,
+    pub is_error: bool,
+}
+
+impl MetricsMatrix {
+    /// `zones` gets a trailing `default` slot when missing, used when no zone was selected.
+    pub fn new(routes: Vec<String>, mut zones: Vec<String>) -> Self {
+        if !zones.iter().any(|z| z == DEFAULT_ZONE) {
+            zones.push(DEFAULT_ZONE.to_string());
+        }
+        let zone_index = zones
+            .iter()
+            .enumerate()
+            .map(|(idx, z)| (z.clone(), idx))
+            .collect();
+        let series_labels = routes
+            .iter()
+            .flat_map(|route| {
+                zones
+                    .iter()
+                    .map(move |zone| encode_labels(&[("route", route), ("zone", zone)]))
+            })
+            .collect();
+        let zone_labels = zones
+            .iter()
+            .map(|zone| encode_labels(&[("zone", zone)]))
+            .collect();
+        let route_labels = routes
+            .iter()
+            .map(|route| encode_labels(&[("route", route)]))
+            .collect();
+        let latency_layout = Arc::new(LatencyLayout::default());
+        let route_zone = (0..routes.len() * zones.len())
+            .map(|_| Arc::new(RouteZoneCounters::new(&latency_layout)))
+            .collect();
+        let zone = (0..zones.len()).map(|_| Arc::new(ZoneCounters::default())).collect();
+        let route_decisions = (0..routes.len())
+            .map(|_| Arc::new(RouteDecisionState::default()))
+            .collect();
+        let share_windows = (0..routes.len()).map(|_| None).collect();
+        let recent_window = (
+            DEFAULT_RECENT_WINDOW_MS,
+            DEFAULT_RECENT_WINDOW_BUCKETS,
+            DEFAULT_RECENT_MIN_SAMPLES,
+        );
+        let recent_zones = Self::recent_zone_stats(zones.len(), &latency_layout, recent_window);
+        Self {
+            routes,
+            zones,
+            zone_index,
+            series_labels,
+            zone_labels,
+            route_labels,
+            route_zone,
+            zone,
+            route_decisions,
+            share_windows,
+            recent_zones,
+            recent_window,
+            latency_layout,
+        }
+    }
+
+    /// Track `route_idx`'s per-zone request share over a sliding window of `window_ms`
+    /// split into `buckets`, instead of since process start.
+    pub fn enable_share_window(&mut self, route_idx: usize, window_ms: u64, buckets: usize) {
+        let window = ShareWindow::new(window_ms, buckets, self.zones.len());
+        self.share_windows[route_idx] = Some(Arc::new(window));
+    }
+
+    fn recent_zone_stats(
+        zones: usize,
+        layout: &Arc<LatencyLayout>,
+        (window_ms, buckets, min_samples): (u64, usize, u64),
+    ) -> Vec<Arc<RecentZoneStats>> {
+        (0..zones)
+            .map(|_| {
+                Arc::new(RecentZoneStats::new(
+                    layout.clone(),
+                    window_ms,
+                    buckets,
+                    min_samples,
+                ))
+            })
+            .collect()
+    }
+
+    /// Resize the sliding window behind [`MetricsMatrix::recent_zone`].
+    pub fn set_recent_window(&mut self, window_ms: u64, buckets: usize, min_samples: u64) {
+        self.recent_window = (window_ms, buckets, min_samples);
+        self.recent_zones =
+            Self::recent_zone_stats(self.zones.len(), &self.latency_layout, self.recent_window);
+    }
+
+    /// Replace the latency bucket layout. Call before any request is recorded: every
+    /// histogram is recreated empty.
+    pub fn set_latency_layout(&mut self, layout: LatencyLayout) {
+        self.latency_layout = Arc::new(layout);
+        self.route_zone = (0..self.route_zone.len())
+            .map(|_| Arc::new(RouteZoneCounters::new(&self.latency_layout)))
+            .collect();
+        self.recent_zones =
+            Self::recent_zone_stats(self.zones.len(), &self.latency_layout, self.recent_window);
+    }
+
+    pub fn latency_layout(&self) -> &LatencyLayout {
+        &self.latency_layout
+    }
+
+    /// Adopt `previous`'s runtime state after a config reload, matching routes by path
+    /// and zones by name. Counters move over as shared `Arc`s, so requests still
+    /// finishing against `previous` land in the same series. Histograms and windows
+    /// whose layout changed, and hysteresis state whose zone index moved, start fresh.
+    /// Route totals are summed from the zone series, so they follow the same rule.
+    pub fn carry_over(&mut self, previous: &MetricsMatrix) {
+        let same_layout = self.latency_layout == previous.latency_layout;
+        let same_recent = same_layout && self.recent_window == previous.recent_window;
+        let zone_map: Vec<Option<usize>> =
+            self.zones.iter().map(|z| previous.zone_idx(z)).collect();
+        for (zone_idx, old_zone) in zone_map.iter().enumerate() {
+            let Some(old_zone) = *old_zone else {
+                continue;
+            };
+            self.zone[zone_idx] = previous.zone[old_zone].clone();
+            if same_recent {
+                self.recent_zones[zone_idx] = previous.recent_zones[old_zone].clone();
+            }
+        }
+
+        for route_idx in 0..self.routes.len() {
+            let Some(old_route) = previous
+                .routes
+                .iter()
+                .position(|r| *r == self.routes[route_idx])
+            else {
+                continue;
+            };
+            if same_layout {
+                let (base, old_base) = (
+                    route_idx * self.zones.len(),
+                    old_route * previous.zones.len(),
+                );
+                for (zone_idx, old_zone) in zone_map.iter().enumerate() {
+                    if let Some(old_zone) = *old_zone {
+                        self.route_zone[base + zone_idx] =
+                            previous.route_zone[old_base + old_zone].clone();
+                    }
+                }
+            }
+            let decision = &previous.route_decisions[old_route];
+            let same_zone = decision.last().map_or(true, |(zone, _, _)| {
+                self.zone_idx(&previous.zones[zone]) == Some(zone)
+            });
+            if same_zone {
+                self.route_decisions[route_idx] = decision.clone();
+            }
+            // Window columns are zone indices, so only an identical zone list keeps them.
+            if let (Some(window), Some(old_window)) = (
+                &self.share_windows[route_idx],
+                &previous.share_windows[old_route],
+            ) {
+                if self.zones == previous.zones
+                    && window.counts.bucket_ms == old_window.counts.bucket_ms
+                    && window.counts.counts.len() == old_window.counts.counts.len()
+                {
+                    self.share_windows[route_idx] = Some(old_window.clone());
+                }
+            }
+        }
+    }
+
+    pub fn zone_idx(&self, name: &str) -> Option<usize> {
+        self.zone_index.get(name).copied()
+    }
+
+    pub fn default_zone_idx(&self) -> usize {
+        self.zone_index[DEFAULT_ZONE]
+    }
+
+    pub fn route_zone(&self, route_idx: usize, zone_idx: usize) -> &RouteZoneCounters {
+        &self.route_zone[route_idx * self.zones.len() + zone_idx]
+    }
+
+    pub fn series_labels(&self, route_idx: usize, zone_idx: usize) -> &str {
+        &self.series_labels[route_idx * self.zones.len() + zone_idx]
+    }
+
+    pub fn zone_labels(&self, zone_idx: usize) -> &str {
+        &self.zone_labels[zone_idx]
+    }
+
+    pub fn route_labels(&self, route_idx: usize) -> &str {
+        &self.route_labels[route_idx]
+    }
+
+    pub fn zone(&self, zone_idx: usize) -> &ZoneCounters {
+        &self.zone[zone_idx]
+    }
+
+    pub fn recent_zone(&self, zone_idx: usize) -> &RecentZoneStats {
+        &self.recent_zones[zone_idx]
+    }
+
+    pub fn route_decision(&self, route_idx: usize) -> &RouteDecisionState {
+        &self.route_decisions[route_idx]
+    }
+
+    /// Series that have seen at least one request, as `(route_idx, zone_idx, counters)`.
+    pub fn active_route_zones(&self) -> impl Iterator<Item = (usize, usize, &RouteZoneCounters)> {
+        let zone_count = self.zones.len();
+        self.route_zone
+            .iter()
+            .enumerate()
+            .filter(|(_, m)| m.requests_total.load(Ordering::Relaxed) > 0)
+            .map(move |(idx, m)| (idx / zone_count, idx % zone_count, m.as_ref()))
+    }
+
+    /// Summed over the route's zone series rather than kept apart, so after a
+    /// reload it covers exactly the zone counters that were carried over.
+    pub fn route_requests_total(&self, route_idx: usize) -> u64 {
+        let zones = self.zones.len();
+        self.route_zone[route_idx * zones..(route_idx + 1) * zones]
+            .iter()
+            .map(|m| m.requests_total.load(Ordering::Relaxed))
+            .sum()
+    }
+
+    /// `zone_idx`'s share of `route_idx` requests in percent: over the route's sliding
+    /// window when one is enabled, otherwise since process start.
+    pub fn route_zone_share_percent(&self, route_idx: usize, zone_idx: usize) -> f64 {
+        if let Some(window) = &self.share_windows[route_idx] {
+            return window.share_percent(zone_idx, monotonic_ms());
+        }
+        let total_requests = self.route_requests_total(route_idx);
+        if total_requests == 0 {
+            return 0.0;
+        }
+        let zone_requests = self
+            .route_zone(route_idx, zone_idx)
+            .requests_total
+            .load(Ordering::Relaxed);
+        (zone_requests as f64 / total_requests as f64) * 100.0
+    }
+
+    /// `quantile` latency of `route_idx` across all zones since process start.
+    pub fn route_latency_quantile(&self, route_idx: usize, quantile: f64) -> Option<f64> {
+        let zones = self.zones.len();
+        let slots = &self.route_zone[route_idx * zones..(route_idx + 1) * zones];
+        self.latency_layout.quantile(quantile, |idx| {
+            slots.iter().map(|m| m.latency_histogram.count(idx)).sum()
+        })
+    }
+
+    pub fn record(&self, route_idx: usize, zone_idx: usize, sample: &RequestSample) {
+        let zone = self.zone(zone_idx);
+        zone.carbon_intensity_g_per_kwh.store(sample.carbon_g_per_kwh);
+        zone.carbon_intensity_seen.store(true, Ordering::Relaxed);
+        zone.requests.fetch_add(1, Ordering::Relaxed);
+        if sample.is_error {
+            zone.errors.fetch_add(1, Ordering::Relaxed);
+        }
+        self.recent_zones[zone_idx].record(sample.latency_ms, sample.is_error, monotonic_ms());
+
+        if let Some(window) = &self.share_windows[route_idx] {
+            window.record(zone_idx, monotonic_ms());
+        }
+        let m = self.route_zone(route_idx, zone_idx);
+        m.requests_total.fetch_add(1, Ordering::Relaxed);
+        if sample.is_carbon_safe {
+            m.carbon_safe_calls_total.fetch_add(1, Ordering::Relaxed);
+        }
+        if sample.is_error {
+            m.errors_total.fetch_add(1, Ordering::Relaxed);
+        }
+        m.carbon_intensity_exposure_total_g_per_kwh
+            .add(sample.carbon_g_per_kwh);
+        m.co2e_estimated_total_g.add(sample.co2e_g);
+        m.energy_estimated_total_j.add(sample.energy_j);
+        m.latency_sum_ms.add(sample.latency_ms);
+        m.latency_count.fetch_add(1, Ordering::Relaxed);
+        m.latency_histogram.record(sample.latency_ms);
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn records_into_dense_route_zone_slot() {
+        let matrix = MetricsMatrix::new(
+            vec!["/a".to_string(), "/b".to_string()],
+            vec!["east".to_string(), "west".to_string()],
+        );
+        let west = matrix.zone_idx("west").unwrap();
+        let sample = RequestSample {
+            latency_ms: 40.0,
+            carbon_g_per_kwh: 200.0,
+            is_carbon_safe: true,
+            energy_j: 1.0,
+            co2e_g: 0.5,
+            is_error: false,
+        };
+        matrix.record(1, west, &sample);
+        matrix.record(1, west, &sample);
+
+        let active: Vec<_> = matrix.active_route_zones().map(|(r, z, _)| (r, z)).collect();
+        assert_eq!(active, vec![(1, west)]);
+        let m = matrix.route_zone(1, west);
+        assert_eq!(m.requests_total.load(Ordering::Relaxed), 2);
+        let bucket = matrix.latency_layout().index(40.0);
+        assert_eq!(matrix.latency_layout().labels()[bucket], "40");
+        assert_eq!(m.latency_histogram.count(bucket), 2);
+        assert_eq!(matrix.route_requests_total(1), 2);
+        assert_eq!(matrix.default_zone_idx(), 2);
+    }
+
+    #[test]
+    fn latency_layout_is_log_linear() {
+        let layout = Arc::new(LatencyLayout::new(1.0, 100.0, 4));
+        // One bucket up to 1ms, 7 octaves of 4, then `+Inf`.
+        assert_eq!(layout.bucket_count(), 30);
+        assert_eq!(&layout.labels()[..3], ["1", "1.25", "1.5"]);
+        assert_eq!(layout.index(0.2), 0);
+        assert_eq!(layout.index(1.1), 1);
+        assert_eq!(layout.index(2.0), 4);
+        assert_eq!(layout.index(2.1), 5);
+        assert_eq!(layout.index(1e9), 29);
+
+        let histogram = LatencyHistogram::new(layout);
+        assert_eq!(histogram.quantile(0.5), None);
+        for ms in 1..=100 {
+            histogram.record(ms as f64);
+        }
+        for (q, exact) in [(0.5, 50.0), (0.95, 95.0), (0.99, 99.0)] {
+            let estimate = histogram.quantile(q).unwrap();
+            assert!((estimate - exact).abs() / exact < 0.125, "p{q}: {estimate}");
+        }
+    }
+
+    #[test]
+    fn share_window_forgets_expired_buckets() {
+        // 4 buckets of 250ms; times are absolute so the test does not sleep.
+        let window = ShareWindow::new(1000, 4, 2);
+        let t0 = window.counts.head.load(Ordering::Relaxed) * 250;
+        window.record(0, t0);
+        window.record(0, t0);
+        window.record(1, t0 + 500);
+        assert!((window.share_percent(0, t0 + 500) - 66.666).abs() < 0.01);
+        // t0's bucket has left the window; only zone 1's request remains.
+        assert_eq!(window.share_percent(0, t0 + 1000), 0.0);
+        assert_eq!(window.share_percent(1, t0 + 1000), 100.0);
+        // Idle for more than a full window clears everything.
+        assert_eq!(window.share_percent(1, t0 + 10_000), 0.0);
+    }
+
+    #[test]
+    fn recent_zone_stats_track_the_window_only() {
+        let stats = RecentZoneStats::new(Arc::new(LatencyLayout::default()), 1000, 4, 5);
+        let t0 = stats.counts.head.load(Ordering::Relaxed) * 250;
+        for i in 0..20 {
+            stats.record(if i < 19 { 10.0 } else { 400.0 }, i % 4 == 0, t0);
+        }
+        assert_eq!(stats.error_rate(t0), 0.25);
+        // 10ms is a bucket bound; the single slow sample is above p95.
+        assert_eq!(stats.latency_quantile_ms(0.95, t0), Some(10.0));
+        assert!(stats.latency_quantile_ms(1.0, t0).unwrap() >= 400.0);
+
+        // The first bucket expired: one request is below `min_samples`.
+        stats.record(50.0, true, t0 + 1000);
+        assert_eq!(stats.requests(t0 + 1000), 1);
+        assert_eq!(stats.error_rate(t0 + 1000), 0.0);
+        assert_eq!(stats.latency_quantile_ms(0.95, t0 + 1000), None);
+    }
+
+    #[test]
+    fn carry_over_matches_routes_and_zones_by_name() {
+        let requests = |m: &MetricsMatrix, route_idx, zone_idx| {
+            m.route_zone(route_idx, zone_idx)
+                .requests_total
+                .load(Ordering::Relaxed)
+        };
+        let sample = RequestSample {
+            latency_ms: 40.0,
+            carbon_g_per_kwh: 200.0,
+            is_carbon_safe: true,
+            energy_j: 1.0,
+            co2e_g: 0.5,
+            is_error: false,
+        };
+        let previous = MetricsMatrix::new(
+            vec!["/a".to_string(), "/b".to_string()],
+            vec!["east".to_string(), "west".to_string()],
+        );
+        previous.record(1, 1, &sample);
+        previous.route_decision(0).set(1, 0.4);
+        previous.route_decision(1).set(0, 0.2);
+
+        // `/a` is gone, `west` moved to index 0 and `north` is new.
+        let mut next = MetricsMatrix::new(
+            vec!["/b".to_string(), "/c".to_string()],
+            vec!["west".to_string(), "north".to_string()],
+        );
+        next.carry_over(&previous);
+        assert_eq!(next.route_requests_total(0), 1);
+        assert_eq!(requests(&next, 0, 0), 1);
+        assert_eq!(next.zone(0).requests.load(Ordering::Relaxed), 1);
+        assert_eq!(next.zone(1).requests.load(Ordering::Relaxed), 0);
+        // `/b` last picked `east`, which no longer exists.
+        assert_eq!(next.route_decision(0).last(), None);
+
+        // Requests still finishing against the old matrix land in the shared series.
+        previous.record(1, 1, &sample);
+        assert_eq!(requests(&next, 0, 0), 2);
+
+        // A different histogram layout starts the latency series over.
+        let mut resized = MetricsMatrix::new(vec!["/b".to_string()], vec!["west".to_string()]);
+        resized.set_latency_layout(LatencyLayout::new(1.0, 100.0, 2));
+        resized.carry_over(&next);
+        assert_eq!(requests(&resized, 0, 0), 0);
+        assert_eq!(resized.route_requests_total(0), 0);
+        assert_eq!(resized.zone(0).requests.load(Ordering::Relaxed), 2);
+    }
+
+    #[test]
+    fn lifetime_share_only_counts_carried_zones() {
+        let sample = RequestSample {
+            latency_ms: 40.0,
+            carbon_g_per_kwh: 200.0,
+            is_carbon_safe: true,
+            energy_j: 1.0,
+            co2e_g: 0.5,
+            is_error: false,
+        };
+        let previous = MetricsMatrix::new(
+            vec!["/a".to_string()],
+            vec!["east".to_string(), "west".to_string()],
+        );
+        for _ in 0..3 {
+            previous.record(0, 0, &sample);
+        }
+        previous.record(0, 1, &sample);
+        assert_eq!(previous.route_zone_share_percent(0, 1), 25.0);
+
+        // `east` is gone: its requests leave the route total along with its series.
+        let mut next = MetricsMatrix::new(vec!["/a".to_string()], vec!["west".to_string()]);
+        next.carry_over(&previous);
+        assert_eq!(next.route_requests_total(0), 1);
+        assert_eq!(next.route_zone_share_percent(0, 0), 100.0);
+    }
+}
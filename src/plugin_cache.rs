@@ -0,0 +1,82 @@
+use std::collections::HashMap;
+use std::sync::atomic::{AtomicU64, Ordering};
+use std::sync::{Arc, Mutex};
+use std::time::{Duration, Instant};
+
+use crate::config;
+use crate::wasm_engine::WasmOutput;
+
+// Unit separator: cannot appear in a method, and is not valid in header values.
+const KEY_SEPARATOR: char = '\u{1f}';
+
+/// Per-route memo of plugin results, for plugins that are pure functions of the
+/// request attributes declared in `policy.plugin_cache`.
+pub struct PluginResultCache {
+    key_headers: Vec<String>,
+    key_method: bool,
+    key_path: bool,
+    entries: Mutex<rilot_core::TtlLru<String, Arc<WasmOutput>>>,
+    pub hits: AtomicU64,
+    pub misses: AtomicU64,
+}
+
+impl PluginResultCache {
+    pub fn new(cfg: &config::PluginCacheConfig) -> Self {
+        Self {
+            key_headers: cfg.key_headers.iter().map(|h| h.to_ascii_lowercase()).collect(),
+            key_method: cfg.key_method,
+            key_path: cfg.key_path,
+            entries: Mutex::new(rilot_core::TtlLru::new(
+                cfg.max_entries,
+                Duration::from_secs(cfg.ttl_secs.max(1)),
+            )),
+            hits: AtomicU64::new(0),
+            misses: AtomicU64::new(0),
+        }
+    }
+
+    /// Cache key from the declared attributes. A missing header and an empty one differ.
+    pub fn key(&self, method: &str, path: &str, headers: &HashMap<String, String>) -> String {
+        let mut key = String::new();
+        if self.key_method {
+            key.push_str(method);
+        }
+        key.push(KEY_SEPARATOR);
+        if self.key_path {
+            key.push_str(path);
+        }
+        for name in &self.key_headers {
+            key.push(KEY_SEPARATOR);
+            if let Some(value) = headers.get(name) {
+                key.push('=');
+                key.push_str(value);
+            }
+        }
+        key
+    }
+
+    pub fn get(&self, key: &str) -> Option<Arc<WasmOutput>> {
+        let hit = self
+            .entries
+            .lock()
+            .expect("plugin cache lock poisoned")
+            .get(key, Instant::now())
+            .cloned();
+        let counter = if hit.is_some() { &self.hits } else { &self.misses };
+        counter.fetch_add(1, Ordering::Relaxed);
+        hit
+    }
+
+    pub fn insert(&self, key: String, output: Arc<WasmOutput>) {
+        self.entries
+            .lock()
+            .expect("plugin cache lock poisoned")
+            .insert(key, output, Instant::now());
+    }
+
+    /// `(entries, evictions)` for `/metrics`.
+    pub fn size(&self) -> (usize, u64) {
+        let entries = self.entries.lock().expect("plugin cache lock poisoned");
+        (entries.len(), entries.evictions())
+    }
+}
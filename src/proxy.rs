@@ -1,23 +1,28 @@
+use futures_util::TryStreamExt;
+use hyper::body::{Bytes, HttpBody};
 use hyper::service::{make_service_fn, service_fn};
 use hyper::{
-    header::{HeaderName, HeaderValue},
-    Body, Client, Request, Response, Server, StatusCode, Uri,
+    header::{HeaderMap, HeaderName, HeaderValue, ACCEPT, ACCEPT_ENCODING},
+    Body, Method, Request, Response, Server, StatusCode, Uri,
 };
 use once_cell::sync::Lazy;
-use reqwest::header::{HeaderMap, HeaderName as ReqHeaderName, HeaderValue as ReqHeaderValue};
-use serde::Serialize;
 use serde_json::json;
-use std::collections::{HashMap, HashSet};
+use std::borrow::Cow;
+use std::collections::HashMap;
 use std::convert::Infallible;
 use std::net::SocketAddr;
-use std::path::Path;
+use std::sync::atomic::{AtomicU64, AtomicUsize, Ordering};
 use std::sync::{Arc, RwLock};
-use std::time::{Duration, Instant, SystemTime, UNIX_EPOCH};
+use std::time::{Duration, Instant};
 
-use crate::{config, wasm_engine};
+use crate::metrics;
+use crate::{
+    carbon, concurrency, config, decision_cache, decision_log, deferral, exposition, health,
+    listener, plugin_cache, reload, upstream, wasm_engine,
+};
 
 const CROSS_REGION_RTT_PENALTY_MS: f64 = 40.0;
-static HTTP_CLIENT: Lazy<reqwest::Client> = Lazy::new(reqwest::Client::new);
+const OBSERVED_LATENCY_QUANTILE: f64 = 0.95;
 static CACHE_TTL_LEFT_HEADER: Lazy<HeaderName> =
     Lazy::new(|| HeaderName::from_static("x-rilot-cc-ttl-left"));
 static SELECTED_ZONE_HEADER: Lazy<HeaderName> =
@@ -48,16 +53,14 @@ static EMULATE_CROSS_REGION_RTT: Lazy<bool> = Lazy::new(|| {
         .unwrap_or(false)
 });
 
-#[derive(Serialize)]
-struct WasmInput {
-    method: String,
-    path: String,
-    headers: HashMap<String, String>,
-    body: String,
+enum BodyReadError {
+    TooLarge,
+    Read(hyper::Error),
 }
 
 #[derive(Clone)]
 struct ZoneCandidate {
+    id: usize,
     name: String,
     app_uri: String,
     region: String,
@@ -68,111 +71,203 @@ struct ZoneCandidate {
     tags: Vec<String>,
 }
 
-#[derive(Default, Clone)]
-struct ZoneRuntimeStats {
-    requests: u64,
-    errors: u64,
-}
-
 #[derive(Clone)]
-struct CachedCarbon {
-    current: Option<f64>,
-    forecast_next: Option<f64>,
-    expires_at: Instant,
+struct StaticState {
+    route_table: Arc<rilot_core::RouteTable>,
+    zones_by_route: Arc<Vec<Vec<Arc<ZoneCandidate>>>>,
+    metrics: Arc<metrics::MetricsMatrix>,
+    upstreams: Arc<upstream::UpstreamPools>,
+    plugin_caches: Arc<Vec<Option<plugin_cache::PluginResultCache>>>,
+    carbon: Arc<carbon::CarbonSignals>,
+    health: Arc<health::ZoneHealth>,
+    limits: Arc<concurrency::ConcurrencyLimits>,
+    decisions: Arc<decision_cache::DecisionCache<ZoneDecision>>,
+    decision_log: Arc<decision_log::DecisionLog>,
+    deferrals: Arc<deferral::DeferralQueue>,
+    reloads: Arc<reload::ReloadStats>,
+    listeners: Arc<listener::ListenerStats>,
 }
 
-#[derive(Default, Clone)]
-struct RouteZoneMetrics {
-    requests_total: u64,
-    carbon_safe_calls_total: u64,
-    errors_total: u64,
-    carbon_intensity_exposure_total_g_per_kwh: f64,
-    co2e_estimated_total_g: f64,
-    energy_estimated_total_j: f64,
-    latency_sum_ms: f64,
-    latency_count: u64,
-    latency_buckets: [u64; 7],
+/// A config and the state built from it, swapped as one on reload. Each request
+/// takes the current one when it arrives and keeps it to the end, so it never mixes
+/// old and new settings.
+struct Runtime {
+    config: Arc<config::Config>,
+    state: StaticState,
 }
 
-#[derive(Default)]
-struct MetricsStore {
-    route_zone: HashMap<(String, String), RouteZoneMetrics>,
-    carbon_intensity_g_per_kwh: HashMap<String, f64>,
+type LiveRuntime = Arc<RwLock<Arc<Runtime>>>;
+
+fn current_runtime(runtime: &LiveRuntime) -> Arc<Runtime> {
+    runtime.read().expect("runtime lock poisoned").clone()
 }
 
 #[derive(Clone)]
-struct LastDecision {
-    zone: String,
+struct ZoneScore {
+    zone: Arc<ZoneCandidate>,
     score: f64,
-    at: Instant,
+    carbon_g_per_kwh: Option<f64>,
+    carbon_saved_vs_worst_g_per_kwh: f64,
+    carbon_saved_vs_worst_percent: f64,
+    latency_ms: f64,
+    error_rate: f64,
+    cost: f64,
+    filtered_out_reason: Option<Cow<'static, str>>,
 }
 
-#[derive(Default)]
-struct RuntimeState {
-    metrics: MetricsStore,
-    zone_stats: HashMap<String, ZoneRuntimeStats>,
-    zone_in_flight: HashMap<String, usize>,
-    carbon_cache: HashMap<String, CachedCarbon>,
-    refresh_in_flight: HashSet<String>,
-    last_decision_by_route: HashMap<String, LastDecision>,
-    decision_counter: u64,
+impl ZoneScore {
+    fn is_eligible(&self) -> bool {
+        self.filtered_out_reason.is_none()
+            || self.filtered_out_reason.as_deref() == Some("deferred-for-greener-window")
+    }
 }
 
-#[derive(Clone)]
-struct AppState {
-    inner: Arc<RwLock<RuntimeState>>,
+/// Outcome of `choose_zone`: the selected zone plus every candidate score, kept so the
+/// research snapshot strings can be formatted on demand instead of on every request.
+struct ZoneDecision {
+    selected: ZoneScore,
+    scores: Vec<ZoneScore>,
+    /// No candidate's breaker admitted a request, so routing ignored them all.
+    breakers_ignored: bool,
 }
 
-impl AppState {
-    fn new() -> Self {
-        Self {
-            inner: Arc::new(RwLock::new(RuntimeState::default())),
+impl ZoneDecision {
+    /// Candidate indices ordered by carbon intensity (unknown last), then config order.
+    fn snapshot_order(&self) -> Vec<usize> {
+        let mut order: Vec<usize> = (0..self.scores.len()).collect();
+        order.sort_by(|&a, &b| {
+            let a = &self.scores[a];
+            let b = &self.scores[b];
+            a.carbon_g_per_kwh
+                .unwrap_or(f64::INFINITY)
+                .total_cmp(&b.carbon_g_per_kwh.unwrap_or(f64::INFINITY))
+                .then_with(|| a.zone.order.cmp(&b.zone.order))
+        });
+        order
+    }
+
+    /// Eligible zones other than the selected one, best first: by score, then latency
+    /// (scores are all zero on latency-only routes), then config order.
+    fn runners_up(&self) -> Vec<Arc<ZoneCandidate>> {
+        let mut rest: Vec<&ZoneScore> = self
+            .scores
+            .iter()
+            .filter(|s| s.filtered_out_reason.is_none() && s.zone.id != self.selected.zone.id)
+            .collect();
+        rest.sort_by(|a, b| {
+            a.score
+                .total_cmp(&b.score)
+                .then_with(|| a.latency_ms.total_cmp(&b.latency_ms))
+                .then_with(|| a.zone.order.cmp(&b.zone.order))
+        });
+        rest.into_iter().map(|s| s.zone.clone()).collect()
+    }
+
+    fn zone_carbon_snapshot(&self, eligible_only: bool) -> String {
+        let mut out = String::new();
+        for idx in self.snapshot_order() {
+            let s = &self.scores[idx];
+            if eligible_only && !s.is_eligible() {
+                continue;
+            }
+            if !out.is_empty() {
+                out.push(';');
+            }
+            out.push_str(&s.zone.name);
+            out.push(':');
+            match s.carbon_g_per_kwh {
+                Some(v) => out.push_str(&format!("{:.3}", v)),
+                None => out.push_str("na"),
+            }
         }
+        out
     }
-}
 
-#[derive(Clone)]
-struct StaticState {
-    zones_by_route: Arc<HashMap<String, Vec<ZoneCandidate>>>,
+    fn zone_filter_reasons(&self) -> String {
+        let mut out = String::new();
+        for idx in self.snapshot_order() {
+            let s = &self.scores[idx];
+            if !out.is_empty() {
+                out.push(';');
+            }
+            out.push_str(&s.zone.name);
+            out.push(':');
+            out.push_str(s.filtered_out_reason.as_deref().unwrap_or("eligible"));
+        }
+        out
+    }
 }
 
-#[derive(Clone)]
-struct ZoneScore {
-    zone: ZoneCandidate,
-    score: f64,
-    carbon_g_per_kwh: Option<f64>,
-    zone_carbon_intensity_g_per_kwh: String,
-    eligible_zone_carbon_intensity_g_per_kwh: String,
+/// Values for the `RILOT_EXPOSE_RESEARCH_HEADERS` response headers, captured before
+/// the decision moves into request accounting.
+struct ResearchHeaders {
+    carbon_cache_ttl_left_secs: Option<u64>,
+    selected_carbon: Option<f64>,
+    zone_carbon_snapshot: String,
+    eligible_zone_carbon_snapshot: String,
     zone_filter_reasons: String,
-    carbon_saved_vs_worst_g_per_kwh: f64,
-    carbon_saved_vs_worst_percent: f64,
-    latency_ms: f64,
-    error_rate: f64,
-    cost: f64,
-    filtered_out_reason: Option<String>,
+    carbon_saved: f64,
+    carbon_saved_percent: f64,
+    reason: String,
 }
 
-#[derive(Clone)]
-struct CarbonSignal {
-    current: Option<f64>,
-    forecast_next: Option<f64>,
+impl ResearchHeaders {
+    fn apply(&self, headers: &mut hyper::HeaderMap, selected_zone_name: &str) {
+        if let Some(ttl_left) = self.carbon_cache_ttl_left_secs {
+            if let Ok(value) = HeaderValue::from_str(&ttl_left.to_string()) {
+                headers.insert(CACHE_TTL_LEFT_HEADER.clone(), value);
+            }
+        }
+        if let Ok(value) = HeaderValue::from_str(selected_zone_name) {
+            headers.insert(SELECTED_ZONE_HEADER.clone(), value);
+        }
+        if let Some(v) = self.selected_carbon {
+            if let Ok(value) = HeaderValue::from_str(&format!("{:.3}", v)) {
+                headers.insert(SELECTED_CARBON_HEADER.clone(), value);
+            }
+        }
+        if !self.zone_carbon_snapshot.is_empty() {
+            if let Ok(value) = HeaderValue::from_str(&self.zone_carbon_snapshot) {
+                headers.insert(ZONE_CARBON_SNAPSHOT_HEADER.clone(), value);
+            }
+        }
+        if !self.eligible_zone_carbon_snapshot.is_empty() {
+            if let Ok(value) = HeaderValue::from_str(&self.eligible_zone_carbon_snapshot) {
+                headers.insert(ELIGIBLE_ZONE_CARBON_SNAPSHOT_HEADER.clone(), value);
+            }
+        }
+        if !self.zone_filter_reasons.is_empty() {
+            if let Ok(value) = HeaderValue::from_str(&self.zone_filter_reasons) {
+                headers.insert(ZONE_FILTER_REASONS_HEADER.clone(), value);
+            }
+        }
+        if let Ok(value) = HeaderValue::from_str(&self.reason) {
+            headers.insert(DECISION_REASON_HEADER.clone(), value);
+        }
+        if let Ok(value) = HeaderValue::from_str(&format!("{:.3}", self.carbon_saved.max(0.0))) {
+            headers.insert(CARBON_SAVED_HEADER.clone(), value);
+        }
+        if let Ok(value) =
+            HeaderValue::from_str(&format!("{:.2}", self.carbon_saved_percent.max(0.0)))
+        {
+            headers.insert(CARBON_SAVED_PERCENT_HEADER.clone(), value);
+        }
+    }
 }
 
-pub async fn start_proxy(config: Arc<config::Config>) {
-    let state = AppState::new();
-    let static_state = build_static_state(&config);
-    spawn_rollup_task(config.clone(), state.clone());
-
-    let make_svc = make_service_fn(move |_conn| {
-        let cfg = config.clone();
-        let st = state.clone();
-        let ss = static_state.clone();
-        async move {
-            Ok::<_, Infallible>(service_fn(move |req| {
-                handle_request(req, cfg.clone(), st.clone(), ss.clone())
-            }))
-        }
-    });
+pub async fn start_proxy(config: Arc<config::Config>, config_path: String) {
+    let static_state = build_static_state(&config, None);
+    start_background_tasks(&static_state, None).await;
+    static_state
+        .deferrals
+        .spawn_scheduler(static_state.carbon.clone());
+    let triggers = reload::spawn_triggers(&config_path, &config.reload);
+    let runtime: LiveRuntime = Arc::new(RwLock::new(Arc::new(Runtime {
+        config,
+        state: static_state,
+    })));
+    spawn_rollup_task(runtime.clone());
+    spawn_reload_task(runtime.clone(), config_path, triggers);
 
     let host = std::env::var("RILOT_HOST").unwrap_or_else(|_| "127.0.0.1".to_string());
     let port = std::env::var("RILOT_PORT")
@@ -181,34 +276,381 @@ pub async fn start_proxy(config: Arc<config::Config>) {
         .unwrap_or(8080);
     let addr = SocketAddr::new(host.parse().expect("Invalid host"), port);
 
-    println!("Rilot proxy starting at http://{}", addr);
-    let server = Server::bind(&addr).serve(make_svc);
+    let settings = current_runtime(&runtime).config.server.clone();
+    let sockets = match listener::bind(addr, &settings) {
+        Ok(sockets) => sockets,
+        Err(e) => {
+            eprintln!("Server error: failed to bind {}: {}", addr, e);
+            return;
+        }
+    };
+    let limit = settings
+        .max_connections
+        .map(|max| Arc::new(tokio::sync::Semaphore::new(max)));
+
+    println!(
+        "Rilot proxy starting at http://{} listeners={}",
+        addr,
+        sockets.len()
+    );
+    let mut servers = Vec::with_capacity(sockets.len());
+    for (index, socket) in sockets.into_iter().enumerate() {
+        let server = serve_listener(
+            index,
+            socket,
+            settings.clone(),
+            limit.clone(),
+            runtime.clone(),
+        );
+        servers.push(if settings.pin_listeners {
+            match listener::spawn_pinned(index, server) {
+                Ok(thread) => tokio::task::spawn_blocking(move || {
+                    let _ = thread.join();
+                }),
+                Err(e) => {
+                    eprintln!("Server error: listener {} thread: {}", index, e);
+                    continue;
+                }
+            }
+        } else {
+            tokio::spawn(server)
+        });
+    }
+    for server in servers {
+        let _ = server.await;
+    }
+}
+
+/// Serves one accept socket until it fails. Runs on whichever runtime polls it.
+async fn serve_listener(
+    index: usize,
+    socket: std::net::TcpListener,
+    settings: config::ServerConfig,
+    limit: Option<Arc<tokio::sync::Semaphore>>,
+    runtime: LiveRuntime,
+) {
+    let stats = current_runtime(&runtime).state.listeners.clone();
+    let incoming = match listener::incoming(index, socket, &settings, limit, stats) {
+        Ok(incoming) => incoming,
+        Err(e) => {
+            eprintln!("Server error: listener {}: {}", index, e);
+            return;
+        }
+    };
+
+    let make_svc = make_service_fn(move |_conn| {
+        let runtime = runtime.clone();
+        async move {
+            Ok::<_, Infallible>(service_fn(move |req| {
+                // Per request, not per connection, so keep-alive clients see reloads.
+                let current = current_runtime(&runtime);
+                handle_request(req, current.config.clone(), current.state.clone())
+            }))
+        }
+    });
+
+    let server = listener::configure(Server::builder(incoming), &settings).serve(make_svc);
     if let Err(e) = server.await {
-        eprintln!("Server error: {}", e);
+        eprintln!("Server error: listener {}: {}", index, e);
+    }
+}
+
+/// Starts the background work of every part of `state` not carried over from
+/// `previous`: pool prewarming, the carbon refresher (after a bounded wait to fill
+/// every zone's cache, so traffic rarely sees a cold one), the decision log writer,
+/// health probes and the scheduler lag sampler.
+async fn start_background_tasks(state: &StaticState, previous: Option<&StaticState>) {
+    if previous.map_or(true, |p| !Arc::ptr_eq(&p.upstreams, &state.upstreams)) {
+        state.upstreams.prewarm().await;
+    }
+    if previous.map_or(true, |p| !Arc::ptr_eq(&p.carbon, &state.carbon)) {
+        state.carbon.prime().await;
+        state.carbon.spawn_refresher();
+    }
+    if previous.map_or(true, |p| !Arc::ptr_eq(&p.decision_log, &state.decision_log)) {
+        state.decision_log.spawn_writer();
+    }
+    if previous.map_or(true, |p| !Arc::ptr_eq(&p.health, &state.health)) {
+        state.health.spawn_probes(state.upstreams.clone());
+    }
+    if previous.map_or(true, |p| !Arc::ptr_eq(&p.limits, &state.limits)) {
+        state.limits.spawn_lag_sampler();
+    }
+}
+
+fn spawn_reload_task(
+    runtime: LiveRuntime,
+    config_path: String,
+    mut triggers: tokio::sync::mpsc::Receiver<&'static str>,
+) {
+    tokio::spawn(async move {
+        while let Some(trigger) = triggers.recv().await {
+            reload_config(&runtime, &config_path, trigger).await;
+        }
+    });
+}
+
+/// Loads and validates `config_path`, builds state for it carrying over everything
+/// still valid, starts its background work, then swaps it in. Until the swap requests
+/// keep running on the old runtime; on any error it stays in place.
+async fn reload_config(runtime: &LiveRuntime, config_path: &str, trigger: &str) {
+    let started = Instant::now();
+    let previous = current_runtime(runtime);
+    let stats = previous.state.reloads.clone();
+    let loaded = config::try_load_config(config_path)
+        .and_then(|config| check_reloadable(&previous.config, &config).map(|()| config));
+    let config = match loaded {
+        Ok(config) => Arc::new(config),
+        Err(e) => {
+            let duration_ms = stats.record(started, false);
+            log::warn!(
+                "config_reload=failed trigger={} duration_ms={:.1} error={}",
+                trigger,
+                duration_ms,
+                e
+            );
+            return;
+        }
+    };
+    let state = build_static_state(&config, Some(previous.as_ref()));
+    start_background_tasks(&state, Some(&previous.state)).await;
+    state
+        .deferrals
+        .reconfigure(&config.deferral, state.carbon.clone());
+    if config.server != previous.config.server {
+        log::warn!("config_reload_server_ignored reason=restart_required");
     }
+    *runtime.write().expect("runtime lock poisoned") = Arc::new(Runtime { config, state });
+    let duration_ms = stats.record(started, true);
+    log::info!(
+        "config_reload=ok trigger={} generation={} duration_ms={:.1}",
+        trigger,
+        stats.generation.load(Ordering::Relaxed),
+        duration_ms
+    );
 }
 
-fn build_static_state(config: &config::Config) -> StaticState {
-    let mut zones_by_route = HashMap::new();
+/// The Wasm engine's instance pool is sized once at startup, so plugin settings and
+/// the set of components cannot change without a restart.
+fn check_reloadable(current: &config::Config, next: &config::Config) -> Result<(), String> {
+    if next.plugins != current.plugins {
+        return Err("plugins changed; restart to apply".to_string());
+    }
+    for proxy in &next.proxies {
+        let Some(path) = proxy.override_file.as_ref() else {
+            continue;
+        };
+        let known = current
+            .proxies
+            .iter()
+            .any(|p| p.override_file.as_ref() == Some(path));
+        if !known {
+            return Err(format!("new override_file {}; restart to apply", path));
+        }
+    }
+    Ok(())
+}
+
+fn zone_uris(zones_by_route: &[Vec<Arc<ZoneCandidate>>]) -> Vec<(&str, &str)> {
+    zones_by_route
+        .iter()
+        .flatten()
+        .map(|z| (z.name.as_str(), z.app_uri.as_str()))
+        .collect()
+}
+
+/// Builds the state for `config`. On reload, `previous` donates every part whose
+/// inputs did not change (upstream pools, carbon signals, the decision log), the
+/// deferral queue and reload stats always, and the metrics of routes and zones that
+/// still exist; caches derived from the old config start empty.
+fn build_static_state(config: &config::Config, previous: Option<&Runtime>) -> StaticState {
+    let mut zone_names: Vec<String> = Vec::new();
+    let mut zone_ids: HashMap<String, usize> = HashMap::new();
+    let mut zones_by_route = Vec::with_capacity(config.proxies.len());
     for proxy in &config.proxies {
-        zones_by_route.insert(proxy.rule.path.clone(), resolve_zones(proxy));
+        let mut zones = resolve_zones(proxy);
+        for zone in &mut zones {
+            zone.id = *zone_ids.entry(zone.name.clone()).or_insert_with(|| {
+                zone_names.push(zone.name.clone());
+                zone_names.len() - 1
+            });
+        }
+        zones_by_route.push(zones.into_iter().map(Arc::new).collect::<Vec<_>>());
+    }
+    let upstreams = match previous {
+        Some(prev)
+            if prev.config.upstream == config.upstream
+                && zone_uris(&prev.state.zones_by_route) == zone_uris(&zones_by_route) =>
+        {
+            prev.state.upstreams.clone()
+        }
+        _ => Arc::new(upstream::UpstreamPools::new(
+            zone_uris(&zones_by_route),
+            &config.upstream,
+        )),
+    };
+    let routes: Vec<String> = config.proxies.iter().map(|p| p.rule.path.clone()).collect();
+    let route_table = rilot_core::RouteTable::new(
+        config
+            .proxies
+            .iter()
+            .map(|p| (p.rule.path.as_str(), p.rule.r#type.as_str())),
+    );
+    let plugin_caches = config
+        .proxies
+        .iter()
+        .map(|p| {
+            p.policy
+                .plugin_cache
+                .as_ref()
+                .filter(|_| p.override_file.is_some())
+                .map(plugin_cache::PluginResultCache::new)
+        })
+        .collect();
+    // Records carry route and zone indices, so the log is only shared while they mean
+    // the same thing.
+    let decision_log = match previous {
+        Some(prev)
+            if prev.config.decision_log == config.decision_log
+                && prev.config.metrics.decision_log_sample_rate
+                    == config.metrics.decision_log_sample_rate
+                && prev.state.metrics.routes == routes
+                && prev.state.carbon.zones == zone_names =>
+        {
+            prev.state.decision_log.clone()
+        }
+        _ => Arc::new(decision_log::DecisionLog::new(
+            &config.decision_log,
+            config.metrics.decision_log_sample_rate,
+            routes.clone(),
+            zone_names.clone(),
+        )),
+    };
+    let mut matrix = metrics::MetricsMatrix::new(routes, zone_names.clone());
+    matrix.set_latency_layout(metrics::LatencyLayout::new(
+        config.metrics.latency_histogram_min_ms,
+        config.metrics.latency_histogram_max_ms,
+        config.metrics.latency_histogram_sub_buckets,
+    ));
+    matrix.set_recent_window(
+        config.signals.window_secs.saturating_mul(1000),
+        config.signals.window_buckets,
+        config.signals.min_samples,
+    );
+    for (route_idx, proxy) in config.proxies.iter().enumerate() {
+        let constraints = &proxy.policy.constraints;
+        if constraints.max_request_share_percent.is_some() && constraints.share_window_secs > 0 {
+            matrix.enable_share_window(
+                route_idx,
+                constraints.share_window_secs.saturating_mul(1000),
+                constraints.share_window_buckets,
+            );
+        }
+    }
+    if let Some(prev) = previous {
+        matrix.carry_over(&prev.state.metrics);
     }
+    let carbon = match previous {
+        Some(prev)
+            if prev.config.carbon == config.carbon && prev.state.carbon.zones == zone_names =>
+        {
+            prev.state.carbon.clone()
+        }
+        _ => Arc::new(carbon::CarbonSignals::new(
+            Arc::new(config.carbon.clone()),
+            zone_names.clone(),
+        )),
+    };
+    // Breaker state belongs to the zone's pool, so it is reset with it.
+    let health = match previous {
+        Some(prev)
+            if prev.config.circuit_breaker == config.circuit_breaker
+                && prev.config.health_check == config.health_check
+                && prev.state.health.zones == zone_names
+                && Arc::ptr_eq(&prev.state.upstreams, &upstreams) =>
+        {
+            prev.state.health.clone()
+        }
+        _ => Arc::new(health::ZoneHealth::new(
+            zone_names.clone(),
+            &config.circuit_breaker,
+            &config.health_check,
+        )),
+    };
+    let mut zone_error_thresholds = vec![Vec::new(); zone_names.len()];
+    // A zone listed by several routes gets the smallest `max_in_flight` among them.
+    let mut zone_ceilings: Vec<Option<usize>> = vec![None; zone_names.len()];
+    for (proxy, zones) in config.proxies.iter().zip(&zones_by_route) {
+        for zone in zones {
+            if let Some(max_error) = proxy.policy.constraints.max_error_rate {
+                zone_error_thresholds[zone.id].push(max_error);
+            }
+            if let Some(limit) = zone.max_in_flight {
+                let ceiling = &mut zone_ceilings[zone.id];
+                *ceiling = Some(ceiling.map_or(limit, |c| c.min(limit)));
+            }
+        }
+    }
+    // Learned limits survive a reload that keeps the zones and their ceilings.
+    let limits = match previous {
+        Some(prev)
+            if prev.config.concurrency == config.concurrency
+                && prev.state.health.zones == zone_names
+                && prev.state.limits.ceilings() == zone_ceilings.as_slice() =>
+        {
+            prev.state.limits.clone()
+        }
+        _ => Arc::new(concurrency::ConcurrencyLimits::new(
+            &zone_ceilings,
+            &config.concurrency,
+        )),
+    };
+    let decisions = decision_cache::DecisionCache::new(
+        &config.decision_cache,
+        config
+            .proxies
+            .iter()
+            .map(|p| p.policy.constraints.max_request_share_percent.is_none())
+            .collect(),
+        zone_error_thresholds,
+    );
     StaticState {
+        route_table: Arc::new(route_table),
         zones_by_route: Arc::new(zones_by_route),
+        metrics: Arc::new(matrix),
+        upstreams,
+        plugin_caches: Arc::new(plugin_caches),
+        carbon,
+        health,
+        limits,
+        decisions: Arc::new(decisions),
+        decision_log,
+        deferrals: previous.map_or_else(
+            || Arc::new(deferral::DeferralQueue::new(&config.deferral)),
+            |prev| prev.state.deferrals.clone(),
+        ),
+        reloads: previous.map_or_else(Default::default, |prev| prev.state.reloads.clone()),
+        listeners: previous.map_or_else(
+            || Arc::new(listener::ListenerStats::new(config.server.listeners)),
+            |prev| prev.state.listeners.clone(),
+        ),
     }
 }
 
-fn spawn_rollup_task(config: Arc<config::Config>, state: AppState) {
-    if !config.metrics.enabled || config.metrics.rollup_interval_secs == 0 {
+/// Rollup interval and `metrics.enabled` are read once at startup; each tick reports
+/// on the current runtime.
+fn spawn_rollup_task(runtime: LiveRuntime) {
+    let metrics_config = current_runtime(&runtime).config.metrics.clone();
+    if !metrics_config.enabled || metrics_config.rollup_interval_secs == 0 {
         return;
     }
 
-    let interval_secs = config.metrics.rollup_interval_secs;
+    let interval_secs = metrics_config.rollup_interval_secs;
     tokio::spawn(async move {
         let mut ticker = tokio::time::interval(Duration::from_secs(interval_secs));
         loop {
             ticker.tick().await;
-            let lines = build_rollup_lines(&state);
+            let lines = build_rollup_lines(&current_runtime(&runtime).state.metrics);
             for line in lines {
                 log::info!("rollup={}", line);
             }
@@ -216,29 +658,27 @@ fn spawn_rollup_task(config: Arc<config::Config>, state: AppState) {
     });
 }
 
-fn build_rollup_lines(state: &AppState) -> Vec<String> {
-    let s = state.inner.read().expect("state lock poisoned");
-    let mut per_route: HashMap<String, (u64, u64, f64, f64)> = HashMap::new();
-    for ((route, _zone), m) in &s.metrics.route_zone {
-        let entry = per_route
-            .entry(route.clone())
-            .or_insert((0, 0, 0.0, 0.0));
-        entry.0 += m.requests_total;
-        entry.1 += m.errors_total;
-        entry.2 += m.co2e_estimated_total_g;
-        entry.3 += m.latency_sum_ms;
+fn build_rollup_lines(matrix: &metrics::MetricsMatrix) -> Vec<String> {
+    let mut per_route: HashMap<usize, (u64, u64, f64, f64)> = HashMap::new();
+    for (route_idx, _zone_idx, m) in matrix.active_route_zones() {
+        let entry = per_route.entry(route_idx).or_insert((0, 0, 0.0, 0.0));
+        entry.0 += m.requests_total.load(Ordering::Relaxed);
+        entry.1 += m.errors_total.load(Ordering::Relaxed);
+        entry.2 += m.co2e_estimated_total_g.load();
+        entry.3 += m.latency_sum_ms.load();
     }
 
     per_route
         .into_iter()
-        .map(|(route, (reqs, errs, co2e, latency_sum))| {
+        .map(|(route_idx, (reqs, errs, co2e, latency_sum))| {
             let avg_latency = if reqs > 0 { latency_sum / reqs as f64 } else { 0.0 };
             json!({
-                "route": route,
+                "route": matrix.routes[route_idx],
                 "requests_total": reqs,
                 "errors_total": errs,
                 "co2e_estimated_total_g": co2e,
-                "avg_latency_ms": avg_latency
+                "avg_latency_ms": avg_latency,
+                "p95_latency_ms": matrix.route_latency_quantile(route_idx, 0.95)
             })
             .to_string()
         })
@@ -256,36 +696,28 @@ fn simple_response(status: StatusCode, body: impl Into<Body>) -> Result<Response
 async fn handle_request(
     mut req: Request<Body>,
     config: Arc<config::Config>,
-    state: AppState,
     static_state: StaticState,
 ) -> Result<Response<Body>, Infallible> {
     let path = req.uri().path().to_string();
     let method = req.method().clone();
 
     if config.metrics.enabled && path == config.metrics.path {
-        return render_metrics(state);
+        return render_metrics(&static_state, req.headers());
+    }
+    if let Some(id) = path
+        .strip_prefix(config.deferral.poll_path.as_str())
+        .and_then(|rest| rest.strip_prefix('/'))
+    {
+        return poll_deferred(&static_state, id);
     }
 
-    let matched_proxy = config.proxies.iter().find(|p| match p.rule.r#type.as_str() {
-        "exact" => path == p.rule.path,
-        _ => path.starts_with(&p.rule.path),
-    });
-
-    let proxy_config = match matched_proxy {
-        Some(p) => p,
+    let proxy_idx = match static_state.route_table.lookup(&path) {
+        Some(idx) => idx,
         None => return simple_response(StatusCode::NOT_FOUND, "Not Found: No matching proxy rule."),
     };
+    let proxy_config = &config.proxies[proxy_idx];
 
-    let headers_map = collect_headers(&req);
-    let body_bytes = match hyper::body::to_bytes(req.body_mut()).await {
-        Ok(bytes) => bytes,
-        Err(e) => {
-            eprintln!("Failed to read request body: {}", e);
-            return simple_response(StatusCode::INTERNAL_SERVER_ERROR, "Error reading request body.");
-        }
-    };
-    let body_str = String::from_utf8_lossy(&body_bytes).to_string();
-
+    let headers_map = Arc::new(collect_headers(&req));
     let classified = rilot_core::classify_route(
         &rilot_core::RoutePolicy {
             route_class: proxy_config.policy.route_class.clone(),
@@ -296,172 +728,411 @@ async fn handle_request(
         },
         &headers_map,
     );
-    let decision = choose_zone(
+
+    // Shed requests are counted per class (`class_shed_total{reason="scheduler-lag"}`).
+    if !static_state
+        .limits
+        .admits_class(concurrency::class_index(&classified.route_class))
+    {
+        return simple_response(
+            StatusCode::SERVICE_UNAVAILABLE,
+            "Overloaded: this route class is being shed.",
+        );
+    }
+
+    // Only a Wasm plugin needs the whole body in memory; everything else is streamed.
+    let plugin_needs_body = classified.plugin_enabled
+        && classified.route_class != "strict-local"
+        && proxy_config.override_file.is_some();
+    let request_bytes = Arc::new(AtomicU64::new(0));
+    let incoming_body = std::mem::replace(req.body_mut(), Body::empty());
+    let (forward_body, buffered_body) = if plugin_needs_body {
+        match read_body_capped(incoming_body, proxy_config.policy.plugin_max_body_bytes).await {
+            Ok(bytes) => {
+                request_bytes.store(bytes.len() as u64, Ordering::Relaxed);
+                (Body::from(bytes.clone()), Some(bytes))
+            }
+            Err(BodyReadError::TooLarge) => {
+                return simple_response(
+                    StatusCode::PAYLOAD_TOO_LARGE,
+                    "Request body exceeds plugin_max_body_bytes.",
+                );
+            }
+            Err(BodyReadError::Read(e)) => {
+                eprintln!("Failed to read request body: {}", e);
+                return simple_response(StatusCode::INTERNAL_SERVER_ERROR, "Error reading request body.");
+            }
+        }
+    } else if incoming_body.is_end_stream() {
+        // Nothing to stream; an empty body can be replayed by retries and hedges.
+        (Body::empty(), Some(Bytes::new()))
+    } else {
+        (counted_body(incoming_body, request_bytes.clone()), None)
+    };
+
+    let decision = decide_zone(
+        proxy_idx,
         proxy_config,
         &classified,
         &headers_map,
-        &config.carbon,
-        &state,
         &static_state,
     );
-    let mut target_uri_str = decision
+    let deferred_zone = decision
+        .as_ref()
+        .filter(|d| {
+            d.selected.filtered_out_reason.as_deref() == Some("deferred-for-greener-window")
+                && classified.time_shift_enabled
+                && proxy_config.policy.max_defer_seconds > 0
+        })
+        .map(|d| d.selected.zone.clone());
+    let prepared = PreparedRequest {
+        req,
+        proxy_idx,
+        path,
+        method,
+        headers_map,
+        classified,
+        decision,
+        forward_body,
+        buffered_body,
+        request_bytes,
+    };
+    match deferred_zone {
+        Some(zone) => defer_request(prepared, zone, config, static_state).await,
+        None => forward_request(prepared, config, static_state).await,
+    }
+}
+
+/// A routed request with its zone decision, ready to forward. Deferred requests are
+/// held in this form until their release.
+struct PreparedRequest {
+    req: Request<Body>,
+    proxy_idx: usize,
+    path: String,
+    method: Method,
+    headers_map: Arc<HashMap<String, String>>,
+    classified: rilot_core::RoutePolicy,
+    decision: Option<Arc<ZoneDecision>>,
+    forward_body: Body,
+    /// The whole body when it is already in memory (plugin routes, empty bodies,
+    /// accepted deferrals); only these requests can be retried or hedged.
+    buffered_body: Option<Bytes>,
+    request_bytes: Arc<AtomicU64>,
+}
+
+/// Parks a time-shifted request in the deferral queue. In `hold` mode the client
+/// waits for the release; in `accept` mode it gets `202 Accepted` and the request is
+/// forwarded in the background, its response kept for polling (and posted to
+/// `x-rilot-callback-url` when callbacks are allowed). A full queue forwards now.
+async fn defer_request(
+    mut prepared: PreparedRequest,
+    zone: Arc<ZoneCandidate>,
+    config: Arc<config::Config>,
+    static_state: StaticState,
+) -> Result<Response<Body>, Infallible> {
+    let policy = &config.proxies[prepared.proxy_idx].policy;
+    let accept = policy.defer_mode == "accept";
+    if accept {
+        let body = std::mem::replace(&mut prepared.forward_body, Body::empty());
+        match read_body_capped(body, config.deferral.max_body_bytes).await {
+            Ok(bytes) => {
+                prepared.forward_body = Body::from(bytes.clone());
+                prepared.buffered_body = Some(bytes);
+            }
+            Err(BodyReadError::TooLarge) => {
+                return simple_response(
+                    StatusCode::PAYLOAD_TOO_LARGE,
+                    "Request body exceeds deferral.max_body_bytes.",
+                );
+            }
+            Err(BodyReadError::Read(e)) => {
+                eprintln!("Failed to read request body: {}", e);
+                return simple_response(
+                    StatusCode::INTERNAL_SERVER_ERROR,
+                    "Error reading request body.",
+                );
+            }
+        }
+    }
+    let released = static_state.deferrals.enqueue(
+        &zone.name,
+        static_state.carbon.get(zone.id).current,
+        policy.forecast_min_improvement_ratio,
+        Duration::from_secs(policy.max_defer_seconds),
+    );
+    let Some(released) = released else {
+        return forward_request(prepared, config, static_state).await;
+    };
+    if !accept {
+        let _ = released.await;
+        return forward_request(prepared, config, static_state).await;
+    }
+
+    let callback = header_or_none(&prepared.headers_map, "x-rilot-callback-url")
+        .filter(|_| config.deferral.allow_callbacks)
+        .and_then(|url| Uri::try_from(url).ok());
+    let id = static_state.deferrals.open_result();
+    let status_url = format!("{}/{}", config.deferral.poll_path.trim_end_matches('/'), id);
+    tokio::spawn(async move {
+        let _ = released.await;
+        let max_result_bytes = config.deferral.max_result_bytes;
+        let deferrals = static_state.deferrals.clone();
+        let upstreams = static_state.upstreams.clone();
+        let response = match forward_request(prepared, config, static_state).await {
+            Ok(response) => response,
+            Err(never) => match never {},
+        };
+        let (parts, body) = response.into_parts();
+        let body = match read_body_capped(body, max_result_bytes).await {
+            Ok(bytes) => bytes,
+            Err(BodyReadError::TooLarge) => {
+                log::warn!("deferral_result_truncated id={} reason=body-too-large", id);
+                Bytes::new()
+            }
+            Err(BodyReadError::Read(e)) => {
+                log::warn!("deferral_result_truncated id={} error={}", id, e);
+                Bytes::new()
+            }
+        };
+        let content_type = parts
+            .headers
+            .get(hyper::header::CONTENT_TYPE)
+            .and_then(|v| v.to_str().ok())
+            .map(str::to_string);
+        if let Some(callback) = callback {
+            let mut request = Request::builder()
+                .method(Method::POST)
+                .uri(callback)
+                .header("x-rilot-deferred-id", id.to_string())
+                .header("x-rilot-upstream-status", parts.status.as_u16().to_string());
+            if let Some(content_type) = &content_type {
+                request = request.header(hyper::header::CONTENT_TYPE, content_type.as_str());
+            }
+            let delivered = match request.body(Body::from(body.clone())) {
+                Ok(request) => match upstreams.shared().request(request).await {
+                    Ok(res) if res.status().is_success() => Ok(()),
+                    Ok(res) => Err(format!("status {}", res.status())),
+                    Err(e) => Err(e.to_string()),
+                },
+                Err(e) => Err(e.to_string()),
+            };
+            if let Err(e) = delivered {
+                deferrals
+                    .stats
+                    .callbacks_failed_total
+                    .fetch_add(1, Ordering::Relaxed);
+                log::warn!("deferral_callback_failed id={} error={}", id, e);
+            }
+        }
+        deferrals.complete_result(
+            id,
+            deferral::DeferredResult::Done {
+                status: parts.status.as_u16(),
+                content_type,
+                body,
+            },
+        );
+    });
+
+    Ok(Response::builder()
+        .status(StatusCode::ACCEPTED)
+        .header("Content-Type", "application/json")
+        .header("Location", status_url.as_str())
+        .body(Body::from(
+            json!({ "id": id.to_string(), "status_url": status_url }).to_string(),
+        ))
+        .unwrap())
+}
+
+/// `GET <deferral.poll_path>/<id>`: `202` while the deferred request is waiting, then
+/// the upstream response.
+fn poll_deferred(static_state: &StaticState, id: &str) -> Result<Response<Body>, Infallible> {
+    let result = id
+        .parse::<u64>()
+        .ok()
+        .and_then(|id| static_state.deferrals.result(id));
+    match result {
+        None => simple_response(StatusCode::NOT_FOUND, "Unknown deferred request."),
+        Some(deferral::DeferredResult::Pending) => Ok(Response::builder()
+            .status(StatusCode::ACCEPTED)
+            .header("Content-Type", "application/json")
+            .body(Body::from(
+                json!({ "id": id, "status": "pending" }).to_string(),
+            ))
+            .unwrap()),
+        Some(deferral::DeferredResult::Done {
+            status,
+            content_type,
+            body,
+        }) => {
+            let mut response = Response::builder()
+                .status(StatusCode::from_u16(status).unwrap_or(StatusCode::BAD_GATEWAY));
+            if let Some(content_type) = content_type {
+                response = response.header("Content-Type", content_type);
+            }
+            Ok(response.body(Body::from(body)).unwrap())
+        }
+    }
+}
+
+async fn forward_request(
+    prepared: PreparedRequest,
+    config: Arc<config::Config>,
+    static_state: StaticState,
+) -> Result<Response<Body>, Infallible> {
+    let PreparedRequest {
+        mut req,
+        proxy_idx,
+        path,
+        method,
+        headers_map,
+        classified,
+        decision,
+        forward_body,
+        buffered_body,
+        request_bytes,
+    } = prepared;
+    let proxy_config = &config.proxies[proxy_idx];
+    let selected_zone = decision.as_ref().map(|d| d.selected.zone.clone());
+    let mut target_uri_str = selected_zone
         .as_ref()
-        .map(|d| d.zone.app_uri.clone())
+        .map(|z| z.app_uri.clone())
         .unwrap_or_else(|| proxy_config.app_uri.clone());
+    let mut plugin_target_override = false;
     let mut plugin_energy_joules_override: Option<f64> = None;
     let mut plugin_carbon_intensity_override: Option<f64> = None;
     let mut plugin_energy_source: Option<String> = None;
-    let selected_zone_name = decision
+    let selected_zone_name = selected_zone
+        .as_ref()
+        .map_or(metrics::DEFAULT_ZONE, |z| z.name.as_str());
+    let selected_zone_idx = selected_zone
         .as_ref()
-        .map(|d| d.zone.name.clone())
-        .unwrap_or_else(|| "default".to_string());
+        .map(|z| z.id)
+        .unwrap_or_else(|| static_state.metrics.default_zone_idx());
     let expose_research_headers = *EXPOSE_RESEARCH_HEADERS;
-    let (
-        carbon_cache_ttl_left_secs,
-        selected_carbon,
-        zone_carbon_snapshot,
-        eligible_zone_carbon_snapshot,
-        zone_filter_reasons,
-        selected_carbon_saved,
-        selected_carbon_saved_percent,
-        selected_reason,
-    ) =
-        if expose_research_headers {
-            let ttl_left = if config.carbon.provider == "electricitymap-local"
-                && config.carbon.electricitymap_local_live_reload
-            {
-                Some(0)
+    // Snapshot strings are only formatted when they will actually be emitted.
+    let research_headers = if expose_research_headers {
+        let ttl_left = selected_zone
+            .as_ref()
+            .map(|z| static_state.carbon.ttl_left_secs(z.id));
+        let reason = decision
+            .as_ref()
+            .and_then(|d| d.selected.filtered_out_reason.as_deref())
+            .unwrap_or(if classified.carbon_cursor_enabled {
+                "score-win"
             } else {
-                cache_ttl_left_secs(&state, &selected_zone_name)
-            };
-            let carbon = decision.as_ref().and_then(|d| d.carbon_g_per_kwh);
-            let zone_carbon_snapshot = decision
-                .as_ref()
-                .map(|d| d.zone_carbon_intensity_g_per_kwh.clone())
-                .unwrap_or_default();
-            let eligible_zone_carbon_snapshot = decision
+                "fallback-lowest-latency"
+            })
+            .to_string();
+        Some(ResearchHeaders {
+            carbon_cache_ttl_left_secs: ttl_left,
+            selected_carbon: decision.as_ref().and_then(|d| d.selected.carbon_g_per_kwh),
+            zone_carbon_snapshot: decision
                 .as_ref()
-                .map(|d| d.eligible_zone_carbon_intensity_g_per_kwh.clone())
-                .unwrap_or_default();
-            let zone_filter_reasons = decision
+                .map(|d| d.zone_carbon_snapshot(false))
+                .unwrap_or_default(),
+            eligible_zone_carbon_snapshot: decision
                 .as_ref()
-                .map(|d| d.zone_filter_reasons.clone())
-                .unwrap_or_default();
-            let carbon_saved = decision
+                .map(|d| d.zone_carbon_snapshot(true))
+                .unwrap_or_default(),
+            zone_filter_reasons: decision
                 .as_ref()
-                .map(|d| d.carbon_saved_vs_worst_g_per_kwh)
-                .unwrap_or(0.0);
-            let carbon_saved_percent = decision
+                .map(|d| d.zone_filter_reasons())
+                .unwrap_or_default(),
+            carbon_saved: decision
                 .as_ref()
-                .map(|d| d.carbon_saved_vs_worst_percent)
-                .unwrap_or(0.0);
-            let reason = decision
+                .map(|d| d.selected.carbon_saved_vs_worst_g_per_kwh)
+                .unwrap_or(0.0),
+            carbon_saved_percent: decision
                 .as_ref()
-                .and_then(|d| d.filtered_out_reason.clone())
-                .unwrap_or_else(|| {
-                    if classified.carbon_cursor_enabled {
-                        "score-win".to_string()
-                    } else {
-                        "fallback-lowest-latency".to_string()
-                    }
-                });
-            (
-                ttl_left,
-                carbon,
-                zone_carbon_snapshot,
-                eligible_zone_carbon_snapshot,
-                zone_filter_reasons,
-                carbon_saved,
-                carbon_saved_percent,
-                reason,
-            )
-        } else {
-            (
-                None,
-                None,
-                String::new(),
-                String::new(),
-                String::new(),
-                0.0,
-                0.0,
-                String::new(),
-            )
-        };
-
-    if let Some(d) = &decision {
-        if d.filtered_out_reason.as_deref() == Some("deferred-for-greener-window")
-            && classified.time_shift_enabled
-            && proxy_config.policy.max_defer_seconds > 0
-        {
-            tokio::time::sleep(Duration::from_secs(proxy_config.policy.max_defer_seconds)).await;
-        }
-    }
+                .map(|d| d.selected.carbon_saved_vs_worst_percent)
+                .unwrap_or(0.0),
+            reason,
+        })
+    } else {
+        None
+    };
 
     if classified.plugin_enabled && classified.route_class != "strict-local" {
         if let Some(wasm_file) = &proxy_config.override_file {
-            let wasm_input = WasmInput {
-                method: method.to_string(),
-                path: path.clone(),
-                headers: headers_map.clone(),
-                body: body_str,
-            };
-            let input_json = match serde_json::to_string(&wasm_input) {
-                Ok(json) => json,
-                Err(e) => {
-                    eprintln!("Failed to serialize input for Wasm: {}", e);
-                    return simple_response(StatusCode::INTERNAL_SERVER_ERROR, "Error preparing Wasm input.");
-                }
+            let result_cache = static_state.plugin_caches[proxy_idx].as_ref();
+            let cache_key = result_cache.map(|c| c.key(method.as_str(), &path, &headers_map));
+            let cached = match (result_cache, &cache_key) {
+                (Some(cache), Some(key)) => cache.get(key),
+                _ => None,
             };
+            let plugin_output = match cached {
+                Some(out) => Some(out),
+                None => {
+                    let plugin_request = wasm_engine::PluginRequest {
+                        method: method.to_string(),
+                        path: path.clone(),
+                        headers: headers_map.clone(),
+                        body: buffered_body.clone().unwrap_or_default(),
+                    };
 
-            let wasm_result = tokio::time::timeout(
-                Duration::from_millis(proxy_config.policy.plugin_timeout_ms),
-                wasm_engine::run_modify_request(wasm_file, &input_json),
-            )
-            .await;
-
-            match wasm_result {
-                Ok(Ok(out)) => {
-                    if let Some(new_target) = out.app_url {
-                        target_uri_str = new_target;
-                    }
-                    if let Some(v) = out.energy_joules_override {
-                        if v.is_finite() && v >= 0.0 {
-                            plugin_energy_joules_override = Some(v);
+                    let wasm_result = tokio::time::timeout(
+                        Duration::from_millis(proxy_config.policy.plugin_timeout_ms),
+                        wasm_engine::run_modify_request(wasm_file, plugin_request),
+                    )
+                    .await;
+
+                    match wasm_result {
+                        Ok(Ok(out)) => {
+                            let out = Arc::new(out);
+                            if let (Some(cache), Some(key)) = (result_cache, cache_key) {
+                                cache.insert(key, out.clone());
+                            }
+                            Some(out)
                         }
-                    }
-                    if let Some(v) = out.carbon_intensity_g_per_kwh_override {
-                        if v.is_finite() && v >= 0.0 {
-                            plugin_carbon_intensity_override = Some(v);
+                        Ok(Err(e)) => {
+                            eprintln!("Wasm execution failed: {}", e);
+                            None
                         }
-                    }
-                    if let Some(source) = out.energy_source {
-                        if !source.trim().is_empty() {
-                            plugin_energy_source = Some(source);
+                        Err(_) => {
+                            eprintln!(
+                                "Wasm plugin timed out for route {} after {}ms (component: {})",
+                                proxy_config.rule.path,
+                                proxy_config.policy.plugin_timeout_ms,
+                                wasm_file
+                            );
+                            None
                         }
                     }
-                    for (k, v) in out.headers_to_update {
-                        if let (Ok(name), Ok(value)) =
-                            (HeaderName::from_bytes(k.as_bytes()), HeaderValue::from_str(&v))
-                        {
-                            req.headers_mut().insert(name, value);
-                        }
+                }
+            };
+
+            if let Some(out) = plugin_output {
+                if let Some(new_target) = &out.app_url {
+                    target_uri_str = new_target.clone();
+                    plugin_target_override = true;
+                }
+                if let Some(v) = out.energy_joules_override {
+                    if v.is_finite() && v >= 0.0 {
+                        plugin_energy_joules_override = Some(v);
                     }
-                    for k in out.headers_to_remove {
-                        if let Ok(name) = HeaderName::from_bytes(k.as_bytes()) {
-                            req.headers_mut().remove(name);
-                        }
+                }
+                if let Some(v) = out.carbon_intensity_g_per_kwh_override {
+                    if v.is_finite() && v >= 0.0 {
+                        plugin_carbon_intensity_override = Some(v);
                     }
                 }
-                Ok(Err(e)) => {
-                    eprintln!("Wasm execution failed: {}", e);
+                if let Some(source) = &out.energy_source {
+                    if !source.trim().is_empty() {
+                        plugin_energy_source = Some(source.clone());
+                    }
                 }
-                Err(_) => {
-                    eprintln!(
-                        "Wasm plugin timed out for route {} after {}ms (component: {})",
-                        proxy_config.rule.path,
-                        proxy_config.policy.plugin_timeout_ms,
-                        wasm_file
-                    );
+                for (k, v) in &out.headers_to_update {
+                    if let (Ok(name), Ok(value)) =
+                        (HeaderName::from_bytes(k.as_bytes()), HeaderValue::from_str(v))
+                    {
+                        req.headers_mut().insert(name, value);
+                    }
+                }
+                for k in &out.headers_to_remove {
+                    if let Ok(name) = HeaderName::from_bytes(k.as_bytes()) {
+                        req.headers_mut().remove(name);
+                    }
                 }
             }
         }
@@ -483,13 +1154,21 @@ async fn handle_request(
             return simple_response(StatusCode::INTERNAL_SERVER_ERROR, "Error constructing target URL.");
         }
     };
+    // Only a body already in memory can be sent a second time.
+    let replay = buffered_body.map(|body| Replay {
+        method: req.method().clone(),
+        version: req.version(),
+        path_and_query: final_path_and_query.to_string(),
+        headers: req.headers().clone(),
+        body,
+    });
 
     *req.uri_mut() = final_uri;
-    *req.body_mut() = Body::from(body_bytes.clone());
+    *req.body_mut() = forward_body;
     if *EMULATE_CROSS_REGION_RTT {
         let user_region = header_or_none(&headers_map, "x-user-region").unwrap_or_default();
-        if let Some(d) = &decision {
-            if !user_region.is_empty() && user_region != d.zone.region {
+        if let Some(zone) = &selected_zone {
+            if !user_region.is_empty() && user_region != zone.region {
                 let penalty_ms = proxy_config
                     .policy
                     .constraints
@@ -502,126 +1181,556 @@ async fn handle_request(
             }
         }
     }
-    increment_in_flight(&state, &selected_zone_name, 1);
+    let pool = if plugin_target_override {
+        static_state.upstreams.shared()
+    } else {
+        static_state.upstreams.for_zone(selected_zone_name)
+    };
+    // Retries and hedges move to runner-up zones only when routing picked the target;
+    // a plugin override is retried as is.
+    let zone_routed = selected_zone.is_some() && !plugin_target_override;
+    let fallbacks = match (&decision, zone_routed) {
+        (Some(d), true) => d.runners_up(),
+        _ => Vec::new(),
+    };
+    let hedge_after = proxy_config
+        .policy
+        .hedging
+        .as_ref()
+        .filter(|_| {
+            zone_routed
+                && !fallbacks.is_empty()
+                && hedgeable(
+                    &method,
+                    replay.is_some(),
+                    &classified.route_class,
+                    &proxy_config.policy.priority_mode,
+                )
+        })
+        .map(|hedging| {
+            hedge_delay(
+                hedging,
+                observed_p95_latency_ms(&static_state.metrics, selected_zone_idx),
+            )
+        });
+    let class = concurrency::class_index(&classified.route_class);
+    let upstream = UpstreamSend {
+        static_state: &static_state,
+        route_idx: proxy_idx,
+        class,
+        primary: Target {
+            pool,
+            zone_idx: selected_zone_idx,
+            app_uri: target_uri_str,
+            breaker: zone_routed,
+        },
+        replay,
+        fallbacks,
+        next_fallback: AtomicUsize::new(0),
+        timeout_ms: config.upstream.request_timeout_ms.filter(|ms| *ms > 0),
+    };
+    // Routing only peeked at the breakers; the request takes its half-open trial slot
+    // here. Where routing ignored the breakers, it goes out without one.
+    let circuit = match zone_routed.then(|| static_state.health.admit(selected_zone_idx)) {
+        None => None,
+        Some(Some(call)) => Some(call),
+        Some(None) if decision.as_ref().map_or(false, |d| d.breakers_ignored) => {
+            Some(static_state.health.call(selected_zone_idx))
+        }
+        Some(None) => {
+            return simple_response(
+                StatusCode::SERVICE_UNAVAILABLE,
+                "Upstream zone is recovering and its trial requests are taken.",
+            );
+        }
+    };
+    // Shed requests are counted per zone and class (`zone_concurrency_shed_total`,
+    // `class_shed_total`).
+    let Some(slot) = InFlight::start(&static_state, selected_zone_idx, class).await else {
+        return simple_response(
+            StatusCode::SERVICE_UNAVAILABLE,
+            "Upstream zone is at its concurrency limit.",
+        );
+    };
     let start = Instant::now();
-    let client = Client::new();
-    let forward_result = client.request(req).await;
+    let (forward_result, served_zone_idx) = upstream
+        .send(
+            req,
+            slot,
+            circuit,
+            proxy_config.policy.connect_retries,
+            hedge_after,
+        )
+        .await;
     let elapsed_ms = start.elapsed().as_secs_f64() * 1000.0;
-
-    let (response, status, is_error) = match forward_result {
-        Ok(mut res) => {
-            if expose_research_headers {
-                if let Some(ttl_left) = carbon_cache_ttl_left_secs {
-                    if let Ok(value) = HeaderValue::from_str(&ttl_left.to_string()) {
-                        res.headers_mut().insert(CACHE_TTL_LEFT_HEADER.clone(), value);
-                    }
-                }
-                if let Ok(value) = HeaderValue::from_str(&selected_zone_name) {
-                    res.headers_mut().insert(SELECTED_ZONE_HEADER.clone(), value);
-                }
-                if let Some(v) = selected_carbon {
-                    if let Ok(value) = HeaderValue::from_str(&format!("{:.3}", v)) {
-                        res.headers_mut().insert(SELECTED_CARBON_HEADER.clone(), value);
-                    }
-                }
-                if !zone_carbon_snapshot.is_empty() {
-                    if let Ok(value) = HeaderValue::from_str(&zone_carbon_snapshot) {
-                        res.headers_mut()
-                            .insert(ZONE_CARBON_SNAPSHOT_HEADER.clone(), value);
-                    }
-                }
-                if !eligible_zone_carbon_snapshot.is_empty() {
-                    if let Ok(value) = HeaderValue::from_str(&eligible_zone_carbon_snapshot) {
-                        res.headers_mut()
-                            .insert(ELIGIBLE_ZONE_CARBON_SNAPSHOT_HEADER.clone(), value);
-                    }
-                }
-                if !zone_filter_reasons.is_empty() {
-                    if let Ok(value) = HeaderValue::from_str(&zone_filter_reasons) {
-                        res.headers_mut()
-                            .insert(ZONE_FILTER_REASONS_HEADER.clone(), value);
-                    }
-                }
-                if let Ok(value) = HeaderValue::from_str(&selected_reason) {
-                    res.headers_mut().insert(DECISION_REASON_HEADER.clone(), value);
-                }
-                if let Ok(value) =
-                    HeaderValue::from_str(&format!("{:.3}", selected_carbon_saved.max(0.0)))
-                {
-                    res.headers_mut().insert(CARBON_SAVED_HEADER.clone(), value);
-                }
-                if let Ok(value) = HeaderValue::from_str(&format!(
-                    "{:.2}",
-                    selected_carbon_saved_percent.max(0.0)
-                )) {
-                    res.headers_mut()
-                        .insert(CARBON_SAVED_PERCENT_HEADER.clone(), value);
-                }
+    let served_zone_name = static_state.metrics.zones[served_zone_idx].as_str();
+    // A retry or hedge answered from another zone is charged that zone's carbon.
+    let served_carbon = decision
+        .as_ref()
+        .filter(|_| served_zone_idx != selected_zone_idx)
+        .and_then(|d| d.scores.iter().find(|s| s.zone.id == served_zone_idx))
+        .and_then(|s| s.carbon_g_per_kwh);
+
+    let mut accounting = RequestAccounting {
+        config: config.clone(),
+        matrix: static_state.metrics.clone(),
+        decisions: static_state.decisions.clone(),
+        decision_log: static_state.decision_log.clone(),
+        proxy_idx,
+        classified,
+        decision,
+        zone_idx: served_zone_idx,
+        method: method.to_string(),
+        status: StatusCode::BAD_GATEWAY,
+        elapsed_ms,
+        is_error: true,
+        request_bytes,
+        energy_joules_override: plugin_energy_joules_override,
+        carbon_intensity_override: plugin_carbon_intensity_override.or(served_carbon),
+        energy_source: plugin_energy_source,
+    };
+    match forward_result {
+        Ok(Ok(mut res)) => {
+            if let Some(research) = &research_headers {
+                research.apply(res.headers_mut(), served_zone_name);
             }
-            let status = res.status();
-            let is_error = status.is_server_error();
-            (Ok(res), status, is_error)
+            accounting.status = res.status();
+            accounting.is_error = accounting.status.is_server_error();
+            // Metrics and decision logs are written once the response body has been
+            // streamed to the client, so energy accounting sees the real byte count.
+            let (parts, body) = res.into_parts();
+            Ok(Response::from_parts(parts, account_response_body(body, accounting)))
         }
-        Err(e) => {
+        Ok(Err(e)) => {
             eprintln!("Error forwarding request: {}", e);
-            (
-                simple_response(StatusCode::BAD_GATEWAY, "Error connecting to upstream service."),
-                StatusCode::BAD_GATEWAY,
-                true,
-            )
+            accounting.finish(0);
+            simple_response(StatusCode::BAD_GATEWAY, "Error connecting to upstream service.")
         }
-    };
-    increment_in_flight(&state, &selected_zone_name, -1);
-
-    let bytes_count = body_bytes.len() as f64;
-    let estimated_energy_j = plugin_energy_joules_override
-        .unwrap_or_else(|| estimate_energy_joules(elapsed_ms, bytes_count));
-    let carbon_g_per_kwh = plugin_carbon_intensity_override
-        .or_else(|| decision.as_ref().and_then(|d| d.carbon_g_per_kwh))
-        .unwrap_or(0.0);
-    let is_carbon_safe = carbon_g_per_kwh > 0.0
-        && carbon_g_per_kwh <= config.carbon.carbon_safe_threshold_g_per_kwh;
-    let co2e_g = estimate_co2e_g(estimated_energy_j, carbon_g_per_kwh);
-    record_metrics(
-        &state,
-        &proxy_config.rule.path,
-        &selected_zone_name,
-        elapsed_ms,
-        carbon_g_per_kwh,
-        is_carbon_safe,
-        estimated_energy_j,
-        co2e_g,
-        is_error,
-    );
+        Err(_) => {
+            eprintln!(
+                "Upstream request to zone {} timed out after {:.0}ms",
+                served_zone_name, elapsed_ms
+            );
+            accounting.status = StatusCode::GATEWAY_TIMEOUT;
+            accounting.finish(0);
+            simple_response(StatusCode::GATEWAY_TIMEOUT, "Upstream service timed out.")
+        }
+    }
+}
 
-    log_decision(
-        &state,
-        &config.metrics,
-        proxy_config,
-        &classified,
-        &decision,
-        method.as_str(),
-        status,
-        elapsed_ms,
-        co2e_g,
-        is_error,
-        plugin_energy_source.as_deref(),
-    );
+/// Outcome of one upstream attempt: the outer error is `request_timeout_ms` expiring.
+type UpstreamResult = Result<Result<Response<Body>, hyper::Error>, tokio::time::error::Elapsed>;
+
+/// The parts of a forwarded request needed to send it again, to any zone.
+struct Replay {
+    method: Method,
+    version: hyper::Version,
+    path_and_query: String,
+    headers: HeaderMap,
+    body: Bytes,
+}
+
+impl Replay {
+    fn request(&self, app_uri: &str) -> Option<Request<Body>> {
+        let uri = format!("{}{}", app_uri.trim_end_matches('/'), self.path_and_query);
+        let mut req = Request::builder()
+            .method(self.method.clone())
+            .version(self.version)
+            .uri(Uri::try_from(uri).ok()?)
+            .body(Body::from(self.body.clone()))
+            .ok()?;
+        *req.headers_mut() = self.headers.clone();
+        Some(req)
+    }
+}
+
+/// Where an attempt goes. `breaker` is set when the outcome counts for the zone's
+/// circuit breaker.
+#[derive(Clone)]
+struct Target<'a> {
+    pool: &'a upstream::ZonePool,
+    zone_idx: usize,
+    app_uri: String,
+    breaker: bool,
+}
+
+/// A runner-up attempt handed out by [`UpstreamSend::fallback`], with its breaker
+/// admission already taken.
+struct Fallback<'a> {
+    target: Target<'a>,
+    req: Request<Body>,
+    slot: InFlight<'a>,
+    circuit: health::Call<'a>,
+}
+
+/// One request's way upstream: the selected target first, then runner-up zones for
+/// connect retries and the hedge, each handed out once.
+struct UpstreamSend<'a> {
+    static_state: &'a StaticState,
+    route_idx: usize,
+    /// [`concurrency::class_index`] of the request's route class.
+    class: usize,
+    primary: Target<'a>,
+    replay: Option<Replay>,
+    fallbacks: Vec<Arc<ZoneCandidate>>,
+    next_fallback: AtomicUsize,
+    timeout_ms: Option<u64>,
+}
+
+impl<'a> UpstreamSend<'a> {
+    /// Sends `req` on the primary target's `slot`, retrying connect errors up to
+    /// `retries` times and, with `hedge_after`, racing a duplicate against it once
+    /// that long has passed without an answer. Returns the result used and the zone
+    /// index that produced it.
+    async fn send(
+        &self,
+        req: Request<Body>,
+        slot: InFlight<'a>,
+        circuit: Option<health::Call<'a>>,
+        retries: u32,
+        hedge_after: Option<Duration>,
+    ) -> (UpstreamResult, usize) {
+        let primary = self.send_with_retries(req, slot, circuit, retries);
+        let Some(delay) = hedge_after else {
+            return primary.await;
+        };
+        tokio::pin!(primary);
+        tokio::select! {
+            done = &mut primary => return done,
+            _ = tokio::time::sleep(delay) => {}
+        }
+        let Some(Fallback {
+            target,
+            req,
+            slot,
+            circuit,
+        }) = self.fallback()
+        else {
+            return primary.await;
+        };
+        let counters = self
+            .static_state
+            .metrics
+            .route_zone(self.route_idx, target.zone_idx);
+        counters.hedges_total.fetch_add(1, Ordering::Relaxed);
+        let hedge = self.attempt(&target, req, slot, Some(circuit));
+        tokio::pin!(hedge);
+        // The first answer wins; an error only counts once the other attempt failed too.
+        let hedge_result = tokio::select! {
+            done = &mut primary => match done {
+                (Ok(Ok(res)), zone_idx) => return (Ok(Ok(res)), zone_idx),
+                _ => hedge.await,
+            },
+            result = &mut hedge => match result {
+                Ok(Ok(res)) => Ok(Ok(res)),
+                _ => return primary.await,
+            },
+        };
+        if matches!(hedge_result, Ok(Ok(_))) {
+            counters.hedge_wins_total.fetch_add(1, Ordering::Relaxed);
+        }
+        (hedge_result, target.zone_idx)
+    }
 
-    response
+    async fn send_with_retries(
+        &self,
+        req: Request<Body>,
+        slot: InFlight<'a>,
+        circuit: Option<health::Call<'a>>,
+        retries: u32,
+    ) -> (UpstreamResult, usize) {
+        let mut result = self.attempt(&self.primary, req, slot, circuit).await;
+        let mut zone_idx = self.primary.zone_idx;
+        // Only idempotent requests with their body in memory are sent again.
+        let retries = match &self.replay {
+            Some(replay) if replay.method.is_idempotent() => retries,
+            _ => 0,
+        };
+        for _ in 0..retries {
+            // Only a failed connect is known not to have reached the upstream.
+            if !matches!(&result, Ok(Err(e)) if e.is_connect()) {
+                break;
+            }
+            let retry = match self.fallback() {
+                Some(fallback) => Some((
+                    fallback.target,
+                    fallback.req,
+                    fallback.slot,
+                    Some(fallback.circuit),
+                )),
+                None => self.replay.as_ref().and_then(|replay| {
+                    let circuit = if self.primary.breaker {
+                        Some(self.static_state.health.admit(self.primary.zone_idx)?)
+                    } else {
+                        None
+                    };
+                    let req = replay.request(&self.primary.app_uri)?;
+                    let slot =
+                        InFlight::try_start(self.static_state, self.primary.zone_idx, self.class)?;
+                    Some((self.primary.clone(), req, slot, circuit))
+                }),
+            };
+            let Some((target, req, slot, circuit)) = retry else {
+                break;
+            };
+            self.static_state
+                .metrics
+                .route_zone(self.route_idx, target.zone_idx)
+                .connect_retries_total
+                .fetch_add(1, Ordering::Relaxed);
+            result = self.attempt(&target, req, slot, circuit).await;
+            zone_idx = target.zone_idx;
+        }
+        (result, zone_idx)
+    }
+
+    /// The next runner-up zone whose breaker admits a request and that has a free
+    /// slot, with the request rebuilt for it. Extra attempts never queue.
+    fn fallback(&self) -> Option<Fallback<'a>> {
+        let replay = self.replay.as_ref()?;
+        loop {
+            let zone = self
+                .fallbacks
+                .get(self.next_fallback.fetch_add(1, Ordering::Relaxed))?;
+            let Some(circuit) = self.static_state.health.admit(zone.id) else {
+                continue;
+            };
+            let Some(slot) = InFlight::try_start(self.static_state, zone.id, self.class) else {
+                continue;
+            };
+            let req = replay.request(&zone.app_uri)?;
+            let target = Target {
+                pool: self.static_state.upstreams.for_zone(&zone.name),
+                zone_idx: zone.id,
+                app_uri: zone.app_uri.clone(),
+                breaker: true,
+            };
+            return Some(Fallback {
+                target,
+                req,
+                slot,
+                circuit,
+            });
+        }
+    }
+
+    /// One attempt on `target`, holding `slot` and the breaker's `circuit` call until
+    /// it finishes or is cancelled.
+    async fn attempt(
+        &self,
+        target: &Target<'_>,
+        req: Request<Body>,
+        _slot: InFlight<'_>,
+        circuit: Option<health::Call<'_>>,
+    ) -> UpstreamResult {
+        let start = Instant::now();
+        let request = target.pool.request(req);
+        let result = match self.timeout_ms {
+            Some(ms) => tokio::time::timeout(Duration::from_millis(ms), request).await,
+            None => Ok(request.await),
+        };
+        let success = matches!(&result, Ok(Ok(res)) if !res.status().is_server_error());
+        self.static_state.limits.record(
+            target.zone_idx,
+            start.elapsed().as_secs_f64() * 1000.0,
+            success,
+        );
+        if let Some(call) = circuit {
+            call.finish(success);
+        }
+        result
+    }
+}
+
+/// Whether a request may be hedged: a safe method with its body in memory, on a
+/// strict-local route or under latency-first.
+fn hedgeable(method: &Method, replayable: bool, route_class: &str, priority_mode: &str) -> bool {
+    replayable
+        && matches!(*method, Method::GET | Method::HEAD | Method::OPTIONS)
+        && (route_class == "strict-local" || priority_mode == "latency-first")
+}
+
+/// Delay before hedging: the selected zone's recent p95, clamped to the configured
+/// range, or `max_delay_ms` while the p95 is unknown.
+fn hedge_delay(hedging: &config::HedgingConfig, p95_ms: Option<f64>) -> Duration {
+    let delay_ms = p95_ms.map_or(hedging.max_delay_ms, |p95| {
+        (p95.ceil() as u64).clamp(hedging.min_delay_ms, hedging.max_delay_ms)
+    });
+    Duration::from_millis(delay_ms)
+}
+
+/// A zone's in-flight slot for one attempt, taken under its concurrency limit and
+/// given back on drop, so a cancelled hedge or a client that went away does not
+/// leak it.
+struct InFlight<'a> {
+    static_state: &'a StaticState,
+    zone_idx: usize,
+}
+
+impl<'a> InFlight<'a> {
+    /// Waits up to `concurrency.max_wait_ms` for a slot when the zone is at the
+    /// class's share of its limit; `None` when the request is shed.
+    async fn start(static_state: &'a StaticState, zone_idx: usize, class: usize) -> Option<Self> {
+        let in_flight = &static_state.metrics.zone(zone_idx).in_flight;
+        let (admitted, saturation_changed) = static_state
+            .limits
+            .acquire(zone_idx, class, in_flight)
+            .await;
+        if saturation_changed {
+            static_state.decisions.observe_saturation_change();
+        }
+        admitted.then_some(Self {
+            static_state,
+            zone_idx,
+        })
+    }
+
+    /// A slot only if one is free right now.
+    fn try_start(static_state: &'a StaticState, zone_idx: usize, class: usize) -> Option<Self> {
+        let in_flight = &static_state.metrics.zone(zone_idx).in_flight;
+        static_state
+            .limits
+            .try_acquire(zone_idx, class, in_flight)
+            .then_some(Self {
+                static_state,
+                zone_idx,
+            })
+    }
 }
 
-fn cache_ttl_left_secs(state: &AppState, zone: &str) -> Option<u64> {
-    let s = state.inner.read().expect("state lock poisoned");
-    let entry = s.carbon_cache.get(zone)?;
-    let now = Instant::now();
-    Some(
-        entry
-            .expires_at
-            .checked_duration_since(now)
-            .map(|d| d.as_secs())
-            .unwrap_or(0),
-    )
+impl Drop for InFlight<'_> {
+    fn drop(&mut self) {
+        let in_flight = &self.static_state.metrics.zone(self.zone_idx).in_flight;
+        let _ = in_flight.fetch_update(Ordering::Relaxed, Ordering::Relaxed, |v| {
+            Some(v.saturating_sub(1))
+        });
+        if self.static_state.limits.release(self.zone_idx, in_flight) {
+            self.static_state.decisions.observe_saturation_change();
+        }
+    }
+}
+
+/// Everything needed to record metrics and the decision log after the response
+/// body finished streaming (or the client went away).
+struct RequestAccounting {
+    config: Arc<config::Config>,
+    matrix: Arc<metrics::MetricsMatrix>,
+    decisions: Arc<decision_cache::DecisionCache<ZoneDecision>>,
+    decision_log: Arc<decision_log::DecisionLog>,
+    proxy_idx: usize,
+    classified: rilot_core::RoutePolicy,
+    decision: Option<Arc<ZoneDecision>>,
+    zone_idx: usize,
+    method: String,
+    status: StatusCode,
+    elapsed_ms: f64,
+    is_error: bool,
+    request_bytes: Arc<AtomicU64>,
+    energy_joules_override: Option<f64>,
+    carbon_intensity_override: Option<f64>,
+    energy_source: Option<String>,
+}
+
+impl RequestAccounting {
+    fn finish(self, response_bytes: u64) {
+        let bytes_count =
+            self.request_bytes.load(Ordering::Relaxed).saturating_add(response_bytes) as f64;
+        let estimated_energy_j = self
+            .energy_joules_override
+            .unwrap_or_else(|| estimate_energy_joules(self.elapsed_ms, bytes_count));
+        let carbon_g_per_kwh = self
+            .carbon_intensity_override
+            .or_else(|| self.decision.as_ref().and_then(|d| d.selected.carbon_g_per_kwh))
+            .unwrap_or(0.0);
+        let is_carbon_safe = carbon_g_per_kwh > 0.0
+            && carbon_g_per_kwh <= self.config.carbon.carbon_safe_threshold_g_per_kwh;
+        let co2e_g = estimate_co2e_g(estimated_energy_j, carbon_g_per_kwh);
+        self.matrix.record(
+            self.proxy_idx,
+            self.zone_idx,
+            &metrics::RequestSample {
+                latency_ms: self.elapsed_ms,
+                carbon_g_per_kwh,
+                is_carbon_safe,
+                energy_j: estimated_energy_j,
+                co2e_g,
+                is_error: self.is_error,
+            },
+        );
+        self.decisions.observe_error_rate(
+            self.zone_idx,
+            current_error_rate(&self.matrix, self.zone_idx),
+        );
+
+        if !self
+            .decision_log
+            .should_keep(self.is_error, self.elapsed_ms)
+        {
+            return;
+        }
+        let selected = self.decision.as_ref().map(|d| &d.selected);
+        self.decision_log.submit(decision_log::DecisionRecord {
+            route_idx: self.proxy_idx,
+            zone_idx: selected.map(|d| d.zone.id),
+            class: self.classified.route_class,
+            method: self.method,
+            status: self.status.as_u16(),
+            score: selected.map(|d| d.score),
+            reason: selected.and_then(|d| d.filtered_out_reason.clone()),
+            carbon_g_per_kwh: selected.and_then(|d| d.carbon_g_per_kwh),
+            latency_ms_estimate: selected.map(|d| d.latency_ms),
+            latency_ms_observed: self.elapsed_ms,
+            co2e_g,
+            is_error: self.is_error,
+            energy_source: self.energy_source,
+        });
+    }
+}
+
+struct ResponseBodyGuard {
+    bytes: u64,
+    accounting: Option<RequestAccounting>,
+}
+
+impl ResponseBodyGuard {
+    fn add(&mut self, n: usize) {
+        self.bytes = self.bytes.saturating_add(n as u64);
+    }
+}
+
+impl Drop for ResponseBodyGuard {
+    fn drop(&mut self) {
+        if let Some(accounting) = self.accounting.take() {
+            accounting.finish(self.bytes);
+        }
+    }
+}
+
+fn account_response_body(body: Body, accounting: RequestAccounting) -> Body {
+    let mut guard = ResponseBodyGuard {
+        bytes: 0,
+        accounting: Some(accounting),
+    };
+    Body::wrap_stream(body.inspect_ok(move |chunk| guard.add(chunk.len())))
+}
+
+fn counted_body(body: Body, counter: Arc<AtomicU64>) -> Body {
+    Body::wrap_stream(body.inspect_ok(move |chunk| {
+        counter.fetch_add(chunk.len() as u64, Ordering::Relaxed);
+    }))
+}
+
+async fn read_body_capped(mut body: Body, max_bytes: usize) -> Result<Bytes, BodyReadError> {
+    let hint = body.size_hint().lower().min(max_bytes as u64) as usize;
+    let mut buf = Vec::with_capacity(hint);
+    while let Some(chunk) = body.data().await {
+        let chunk = chunk.map_err(BodyReadError::Read)?;
+        if buf.len() + chunk.len() > max_bytes {
+            return Err(BodyReadError::TooLarge);
+        }
+        buf.extend_from_slice(&chunk);
+    }
+    Ok(Bytes::from(buf))
 }
 
 fn collect_headers(req: &Request<Body>) -> HashMap<String, String> {
@@ -631,19 +1740,64 @@ fn collect_headers(req: &Request<Body>) -> HashMap<String, String> {
         .collect()
 }
 
+/// `choose_zone` behind the decision cache. Decisions held by hysteresis are not
+/// cached: they depend on the time since the route's last switch.
+fn decide_zone(
+    route_idx: usize,
+    proxy: &config::ProxyConfig,
+    classified: &rilot_core::RoutePolicy,
+    headers: &HashMap<String, String>,
+    static_state: &StaticState,
+) -> Option<Arc<ZoneDecision>> {
+    let decisions = &static_state.decisions;
+    if !decisions.is_enabled(route_idx) {
+        return choose_zone(route_idx, proxy, classified, headers, static_state).map(Arc::new);
+    }
+    let key = decision_cache::DecisionKey {
+        region: headers.get("x-user-region").map_or("", String::as_str),
+        route_class: &classified.route_class,
+        carbon_cursor_enabled: classified.carbon_cursor_enabled,
+        forecasting_enabled: classified.forecasting_enabled,
+        time_shift_enabled: classified.time_shift_enabled,
+    };
+    let stamp = decisions.stamp(static_state.carbon.version(), static_state.health.version());
+    let route_decision = static_state.metrics.route_decision(route_idx);
+    let last_zone = if proxy.policy.min_switch_interval_secs > 0 {
+        route_decision.last().map(|(zone, _, _)| zone)
+    } else {
+        None
+    };
+    if let Some(hit) = decisions.get(route_idx, &key, stamp, last_zone) {
+        // Same bookkeeping `apply_hysteresis` does when the winner is unchanged.
+        route_decision.set(hit.selected.zone.id, hit.selected.score);
+        return Some(hit);
+    }
+
+    let decision = Arc::new(choose_zone(
+        route_idx,
+        proxy,
+        classified,
+        headers,
+        static_state,
+    )?);
+    // A half-open zone only takes a few trial requests, so it must not be cached.
+    let zone_idx = decision.selected.zone.id;
+    if decision.selected.filtered_out_reason.as_deref() != Some("hysteresis-sticky-zone")
+        && static_state.health.is_closed(zone_idx)
+    {
+        decisions.insert(route_idx, &key, stamp, zone_idx, decision.clone());
+    }
+    Some(decision)
+}
+
 fn choose_zone(
+    route_idx: usize,
     proxy: &config::ProxyConfig,
     classified: &rilot_core::RoutePolicy,
     headers: &HashMap<String, String>,
-    carbon_cfg: &config::CarbonProviderConfig,
-    state: &AppState,
     static_state: &StaticState,
-) -> Option<ZoneScore> {
-    let zones = static_state
-        .zones_by_route
-        .get(&proxy.rule.path)
-        .cloned()
-        .unwrap_or_else(|| resolve_zones(proxy));
+) -> Option<ZoneDecision> {
+    let zones = &static_state.zones_by_route[route_idx];
     if zones.is_empty() {
         return None;
     }
@@ -654,48 +1808,61 @@ fn choose_zone(
         .constraints
         .cross_region_rtt_penalty_ms
         .unwrap_or(CROSS_REGION_RTT_PENALTY_MS);
-    let preselected = preselect_candidates(&zones, &proxy.policy.constraints, &user_region);
-    let candidates = if classified.route_class == "strict-local" && !user_region.is_empty() {
-        let local_only: Vec<ZoneCandidate> = preselected
-            .iter()
-            .filter(|z| z.region == user_region)
-            .cloned()
-            .collect();
-        if local_only.is_empty() {
-            preselected
-        } else {
-            local_only
-        }
-    } else {
-        preselected
-    };
-    let best_latency = candidates
+    let mut candidates = preselect_candidates(zones, &proxy.policy.constraints, &user_region);
+    if classified.route_class == "strict-local"
+        && !user_region.is_empty()
+        && candidates.iter().any(|z| z.region == user_region)
+    {
+        candidates.retain(|z| z.region == user_region);
+    }
+    let observed_latency = proxy.policy.constraints.latency_source == "observed";
+    let latencies: Vec<f64> = candidates
+        .iter()
+        .map(|z| {
+            let observed_p95_ms = observed_latency
+                .then(|| observed_p95_latency_ms(&static_state.metrics, z.id))
+                .flatten();
+            estimate_latency_ms(&user_region, z, cross_region_penalty_ms, observed_p95_ms)
+        })
+        .collect();
+    let best_latency = latencies
         .iter()
-        .map(|z| estimate_latency_ms(&user_region, z, cross_region_penalty_ms))
-        .fold(f64::INFINITY, |acc, v| acc.min(v))
+        .fold(f64::INFINITY, |acc, &v| acc.min(v))
         .max(0.0);
+    // With every candidate's circuit open, route as if none were: a failing zone
+    // beats none at all.
+    let mut circuit_open: Vec<bool> = candidates
+        .iter()
+        .map(|z| !static_state.health.admits(z.id))
+        .collect();
+    let breakers_ignored = circuit_open.iter().all(|&open| open);
+    if breakers_ignored {
+        circuit_open.fill(false);
+    }
 
-    let mut scores = Vec::new();
+    let mut scores = Vec::with_capacity(candidates.len());
     let mut max_carbon: f64 = 1.0;
     let mut max_latency: f64 = 1.0;
     let mut max_error: f64 = 0.001;
     let mut max_cost: f64 = 0.001;
     let mut has_any_carbon = false;
 
-    for zone in candidates {
-        let signal = get_signal_nonblocking(&zone.name, carbon_cfg, state);
-        let latency_ms = estimate_latency_ms(&user_region, &zone, cross_region_penalty_ms);
-        let error_rate = current_error_rate(state, &zone.name);
+    let candidates = candidates.into_iter().zip(latencies).zip(circuit_open);
+    for ((zone, latency_ms), circuit_open) in candidates {
+        let signal = static_state.carbon.get(zone.id);
+        let error_rate = current_error_rate(&static_state.metrics, zone.id);
         let cost = zone.cost_weight;
         let mut filtered_out_reason =
             apply_constraints(
                 &proxy.policy.constraints,
-                &zone,
+                zone,
                 latency_ms,
                 error_rate,
                 best_latency,
-                &proxy.rule.path,
-                state,
+                route_idx,
+                &static_state.metrics,
+                &static_state.limits,
+                circuit_open,
             );
 
         let chosen_carbon = if classified.carbon_cursor_enabled
@@ -706,8 +1873,8 @@ fn choose_zone(
         {
             if let (Some(now), Some(next)) = (signal.current, signal.forecast_next) {
                 let improvement = if now > 0.0 { (now - next) / now } else { 0.0 };
-                if improvement >= proxy.policy.forecast_min_improvement_ratio {
-                    filtered_out_reason = Some("deferred-for-greener-window".to_string());
+                if improvement >= proxy.policy.forecast_min_improvement_ratio && !circuit_open {
+                    filtered_out_reason = Some(Cow::Borrowed("deferred-for-greener-window"));
                 }
                 Some(next)
             } else {
@@ -727,12 +1894,9 @@ fn choose_zone(
         max_cost = max_cost.max(cost.max(0.001));
 
         scores.push(ZoneScore {
-            zone,
+            zone: zone.clone(),
             score: 0.0,
             carbon_g_per_kwh: chosen_carbon,
-            zone_carbon_intensity_g_per_kwh: String::new(),
-            eligible_zone_carbon_intensity_g_per_kwh: String::new(),
-            zone_filter_reasons: String::new(),
             carbon_saved_vs_worst_g_per_kwh: 0.0,
             carbon_saved_vs_worst_percent: 0.0,
             latency_ms,
@@ -755,93 +1919,58 @@ fn choose_zone(
         };
     }
 
-    let mut snapshot_scores = scores.clone();
-    snapshot_scores.sort_by(|a, b| {
-        let a_carbon = a.carbon_g_per_kwh.unwrap_or(f64::INFINITY);
-        let b_carbon = b.carbon_g_per_kwh.unwrap_or(f64::INFINITY);
-        a_carbon
-            .total_cmp(&b_carbon)
-            .then_with(|| a.zone.order.cmp(&b.zone.order))
-    });
-    let zone_snapshot = snapshot_scores
-        .iter()
-        .map(|s| {
-            let carbon = s
-                .carbon_g_per_kwh
-                .map(|v| format!("{:.3}", v))
-                .unwrap_or_else(|| "na".to_string());
-            format!("{}:{}", s.zone.name, carbon)
-        })
-        .collect::<Vec<_>>()
-        .join(";");
-    let eligible_zone_snapshot = snapshot_scores
-        .iter()
-        .filter(|s| {
-            s.filtered_out_reason.is_none()
-                || s.filtered_out_reason.as_deref() == Some("deferred-for-greener-window")
-        })
-        .map(|s| {
-            let carbon = s
-                .carbon_g_per_kwh
-                .map(|v| format!("{:.3}", v))
-                .unwrap_or_else(|| "na".to_string());
-            format!("{}:{}", s.zone.name, carbon)
-        })
-        .collect::<Vec<_>>()
-        .join(";");
-    let zone_filter_reasons_snapshot = snapshot_scores
-        .iter()
-        .map(|s| {
-            let reason = s
-                .filtered_out_reason
-                .clone()
-                .unwrap_or_else(|| "eligible".to_string());
-            format!("{}:{}", s.zone.name, reason)
-        })
-        .collect::<Vec<_>>()
-        .join(";");
-    for score in &mut scores {
-        score.zone_carbon_intensity_g_per_kwh = zone_snapshot.clone();
-        score.eligible_zone_carbon_intensity_g_per_kwh = eligible_zone_snapshot.clone();
-        score.zone_filter_reasons = zone_filter_reasons_snapshot.clone();
-    }
-
+    // Candidates whose circuit is not open.
+    let all: Vec<usize> = (0..scores.len())
+        .filter(|&i| scores[i].filtered_out_reason.as_deref() != Some("circuit-open"))
+        .collect();
     if !classified.carbon_cursor_enabled || !has_any_carbon {
-        return lowest_latency_with_hysteresis(proxy, scores, state, &user_region, &classified.route_class);
+        let selected = lowest_latency_with_hysteresis(
+            route_idx,
+            proxy,
+            &scores,
+            all,
+            static_state,
+            &user_region,
+            &classified.route_class,
+        )?;
+        return Some(ZoneDecision {
+            selected,
+            scores,
+            breakers_ignored,
+        });
     }
 
     // Rare tie case: if all eligible candidates have identical carbon signal,
     // pick deterministically by config order (first zone wins).
-    let mut carbon_tie_candidates: Vec<ZoneScore> = scores
-        .iter()
-        .cloned()
-        .filter(|s| {
-            s.filtered_out_reason.is_none()
-                || s.filtered_out_reason.as_deref() == Some("deferred-for-greener-window")
-        })
-        .collect();
-    let carbon_values: Vec<f64> = carbon_tie_candidates
+    let mut eligible: Vec<usize> = all
         .iter()
-        .filter_map(|s| s.carbon_g_per_kwh)
+        .copied()
+        .filter(|&i| scores[i].is_eligible())
         .collect();
-    if carbon_values.len() >= 2 {
-        let first = carbon_values[0];
-        let is_full_carbon_tie = carbon_values
-            .iter()
+    let mut carbon_values = eligible.iter().filter_map(|&i| scores[i].carbon_g_per_kwh);
+    if let (Some(first), Some(second)) = (carbon_values.next(), carbon_values.next()) {
+        let is_full_carbon_tie = std::iter::once(second)
+            .chain(carbon_values)
             .all(|v| (v - first).abs() <= f64::EPSILON);
         if is_full_carbon_tie {
-            carbon_tie_candidates.sort_by_key(|s| s.zone.order);
-            if let Some(mut chosen) = carbon_tie_candidates.first().cloned() {
+            if let Some(&first_in_order) = eligible.iter().min_by_key(|&&i| scores[i].zone.order) {
+                let mut chosen = scores[first_in_order].clone();
                 if chosen.filtered_out_reason.is_none() {
-                    chosen.filtered_out_reason = Some("config-order-carbon-tie".to_string());
+                    chosen.filtered_out_reason = Some(Cow::Borrowed("config-order-carbon-tie"));
                 }
-                return Some(apply_hysteresis(
+                let selected = apply_hysteresis(
+                    route_idx,
                     proxy,
                     chosen,
-                    state,
+                    static_state,
                     &user_region,
                     &classified.route_class,
-                ));
+                );
+                return Some(ZoneDecision {
+                    selected,
+                    scores,
+                    breakers_ignored,
+                });
             }
         }
     }
@@ -866,73 +1995,85 @@ fn choose_zone(
             + (mode_weights.w_cost * n_cost);
     }
 
-    let all_scores = scores.clone();
-    let mut eligible: Vec<ZoneScore> = scores
-        .iter()
-        .cloned()
-        .filter(|s| {
-            s.filtered_out_reason.is_none()
-                || s.filtered_out_reason.as_deref() == Some("deferred-for-greener-window")
-        })
-        .collect();
-    if eligible.is_empty() && proxy.policy.constraints.max_request_share_percent.is_some() {
-        let mut relaxed = all_scores;
-        for s in &mut relaxed {
-            if s.filtered_out_reason.as_deref() == Some("share-cap") {
-                s.filtered_out_reason = Some("share-cap-relaxed-fallback".to_string());
-            }
-        }
-        eligible = relaxed;
+    let share_cap_relaxed =
+        eligible.is_empty() && proxy.policy.constraints.max_request_share_percent.is_some();
+    if share_cap_relaxed {
+        eligible = all;
     }
-    eligible.sort_by(|a, b| {
-        a.score
-            .partial_cmp(&b.score)
+    // Stable sort keeps config order among equal scores.
+    eligible.sort_by(|&a, &b| {
+        scores[a]
+            .score
+            .partial_cmp(&scores[b].score)
             .unwrap_or(std::cmp::Ordering::Equal)
     });
 
-    if let Some(best) = eligible.first().cloned() {
-        return Some(apply_hysteresis(
+    if let Some(&best_idx) = eligible.first() {
+        let mut best = scores[best_idx].clone();
+        if share_cap_relaxed && best.filtered_out_reason.as_deref() == Some("share-cap") {
+            best.filtered_out_reason = Some(Cow::Borrowed("share-cap-relaxed-fallback"));
+        }
+        let selected = apply_hysteresis(
+            route_idx,
             proxy,
             best,
-            state,
+            static_state,
             &user_region,
             &classified.route_class,
-        ));
+        );
+        return Some(ZoneDecision {
+            selected,
+            scores,
+            breakers_ignored,
+        });
     }
     if proxy.policy.fail_safe_lowest_latency {
-        return lowest_latency_with_hysteresis(proxy, eligible, state, &user_region, &classified.route_class);
+        let selected = lowest_latency_with_hysteresis(
+            route_idx,
+            proxy,
+            &scores,
+            eligible,
+            static_state,
+            &user_region,
+            &classified.route_class,
+        )?;
+        return Some(ZoneDecision {
+            selected,
+            scores,
+            breakers_ignored,
+        });
     }
     None
 }
 
 fn lowest_latency_with_hysteresis(
+    route_idx: usize,
     proxy: &config::ProxyConfig,
-    mut candidates: Vec<ZoneScore>,
-    state: &AppState,
+    scores: &[ZoneScore],
+    candidates: Vec<usize>,
+    static_state: &StaticState,
     user_region: &str,
     route_class: &str,
 ) -> Option<ZoneScore> {
-    if candidates.is_empty() {
-        return None;
-    }
-    candidates.sort_by(|a, b| {
-        a.latency_ms
-            .partial_cmp(&b.latency_ms)
+    let best_idx = candidates.into_iter().min_by(|&a, &b| {
+        scores[a]
+            .latency_ms
+            .partial_cmp(&scores[b].latency_ms)
             .unwrap_or(std::cmp::Ordering::Equal)
-            .then_with(|| a.zone.order.cmp(&b.zone.order))
-    });
-    let mut best = candidates.remove(0);
+            .then_with(|| scores[a].zone.order.cmp(&scores[b].zone.order))
+    })?;
+    let mut best = scores[best_idx].clone();
     best.score = 9999.0;
-    best.filtered_out_reason = Some("fallback-lowest-latency".to_string());
-    Some(apply_hysteresis(proxy, best, state, user_region, route_class))
+    best.filtered_out_reason = Some(Cow::Borrowed("fallback-lowest-latency"));
+    Some(apply_hysteresis(route_idx, proxy, best, static_state, user_region, route_class))
 }
 
-fn preselect_candidates(
-    zones: &[ZoneCandidate],
+fn preselect_candidates<'a>(
+    zones: &'a [Arc<ZoneCandidate>],
     constraints: &config::PolicyConstraints,
     user_region: &str,
-) -> Vec<ZoneCandidate> {
-    let mut filtered: Vec<ZoneCandidate> = zones
+) -> Vec<&'a Arc<ZoneCandidate>> {
+    let mut filtered: Vec<&Arc<ZoneCandidate>> = zones
         .iter()
         .filter(|z| {
             if constraints.zone_allowlist.is_empty() {
@@ -950,10 +2091,9 @@ fn preselect_candidates(
                 .filter_map(|entry| entry.strip_prefix("tag:"))
                 .any(|tag| z.tags.iter().any(|t| t == tag))
         })
-        .cloned()
         .collect();
     if filtered.is_empty() {
-        filtered = zones.to_vec();
+        filtered = zones.iter().collect();
     }
 
     filtered.sort_by(|a, b| {
@@ -973,7 +2113,8 @@ fn preselect_candidates(
                 .unwrap_or(std::cmp::Ordering::Equal)
         })
     });
-    filtered.into_iter().take(constraints.max_candidates.max(1)).collect()
+    filtered.truncate(constraints.max_candidates.max(1));
+    filtered
 }
 
 fn apply_constraints(
@@ -982,114 +2123,79 @@ fn apply_constraints(
     latency_ms: f64,
     error_rate: f64,
     best_latency_ms: f64,
-    route: &str,
-    state: &AppState,
-) -> Option<String> {
+    route_idx: usize,
+    matrix: &metrics::MetricsMatrix,
+    limits: &concurrency::ConcurrencyLimits,
+    circuit_open: bool,
+) -> Option<Cow<'static, str>> {
+    if circuit_open {
+        return Some(Cow::Borrowed("circuit-open"));
+    }
     if let Some(max_added) = constraints.max_added_latency_ms {
         if latency_ms > (best_latency_ms + max_added) {
-            return Some(format!("added-latency>{}", max_added));
+            return Some(Cow::Owned(format!("added-latency>{}", max_added)));
         }
     }
     if let Some(latency_budget) = constraints.p95_latency_budget_ms {
         if latency_ms > latency_budget {
-            return Some(format!("latency>{}", latency_budget));
+            return Some(Cow::Owned(format!("latency>{}", latency_budget)));
         }
     }
     if let Some(max_error) = constraints.max_error_rate {
         if error_rate > max_error {
-            return Some(format!("error-rate>{}", max_error));
+            return Some(Cow::Owned(format!("error-rate>{}", max_error)));
         }
     }
-    if let Some(limit) = zone.max_in_flight {
-        let in_flight = current_in_flight(state, &zone.name);
-        if in_flight >= limit {
-            return Some(format!("capacity>{}", limit));
-        }
+    // A zone at its limit keeps its traffic while requests can still queue for it.
+    if limits.is_saturated(zone.id) {
+        let limit = limits.zone(zone.id).map_or(0, |z| z.limit());
+        return Some(Cow::Owned(format!("capacity>{}", limit)));
     }
     if let Some(share_cap_percent) = constraints.max_request_share_percent {
         let cap = share_cap_percent.clamp(0.0, 100.0);
-        let current_share = current_route_zone_share_percent(state, route, &zone.name);
+        let current_share = matrix.route_zone_share_percent(route_idx, zone.id);
         if current_share >= cap {
-            return Some("share-cap".to_string());
+            return Some(Cow::Borrowed("share-cap"));
         }
     }
     None
 }
 
-fn current_route_zone_share_percent(state: &AppState, route: &str, zone: &str) -> f64 {
-    let s = state.inner.read().expect("state lock poisoned");
-    let total_requests: u64 = s
-        .metrics
-        .route_zone
-        .iter()
-        .filter_map(|((r, _), m)| if r == route { Some(m.requests_total) } else { None })
-        .sum();
-    if total_requests == 0 {
-        return 0.0;
-    }
-    let zone_requests = s
-        .metrics
-        .route_zone
-        .get(&(route.to_string(), zone.to_string()))
-        .map(|m| m.requests_total)
-        .unwrap_or(0);
-    (zone_requests as f64 / total_requests as f64) * 100.0
-}
-
 fn apply_hysteresis(
+    route_idx: usize,
     proxy: &config::ProxyConfig,
     candidate: ZoneScore,
-    state: &AppState,
+    static_state: &StaticState,
     user_region: &str,
     route_class: &str,
 ) -> ZoneScore {
-    let route_key = proxy.rule.path.clone();
-    let mut s = state.inner.write().expect("state lock poisoned");
-    if let Some(last) = s.last_decision_by_route.get(&route_key) {
-        let interval = last.at.elapsed().as_secs();
-        let score_gain = last.score - candidate.score;
+    let last_decision = static_state.metrics.route_decision(route_idx);
+    if let Some((last_zone, last_score, last_at_ms)) = last_decision.last() {
+        let interval = metrics::monotonic_ms().saturating_sub(last_at_ms) / 1000;
+        let score_gain = last_score - candidate.score;
         if interval < proxy.policy.min_switch_interval_secs
             && score_gain < proxy.policy.hysteresis_delta
-            && last.zone != candidate.zone.name
+            && last_zone != candidate.zone.id
+            && static_state.health.admits(last_zone)
         {
-            if let Some(existing) = resolve_zones(proxy).into_iter().find(|z| z.name == last.zone) {
+            if let Some(existing) = static_state.zones_by_route[route_idx]
+                .iter()
+                .find(|z| z.id == last_zone)
+            {
                 if route_class == "strict-local" && !user_region.is_empty() && existing.region != user_region {
-                    s.last_decision_by_route.insert(
-                        route_key,
-                        LastDecision {
-                            zone: candidate.zone.name.clone(),
-                            score: candidate.score,
-                            at: Instant::now(),
-                        },
-                    );
+                    last_decision.set(candidate.zone.id, candidate.score);
                     return candidate;
                 }
                 return ZoneScore {
-                    zone: existing,
-                    score: last.score,
-                    carbon_g_per_kwh: candidate.carbon_g_per_kwh,
-                    zone_carbon_intensity_g_per_kwh: candidate.zone_carbon_intensity_g_per_kwh,
-                    eligible_zone_carbon_intensity_g_per_kwh: candidate
-                        .eligible_zone_carbon_intensity_g_per_kwh,
-                    zone_filter_reasons: candidate.zone_filter_reasons,
-                    carbon_saved_vs_worst_g_per_kwh: candidate.carbon_saved_vs_worst_g_per_kwh,
-                    carbon_saved_vs_worst_percent: candidate.carbon_saved_vs_worst_percent,
-                    latency_ms: candidate.latency_ms,
-                    error_rate: candidate.error_rate,
-                    cost: candidate.cost,
-                    filtered_out_reason: Some("hysteresis-sticky-zone".to_string()),
+                    zone: existing.clone(),
+                    score: last_score,
+                    filtered_out_reason: Some(Cow::Borrowed("hysteresis-sticky-zone")),
+                    ..candidate
                 };
             }
         }
     }
-    s.last_decision_by_route.insert(
-        route_key,
-        LastDecision {
-            zone: candidate.zone.name.clone(),
-            score: candidate.score,
-            at: Instant::now(),
-        },
-    );
+    last_decision.set(candidate.zone.id, candidate.score);
     candidate
 }
 
@@ -1100,6 +2206,7 @@ fn resolve_zones(proxy: &config::ProxyConfig) -> Vec<ZoneCandidate> {
             .iter()
             .enumerate()
             .map(|(idx, z)| ZoneCandidate {
+                id: 0,
                 name: z.name.clone(),
                 app_uri: z.app_uri.clone(),
                 region: z.region.clone().unwrap_or_else(|| z.name.clone()),
@@ -1112,6 +2219,7 @@ fn resolve_zones(proxy: &config::ProxyConfig) -> Vec<ZoneCandidate> {
             .collect();
     }
     vec![ZoneCandidate {
+        id: 0,
         name: proxy.app_name.clone(),
         app_uri: proxy.app_uri.clone(),
         region: proxy.app_name.clone(),
@@ -1123,532 +2231,533 @@ fn resolve_zones(proxy: &config::ProxyConfig) -> Vec<ZoneCandidate> {
     }]
 }
 
-fn estimate_latency_ms(user_region: &str, zone: &ZoneCandidate, cross_region_penalty_ms: f64) -> f64 {
+/// `observed_p95_ms` replaces the configured `base_rtt_ms` when the route uses
+/// observed latency. It is measured from the proxy, so the cross-region penalty still
+/// applies on top.
+fn estimate_latency_ms(
+    user_region: &str,
+    zone: &ZoneCandidate,
+    cross_region_penalty_ms: f64,
+    observed_p95_ms: Option<f64>,
+) -> f64 {
+    let base_ms = observed_p95_ms.unwrap_or(zone.base_rtt_ms);
     if user_region.is_empty() || user_region == zone.region {
-        zone.base_rtt_ms
+        base_ms
     } else {
-        zone.base_rtt_ms + cross_region_penalty_ms
+        base_ms + cross_region_penalty_ms
     }
 }
 
-fn get_signal_nonblocking(zone: &str, cfg: &config::CarbonProviderConfig, state: &AppState) -> CarbonSignal {
-    if cfg.provider == "electricitymap-local" {
-        if cfg.electricitymap_local_live_reload {
-            let (current, forecast_next) = fetch_electricitymap_local_signal(zone, cfg);
-            return CarbonSignal {
-                current,
-                forecast_next,
-            };
-        }
-
-        let now = Instant::now();
-        {
-            let s = state.inner.read().expect("state lock poisoned");
-            if let Some(entry) = s.carbon_cache.get(zone) {
-                if now <= entry.expires_at {
-                    return CarbonSignal {
-                        current: entry.current,
-                        forecast_next: entry.forecast_next,
-                    };
-                }
-            }
-        }
+/// Upstream p95 over the recent window; `None` until the zone has enough samples.
+fn observed_p95_latency_ms(matrix: &metrics::MetricsMatrix, zone_idx: usize) -> Option<f64> {
+    matrix
+        .recent_zone(zone_idx)
+        .latency_quantile_ms(OBSERVED_LATENCY_QUANTILE, metrics::monotonic_ms())
+}
 
-        let (current, forecast_next) = fetch_electricitymap_local_signal(zone, cfg);
-        let ttl_secs = cfg.cache_ttl_seconds.max(1);
-        let mut s = state.inner.write().expect("state lock poisoned");
-        s.carbon_cache.insert(
-            zone.to_string(),
-            CachedCarbon {
-                current,
-                forecast_next,
-                expires_at: Instant::now() + Duration::from_secs(ttl_secs),
-            },
-        );
-        return CarbonSignal {
-            current,
-            forecast_next,
-        };
-    }
+/// Error rate over the recent window, so old failures stop counting against a zone.
+fn current_error_rate(matrix: &metrics::MetricsMatrix, zone_idx: usize) -> f64 {
+    matrix
+        .recent_zone(zone_idx)
+        .error_rate(metrics::monotonic_ms())
+}
 
-    let now = Instant::now();
-    {
-        let s = state.inner.read().expect("state lock poisoned");
-        if let Some(entry) = s.carbon_cache.get(zone) {
-            if now <= entry.expires_at {
-                return CarbonSignal {
-                    current: entry.current,
-                    forecast_next: entry.forecast_next,
-                };
+fn render_metrics(
+    static_state: &StaticState,
+    headers: &HeaderMap,
+) -> Result<Response<Body>, Infallible> {
+    let header = |name: HeaderName| headers.get(name).and_then(|v| v.to_str().ok());
+    let format = exposition::Format::negotiate(header(ACCEPT));
+    let mut ex = exposition::Exposition::new(format);
+    exposition::render_matrix(&mut ex, &static_state.metrics);
+    render_upstream_pool_metrics(&mut ex, &static_state.upstreams);
+    render_upstream_attempt_metrics(&mut ex, &static_state.metrics);
+    render_plugin_cache_metrics(&mut ex, &static_state.metrics, &static_state.plugin_caches);
+    render_carbon_refresh_metrics(&mut ex, &static_state.metrics, &static_state.carbon);
+    render_zone_health_metrics(&mut ex, &static_state.metrics, &static_state.health);
+    render_concurrency_metrics(&mut ex, &static_state.metrics, &static_state.limits);
+    render_decision_cache_metrics(&mut ex, &static_state.decisions);
+    render_decision_log_metrics(&mut ex, &static_state.decision_log);
+    render_deferral_metrics(&mut ex, &static_state.deferrals);
+    render_reload_metrics(&mut ex, &static_state.reloads);
+    render_listener_metrics(&mut ex, &static_state.listeners);
+    let body = ex.finish();
+
+    let response = Response::builder()
+        .status(StatusCode::OK)
+        .header("Content-Type", format.content_type())
+        .header("Vary", "Accept, Accept-Encoding");
+    if exposition::accepts_gzip(header(ACCEPT_ENCODING)) {
+        match exposition::gzip(body.as_bytes()) {
+            Ok(compressed) => {
+                return Ok(response
+                    .header("Content-Encoding", "gzip")
+                    .body(Body::from(compressed))
+                    .unwrap());
             }
+            Err(e) => log::warn!("metrics_gzip_failed error={}", e),
         }
     }
-
-    trigger_refresh(zone.to_string(), cfg.clone(), state.clone());
-
-    let fallback_current = cfg
-        .zone_current
-        .get(zone)
-        .copied()
-        .or(Some(cfg.default_carbon_intensity));
-    let fallback_next = cfg.zone_forecast_next.get(zone).copied();
-    CarbonSignal {
-        current: fallback_current,
-        forecast_next: fallback_next,
-    }
+    Ok(response.body(Body::from(body)).unwrap())
 }
 
-fn trigger_refresh(zone: String, cfg: config::CarbonProviderConfig, state: AppState) {
-    {
-        let mut s = state.inner.write().expect("state lock poisoned");
-        if s.refresh_in_flight.contains(&zone) {
-            return;
+fn render_upstream_pool_metrics(
+    ex: &mut exposition::Exposition,
+    upstreams: &upstream::UpstreamPools,
+) {
+    let pools: Vec<_> = upstreams
+        .pools()
+        .map(|pool| (exposition::encode_labels(&[("zone", &pool.name)]), pool))
+        .collect();
+    ex.family("upstream_pool_connections_opened_total", "counter");
+    for (labels, pool) in &pools {
+        let value = pool.stats.connections_opened.load(Ordering::Relaxed);
+        ex.sample("upstream_pool_connections_opened_total", labels, value);
+    }
+    ex.family("upstream_pool_connect_errors_total", "counter");
+    for (labels, pool) in &pools {
+        let value = pool.stats.connect_errors.load(Ordering::Relaxed);
+        ex.sample("upstream_pool_connect_errors_total", labels, value);
+    }
+    ex.family("upstream_pool_requests_total", "counter");
+    for (labels, pool) in &pools {
+        let value = pool.stats.requests_total.load(Ordering::Relaxed);
+        ex.sample("upstream_pool_requests_total", labels, value);
+    }
+    ex.family("upstream_pool_permit_waits_total", "counter");
+    for (labels, pool) in &pools {
+        let value = pool.stats.permit_waits_total.load(Ordering::Relaxed);
+        ex.sample("upstream_pool_permit_waits_total", labels, value);
+    }
+    ex.family("upstream_pool_prewarmed_total", "counter");
+    for (labels, pool) in &pools {
+        let value = pool.stats.prewarmed.load(Ordering::Relaxed);
+        ex.sample("upstream_pool_prewarmed_total", labels, value);
+    }
+    ex.family("upstream_pool_in_use", "gauge");
+    for (labels, pool) in &pools {
+        let value = pool.stats.in_use.load(Ordering::Relaxed);
+        ex.sample("upstream_pool_in_use", labels, value);
+    }
+    ex.family("upstream_pool_max_connections", "gauge");
+    for (labels, pool) in &pools {
+        if let Some(max) = pool.max_connections {
+            ex.sample("upstream_pool_max_connections", labels, max);
         }
-        s.refresh_in_flight.insert(zone.clone());
     }
+}
 
-    tokio::spawn(async move {
-        let fetch = tokio::time::timeout(
-            Duration::from_millis(cfg.provider_timeout_ms),
-            fetch_provider_signal(&zone, &cfg),
-        )
-        .await;
-
-        let mut s = state.inner.write().expect("state lock poisoned");
-        s.refresh_in_flight.remove(&zone);
-        match fetch {
-            Ok((current, forecast_next)) => {
-                let ttl_secs = cfg.cache_ttl_seconds.max(1);
-                s.carbon_cache.insert(
-                    zone,
-                    CachedCarbon {
-                        current,
-                        forecast_next,
-                        expires_at: Instant::now() + Duration::from_secs(ttl_secs),
-                    },
-                );
-            }
-            Err(_) => {
-                // Provider timeout: keep old cache if present; otherwise no update.
-                log::warn!("carbon_provider_timeout=true");
+/// Hedges and connect retries per `(route, zone)` they were sent to; series stay
+/// hidden until the route uses them.
+fn render_upstream_attempt_metrics(
+    ex: &mut exposition::Exposition,
+    matrix: &metrics::MetricsMatrix,
+) {
+    let counters: [(&str, fn(&metrics::RouteZoneCounters) -> &AtomicU64); 3] = [
+        ("upstream_hedges_total", |c| &c.hedges_total),
+        ("upstream_hedge_wins_total", |c| &c.hedge_wins_total),
+        ("upstream_connect_retries_total", |c| {
+            &c.connect_retries_total
+        }),
+    ];
+    for (name, counter) in counters {
+        ex.family(name, "counter");
+        for route_idx in 0..matrix.routes.len() {
+            for zone_idx in 0..matrix.zones.len() {
+                let value = counter(matrix.route_zone(route_idx, zone_idx)).load(Ordering::Relaxed);
+                if value > 0 {
+                    ex.sample(name, matrix.series_labels(route_idx, zone_idx), value);
+                }
             }
         }
-    });
+    }
 }
 
-async fn fetch_provider_signal(zone: &str, cfg: &config::CarbonProviderConfig) -> (Option<f64>, Option<f64>) {
-    // Keep this async so providers can be swapped without changing the hot path.
-    if cfg.provider == "electricitymap" {
-        return fetch_electricitymap_signal(zone, cfg).await;
-    }
-    if cfg.provider == "electricitymap-local" {
-        return fetch_electricitymap_local_signal(zone, cfg);
+fn render_carbon_refresh_metrics(
+    ex: &mut exposition::Exposition,
+    matrix: &metrics::MetricsMatrix,
+    carbon: &carbon::CarbonSignals,
+) {
+    let provider = &carbon.provider_stats;
+    for (name, counter) in [
+        ("carbon_provider_fetches_total", &provider.fetches_total),
+        ("carbon_provider_coalesced_total", &provider.coalesced_total),
+        (
+            "carbon_provider_budget_waits_total",
+            &provider.budget_waits_total,
+        ),
+    ] {
+        ex.family(name, "counter");
+        ex.sample(name, "", counter.load(Ordering::Relaxed));
     }
 
-    if cfg.provider == "slow-mock" {
-        tokio::time::sleep(Duration::from_millis(cfg.provider_timeout_ms + 10)).await;
+    // Carbon zones are the matrix zones in the same order (without `default`).
+    let zones = 0..carbon.zones.len();
+    let freshness: Vec<(f64, f64)> = zones.clone().map(|z| carbon.freshness_secs(z)).collect();
+    ex.family("carbon_signal_age_seconds", "gauge");
+    for (zone_idx, (age, _)) in freshness.iter().enumerate() {
+        ex.sample(
+            "carbon_signal_age_seconds",
+            matrix.zone_labels(zone_idx),
+            format_args!("{:.3}", age),
+        );
     }
-    let current_from_cfg = cfg
-        .zone_current
-        .get(zone)
-        .copied()
-        .or(Some(cfg.default_carbon_intensity));
-    let forecast_from_cfg = cfg.zone_forecast_next.get(zone).copied();
-
-    if cfg.provider == "mock" || cfg.provider == "slow-mock" {
-        let epoch_secs = SystemTime::now()
-            .duration_since(UNIX_EPOCH)
-            .map(|d| d.as_secs_f64())
-            .unwrap_or(0.0);
-        let wave = (epoch_secs / 300.0).sin() * 0.08;
-        let current = current_from_cfg.map(|v| (v * (1.0 + wave)).max(0.0));
-        let forecast = forecast_from_cfg.or_else(|| current.map(|c| (c * 0.92).max(0.0)));
-        (current, forecast)
-    } else {
-        (current_from_cfg, forecast_from_cfg)
-    }
-}
-
-async fn fetch_electricitymap_signal(
-    zone: &str,
-    cfg: &config::CarbonProviderConfig,
-) -> (Option<f64>, Option<f64>) {
-    let Some(api_key) = cfg.electricitymap_api_key.as_ref() else {
-        log::warn!("electricitymap_api_key_missing=true zone={}", zone);
-        return (
-            cfg.zone_current
-                .get(zone)
-                .copied()
-                .or(Some(cfg.default_carbon_intensity)),
-            cfg.zone_forecast_next.get(zone).copied(),
+    ex.family("carbon_signal_staleness_seconds", "gauge");
+    for (zone_idx, (_, staleness)) in freshness.iter().enumerate() {
+        ex.sample(
+            "carbon_signal_staleness_seconds",
+            matrix.zone_labels(zone_idx),
+            format_args!("{:.3}", staleness),
         );
-    };
-
-    let external_zone = cfg
-        .electricitymap_zone_map
-        .get(zone)
-        .cloned()
-        .unwrap_or_else(|| zone.to_string());
-    let base = cfg.electricitymap_base_url.trim_end_matches('/');
-    let disable_estimations = if cfg.electricitymap_disable_estimations {
-        "true"
-    } else {
-        "false"
-    };
-    // ElectricityMap API:
-    // GET /v3/carbon-intensity/latest?zone=<ZONE>&disableEstimations=<bool>
-    // Expected fields read from response JSON:
-    // - carbonIntensity
-    // - carbonIntensityForecast (optional)
-    let url = format!(
-        "{}/v3/carbon-intensity/latest?zone={}&disableEstimations={}",
-        base, external_zone, disable_estimations
-    );
-
-    let mut headers = HeaderMap::new();
-    if let (Ok(name), Ok(value)) = (
-        ReqHeaderName::from_bytes(cfg.electricitymap_api_token_header.as_bytes()),
-        ReqHeaderValue::from_str(api_key),
-    ) {
-        headers.insert(name, value);
-    }
-
-    let response = HTTP_CLIENT.get(url).headers(headers).send().await;
-    let Ok(resp) = response else {
-        log::warn!("electricitymap_request_failed=true zone={}", zone);
-        return (
-            cfg.zone_current
-                .get(zone)
-                .copied()
-                .or(Some(cfg.default_carbon_intensity)),
-            cfg.zone_forecast_next.get(zone).copied(),
+    }
+    ex.family("carbon_refresh_lag_seconds", "gauge");
+    for zone_idx in zones.clone() {
+        ex.sample(
+            "carbon_refresh_lag_seconds",
+            matrix.zone_labels(zone_idx),
+            format_args!("{:.3}", carbon.stats[zone_idx].last_lag_secs.load()),
         );
-    };
-    let status = resp.status();
-    if !status.is_success() {
-        log::warn!(
-            "electricitymap_status_failed=true zone={} status={}",
-            zone,
-            status.as_u16()
+    }
+    ex.family("carbon_refresh_duration_ms", "gauge");
+    for zone_idx in zones.clone() {
+        ex.sample(
+            "carbon_refresh_duration_ms",
+            matrix.zone_labels(zone_idx),
+            format_args!("{:.3}", carbon.stats[zone_idx].last_duration_ms.load()),
         );
-        return (
-            cfg.zone_current
-                .get(zone)
-                .copied()
-                .or(Some(cfg.default_carbon_intensity)),
-            cfg.zone_forecast_next.get(zone).copied(),
+    }
+    ex.family("carbon_refreshes_total", "counter");
+    for zone_idx in zones.clone() {
+        ex.sample(
+            "carbon_refreshes_total",
+            matrix.zone_labels(zone_idx),
+            carbon.stats[zone_idx]
+                .refreshes_total
+                .load(Ordering::Relaxed),
         );
     }
-
-    let parsed = resp.json::<serde_json::Value>().await;
-    let Ok(data) = parsed else {
-        log::warn!("electricitymap_parse_failed=true zone={}", zone);
-        return (
-            cfg.zone_current
-                .get(zone)
-                .copied()
-                .or(Some(cfg.default_carbon_intensity)),
-            cfg.zone_forecast_next.get(zone).copied(),
+    ex.family("carbon_refresh_failures_total", "counter");
+    for zone_idx in zones {
+        ex.sample(
+            "carbon_refresh_failures_total",
+            matrix.zone_labels(zone_idx),
+            carbon.stats[zone_idx]
+                .failures_total
+                .load(Ordering::Relaxed),
         );
-    };
+    }
+}
 
-    let current = data
-        .get("carbonIntensity")
-        .and_then(|v| v.as_f64().or_else(|| v.as_i64().map(|i| i as f64)));
-    let forecast_next = data
-        .get("carbonIntensityForecast")
-        .and_then(|v| v.as_f64().or_else(|| v.as_i64().map(|i| i as f64)))
-        .or_else(|| cfg.zone_forecast_next.get(zone).copied());
-
-    (
-        current.or_else(|| {
-            cfg.zone_current
-                .get(zone)
-                .copied()
-                .or(Some(cfg.default_carbon_intensity))
+fn render_zone_health_metrics(
+    ex: &mut exposition::Exposition,
+    matrix: &metrics::MetricsMatrix,
+    health: &health::ZoneHealth,
+) {
+    // Health zones are the matrix zones in the same order (without `default`).
+    ex.family("zone_circuit_state", "gauge");
+    for (zone_idx, breaker) in health.breakers.iter().enumerate() {
+        let labels = matrix.zone_labels(zone_idx);
+        let state = breaker.state() as usize;
+        for (idx, name) in health::CIRCUIT_STATES.iter().enumerate() {
+            ex.sample_with(
+                "zone_circuit_state",
+                labels,
+                "state",
+                name,
+                u8::from(idx == state),
+            );
+        }
+    }
+    let counters: [(&str, fn(&health::Breaker) -> &AtomicU64); 3] = [
+        ("zone_circuit_opens_total", |b| &b.opens_total),
+        ("zone_health_checks_total", |b| &b.probes_total),
+        ("zone_health_check_failures_total", |b| {
+            &b.probe_failures_total
         }),
-        forecast_next,
-    )
-}
-
-fn fetch_electricitymap_local_signal(
-    zone: &str,
-    cfg: &config::CarbonProviderConfig,
-) -> (Option<f64>, Option<f64>) {
-    let Some(path) = cfg.electricitymap_local_fixture.as_ref() else {
-        log::warn!("electricitymap_local_fixture_missing=true zone={}", zone);
-        return (
-            cfg.zone_current
-                .get(zone)
-                .copied()
-                .or(Some(cfg.default_carbon_intensity)),
-            cfg.zone_forecast_next.get(zone).copied(),
-        );
-    };
+    ];
+    for (name, counter) in counters {
+        ex.family(name, "counter");
+        for (zone_idx, breaker) in health.breakers.iter().enumerate() {
+            ex.sample(
+                name,
+                matrix.zone_labels(zone_idx),
+                counter(breaker).load(Ordering::Relaxed),
+            );
+        }
+    }
+}
 
-    let parsed = std::fs::read_to_string(Path::new(path))
-        .ok()
-        .and_then(|txt| serde_json::from_str::<serde_json::Value>(&txt).ok());
-    let Some(doc) = parsed else {
-        log::warn!("electricitymap_local_fixture_parse_failed=true zone={} path={}", zone, path);
-        return (
-            cfg.zone_current
-                .get(zone)
-                .copied()
-                .or(Some(cfg.default_carbon_intensity)),
-            cfg.zone_forecast_next.get(zone).copied(),
-        );
-    };
+fn render_concurrency_metrics(
+    ex: &mut exposition::Exposition,
+    matrix: &metrics::MetricsMatrix,
+    limits: &concurrency::ConcurrencyLimits,
+) {
+    // Zones without a limit (`default_max_in_flight` of `0`) are left out.
+    let zones: Vec<_> = (0..matrix.zones.len())
+        .filter_map(|zone_idx| Some((matrix.zone_labels(zone_idx), limits.zone(zone_idx)?)))
+        .collect();
+    ex.family("zone_concurrency_limit", "gauge");
+    for (labels, zone) in &zones {
+        ex.sample("zone_concurrency_limit", labels, zone.limit());
+    }
+    ex.family("zone_concurrency_queue_waiting", "gauge");
+    for (labels, zone) in &zones {
+        let value = zone.waiting.load(Ordering::Relaxed);
+        ex.sample("zone_concurrency_queue_waiting", labels, value);
+    }
+    let counters: [(&str, fn(&concurrency::ZoneLimit) -> &AtomicU64); 3] = [
+        ("zone_concurrency_queued_total", |z| &z.queued_total),
+        ("zone_concurrency_shed_total", |z| &z.shed_total),
+        ("zone_concurrency_backoffs_total", |z| &z.backoffs_total),
+    ];
+    for (name, counter) in counters {
+        ex.family(name, "counter");
+        for (labels, zone) in &zones {
+            ex.sample(name, labels, counter(zone).load(Ordering::Relaxed));
+        }
+    }
 
-    let external_zone = cfg
-        .electricitymap_zone_map
-        .get(zone)
-        .cloned()
-        .unwrap_or_else(|| zone.to_string());
-
-    // Fixture can be either:
-    // 1) {"carbonIntensity": ..., "carbonIntensityForecast": ...}
-    // 2) {"zones": {"<zone>": {"carbonIntensity": ..., "carbonIntensityForecast": ...}}}
-    let zone_obj = doc
-        .get("zones")
-        .and_then(|zones| zones.get(&external_zone))
-        .unwrap_or(&doc);
-
-    let current = zone_obj
-        .get("carbonIntensity")
-        .and_then(|v| v.as_f64().or_else(|| v.as_i64().map(|i| i as f64)));
-    let forecast = zone_obj
-        .get("carbonIntensityForecast")
-        .and_then(|v| v.as_f64().or_else(|| v.as_i64().map(|i| i as f64)))
-        .or_else(|| cfg.zone_forecast_next.get(zone).copied());
-
-    (
-        current.or_else(|| {
-            cfg.zone_current
-                .get(zone)
-                .copied()
-                .or(Some(cfg.default_carbon_intensity))
-        }),
-        forecast,
-    )
+    let classes: Vec<_> = concurrency::CLASSES
+        .iter()
+        .zip(&limits.classes)
+        .map(|(class, stats)| (format!("class=\"{}\"", class), stats))
+        .collect();
+    ex.family("class_queue_waiting", "gauge");
+    for (labels, stats) in &classes {
+        let value = stats.waiting.load(Ordering::Relaxed);
+        ex.sample("class_queue_waiting", labels, value);
+    }
+    ex.family("class_queued_total", "counter");
+    for (labels, stats) in &classes {
+        let value = stats.queued_total.load(Ordering::Relaxed);
+        ex.sample("class_queued_total", labels, value);
+    }
+    ex.family("class_shed_total", "counter");
+    for (labels, stats) in &classes {
+        let shed = [
+            ("concurrency", &stats.shed_total),
+            ("scheduler-lag", &stats.lag_shed_total),
+        ];
+        for (reason, counter) in shed {
+            let value = counter.load(Ordering::Relaxed);
+            ex.sample_with("class_shed_total", labels, "reason", reason, value);
+        }
+    }
+    ex.family("scheduler_lag_ms", "gauge");
+    ex.sample("scheduler_lag_ms", "", limits.scheduler_lag_ms());
 }
 
-fn current_error_rate(state: &AppState, zone: &str) -> f64 {
-    let s = state.inner.read().expect("state lock poisoned");
-    let Some(stats) = s.zone_stats.get(zone) else {
-        return 0.0;
+fn render_decision_cache_metrics(
+    ex: &mut exposition::Exposition,
+    decisions: &decision_cache::DecisionCache<ZoneDecision>,
+) {
+    let hits = decisions.hits.load(Ordering::Relaxed);
+    let misses = decisions.misses.load(Ordering::Relaxed);
+    let lookups = hits + misses;
+    let hit_ratio = if lookups > 0 {
+        hits as f64 / lookups as f64
+    } else {
+        0.0
     };
-    if stats.requests == 0 {
-        return 0.0;
+    ex.family("decision_cache_hits_total", "counter");
+    ex.sample("decision_cache_hits_total", "", hits);
+    ex.family("decision_cache_misses_total", "counter");
+    ex.sample("decision_cache_misses_total", "", misses);
+    ex.family("decision_cache_hit_ratio", "gauge");
+    ex.sample(
+        "decision_cache_hit_ratio",
+        "",
+        format_args!("{:.6}", hit_ratio),
+    );
+    ex.family("decision_cache_entries", "gauge");
+    ex.sample("decision_cache_entries", "", decisions.len());
+    ex.family("decision_cache_invalidations_total", "counter");
+    for (reason, count) in decision_cache::INVALIDATION_REASONS
+        .iter()
+        .zip(&decisions.invalidations)
+    {
+        ex.sample_with(
+            "decision_cache_invalidations_total",
+            "",
+            "reason",
+            reason,
+            count.load(Ordering::Relaxed),
+        );
     }
-    stats.errors as f64 / stats.requests as f64
 }
 
-fn current_in_flight(state: &AppState, zone: &str) -> usize {
-    let s = state.inner.read().expect("state lock poisoned");
-    s.zone_in_flight.get(zone).copied().unwrap_or(0)
-}
-
-fn increment_in_flight(state: &AppState, zone: &str, delta: i32) {
-    let mut s = state.inner.write().expect("state lock poisoned");
-    let entry = s.zone_in_flight.entry(zone.to_string()).or_insert(0);
-    if delta > 0 {
-        *entry = entry.saturating_add(delta as usize);
-    } else {
-        *entry = entry.saturating_sub(delta.unsigned_abs() as usize);
+fn render_decision_log_metrics(ex: &mut exposition::Exposition, sink: &decision_log::DecisionLog) {
+    for (name, counter) in [
+        ("decision_log_enqueued_total", &sink.stats.enqueued_total),
+        ("decision_log_dropped_total", &sink.stats.dropped_total),
+        ("decision_log_written_total", &sink.stats.written_total),
+        (
+            "decision_log_write_errors_total",
+            &sink.stats.write_errors_total,
+        ),
+        ("decision_log_rotations_total", &sink.stats.rotations_total),
+    ] {
+        ex.family(name, "counter");
+        ex.sample(name, "", counter.load(Ordering::Relaxed));
     }
+    ex.family("decision_log_queue_depth", "gauge");
+    ex.sample("decision_log_queue_depth", "", sink.queue_depth());
 }
 
-fn record_metrics(
-    state: &AppState,
-    route: &str,
-    zone: &str,
-    latency_ms: f64,
-    carbon_g_per_kwh: f64,
-    is_carbon_safe: bool,
-    energy_j: f64,
-    co2e_g: f64,
-    is_error: bool,
-) {
-    let mut s = state.inner.write().expect("state lock poisoned");
-    s.metrics
-        .carbon_intensity_g_per_kwh
-        .insert(zone.to_string(), carbon_g_per_kwh);
-
-    let key = (route.to_string(), zone.to_string());
-    let m = s.metrics.route_zone.entry(key).or_default();
-    m.requests_total += 1;
-    if is_carbon_safe {
-        m.carbon_safe_calls_total += 1;
-    }
-    if is_error {
-        m.errors_total += 1;
-    }
-    m.carbon_intensity_exposure_total_g_per_kwh += carbon_g_per_kwh;
-    m.co2e_estimated_total_g += co2e_g;
-    m.energy_estimated_total_j += energy_j;
-    m.latency_sum_ms += latency_ms;
-    m.latency_count += 1;
-    let buckets = [25.0, 50.0, 100.0, 250.0, 500.0, 1000.0, 2000.0];
-    for (idx, upper) in buckets.iter().enumerate() {
-        if latency_ms <= *upper {
-            m.latency_buckets[idx] += 1;
-        }
-    }
-
-    let zone_stat = s.zone_stats.entry(zone.to_string()).or_default();
-    zone_stat.requests += 1;
-    if is_error {
-        zone_stat.errors += 1;
-    }
-}
-
-fn render_metrics(state: AppState) -> Result<Response<Body>, Infallible> {
-    let s = state.inner.read().expect("state lock poisoned");
-    let mut out = String::new();
-    out.push_str("# TYPE requests_total counter\n");
-    out.push_str("# TYPE carbon_safe_calls_total counter\n");
-    out.push_str("# TYPE carbon_safe_call_ratio gauge\n");
-    out.push_str("# TYPE errors_total counter\n");
-    out.push_str("# TYPE latency_ms_bucket counter\n");
-    out.push_str("# TYPE carbon_intensity_g_per_kwh gauge\n");
-    out.push_str("# TYPE carbon_intensity_exposure_total counter\n");
-    out.push_str("# TYPE co2e_estimated_total counter\n");
-    out.push_str("# TYPE energy_joules_estimated_total counter\n");
-
-    for ((route, zone), m) in &s.metrics.route_zone {
-        out.push_str(&format!(
-            "requests_total{{route=\"{}\",zone=\"{}\"}} {}\n",
-            escape_label(route),
-            escape_label(zone),
-            m.requests_total
-        ));
-        out.push_str(&format!(
-            "carbon_safe_calls_total{{route=\"{}\",zone=\"{}\"}} {}\n",
-            escape_label(route),
-            escape_label(zone),
-            m.carbon_safe_calls_total
-        ));
-        let safe_ratio = if m.requests_total > 0 {
-            m.carbon_safe_calls_total as f64 / m.requests_total as f64
-        } else {
-            0.0
-        };
-        out.push_str(&format!(
-            "carbon_safe_call_ratio{{route=\"{}\",zone=\"{}\"}} {:.8}\n",
-            escape_label(route),
-            escape_label(zone),
-            safe_ratio
-        ));
-        out.push_str(&format!(
-            "errors_total{{route=\"{}\",zone=\"{}\"}} {}\n",
-            escape_label(route),
-            escape_label(zone),
-            m.errors_total
-        ));
-        out.push_str(&format!(
-            "carbon_intensity_exposure_total{{route=\"{}\",zone=\"{}\"}} {:.8}\n",
-            escape_label(route),
-            escape_label(zone),
-            m.carbon_intensity_exposure_total_g_per_kwh
-        ));
-        out.push_str(&format!(
-            "co2e_estimated_total{{route=\"{}\",zone=\"{}\"}} {:.8}\n",
-            escape_label(route),
-            escape_label(zone),
-            m.co2e_estimated_total_g
-        ));
-        out.push_str(&format!(
-            "energy_joules_estimated_total{{route=\"{}\",zone=\"{}\"}} {:.8}\n",
-            escape_label(route),
-            escape_label(zone),
-            m.energy_estimated_total_j
-        ));
-        let bounds = ["25", "50", "100", "250", "500", "1000", "2000"];
-        for (i, b) in bounds.iter().enumerate() {
-            out.push_str(&format!(
-                "latency_ms_bucket{{route=\"{}\",zone=\"{}\",le=\"{}\"}} {}\n",
-                escape_label(route),
-                escape_label(zone),
-                b,
-                m.latency_buckets[i]
-            ));
-        }
-    }
-
-    for (zone, v) in &s.metrics.carbon_intensity_g_per_kwh {
-        out.push_str(&format!(
-            "carbon_intensity_g_per_kwh{{zone=\"{}\"}} {:.6}\n",
-            escape_label(zone),
-            v
-        ));
+fn render_deferral_metrics(ex: &mut exposition::Exposition, deferrals: &deferral::DeferralQueue) {
+    let stats = &deferrals.stats;
+    ex.family("deferral_queue_depth", "gauge");
+    ex.sample("deferral_queue_depth", "", deferrals.depth());
+    ex.family("deferral_enqueued_total", "counter");
+    ex.sample(
+        "deferral_enqueued_total",
+        "",
+        stats.enqueued_total.load(Ordering::Relaxed),
+    );
+    ex.family("deferral_rejected_total", "counter");
+    ex.sample(
+        "deferral_rejected_total",
+        "",
+        stats.rejected_total.load(Ordering::Relaxed),
+    );
+    ex.family("deferral_released_total", "counter");
+    for (reason, count) in deferral::RELEASE_REASONS.iter().zip(&stats.released) {
+        ex.sample_with(
+            "deferral_released_total",
+            "",
+            "reason",
+            reason,
+            count.load(Ordering::Relaxed),
+        );
     }
+    ex.family("deferral_callbacks_failed_total", "counter");
+    ex.sample(
+        "deferral_callbacks_failed_total",
+        "",
+        stats.callbacks_failed_total.load(Ordering::Relaxed),
+    );
 
-    Ok(Response::builder()
-        .status(StatusCode::OK)
-        .header("Content-Type", "text/plain; version=0.0.4")
-        .body(Body::from(out))
-        .unwrap())
+    ex.family("deferral_wait_ms", "histogram");
+    let mut cumulative = 0;
+    for (i, le) in stats.wait_ms.layout().labels().iter().enumerate() {
+        cumulative += stats.wait_ms.count(i);
+        ex.sample_with("deferral_wait_ms_bucket", "", "le", le, cumulative);
+    }
+    cumulative += stats.wait_ms.count(stats.wait_ms.layout().labels().len());
+    ex.sample_with("deferral_wait_ms_bucket", "", "le", "+Inf", cumulative);
+    ex.sample(
+        "deferral_wait_ms_sum",
+        "",
+        format_args!("{:.3}", stats.wait_ms_sum.load()),
+    );
+    ex.sample("deferral_wait_ms_count", "", cumulative);
 }
 
-fn log_decision(
-    state: &AppState,
-    metrics: &config::MetricsConfig,
-    proxy: &config::ProxyConfig,
-    classified: &rilot_core::RoutePolicy,
-    decision: &Option<ZoneScore>,
-    method: &str,
-    status: StatusCode,
-    latency_ms: f64,
-    co2e_g: f64,
-    is_error: bool,
-    energy_source: Option<&str>,
-) {
-    let log_full = should_log_decision(state, metrics.decision_log_sample_rate) || is_error;
-    if !log_full {
-        return;
+fn render_reload_metrics(ex: &mut exposition::Exposition, stats: &reload::ReloadStats) {
+    ex.family("config_reloads_total", "counter");
+    for (result, count) in reload::RELOAD_RESULTS.iter().zip(&stats.reloads) {
+        ex.sample_with(
+            "config_reloads_total",
+            "",
+            "result",
+            result,
+            count.load(Ordering::Relaxed),
+        );
     }
+    ex.family("config_reload_last_duration_ms", "gauge");
+    ex.sample(
+        "config_reload_last_duration_ms",
+        "",
+        format_args!("{:.3}", stats.last_duration_ms.load()),
+    );
+    ex.family("config_generation", "gauge");
+    ex.sample(
+        "config_generation",
+        "",
+        stats.generation.load(Ordering::Relaxed),
+    );
+}
 
-    let entry = json!({
-        "route": proxy.rule.path,
-        "class": classified.route_class,
-        "method": method,
-        "status": status.as_u16(),
-        "selected_zone": decision.as_ref().map(|d| d.zone.name.clone()).unwrap_or_else(|| "default".to_string()),
-        "score": decision.as_ref().map(|d| d.score),
-        "reason": decision.as_ref().and_then(|d| d.filtered_out_reason.clone()),
-        "carbon_g_per_kwh": decision.as_ref().and_then(|d| d.carbon_g_per_kwh),
-        "latency_ms_estimate": decision.as_ref().map(|d| d.latency_ms),
-        "latency_ms_observed": latency_ms,
-        "co2e_g": co2e_g,
-        "is_error": is_error,
-        "energy_source": energy_source
-    });
-    log::info!("decision={}", entry);
+fn render_listener_metrics(ex: &mut exposition::Exposition, stats: &listener::ListenerStats) {
+    let listeners: Vec<String> = (0..stats.accepted.len()).map(|i| i.to_string()).collect();
+    ex.family("downstream_connections_accepted_total", "counter");
+    for (index, count) in listeners.iter().zip(&stats.accepted) {
+        ex.sample_with(
+            "downstream_connections_accepted_total",
+            "",
+            "listener",
+            index,
+            count.load(Ordering::Relaxed),
+        );
+    }
+    ex.family("downstream_accept_errors_total", "counter");
+    for (index, count) in listeners.iter().zip(&stats.accept_errors) {
+        ex.sample_with(
+            "downstream_accept_errors_total",
+            "",
+            "listener",
+            index,
+            count.load(Ordering::Relaxed),
+        );
+    }
+    ex.family("downstream_connections_open", "gauge");
+    ex.sample(
+        "downstream_connections_open",
+        "",
+        stats.open.load(Ordering::Relaxed),
+    );
+    ex.family("downstream_connection_limit_waits_total", "counter");
+    ex.sample(
+        "downstream_connection_limit_waits_total",
+        "",
+        stats.limit_waits.load(Ordering::Relaxed),
+    );
 }
 
-fn should_log_decision(state: &AppState, sample_rate: f64) -> bool {
-    if sample_rate <= 0.0 {
-        return false;
+fn render_plugin_cache_metrics(
+    ex: &mut exposition::Exposition,
+    matrix: &metrics::MetricsMatrix,
+    caches: &[Option<plugin_cache::PluginResultCache>],
+) {
+    let caches: Vec<_> = caches
+        .iter()
+        .enumerate()
+        .filter_map(|(route_idx, cache)| {
+            let cache = cache.as_ref()?;
+            let (entries, evictions) = cache.size();
+            Some((matrix.route_labels(route_idx), cache, entries, evictions))
+        })
+        .collect();
+    ex.family("plugin_cache_hits_total", "counter");
+    for (labels, cache, _, _) in &caches {
+        ex.sample(
+            "plugin_cache_hits_total",
+            labels,
+            cache.hits.load(Ordering::Relaxed),
+        );
+    }
+    ex.family("plugin_cache_misses_total", "counter");
+    for (labels, cache, _, _) in &caches {
+        ex.sample(
+            "plugin_cache_misses_total",
+            labels,
+            cache.misses.load(Ordering::Relaxed),
+        );
+    }
+    ex.family("plugin_cache_evictions_total", "counter");
+    for (labels, _, _, evictions) in &caches {
+        ex.sample("plugin_cache_evictions_total", labels, evictions);
     }
-    if sample_rate >= 1.0 {
-        return true;
+    ex.family("plugin_cache_entries", "gauge");
+    for (labels, _, entries, _) in &caches {
+        ex.sample("plugin_cache_entries", labels, entries);
     }
-    let mut s = state.inner.write().expect("state lock poisoned");
-    s.decision_counter = s.decision_counter.saturating_add(1);
-    let n = (1.0 / sample_rate).round() as u64;
-    let n = n.max(1);
-    s.decision_counter % n == 0
 }
 
 fn header_or_none(headers: &HashMap<String, String>, key: &str) -> Option<String> {
     headers.get(key).cloned()
 }
 
-fn escape_label(value: &str) -> String {
-    value.replace('\\', "\\\\").replace('"', "\\\"")
-}
-
 fn estimate_energy_joules(latency_ms: f64, bytes: f64) -> f64 {
     let net_component = bytes * 0.00001;
     let cpu_component = latency_ms * 0.003;
@@ -1659,3 +2768,282 @@ fn estimate_co2e_g(energy_j: f64, carbon_g_per_kwh: f64) -> f64 {
     let kwh = energy_j / 3_600_000.0;
     kwh * carbon_g_per_kwh
 }
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    /// An upstream answering `200 <name>` after `delay_ms`.
+    fn upstream_server(name: &'static str, delay_ms: u64) -> String {
+        let make_svc = make_service_fn(move |_| async move {
+            Ok::<_, Infallible>(service_fn(move |_req: Request<Body>| async move {
+                tokio::time::sleep(Duration::from_millis(delay_ms)).await;
+                Ok::<_, Infallible>(Response::new(Body::from(name)))
+            }))
+        });
+        let server = Server::bind(&SocketAddr::from(([127, 0, 0, 1], 0))).serve(make_svc);
+        let uri = format!("http://{}", server.local_addr());
+        tokio::spawn(server);
+        uri
+    }
+
+    /// An upstream that accepts connections and closes them without answering.
+    async fn hang_up_server() -> String {
+        let listener = tokio::net::TcpListener::bind("127.0.0.1:0").await.unwrap();
+        let uri = format!("http://{}", listener.local_addr().unwrap());
+        tokio::spawn(async move {
+            while let Ok((stream, _)) = listener.accept().await {
+                drop(stream);
+            }
+        });
+        uri
+    }
+
+    /// An address nothing listens on, so connecting to it is refused.
+    fn refused() -> String {
+        let listener = std::net::TcpListener::bind("127.0.0.1:0").unwrap();
+        format!("http://{}", listener.local_addr().unwrap())
+    }
+
+    /// State for one route over `zones`, given as `(name, app_uri)` in config order.
+    fn route_state(zones: &[(&str, &str)]) -> StaticState {
+        let zones: Vec<_> = zones
+            .iter()
+            .map(|(name, app_uri)| json!({ "name": name, "app_uri": app_uri }))
+            .collect();
+        let config: config::Config = serde_json::from_value(json!({
+            "proxies": [{
+                "app_name": "app",
+                "app_uri": "http://127.0.0.1:9",
+                "rule": { "path": "/" },
+                "zones": zones,
+            }]
+        }))
+        .unwrap();
+        build_static_state(&config, None)
+    }
+
+    fn replay(method: Method) -> Replay {
+        Replay {
+            method,
+            version: hyper::Version::HTTP_11,
+            path_and_query: "/".to_string(),
+            headers: HeaderMap::new(),
+            body: Bytes::new(),
+        }
+    }
+
+    /// Sends on the route's first zone with the rest as runners-up.
+    fn upstream_send(state: &StaticState, replay: Option<Replay>) -> UpstreamSend<'_> {
+        let zones = &state.zones_by_route[0];
+        UpstreamSend {
+            static_state: state,
+            route_idx: 0,
+            class: concurrency::class_index("flexible"),
+            primary: Target {
+                pool: state.upstreams.for_zone(&zones[0].name),
+                zone_idx: zones[0].id,
+                app_uri: zones[0].app_uri.clone(),
+                breaker: true,
+            },
+            replay,
+            fallbacks: zones[1..].to_vec(),
+            next_fallback: AtomicUsize::new(0),
+            timeout_ms: None,
+        }
+    }
+
+    /// Runs [`UpstreamSend::send`]; returns the body of a successful answer (`None`
+    /// on error) and the zone index that produced the result.
+    async fn send(
+        upstream: &UpstreamSend<'_>,
+        retries: u32,
+        hedge_after: Option<Duration>,
+    ) -> (Option<String>, usize) {
+        let req = match &upstream.replay {
+            Some(replay) => replay.request(&upstream.primary.app_uri).unwrap(),
+            None => Request::post(upstream.primary.app_uri.as_str())
+                .body(Body::from("streamed"))
+                .unwrap(),
+        };
+        let slot = InFlight::start(
+            upstream.static_state,
+            upstream.primary.zone_idx,
+            upstream.class,
+        )
+        .await
+        .unwrap();
+        let circuit = upstream
+            .static_state
+            .health
+            .admit(upstream.primary.zone_idx);
+        let (result, zone_idx) = upstream
+            .send(req, slot, circuit, retries, hedge_after)
+            .await;
+        let body = match result {
+            Ok(Ok(res)) => {
+                let bytes = hyper::body::to_bytes(res.into_body()).await.unwrap();
+                Some(String::from_utf8(bytes.to_vec()).unwrap())
+            }
+            _ => None,
+        };
+        (body, zone_idx)
+    }
+
+    fn counter(value: &AtomicU64) -> u64 {
+        value.load(Ordering::Relaxed)
+    }
+
+    #[test]
+    fn only_safe_replayable_latency_sensitive_requests_are_hedged() {
+        assert!(hedgeable(&Method::GET, true, "strict-local", "balanced"));
+        assert!(hedgeable(&Method::HEAD, true, "flexible", "latency-first"));
+        assert!(!hedgeable(
+            &Method::POST,
+            true,
+            "strict-local",
+            "latency-first"
+        ));
+        assert!(!hedgeable(
+            &Method::GET,
+            false,
+            "strict-local",
+            "latency-first"
+        ));
+        assert!(!hedgeable(&Method::GET, true, "flexible", "balanced"));
+    }
+
+    #[tokio::test]
+    async fn a_slow_get_is_hedged_and_the_faster_zone_wins() {
+        let state = route_state(&[
+            ("east", &upstream_server("east", 2000)),
+            ("west", &upstream_server("west", 0)),
+        ]);
+        let upstream = upstream_send(&state, Some(replay(Method::GET)));
+        let started = Instant::now();
+        let (body, zone_idx) = send(&upstream, 0, Some(Duration::from_millis(20))).await;
+        assert_eq!(body.as_deref(), Some("west"));
+        assert_eq!(zone_idx, 1);
+        assert!(started.elapsed() < Duration::from_millis(1000));
+        let west = state.metrics.route_zone(0, 1);
+        assert_eq!(counter(&west.hedges_total), 1);
+        assert_eq!(counter(&west.hedge_wins_total), 1);
+        // The losing attempt was cancelled and gave back its slot and connection.
+        assert_eq!(state.metrics.zone(0).in_flight.load(Ordering::Relaxed), 0);
+        assert_eq!(
+            state
+                .upstreams
+                .for_zone("east")
+                .stats
+                .in_use
+                .load(Ordering::Relaxed),
+            0
+        );
+    }
+
+    #[tokio::test]
+    async fn a_primary_that_answers_in_time_is_not_hedged() {
+        let state = route_state(&[
+            ("east", &upstream_server("east", 0)),
+            ("west", &upstream_server("west", 0)),
+        ]);
+        let upstream = upstream_send(&state, Some(replay(Method::GET)));
+        let (body, zone_idx) = send(&upstream, 0, Some(Duration::from_millis(500))).await;
+        assert_eq!(body.as_deref(), Some("east"));
+        assert_eq!(zone_idx, 0);
+        assert_eq!(counter(&state.metrics.route_zone(0, 1).hedges_total), 0);
+    }
+
+    #[tokio::test]
+    async fn a_failed_hedge_falls_back_to_the_primary() {
+        let state = route_state(&[
+            ("east", &upstream_server("east", 100)),
+            ("west", &refused()),
+        ]);
+        let upstream = upstream_send(&state, Some(replay(Method::GET)));
+        let (body, zone_idx) = send(&upstream, 0, Some(Duration::from_millis(20))).await;
+        assert_eq!(body.as_deref(), Some("east"));
+        assert_eq!(zone_idx, 0);
+        let west = state.metrics.route_zone(0, 1);
+        assert_eq!(counter(&west.hedges_total), 1);
+        assert_eq!(counter(&west.hedge_wins_total), 0);
+    }
+
+    #[tokio::test]
+    async fn a_streamed_body_is_never_hedged_or_retried() {
+        let state = route_state(&[
+            ("east", &upstream_server("east", 100)),
+            ("west", &upstream_server("west", 0)),
+        ]);
+        let upstream = upstream_send(&state, None);
+        let (body, zone_idx) = send(&upstream, 2, Some(Duration::from_millis(20))).await;
+        assert_eq!(body.as_deref(), Some("east"));
+        assert_eq!(zone_idx, 0);
+        assert_eq!(counter(&state.metrics.route_zone(0, 1).hedges_total), 0);
+
+        let state = route_state(&[("east", &refused()), ("west", &upstream_server("west", 0))]);
+        let upstream = upstream_send(&state, None);
+        let (body, zone_idx) = send(&upstream, 2, None).await;
+        assert_eq!(body, None);
+        assert_eq!(zone_idx, 0);
+        for zone_idx in 0..2 {
+            let counters = state.metrics.route_zone(0, zone_idx);
+            assert_eq!(counter(&counters.connect_retries_total), 0);
+        }
+    }
+
+    #[tokio::test]
+    async fn a_post_is_not_retried() {
+        let state = route_state(&[("east", &refused()), ("west", &upstream_server("west", 0))]);
+        let upstream = upstream_send(&state, Some(replay(Method::POST)));
+        let (body, zone_idx) = send(&upstream, 2, None).await;
+        assert_eq!(body, None);
+        assert_eq!(zone_idx, 0);
+        assert_eq!(
+            counter(&state.metrics.route_zone(0, 1).connect_retries_total),
+            0
+        );
+    }
+
+    #[tokio::test]
+    async fn connect_errors_are_retried_on_the_runner_up() {
+        let state = route_state(&[("east", &refused()), ("west", &upstream_server("west", 0))]);
+        let upstream = upstream_send(&state, Some(replay(Method::PUT)));
+        let (body, zone_idx) = send(&upstream, 1, None).await;
+        assert_eq!(body.as_deref(), Some("west"));
+        assert_eq!(zone_idx, 1);
+        assert_eq!(
+            counter(&state.metrics.route_zone(0, 1).connect_retries_total),
+            1
+        );
+    }
+
+    #[tokio::test]
+    async fn retries_run_out_of_runners_up_then_replay_on_the_primary() {
+        let state = route_state(&[("east", &refused()), ("west", &refused())]);
+        let upstream = upstream_send(&state, Some(replay(Method::GET)));
+        let (body, zone_idx) = send(&upstream, 2, None).await;
+        assert_eq!(body, None);
+        assert_eq!(zone_idx, 0);
+        for zone_idx in 0..2 {
+            let counters = state.metrics.route_zone(0, zone_idx);
+            assert_eq!(counter(&counters.connect_retries_total), 1);
+        }
+    }
+
+    #[tokio::test]
+    async fn errors_after_connecting_are_not_retried() {
+        let state = route_state(&[
+            ("east", &hang_up_server().await),
+            ("west", &upstream_server("west", 0)),
+        ]);
+        let upstream = upstream_send(&state, Some(replay(Method::GET)));
+        let (body, zone_idx) = send(&upstream, 2, None).await;
+        assert_eq!(body, None);
+        assert_eq!(zone_idx, 0);
+        assert_eq!(
+            counter(&state.metrics.route_zone(0, 1).connect_retries_total),
+            0
+        );
+    }
+}
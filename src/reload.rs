@@ -0,0 +1,83 @@
+use std::path::{Path, PathBuf};
+use std::sync::atomic::{AtomicU64, Ordering};
+use std::time::{Duration, Instant, SystemTime};
+use tokio::sync::mpsc;
+
+use crate::config::ReloadConfig;
+use crate::metrics::AtomicF64;
+
+/// Reload outcomes, in `reloads` counter order.
+pub const RELOAD_RESULTS: [&str; 2] = ["success", "failure"];
+const RESULT_SUCCESS: usize = 0;
+const RESULT_FAILURE: usize = 1;
+
+/// Reload bookkeeping, exported on `/metrics`. Carried across reloads.
+#[derive(Default)]
+pub struct ReloadStats {
+    pub reloads: [AtomicU64; RELOAD_RESULTS.len()],
+    pub last_duration_ms: AtomicF64,
+    /// Number of configs applied since start; `0` is the startup config.
+    pub generation: AtomicU64,
+}
+
+impl ReloadStats {
+    /// Counts one reload attempt that started at `started`; returns its duration.
+    pub fn record(&self, started: Instant, applied: bool) -> f64 {
+        let duration_ms = started.elapsed().as_secs_f64() * 1000.0;
+        self.last_duration_ms.store(duration_ms);
+        if applied {
+            self.generation.fetch_add(1, Ordering::Relaxed);
+            self.reloads[RESULT_SUCCESS].fetch_add(1, Ordering::Relaxed);
+        } else {
+            self.reloads[RESULT_FAILURE].fetch_add(1, Ordering::Relaxed);
+        }
+        duration_ms
+    }
+}
+
+/// Reload requests: `SIGHUP`, plus a change of the config file's mtime or size when
+/// `watch` is on. Each item names its trigger. Requests arriving while one is still
+/// pending are folded into it.
+pub fn spawn_triggers(path: &str, config: &ReloadConfig) -> mpsc::Receiver<&'static str> {
+    let (tx, rx) = mpsc::channel(1);
+
+    #[cfg(unix)]
+    {
+        use tokio::signal::unix::{signal, SignalKind};
+        match signal(SignalKind::hangup()) {
+            Ok(mut hangups) => {
+                let tx = tx.clone();
+                tokio::spawn(async move {
+                    while hangups.recv().await.is_some() {
+                        let _ = tx.try_send("sighup");
+                    }
+                });
+            }
+            Err(e) => log::warn!("config_reload_sighup_unavailable error={}", e),
+        }
+    }
+
+    if config.watch {
+        let path = PathBuf::from(path);
+        let every = Duration::from_millis(config.watch_interval_ms.max(100));
+        tokio::spawn(async move {
+            let mut stamp = file_stamp(&path);
+            let mut ticker = tokio::time::interval(every);
+            ticker.set_missed_tick_behavior(tokio::time::MissedTickBehavior::Delay);
+            loop {
+                ticker.tick().await;
+                let current = file_stamp(&path);
+                if current != stamp {
+                    stamp = current;
+                    let _ = tx.try_send("watch");
+                }
+            }
+        });
+    }
+    rx
+}
+
+fn file_stamp(path: &Path) -> Option<(SystemTime, u64)> {
+    let meta = std::fs::metadata(path).ok()?;
+    Some((meta.modified().ok()?, meta.len()))
+}
@@ -0,0 +1,366 @@
+use futures_util::TryStreamExt;
+use hyper::client::HttpConnector;
+use hyper::service::Service;
+use hyper::{Body, Client, Method, Request, Response, Uri};
+use std::collections::HashMap;
+use std::future::Future;
+use std::pin::Pin;
+use std::sync::atomic::{AtomicU64, AtomicUsize, Ordering};
+use std::sync::Arc;
+use std::task::{Context, Poll};
+use std::time::Duration;
+use tokio::sync::{OwnedSemaphorePermit, Semaphore};
+
+use crate::config;
+
+const SHARED_POOL_NAME: &str = "shared";
+/// Deadline for a warming request when neither `request_timeout_ms` nor
+/// `connect_timeout_ms` is set.
+const PREWARM_TIMEOUT_MS: u64 = 1000;
+
+/// Counters for one upstream pool. Read lock-free by `/metrics`.
+#[derive(Default)]
+pub struct PoolStats {
+    pub connections_opened: AtomicU64,
+    pub connect_errors: AtomicU64,
+    pub requests_total: AtomicU64,
+    pub permit_waits_total: AtomicU64,
+    pub in_use: AtomicUsize,
+    pub prewarmed: AtomicU64,
+}
+
+/// `HttpConnector` wrapper that counts fresh TCP connections, so pool reuse is visible.
+#[derive(Clone)]
+struct CountingConnector {
+    inner: HttpConnector,
+    stats: Arc<PoolStats>,
+}
+
+impl Service<Uri> for CountingConnector {
+    type Response = <HttpConnector as Service<Uri>>::Response;
+    type Error = <HttpConnector as Service<Uri>>::Error;
+    type Future = Pin<Box<dyn Future<Output = Result<Self::Response, Self::Error>> + Send>>;
+
+    fn poll_ready(&mut self, cx: &mut Context<'_>) -> Poll<Result<(), Self::Error>> {
+        self.inner.poll_ready(cx)
+    }
+
+    fn call(&mut self, dst: Uri) -> Self::Future {
+        let connecting = self.inner.call(dst);
+        let stats = self.stats.clone();
+        Box::pin(async move {
+            let result = connecting.await;
+            match &result {
+                Ok(_) => stats.connections_opened.fetch_add(1, Ordering::Relaxed),
+                Err(_) => stats.connect_errors.fetch_add(1, Ordering::Relaxed),
+            };
+            result
+        })
+    }
+}
+
+/// Holds one count in `PoolStats::in_use` until dropped, so a request whose future
+/// is cancelled (client gone, request timeout, lost hedge race) still gives it back.
+struct InUse(Arc<PoolStats>);
+
+impl InUse {
+    fn start(stats: Arc<PoolStats>) -> Self {
+        stats.in_use.fetch_add(1, Ordering::Relaxed);
+        Self(stats)
+    }
+}
+
+impl Drop for InUse {
+    fn drop(&mut self) {
+        self.0.in_use.fetch_sub(1, Ordering::Relaxed);
+    }
+}
+
+/// A request's hold on its pool: the connection slot and the `in_use` count. It
+/// moves into the response body, since the connection stays busy until the body
+/// has been read to the end or dropped.
+struct Lease {
+    _permit: Option<OwnedSemaphorePermit>,
+    _in_use: InUse,
+}
+
+pub struct ZonePool {
+    pub name: String,
+    app_uri: String,
+    client: Client<CountingConnector>,
+    permits: Option<Arc<Semaphore>>,
+    pub max_connections: Option<usize>,
+    pub stats: Arc<PoolStats>,
+}
+
+impl ZonePool {
+    fn new(name: &str, app_uri: &str, cfg: &config::UpstreamConfig) -> Self {
+        let stats = Arc::new(PoolStats::default());
+        let mut http = HttpConnector::new();
+        http.set_nodelay(cfg.tcp_nodelay);
+        http.set_keepalive(
+            (cfg.tcp_keepalive_secs > 0).then(|| Duration::from_secs(cfg.tcp_keepalive_secs)),
+        );
+        http.set_connect_timeout(
+            (cfg.connect_timeout_ms > 0).then(|| Duration::from_millis(cfg.connect_timeout_ms)),
+        );
+        let connector = CountingConnector {
+            inner: http,
+            stats: stats.clone(),
+        };
+        let client = Client::builder()
+            .pool_idle_timeout(Duration::from_secs(cfg.pool_idle_timeout_secs.max(1)))
+            .pool_max_idle_per_host(cfg.pool_max_idle_per_zone)
+            .build(connector);
+        let max_connections = cfg.max_connections_per_zone.filter(|n| *n > 0);
+        Self {
+            name: name.to_string(),
+            app_uri: app_uri.to_string(),
+            client,
+            permits: max_connections.map(|n| Arc::new(Semaphore::new(n))),
+            max_connections,
+            stats,
+        }
+    }
+
+    /// Forward through the pooled client. When `max_connections_per_zone` is set the
+    /// request waits for a slot instead of opening yet another socket. The slot and
+    /// the `in_use` count are held until the response body ends or is dropped.
+    pub async fn request(&self, req: Request<Body>) -> Result<Response<Body>, hyper::Error> {
+        let permit = match &self.permits {
+            Some(sem) => match sem.clone().try_acquire_owned() {
+                Ok(p) => Some(p),
+                Err(_) => {
+                    self.stats.permit_waits_total.fetch_add(1, Ordering::Relaxed);
+                    sem.clone().acquire_owned().await.ok()
+                }
+            },
+            None => None,
+        };
+        self.stats.requests_total.fetch_add(1, Ordering::Relaxed);
+        let lease = Lease {
+            _permit: permit,
+            _in_use: InUse::start(self.stats.clone()),
+        };
+        let res = self.client.request(req).await?;
+        Ok(res.map(|body| {
+            Body::wrap_stream(body.inspect_ok(move |_| {
+                let _ = &lease;
+            }))
+        }))
+    }
+
+    /// Health probe: `GET <app_uri><path>`, healthy on any status below `500` within
+    /// `timeout`. Bypasses `max_connections_per_zone` and the request counters.
+    pub async fn probe(&self, path: &str, timeout: Duration) -> bool {
+        let target = format!("{}{}", self.app_uri.trim_end_matches('/'), path);
+        let Ok(uri) = Uri::try_from(target.as_str()) else {
+            return false;
+        };
+        let Ok(req) = Request::builder()
+            .method(Method::GET)
+            .uri(uri)
+            .body(Body::empty())
+        else {
+            return false;
+        };
+        let probe = async {
+            let res = self.client.request(req).await.ok()?;
+            let healthy = !res.status().is_server_error();
+            // Drain so the connection goes back to the idle pool.
+            hyper::body::to_bytes(res.into_body()).await.ok()?;
+            Some(healthy)
+        };
+        matches!(tokio::time::timeout(timeout, probe).await, Ok(Some(true)))
+    }
+
+    /// Opens up to `connections` keep-alive connections; a warming request without a
+    /// response within `timeout` is abandoned, so a hung upstream cannot hold up
+    /// startup or a reload.
+    async fn prewarm(&self, connections: usize, timeout: Duration) -> usize {
+        let Ok(uri) = Uri::try_from(self.app_uri.as_str()) else {
+            return 0;
+        };
+        let mut tasks = Vec::with_capacity(connections);
+        for _ in 0..connections {
+            let client = self.client.clone();
+            let uri = uri.clone();
+            tasks.push(tokio::spawn(async move {
+                let req = Request::builder()
+                    .method(Method::HEAD)
+                    .uri(uri)
+                    .body(Body::empty())
+                    .ok()?;
+                let warm = async {
+                    let res = client.request(req).await.ok()?;
+                    // Drain so the connection goes back to the idle pool.
+                    hyper::body::to_bytes(res.into_body()).await.ok()
+                };
+                tokio::time::timeout(timeout, warm).await.ok()?
+            }));
+        }
+        let mut warmed = 0;
+        for task in tasks {
+            if let Ok(Some(_)) = task.await {
+                warmed += 1;
+            }
+        }
+        self.stats.prewarmed.fetch_add(warmed as u64, Ordering::Relaxed);
+        warmed
+    }
+}
+
+/// Long-lived keep-alive pools, one per configured zone plus a shared pool for
+/// targets that are not a zone (route default `app_uri`, plugin `app_url` overrides).
+pub struct UpstreamPools {
+    by_zone: HashMap<String, Arc<ZonePool>>,
+    shared: Arc<ZonePool>,
+    prewarm_connections: usize,
+    prewarm_timeout: Duration,
+}
+
+impl UpstreamPools {
+    pub fn new<'a>(
+        zones: impl IntoIterator<Item = (&'a str, &'a str)>,
+        cfg: &config::UpstreamConfig,
+    ) -> Self {
+        let mut by_zone = HashMap::new();
+        for (name, app_uri) in zones {
+            by_zone
+                .entry(name.to_string())
+                .or_insert_with(|| Arc::new(ZonePool::new(name, app_uri, cfg)));
+        }
+        Self {
+            by_zone,
+            shared: Arc::new(ZonePool::new(SHARED_POOL_NAME, "", cfg)),
+            prewarm_connections: cfg.prewarm_connections,
+            prewarm_timeout: Duration::from_millis(
+                cfg.request_timeout_ms
+                    .filter(|ms| *ms > 0)
+                    .or((cfg.connect_timeout_ms > 0).then_some(cfg.connect_timeout_ms))
+                    .unwrap_or(PREWARM_TIMEOUT_MS),
+            ),
+        }
+    }
+
+    pub fn for_zone(&self, zone: &str) -> &ZonePool {
+        self.by_zone.get(zone).unwrap_or(&self.shared)
+    }
+
+    pub fn shared(&self) -> &ZonePool {
+        &self.shared
+    }
+
+    pub fn pools(&self) -> impl Iterator<Item = &ZonePool> {
+        self.by_zone
+            .values()
+            .map(|p| p.as_ref())
+            .chain(std::iter::once(self.shared.as_ref()))
+    }
+
+    /// Open `prewarm_connections` idle keep-alive connections per zone before traffic arrives.
+    pub async fn prewarm(&self) {
+        if self.prewarm_connections == 0 {
+            return;
+        }
+        let connections = self.prewarm_connections;
+        let timeout = self.prewarm_timeout;
+        let tasks: Vec<_> = self
+            .by_zone
+            .values()
+            .cloned()
+            .map(|pool| {
+                tokio::spawn(async move {
+                    let warmed = pool.prewarm(connections, timeout).await;
+                    log::info!(
+                        "upstream_prewarm zone={} warmed={} requested={}",
+                        pool.name,
+                        warmed,
+                        connections
+                    );
+                })
+            })
+            .collect();
+        for task in tasks {
+            let _ = task.await;
+        }
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use hyper::body::HttpBody;
+    use std::io::{Read, Write};
+    use tokio::net::TcpListener;
+
+    #[tokio::test]
+    async fn cancelled_requests_give_back_their_in_use_count() {
+        // Accepts connections into the backlog but never answers.
+        let listener = TcpListener::bind("127.0.0.1:0").await.unwrap();
+        let app_uri = format!("http://{}", listener.local_addr().unwrap());
+        let pool = ZonePool::new("east", &app_uri, &config::UpstreamConfig::default());
+        let req = Request::get(app_uri.as_str()).body(Body::empty()).unwrap();
+
+        let mut pending = Box::pin(pool.request(req));
+        let waited = tokio::time::timeout(Duration::from_millis(50), &mut pending).await;
+        assert!(waited.is_err());
+        assert_eq!(pool.stats.in_use.load(Ordering::Relaxed), 1);
+        drop(pending);
+        assert_eq!(pool.stats.in_use.load(Ordering::Relaxed), 0);
+        assert_eq!(pool.stats.requests_total.load(Ordering::Relaxed), 1);
+    }
+
+    /// Answers every request with headers and a first chunk, then keeps the body
+    /// open for `hold`.
+    fn streaming_server(hold: Duration) -> String {
+        let listener = std::net::TcpListener::bind("127.0.0.1:0").unwrap();
+        let app_uri = format!("http://{}", listener.local_addr().unwrap());
+        std::thread::spawn(move || {
+            for mut stream in listener.incoming().flatten() {
+                std::thread::spawn(move || {
+                    let mut buf = [0; 1024];
+                    let _ = stream.read(&mut buf);
+                    let _ = stream.write_all(
+                        b"HTTP/1.1 200 OK\r\ntransfer-encoding: chunked\r\n\r\n5\r\nhello\r\n",
+                    );
+                    std::thread::sleep(hold);
+                });
+            }
+        });
+        app_uri
+    }
+
+    #[tokio::test]
+    async fn a_streaming_body_keeps_its_connection_slot() {
+        let app_uri = streaming_server(Duration::from_secs(5));
+        let cfg = config::UpstreamConfig {
+            max_connections_per_zone: Some(1),
+            ..config::UpstreamConfig::default()
+        };
+        let pool = ZonePool::new("east", &app_uri, &cfg);
+        let get = || Request::get(app_uri.as_str()).body(Body::empty()).unwrap();
+
+        let mut body = pool.request(get()).await.unwrap().into_body();
+        assert_eq!(&body.data().await.unwrap().unwrap()[..], b"hello");
+        assert_eq!(pool.stats.in_use.load(Ordering::Relaxed), 1);
+        // Headers are in but the body is still streaming, so the slot is still taken.
+        let second = tokio::time::timeout(Duration::from_millis(50), pool.request(get())).await;
+        assert!(second.is_err());
+        assert_eq!(pool.stats.permit_waits_total.load(Ordering::Relaxed), 1);
+
+        drop(body);
+        assert_eq!(pool.stats.in_use.load(Ordering::Relaxed), 0);
+        assert_eq!(pool.permits.as_ref().unwrap().available_permits(), 1);
+    }
+
+    #[tokio::test]
+    async fn prewarming_gives_up_on_an_upstream_that_never_answers() {
+        let listener = TcpListener::bind("127.0.0.1:0").await.unwrap();
+        let app_uri = format!("http://{}", listener.local_addr().unwrap());
+        let pool = ZonePool::new("east", &app_uri, &config::UpstreamConfig::default());
+        let warming = pool.prewarm(2, Duration::from_millis(50));
+        let warmed = tokio::time::timeout(Duration::from_secs(5), warming).await;
+        assert_eq!(warmed.unwrap(), 0);
+    }
+}
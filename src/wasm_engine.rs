@@ -1,9 +1,21 @@
 use anyhow::{Context, Result};
-use once_cell::sync::Lazy;
+use hyper::body::Bytes;
+use once_cell::sync::{Lazy, OnceCell};
 use serde::{Deserialize, Serialize};
-use std::{collections::{HashMap, HashSet}, env, sync::RwLock};
-use wasmtime::{Engine, Store, Config as WasmtimeConfig};
-use wasmtime::component::{Component, Linker, ResourceTable, TypedFunc};
+use std::{
+    borrow::Cow,
+    collections::{hash_map::DefaultHasher, HashMap, HashSet},
+    env, fs,
+    hash::{Hash, Hasher},
+    path::{Path, PathBuf},
+    sync::{Arc, RwLock},
+    time::SystemTime,
+};
+use tokio::sync::Semaphore;
+use wasmtime::{
+    Config as WasmtimeConfig, Engine, InstanceAllocationStrategy, PoolingAllocationConfig, Store,
+};
+use wasmtime::component::{Component, InstancePre, Linker, ResourceTable, TypedFunc};
 use wasmtime_wasi::{
     add_to_linker_async as wasi_add,
     pipe::{MemoryInputPipe, MemoryOutputPipe},
@@ -18,6 +30,8 @@ use wasmtime_wasi_http::{
     WasiHttpView,
 };
 
+use crate::config;
+
 #[derive(Deserialize, Serialize, Debug, Default, Clone)]
 pub struct WasmOutput {
     pub app_url: Option<String>,
@@ -37,23 +51,139 @@ pub struct WasmOutput {
     pub energy_source: Option<String>,
 }
 
+mod typed {
+    wasmtime::component::bindgen!({
+        path: "wit",
+        world: "typed-override",
+        async: true,
+    });
+}
+
+use typed::rilot::plugin::types::{Decision, RequestInfo};
+
+/// The request a plugin runs against. Headers and body are shared, not copied; the
+/// typed ABI hands them to the guest piecemeal through `rilot:plugin/request`.
+pub struct PluginRequest {
+    pub method: String,
+    pub path: String,
+    pub headers: Arc<HashMap<String, String>>,
+    pub body: Bytes,
+}
+
+/// Input document for the stdio/JSON compatibility ABI.
+#[derive(Serialize)]
+struct WasmInput<'a> {
+    method: &'a str,
+    path: &'a str,
+    headers: &'a HashMap<String, String>,
+    body: Cow<'a, str>,
+}
+
 struct Host {
     table: ResourceTable,
     wasi: WasiCtx,
     http: WasiHttpCtx,
+    request: PluginRequest,
 }
 
 impl IoView for Host { fn table(&mut self) -> &mut ResourceTable { &mut self.table } }
 impl WasiView for Host { fn ctx(&mut self) -> &mut WasiCtx { &mut self.wasi } }
 impl WasiHttpView for Host { fn ctx(&mut self) -> &mut WasiHttpCtx { &mut self.http } }
 
-static ENGINE: Lazy<Engine> = Lazy::new(|| {
-    Engine::new(&WasmtimeConfig::new().async_support(true).wasm_component_model(true)).unwrap()
-});
+impl typed::rilot::plugin::types::Host for Host {}
+
+impl typed::rilot::plugin::request::Host for Host {
+    async fn header(&mut self, name: String) -> Option<String> {
+        match self.request.headers.get(&name) {
+            Some(v) => Some(v.clone()),
+            None => self.request.headers.get(&name.to_ascii_lowercase()).cloned(),
+        }
+    }
+
+    async fn header_names(&mut self) -> Vec<String> {
+        self.request.headers.keys().cloned().collect()
+    }
+
+    async fn body_size(&mut self) -> u64 {
+        self.request.body.len() as u64
+    }
+
+    async fn body_read(&mut self, offset: u64, len: u32) -> Vec<u8> {
+        let body = &self.request.body;
+        let start = usize::try_from(offset).unwrap_or(usize::MAX).min(body.len());
+        let end = start.saturating_add(len as usize).min(body.len());
+        body[start..end].to_vec()
+    }
+}
+
+impl From<Decision> for WasmOutput {
+    fn from(d: Decision) -> Self {
+        Self {
+            app_url: d.app_url,
+            headers_to_update: d.headers_to_update.into_iter().collect(),
+            headers_to_remove: d.headers_to_remove,
+            response_headers_to_add: d.response_headers_to_add.into_iter().collect(),
+            response_headers_to_remove: d.response_headers_to_remove,
+            energy_joules_override: d.energy_joules_override,
+            carbon_intensity_g_per_kwh_override: d.carbon_intensity_g_per_kwh_override,
+            energy_source: d.energy_source,
+        }
+    }
+}
 
-static COMPONENT_CACHE: Lazy<RwLock<HashMap<String, Component>>> =
+/// How a component exchanges data with the host.
+enum PluginAbi {
+    /// Legacy `modify-request: func()` with JSON over WASI stdin/stdout.
+    Json,
+    /// `typed-override` world from `wit/rilot-plugin.wit`.
+    Typed(typed::TypedOverridePre<Host>),
+}
+
+/// Core instances, memories and tables reserved per component slot in the pooling allocator.
+const CORE_INSTANCES_PER_SLOT: u32 = 8;
+const MEMORIES_PER_SLOT: u32 = 2;
+const TABLES_PER_SLOT: u32 = 4;
+
+struct Runtime {
+    engine: Engine,
+    linker: Linker<Host>,
+    plugins: config::PluginsConfig,
+    cache_dir: Option<PathBuf>,
+}
+
+static RUNTIME: OnceCell<Runtime> = OnceCell::new();
+
+/// What the component file looked like when it was compiled. Dev mode compares the
+/// cheap `modified`/`len` pair first and only rehashes the file when they changed.
+#[derive(Clone, Copy)]
+struct SourceStamp {
+    modified: Option<SystemTime>,
+    len: u64,
+    hash: u64,
+}
+
+impl SourceStamp {
+    fn matches(&self, meta: &fs::Metadata) -> bool {
+        self.modified.is_some() && self.modified == meta.modified().ok() && self.len == meta.len()
+    }
+}
+
+/// A compiled component with its imports already resolved against the shared linker.
+/// Instantiating from it only allocates a pooled slot and runs the component's start.
+struct PreparedComponent {
+    pre: InstancePre<Host>,
+    abi: Arc<PluginAbi>,
+    permits: Arc<Semaphore>,
+    source: SourceStamp,
+}
+
+static COMPONENT_CACHE: Lazy<RwLock<HashMap<String, Arc<PreparedComponent>>>> =
     Lazy::new(|| RwLock::new(HashMap::new()));
 
+// Captured once: building the WASI context per call should not re-read the process env.
+static HOST_ARGS: Lazy<Vec<String>> = Lazy::new(|| env::args().collect());
+static HOST_ENV: Lazy<Vec<(String, String)>> = Lazy::new(|| env::vars().collect());
+
 static PROD_MODE: Lazy<bool> = Lazy::new(|| {
     env::var("RILOT_ENV")
         .map(|val| val.eq_ignore_ascii_case("production"))
@@ -64,81 +194,292 @@ pub fn is_production_mode() -> bool {
     *PROD_MODE
 }
 
-fn load_component(component_path: &str, use_cache: bool) -> Result<Component> {
-    if use_cache {
-        let read_cache = COMPONENT_CACHE.read().expect("Cache lock poisoned");
-        if let Some(comp) = read_cache.get(component_path) {
-            return Ok(comp.clone());
+/// Build the shared engine (pooling allocator sized from `plugins` for every configured
+/// component) and linker. Must run before the first plugin call; later calls are no-ops.
+pub fn configure(plugins: &config::PluginsConfig, component_paths: &[String]) -> Result<()> {
+    RUNTIME
+        .get_or_try_init(|| build_runtime(plugins, component_paths))
+        .map(|_| ())
+}
+
+fn build_runtime(plugins: &config::PluginsConfig, component_paths: &[String]) -> Result<Runtime> {
+    let unique: HashSet<&str> = component_paths
+        .iter()
+        .map(|p| p.as_str())
+        .filter(|p| !p.trim().is_empty())
+        .collect();
+    let slots: usize = unique.iter().map(|p| plugins.limits_for(p).0).sum();
+    let slots = slots.max(plugins.pool_size).max(1) as u32;
+
+    let mut pooling = PoolingAllocationConfig::default();
+    pooling
+        .total_component_instances(slots)
+        .total_core_instances(slots * CORE_INSTANCES_PER_SLOT)
+        .total_memories(slots * MEMORIES_PER_SLOT)
+        .total_tables(slots * TABLES_PER_SLOT)
+        .max_memory_size(plugins.max_memory_bytes);
+
+    let mut wasm_config = WasmtimeConfig::new();
+    wasm_config
+        .async_support(true)
+        .wasm_component_model(true)
+        .allocation_strategy(InstanceAllocationStrategy::Pooling(pooling));
+    let engine = Engine::new(&wasm_config).context("Failed to create pooled Wasm engine")?;
+
+    let mut linker = Linker::new(&engine);
+    wasi_add(&mut linker)?;
+    add_only_http_to_linker_async(&mut linker)?;
+    typed::TypedOverride::add_to_linker(&mut linker, |host: &mut Host| host)?;
+    log::info!(
+        "wasm_pool_slots={} components={} max_memory_bytes={}",
+        slots,
+        unique.len(),
+        plugins.max_memory_bytes
+    );
+
+    Ok(Runtime {
+        engine,
+        linker,
+        plugins: plugins.clone(),
+        cache_dir: (!plugins.compiled_cache_dir.trim().is_empty())
+            .then(|| PathBuf::from(&plugins.compiled_cache_dir)),
+    })
+}
+
+fn runtime() -> Result<&'static Runtime> {
+    RUNTIME.get_or_try_init(|| build_runtime(&config::PluginsConfig::default(), &[]))
+}
+
+fn content_hash(bytes: &[u8]) -> u64 {
+    let mut hasher = DefaultHasher::new();
+    bytes.hash(&mut hasher);
+    hasher.finish()
+}
+
+/// Compile `bytes`, going through the on-disk artifact cache when one is configured.
+/// Artifacts are keyed by the file hash and the engine's compatibility hash, so a
+/// wasmtime upgrade or engine config change never picks up a stale artifact.
+fn compile_component(rt: &Runtime, component_path: &str, bytes: &[u8], hash: u64) -> Result<Component> {
+    let Some(dir) = rt.cache_dir.as_ref() else {
+        return Component::new(&rt.engine, bytes)
+            .with_context(|| format!("Failed to load Wasm component file: {}", component_path));
+    };
+    let mut hasher = DefaultHasher::new();
+    hash.hash(&mut hasher);
+    rt.engine.precompile_compatibility_hash().hash(&mut hasher);
+    let artifact = dir.join(format!("{:016x}.cwasm", hasher.finish()));
+
+    if artifact.is_file() {
+        // SAFETY: files in the cache directory are only written by `write_artifact` from
+        // `Component::serialize`; wasmtime still rejects artifacts built for another engine.
+        match unsafe { Component::deserialize_file(&rt.engine, &artifact) } {
+            Ok(component) => {
+                log::debug!("Loaded precompiled component {} for {}", artifact.display(), component_path);
+                return Ok(component);
+            }
+            Err(e) => log::warn!(
+                "wasm_artifact_load_failed=true path={} err={}",
+                artifact.display(),
+                e
+            ),
         }
-        drop(read_cache);
+    }
 
-        let comp = Component::from_file(&*ENGINE, component_path)
-            .with_context(|| format!("Failed to load Wasm component file: {}", component_path))?;
-        let mut write_cache = COMPONENT_CACHE.write().expect("Cache lock poisoned");
-        write_cache.insert(component_path.to_string(), comp.clone());
-        Ok(comp)
-    } else {
-        Component::from_file(&*ENGINE, component_path)
-            .with_context(|| format!("Failed to load Wasm component file: {}", component_path))
+    let component = Component::new(&rt.engine, bytes)
+        .with_context(|| format!("Failed to load Wasm component file: {}", component_path))?;
+    if let Err(e) = write_artifact(&artifact, &component) {
+        log::warn!(
+            "wasm_artifact_write_failed=true path={} err={}",
+            artifact.display(),
+            e
+        );
+    }
+    Ok(component)
+}
+
+fn write_artifact(path: &Path, component: &Component) -> Result<()> {
+    let serialized = component.serialize()?;
+    if let Some(parent) = path.parent() {
+        fs::create_dir_all(parent)?;
     }
+    // Write-then-rename so a concurrent reader never sees a partial artifact.
+    let tmp = path.with_extension(format!("cwasm.{}.tmp", std::process::id()));
+    fs::write(&tmp, serialized)?;
+    fs::rename(&tmp, path)?;
+    Ok(())
+}
+
+fn prepare_component(component_path: &str, bytes: &[u8], source: SourceStamp) -> Result<PreparedComponent> {
+    let rt = runtime()?;
+    let component = compile_component(rt, component_path, bytes, source.hash)?;
+    let pre = rt
+        .linker
+        .instantiate_pre(&component)
+        .with_context(|| format!("Failed to link Wasm component imports: {}", component_path))?;
+    let abi = match rt.plugins.abi_for(component_path) {
+        "typed" => PluginAbi::Typed(
+            typed::TypedOverridePre::new(pre.clone()).with_context(|| {
+                format!("Wasm component does not implement the typed plugin ABI: {}", component_path)
+            })?,
+        ),
+        _ => PluginAbi::Json,
+    };
+    let (_, max_concurrent) = rt.plugins.limits_for(component_path);
+    Ok(PreparedComponent {
+        pre,
+        abi: Arc::new(abi),
+        permits: Arc::new(Semaphore::new(max_concurrent)),
+        source,
+    })
+}
+
+/// Return the prepared component for `component_path`. With `revalidate` (dev mode) the
+/// file is stat-ed on every call and recompiled only when its content hash changed.
+fn load_component(component_path: &str, revalidate: bool) -> Result<Arc<PreparedComponent>> {
+    let cached = COMPONENT_CACHE
+        .read()
+        .expect("Cache lock poisoned")
+        .get(component_path)
+        .cloned();
+    if let Some(comp) = &cached {
+        if !revalidate {
+            return Ok(comp.clone());
+        }
+        let meta = fs::metadata(component_path)
+            .with_context(|| format!("Failed to stat Wasm component file: {}", component_path))?;
+        if comp.source.matches(&meta) {
+            return Ok(comp.clone());
+        }
+    }
+
+    let meta = fs::metadata(component_path)
+        .with_context(|| format!("Failed to stat Wasm component file: {}", component_path))?;
+    let bytes = fs::read(component_path)
+        .with_context(|| format!("Failed to read Wasm component file: {}", component_path))?;
+    let source = SourceStamp {
+        modified: meta.modified().ok(),
+        len: meta.len(),
+        hash: content_hash(&bytes),
+    };
+    let comp = match cached {
+        // Touched but unchanged: keep the compiled component, remember the new stamp.
+        Some(comp) if comp.source.hash == source.hash => Arc::new(PreparedComponent {
+            pre: comp.pre.clone(),
+            abi: comp.abi.clone(),
+            permits: comp.permits.clone(),
+            source,
+        }),
+        _ => {
+            log::debug!("Compiling Wasm component: {}", component_path);
+            Arc::new(prepare_component(component_path, &bytes, source)?)
+        }
+    };
+    COMPONENT_CACHE
+        .write()
+        .expect("Cache lock poisoned")
+        .insert(component_path.to_string(), comp.clone());
+    Ok(comp)
 }
 
+/// Compile (or load precompiled artifacts for) every configured component in parallel.
 pub fn preload_components(paths: &[String]) -> Result<usize> {
     if !is_production_mode() {
         return Ok(0);
     }
 
-    let mut unique = HashSet::new();
-    for path in paths {
-        if path.trim().is_empty() || !unique.insert(path.clone()) {
-            continue;
-        }
-        let _ = load_component(path, true)?;
-    }
+    let unique: HashSet<&str> = paths
+        .iter()
+        .map(|p| p.as_str())
+        .filter(|p| !p.trim().is_empty())
+        .collect();
+    std::thread::scope(|scope| {
+        let handles: Vec<_> = unique
+            .iter()
+            .map(|path| scope.spawn(move || load_component(path, false).map(|_| ())))
+            .collect();
+        handles
+            .into_iter()
+            .map(|h| h.join().expect("Wasm preload thread panicked"))
+            .collect::<Result<Vec<_>>>()
+    })?;
     Ok(unique.len())
 }
 
-pub async fn run_modify_request(component_path: &str, input_json: &str) -> Result<WasmOutput> {
-    let component = if is_production_mode() {
+pub async fn run_modify_request(component_path: &str, request: PluginRequest) -> Result<WasmOutput> {
+    let prepared = if is_production_mode() {
         log::debug!("[Prod Mode] Loading component from in-memory cache: {}", component_path);
-        load_component(component_path, true)?
-    } else {
-        log::debug!("[Dev Mode] Compiling component (no cache): {}", component_path);
         load_component(component_path, false)?
+    } else {
+        log::debug!("[Dev Mode] Loading component, recompiling if changed: {}", component_path);
+        load_component(component_path, true)?
     };
     log::debug!("Component loaded/retrieved.");
 
-    log::debug!("Creating I/O pipes...");
-    let input_json_owned = input_json.to_string();
-    let stdin_pipe = MemoryInputPipe::new(input_json_owned);
-    let stdout_pipe = MemoryOutputPipe::new(4096);
+    // Bounded by `max_concurrent_instances`, so pooled slots are never exhausted.
+    let _permit = prepared
+        .permits
+        .clone()
+        .acquire_owned()
+        .await
+        .context("Wasm instance pool closed")?;
+
+    match prepared.abi.as_ref() {
+        PluginAbi::Typed(pre) => run_typed(pre, request).await,
+        PluginAbi::Json => run_json(&prepared.pre, request).await,
+    }
+}
 
-    log::debug!("Building WASI context with pipes...");
+fn new_store(request: PluginRequest, stdio: Option<(MemoryInputPipe, MemoryOutputPipe)>) -> Result<Store<Host>> {
     let mut builder = WasiCtxBuilder::new();
     builder
-        .inherit_args()
-        .inherit_env()
-        .stdin(stdin_pipe.clone())
-        .stdout(stdout_pipe.clone())
+        .args(HOST_ARGS.as_slice())
+        .envs(HOST_ENV.as_slice())
         .inherit_stderr();
+    if let Some((stdin_pipe, stdout_pipe)) = stdio {
+        builder.stdin(stdin_pipe).stdout(stdout_pipe);
+    }
 
-    let wasi_ctx = builder.build();
     let host = Host {
         table: ResourceTable::default(),
-        wasi: wasi_ctx,
+        wasi: builder.build(),
         http: WasiHttpCtx::new(),
+        request,
     };
-    let mut store = Store::new(&*ENGINE, host);
-    log::debug!("Host and Store created.");
+    Ok(Store::new(&runtime()?.engine, host))
+}
+
+async fn run_typed(pre: &typed::TypedOverridePre<Host>, request: PluginRequest) -> Result<WasmOutput> {
+    let info = RequestInfo {
+        method: request.method.clone(),
+        path: request.path.clone(),
+    };
+    let mut store = new_store(request, None)?;
+    let bindings = pre.instantiate_async(&mut store).await?;
+    log::debug!("Calling typed `modify-request` in Wasm...");
+    let decision = bindings
+        .call_modify_request(&mut store, &info)
+        .await
+        .context("Failed during Wasm function call 'modify-request'")?;
+    Ok(decision.into())
+}
 
-    let mut linker = Linker::new(&*ENGINE);
+async fn run_json(pre: &InstancePre<Host>, request: PluginRequest) -> Result<WasmOutput> {
+    let input_json = serde_json::to_string(&WasmInput {
+        method: &request.method,
+        path: &request.path,
+        headers: &request.headers,
+        body: String::from_utf8_lossy(&request.body),
+    })
+    .context("Failed to serialize input for Wasm")?;
 
-    wasi_add(&mut linker)?;
-    add_only_http_to_linker_async(&mut linker)?;
-    log::debug!("WASI interfaces linked.");
+    log::debug!("Creating I/O pipes...");
+    let stdin_pipe = MemoryInputPipe::new(input_json);
+    let stdout_pipe = MemoryOutputPipe::new(4096);
+    let mut store = new_store(request, Some((stdin_pipe, stdout_pipe.clone())))?;
+    log::debug!("Host and Store created.");
 
     log::debug!("Instantiating component...");
-    let instance = linker.instantiate_async(&mut store, &component).await?;
+    let instance = pre.instantiate_async(&mut store).await?;
     log::debug!("Component instantiated.");
 
     let actual_export_name = "modify-request";